@@ -25,6 +25,7 @@ from model.bond_constants import atoms_are_bonded
 
 from utilities.Log import greenmsg
 from utilities.debug import Stopwatch
+from utilities.GlobalPreferences import pref_bulk_hexagonal_generators
 
 from geometry.VQT import Q, V, angleBetween, cross, vlen, norm
 from geometry.geometryUtilities import matrix_putting_axis_at_z
@@ -32,6 +33,9 @@ from model.chunk import Chunk
 from model.elements import PeriodicTable
 
 from model.bonds import CC_GRAPHITIC_BONDLENGTH, BN_GRAPHITIC_BONDLENGTH
+from model.bulk_chunk import add_hexagonal_structure, hexagonal_rcov
+
+from geometry.hexagonal_lattice import nanotube
 
 ntTypes = ["Carbon", "Boron Nitride"]
 ntEndings = ["Hydrogen", "None"] # "Capped" NIY. "Nitrogen" removed. --mark
@@ -567,6 +571,8 @@ class Nanotube:
             # If it's a multi-wall tube, only print the "Creating" message once.
             if length > 100.0:
                 env.history.message("This may take a moment...")
+        if pref_bulk_hexagonal_generators() and self.endings != "Capped":
+            return self._build_in_bulk(name, assy, position, mol, length)
         PROFILE = False
         if PROFILE:
             sw = Stopwatch()
@@ -686,6 +692,32 @@ class Nanotube:
         return mol
     pass # End build()
 
+    def _build_in_bulk(self, name, assy, position, mol, length):
+        """
+        Build a single-walled nanotube like build does (for endings other
+        than "Capped"), but computing the positions and bonds of all its
+        atoms at once (see geometry/hexagonal_lattice.py) and making them
+        in bulk.
+        """
+        endPoint1, endPoint2 = self.getEndPoints()
+        if mol == None:
+            mol = Chunk(assy, name)
+        if self.type == "Carbon":
+            carbon = PeriodicTable.getElement('C').find_atomtype('sp2')
+            atomtypes = (carbon, carbon)
+            v6 = V_GRAPHITE
+        else:
+            atomtypes = (PeriodicTable.getElement('B').find_atomtype('sp2'),
+                         PeriodicTable.getElement('N').find_atomtype('sp3'))
+            v6 = V_SINGLE
+        tube = nanotube(self, length, self.zdist, self.xydist,
+                        self.twist, self.bend,
+                        rcov = hexagonal_rcov(atomtypes, v6))
+        tube.translate(position)
+        add_hexagonal_structure(mol, tube, atomtypes, v6, self.endings)
+        self._orient(mol, endPoint1, endPoint2)
+        return mol
+
     def _postProcess(self, cntCellList):
         pass
     
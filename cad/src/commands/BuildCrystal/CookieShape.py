@@ -20,7 +20,7 @@ But it'll end up in a package for Build Crystal, so this might be ok.
 [bruce 071215]
 """
 
-from Numeric import dot, floor
+from Numeric import dot, floor, add, logical_and
 
 from geometry.VQT import vlen, V
 from OpenGL.GL import glNewList, glEndList, glCallList
@@ -48,6 +48,10 @@ from graphics.behaviors.shape import simple_shape_2d
 from graphics.behaviors.shape import get_selCurve_color
 from graphics.behaviors.shape import shape
 
+from commands.BuildCrystal.crystal_cutter import CrystalCut
+from commands.BuildCrystal.crystal_cutter import build_crystal_chunk
+from utilities.GlobalPreferences import pref_vectorized_crystal_cutter
+
 # ==
 
 class _Circle(simple_shape_2d):
@@ -80,7 +84,16 @@ class _Circle(simple_shape_2d):
             return True
         else:
             return False
-   
+
+    def isin_array(self, points):
+        """
+        Like isin, but for an N x 3 array of points; return a Numeric
+        array which is true for the points that are in.
+        """
+        res, p = self.project_2d_array(points)
+        d = p - self.cirCenter
+        return logical_and(res, add.reduce(d * d, 1) <= self.rad * self.rad)
+
     def _computeBBox(self):
         """
         Construct the 3D bounding box for this volume.
@@ -118,6 +131,10 @@ class CookieShape(shape):
         self.latticeType = latticeType
         self.layerThickness = {}
         self.layeredCurves = {} # A list of (merged bb, curves) for each layer
+        # If true, the cookie is cut by a CrystalCut of all the curves,
+        # rather than incrementally by _cutCookie.
+        self.vectorized = pref_vectorized_crystal_cutter()
+        self._crystalCut = None
 
     def pushdown(self, lastLayer):
         """
@@ -214,6 +231,7 @@ class CookieShape(shape):
             self.carbonPosDict[currentLayer] = {} 
             self.hedroPosDict[currentLayer] = {}
             self.bondLayers[currentLayer] = {}
+            self._crystalCut = None
             for c in curves[1:]:
                 self._cutCookie(currentLayer, c)
             
@@ -226,6 +244,7 @@ class CookieShape(shape):
         curves = self.layeredCurves[currentLayer]
         curves = []
         self.layeredCurves[currentLayer] = curves
+        self._crystalCut = None
         self.havelist = 0
 
     def anyCurvesLeft(self):
@@ -329,6 +348,11 @@ class CookieShape(shape):
         """
         self.havelist = 0
         
+        if self.vectorized:
+            # the whole cookie is cut when next needed, by getCrystalCut
+            self._crystalCut = None
+            return
+        
         bblo, bbhi = c.bbox.data[1], c.bbox.data[0]
         #Without +(-) 1.6, cookie for lonsdaileite may not be right
         allCells = genDiam(bblo - 1.6, bbhi + 1.6, self.latticeType)
@@ -731,6 +755,19 @@ class CookieShape(shape):
             dict[key] = values
                 
    
+    def getCrystalCut(self):
+        """
+        Return a CrystalCut of the curves of all layers (made if needed).
+        Only used if self.vectorized is true.
+        """
+        if self._crystalCut is None:
+            layers = {}
+            for layer, curves in self.layeredCurves.items():
+                if len(curves) > 1:
+                    layers[layer] = curves[1:]
+            self._crystalCut = CrystalCut(layers, self.latticeType)
+        return self._crystalCut
+    
     def changeDisplayMode(self, mode):
         self.dispMode = mode
         self.havelist = 0
@@ -769,6 +806,10 @@ class CookieShape(shape):
             self._anotherDraw(layerColor)
             return
         
+        if self.vectorized:
+            self._drawCrystalCut(layerColor)
+            return
+        
         markedAtoms = self.markedAtoms
         
         if self.havelist:
@@ -844,6 +885,32 @@ class CookieShape(shape):
 
         self.havelist = 1 # always set this flag, even if exception happened.
     
+    def _drawCrystalCut(self, layerColor):
+        """
+        Draw the shape (as in draw) from self.getCrystalCut().
+        """
+        if self.havelist:
+            glCallList(self.displist.dl)
+            return
+        ColorSorter.start(self.displist)
+        try:
+            cut = self.getCrystalCut()
+            positions = cut.positions
+            for layer in cut.layer_inside.keys():
+                color = layerColor[layer]
+                self.layeredCurves[layer][-1].draw()
+                full, half = cut.layer_bonds(layer)
+                for i0, i1 in full.tolist():
+                    self._bondDraw(color, positions[i0], positions[i1], -1)
+                for i0, i1 in half.tolist():
+                    p0 = positions[i0]
+                    self._bondDraw(color, p0, (p0 + positions[i1]) / 2.0, 0)
+        except:
+            # (see comment in draw)
+            print_compact_traceback( "bug: exception in shape.draw's displist; ignored: ")
+        ColorSorter.finish()
+        self.havelist = 1
+    
     def buildChunk(self, assy):
         """
         Build Chunk for the cookies. First, combine bonds from
@@ -853,6 +920,11 @@ class CookieShape(shape):
         from model.chem import Atom
         from utilities.constants import gensym
         
+        if self.vectorized:
+            mol = build_crystal_chunk(assy, self.getCrystalCut())
+            self._addChunk(assy, mol)
+            return
+        
         numLayers = len(self.bondLayers)
         if numLayers:
             allBonds = {}
@@ -931,16 +1003,24 @@ class CookieShape(shape):
                         
                         mol.bond(keyAtom, bondAtom)
         
-            if len(mol.atoms) > 0:
-                #bruce 050222 comment: much of this is not needed, since mol.pick() does it.
-                # Note: this method is similar to one in cookieMode.py.
-                assy.addmol(mol)
-                assy.unpickall_in_GLPane() # was unpickparts; not sure _in_GLPane is best (or that this is needed at all) [bruce 060721]
-                mol.pick()
-                assy.mt.mt_update()
+            self._addChunk(assy, mol)
         
         return # from buildChunk
     
+    def _addChunk(self, assy, mol):
+        """
+        Add mol (the new crystal chunk) to assy and select it,
+        unless it has no atoms.
+        """
+        if len(mol.atoms) > 0:
+            #bruce 050222 comment: much of this is not needed, since mol.pick() does it.
+            # Note: this method is similar to one in cookieMode.py.
+            assy.addmol(mol)
+            assy.unpickall_in_GLPane() # was unpickparts; not sure _in_GLPane is best (or that this is needed at all) [bruce 060721]
+            mol.pick()
+            assy.mt.mt_update()
+        return
+    
     pass # end of class CookieShape
 
 # end
@@ -0,0 +1,315 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+crystal_cutter.py -- cut a crystal from a diamond or lonsdaleite lattice
+using layers of 2d curves, with Numeric operations over all lattice
+sites at once.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that cutting a large crystal in Build Crystal mode doesn't
+take minutes. CookieShape._cutCookie walks the lattice cells returned
+by genDiam one bond at a time, testing each end with the curve's isin
+method and keeping track of the atoms and bonds of each layer in dicts
+keyed by a hash of the atom positions, updated incrementally for each
+new curve. Used by CookieShape (for drawing the cookie and for
+buildChunk) when pref_vectorized_crystal_cutter is enabled.
+
+Usage:
+
+A CrystalCut is made from the curves of each layer (as made by
+CookieShape.pickCircle, pickrect or pickline, in the order they were
+added) and the lattice type. It finds all lattice sites and bonds
+in the bounding box of the curves (see geometry/crystal_lattice.py),
+tests all the sites against each layer's curves with their isin_array
+methods, and can then return the bonds of each layer (for drawing)
+or the atoms and bonds of the crystal as arrays. build_crystal_chunk
+makes a Chunk from them.
+
+None of this uses the GLPane or cookieMode, so it can be used (e.g.
+by scripts) with any curves which have isin_array methods, selSense
+attributes, and bboxes.
+
+Implementation notes:
+
+A lattice site is in a layer if it's in the combination of the layer's
+curves (see curves_isin_array), and in the crystal if it's in any layer.
+This is what _cutCookie and buildChunk compute incrementally: each
+site in the crystal becomes a carbon atom, and each bond from such an
+atom to a site not in the crystal becomes a bondpoint halfway along
+that bond.
+"""
+
+import Numeric
+from Numeric import Int
+
+from geometry.crystal_lattice import lattice_sites_and_bonds
+
+from utilities.constants import SUBTRACT_FROM_SELECTION
+from utilities.constants import OUTSIDE_SUBTRACT_FROM_SELECTION
+from utilities.constants import ADD_TO_SELECTION
+from utilities.constants import START_NEW_SELECTION
+
+# Margin added to the bounding box of the curves when generating the
+# lattice (as in CookieShape._cutCookie: without it, cookies of
+# lonsdaleite may not be right).
+LATTICE_MARGIN = 1.6
+
+# ==
+
+def _isin_where(curve, points, mask):
+    """
+    Return a Numeric array which is true for the points (an N x 3 array)
+    which are in curve, testing only the points for which mask is true
+    (and returning false for the others).
+    """
+    indices = Numeric.nonzero(mask)
+    res = Numeric.zeros(len(points), Int)
+    if len(indices):
+        Numeric.put(res, indices, curve.isin_array(Numeric.take(points, indices)))
+    return res
+
+def curves_isin_array(points, curves):
+    """
+    Return a Numeric array which is true for those points (an N x 3 array)
+    which are in the area defined by curves (a sequence of curves, in
+    the order they were added, each combined with the previous ones
+    according to its selSense, as in CookieShape._cutCookie: a
+    START_NEW_SELECTION curve replaces them, ADD_TO_SELECTION adds to them,
+    SUBTRACT_FROM_SELECTION removes from them, and
+    OUTSIDE_SUBTRACT_FROM_SELECTION removes whatever is outside it).
+    Each curve only tests the points whose in-ness it might change.
+    """
+    res = Numeric.zeros(len(points), Int)
+    for c in curves:
+        sense = c.selSense
+        if sense == START_NEW_SELECTION:
+            res = Numeric.not_equal(c.isin_array(points), 0)
+        elif sense == ADD_TO_SELECTION:
+            res = Numeric.logical_or(res, _isin_where(c, points, Numeric.logical_not(res)))
+        elif sense == OUTSIDE_SUBTRACT_FROM_SELECTION:
+            res = _isin_where(c, points, res)
+        elif sense == SUBTRACT_FROM_SELECTION:
+            res = Numeric.logical_and(res, Numeric.logical_not(_isin_where(c, points, res)))
+    return res
+
+def _split_bonds(bonds, inside):
+    """
+    Return (full, half) for the bonds (an M x 2 array of site indices)
+    with at least one end inside (an array which is true for the sites
+    which are): full lists those with both ends inside, and half those
+    with one end inside, as pairs (inside site, outside site).
+    """
+    in0 = Numeric.take(inside, bonds[:,0])
+    in1 = Numeric.take(inside, bonds[:,1])
+    full = Numeric.compress(Numeric.logical_and(in0, in1), bonds, 0)
+    half0 = Numeric.compress(Numeric.logical_and(in0, Numeric.logical_not(in1)), bonds, 0)
+    half1 = Numeric.compress(Numeric.logical_and(in1, Numeric.logical_not(in0)), bonds, 0)
+    half = Numeric.concatenate((half0, Numeric.take(half1, [1, 0], 1)))
+    return full, half
+
+# ==
+
+class CrystalCut:
+    """
+    The lattice sites and bonds cut out by the layers of curves of a
+    CookieShape. See module docstring for details.
+
+    @ivar positions: N x 3 array of the positions of the lattice sites
+                     in the bounding box of the curves.
+    @ivar bonds: M x 2 array of the lattice bonds (as site indices) with
+                 at least one end in the crystal.
+    @ivar inside: array which is true for the sites in the crystal.
+    @ivar layer_inside: dict from layer to an array which is true
+                        for the sites in that layer.
+    """
+    def __init__(self, layers, latticeType):
+        """
+        @param layers: a dict from layer to the list of curves in that
+                       layer (in the order they were added).
+        @param latticeType: 'DIAMOND' or 'LONSDALEITE'.
+        """
+        self.latticeType = latticeType
+        self.layer_inside = {}
+        his = []
+        los = []
+        for curves in layers.values():
+            for c in curves:
+                his.append(c.bbox.data[0])
+                los.append(c.bbox.data[1])
+        if his:
+            bbhi = Numeric.maximum.reduce(his) + LATTICE_MARGIN
+            bblo = Numeric.minimum.reduce(los) - LATTICE_MARGIN
+            positions, bonds = lattice_sites_and_bonds(bblo, bbhi, latticeType)
+        else:
+            positions, bonds = lattice_sites_and_bonds((0, 0, 0), (0, 0, 0), latticeType)
+        inside = Numeric.zeros(len(positions), Int)
+        for layer, curves in layers.items():
+            layer_inside = curves_isin_array(positions, curves)
+            self.layer_inside[layer] = layer_inside
+            inside = Numeric.logical_or(inside, layer_inside)
+        touching = Numeric.logical_or(Numeric.take(inside, bonds[:,0]),
+                                      Numeric.take(inside, bonds[:,1]))
+        self.positions = positions
+        self.bonds = Numeric.compress(touching, bonds, 0)
+        self.inside = inside
+        return
+
+    def layer_bonds(self, layer):
+        """
+        Return (full, half) for the bonds of one layer, i.e. the bonds
+        with at least one end in that layer: full is an array of the
+        pairs of site indices of those with both ends in it, and half of
+        those with one end in it, as pairs (inside site, outside site).
+        """
+        return _split_bonds(self.bonds, self.layer_inside[layer])
+
+    def atoms(self):
+        """
+        Return (carbons, bondpoints, cc_bonds, cx_bonds) for the crystal:
+        the positions of its carbon atoms and of its bondpoints (each
+        an N x 3 array), and its carbon-carbon bonds and carbon-bondpoint
+        bonds (each an M x 2 array of index pairs, into carbons for the
+        former and into carbons and bondpoints for the latter).
+        """
+        positions = self.positions
+        full, half = _split_bonds(self.bonds, self.inside)
+        sites = Numeric.nonzero(self.inside)
+        number = Numeric.zeros(len(positions), Int) # carbon index of each site
+        Numeric.put(number, sites, Numeric.arange(len(sites)))
+        carbons = Numeric.take(positions, sites)
+        cc_bonds = Numeric.reshape(Numeric.take(number, Numeric.ravel(full)), (-1, 2))
+        bondpoints = (Numeric.take(positions, half[:,0]) +
+                      Numeric.take(positions, half[:,1])) / 2.0
+        cx_bonds = Numeric.transpose(Numeric.array([Numeric.take(number, half[:,0]),
+                                                    Numeric.arange(len(half))]))
+        return carbons, bondpoints, cc_bonds, cx_bonds
+
+    pass # end of class CrystalCut
+
+def build_crystal_chunk(assy, cut, name = None):
+    """
+    Make and return a new Chunk (not added to assy) containing the atoms
+    and bonds of cut (a CrystalCut), named name or (by default) a new
+    name like "Crystal-1".
+    """
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from model.bonds import bond_atoms_faster
+    from model.bond_constants import V_SINGLE
+    from utilities.constants import gensym
+    carbons, bondpoints, cc_bonds, cx_bonds = cut.atoms()
+    mol = Chunk(assy, name or gensym("Crystal", assy))
+    catoms = [Atom("C", pos, mol) for pos in carbons]
+    xatoms = [Atom("X", pos, mol) for pos in bondpoints]
+    for i, j in cc_bonds.tolist():
+        bond_atoms_faster(catoms[i], catoms[j], V_SINGLE)
+    for i, j in cx_bonds.tolist():
+        bond_atoms_faster(catoms[i], xatoms[j], V_SINGLE)
+    return mol
+
+# ==
+
+def _old_layer_result(shape, layer):
+    """
+    Return (carbons, nfull, nhalf) for one layer of a CookieShape which
+    uses _cutCookie: the set of its carbon positions (rounded), and its
+    numbers of full and half bonds (which are only right if no curve
+    has removed atoms, until the layer is drawn; see CookieShape.draw).
+    """
+    carbons = {}
+    for pos in shape.carbonPosDict[layer].values():
+        carbons[tuple([round(x, 3) for x in pos])] = 1
+    nfull = nhalf = 0
+    for values in shape.bondLayers[layer].values():
+        for b in values:
+            if type(b) == type(1):
+                nfull += 1
+            else:
+                nhalf += 1
+    return carbons, nfull, nhalf
+
+def _new_layer_result(shape, layer):
+    """
+    Return (carbons, nfull, nhalf, time) for one layer of a CookieShape
+    as for _old_layer_result, but from a CrystalCut of its curves,
+    with the time taken to make the CrystalCut and get its atoms.
+    """
+    import time
+    t0 = time.time()
+    cut = CrystalCut({layer: shape.layeredCurves[layer][1:]}, shape.latticeType)
+    positions, bondpoints, cc_bonds, cx_bonds = cut.atoms()
+    t1 = time.time()
+    carbons = {}
+    for pos in positions.tolist():
+        carbons[tuple([round(x, 3) for x in pos])] = 1
+    return carbons, len(cc_bonds), len(cx_bonds), t1 - t0
+
+def _benchmark(radius = 30.0, large_size = 600.0):
+    """
+    Print the time to cut a cylinder of the given radius plus a
+    rectangle, and then to subtract a smaller cylinder from it, out of
+    each lattice with CookieShape._cutCookie and with a CrystalCut,
+    and check that they agree; then print the time to cut and build
+    a square slab of side large_size Angstroms with a CrystalCut.
+    """
+    import time
+    from geometry.VQT import V
+    from geometry.Slab import Slab
+    from commands.BuildCrystal.CookieShape import CookieShape
+    from model.assembly import Assembly
+    right, up, normal = V(1, 0, 0), V(0, 1, 0), V(0, 0, -1)
+    origin = V(0, 0, 0)
+    slab = Slab(origin, V(0, 0, 1), 10.0)
+    print "crystal cutter benchmark:"
+    for latticeType in ('DIAMOND', 'LONSDALEITE'):
+        shape = CookieShape(right, up, normal, 'Tubes', latticeType)
+        shape.vectorized = False
+        t0 = time.time()
+        shape.pickCircle([origin, V(radius, 0, 0)], origin,
+                         START_NEW_SELECTION, 0, slab)
+        shape.pickrect(origin, V(2 * radius, radius, 0), origin,
+                       ADD_TO_SELECTION, 0, slab)
+        t1 = time.time()
+        old = _old_layer_result(shape, 0)
+        new = _new_layer_result(shape, 0)
+        assert new[:3] == old, "cut mismatch for %s" % latticeType
+        print "  %-11s add:      _cutCookie %6.2f sec; CrystalCut %6.3f sec " \
+              "(%d carbons, %d full bonds, %d half bonds)" % \
+              (latticeType, t1 - t0, new[3], len(new[0]), new[1], new[2])
+        t0 = time.time()
+        shape.pickCircle([origin, V(radius / 3, 0, 0)], origin,
+                         SUBTRACT_FROM_SELECTION, 0, slab)
+        t1 = time.time()
+        old = _old_layer_result(shape, 0)
+        new = _new_layer_result(shape, 0)
+        assert new[0] == old[0], "subtract mismatch for %s" % latticeType
+        print "  %-11s subtract: _cutCookie %6.2f sec; CrystalCut %6.3f sec (%d carbons)" % \
+              (latticeType, t1 - t0, new[3], len(new[0]))
+    # a large slab, only with CrystalCut
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    shape = CookieShape(right, up, normal, 'Tubes', 'DIAMOND')
+    shape.vectorized = True
+    shape.pickrect(origin, V(large_size, large_size, 0), origin,
+                   START_NEW_SELECTION, 0, slab)
+    t0 = time.time()
+    cut = CrystalCut({0: shape.layeredCurves[0][1:]}, 'DIAMOND')
+    carbons, bondpoints, cc_bonds, cx_bonds = cut.atoms()
+    t1 = time.time()
+    mol = build_crystal_chunk(assy, cut)
+    t2 = time.time()
+    assert len(mol.atoms) == len(carbons) + len(bondpoints)
+    print "  DIAMOND slab %g x %g x 10 A: CrystalCut %6.2f sec, build_crystal_chunk %6.2f sec " \
+          "(%d carbons, %d bonds, %d bondpoints)" % \
+          (large_size, large_size, t1 - t0, t2 - t1,
+           len(carbons), len(cc_bonds), len(bondpoints))
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -33,6 +33,7 @@ from commands.Move.Move_Command import Move_Command
 from commands.Fuse.fusechunksMode import fusechunksBase
 
 from commands.Fuse.fusechunksMode import fusechunks_lambda_tol_natoms, fusechunks_lambda_tol_nbonds
+from utilities.GlobalPreferences import pref_fuse_chunks_spatial_index
 
 #@ Warning: MAKEBONDS and FUSEATOMS must be the same exact strings used in the
 #  PM combo box "fuseComboBox" widget in FusePropertyManager.
@@ -120,6 +121,7 @@ class FuseChunks_Command(Move_Command, fusechunksBase):
         self.connect_or_disconnect_signals(False)
         self.w.toolsFuseChunksAction.setChecked(False)
         self.propMgr.close()
+        self._fuse_index = None # don't keep its arrays after leaving this command
 
     def connect_or_disconnect_signals(self, connect):
         if connect:
@@ -299,7 +301,20 @@ class FuseChunks_Command(Move_Command, fusechunksBase):
 
         self.overlapping_atoms = []
 
-        for chunk in self.o.assy.selmols:
+        selmols = self.o.assy.selmols
+        if pref_fuse_chunks_spatial_index():
+            # find the same atoms as the loops below, in bulk
+            selected = [chunk for chunk in selmols
+                        if not (chunk.hidden or chunk.display == diINVISIBLE)]
+            selected_ids = dict([(id(chunk), chunk) for chunk in selmols])
+            targets = [mol for mol in self.o.assy.molecules
+                       if not (mol.hidden or mol.display == diINVISIBLE) and
+                          not selected_ids.has_key(id(mol))]
+            self.overlapping_atoms = self.get_fuse_index().overlapping_atoms(
+                selected, targets, self.tol)
+            selmols = [] # skip the loops
+
+        for chunk in selmols:
 
             if chunk.hidden or chunk.display == diINVISIBLE:
                 # Skip selected chunk if hidden or invisible.
@@ -0,0 +1,335 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+fuse_index.py -- find bondable pairs of bondpoints, or overlapping atoms,
+between chunks for Fuse Chunks, in bulk, using a spatial index.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written to replace the nested loops over chunks and atoms in
+fusechunksBase.find_bondable_pairs and
+FuseChunks_Command.find_overlapping_atoms, which compared every bondpoint
+(or atom) of each selected chunk with every one in each nearby chunk,
+and which run again after every move of the tolerance slider.
+
+Usage:
+
+A command keeps one FuseIndex while it's in use. Its bondable_pairs and
+overlapping_atoms methods take lists of the selected and target chunks
+(already filtered by the caller for visibility and selection), and a
+tolerance, and return the same lists of pairs as the old loops did, in
+the same order.
+
+Implementation notes:
+
+The points (bondpoints, or real atoms) of all the target chunks are put
+into one CellIndex, with cells as large as the largest tolerance; then
+the points of all the selected chunks are looked up in it with one
+CellIndex.regions query, giving arrays of all (selected, target) point
+pairs within that radius, and their distances. Both are kept and reused
+for as long as the chunks and their points' positions and elements stay
+the same (checked by comparing arrays), so moving the tolerance slider
+only filters the kept distances, and dragging the selected chunks only
+repeats the query.
+
+Each chunk's lists of bondpoints and real atoms are also kept, for as
+long as its atlist and singlets and its assy's model change counter
+stay the same. (An element change, e.g. by Transmute, doesn't remake
+atlist, and only remakes singlets when an atom becomes or stops being
+a bondpoint.)
+
+The old loops also skipped chunk pairs and atoms using bounding spheres
+(see Chunk.overlapping_chunk and overlapping_atom), but those tests can't
+exclude any pair within the tolerance, so they're not needed here.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+from geometry.CellIndex import CellIndex
+from model.elements import Singlet
+
+FUSE_INDEX_RADIUS = 3.01
+    # in Angstroms; a bit more than the largest tolerance on the Fuse Chunks
+    # tolerance slider (300%, i.e. 3.0), since tolerances are tested with <=
+    # but CellIndex finds points closer than its radius
+
+_EMPTY = Numeric.zeros((0,), Int)
+
+class _Points:
+    """
+    [private helper for FuseIndex]
+    The atoms (bondpoints or real atoms) of a list of chunks, in order,
+    with columns of their positions, element codes and owners (indices
+    of their chunks in that list).
+    """
+    def __init__(self, key, atoms, positions, codes, owners):
+        self.key = key # identifies the chunks and their atom lists
+        self.atoms = atoms
+        self.positions = positions
+        self.codes = codes
+        self.owners = owners
+
+    def same_points(self, other):
+        """
+        Do self and other have the same atoms, of the same elements,
+        at the same positions?
+        """
+        if other is None or self.key != other.key:
+            return False
+        return len(self.positions) == len(other.positions) and \
+               Numeric.alltrue(Numeric.equal(self.codes, other.codes)) and \
+               Numeric.alltrue(Numeric.equal(Numeric.ravel(self.positions),
+                                             Numeric.ravel(other.positions)))
+    pass
+
+class FuseIndex:
+    """
+    Finds bondable pairs of bondpoints, or overlapping atoms, between
+    selected chunks and target chunks.
+    See module docstring for details.
+    """
+    def __init__(self, radius = FUSE_INDEX_RADIUS):
+        self.radius = radius
+        self._chunk_data = {} # id(chunk) -> (chunk, structure, data for each kind)
+        self._element_codes = {} # element -> small int
+        self._targets = {} # kind -> (_Points, CellIndex) for target chunks
+        self._queries = {} # kind -> (_Points, CellIndex, qi, pi, distances)
+        return
+
+    def bondable_pairs(self, selected, targets, tol):
+        """
+        Return a list of pairs (s1, s2) of bondpoints, s1 of a chunk in
+        selected and s2 of a different chunk in targets, no farther apart
+        than tol, ordered by the positions of their chunks in selected and
+        targets, and then by their positions in their chunks' singlets.
+        """
+        qpoints, tpoints, qi, pi, distances = \
+                 self._close_pairs('singlets', selected, targets, tol)
+        qatoms = qpoints.atoms
+        tatoms = tpoints.atoms
+        return [(qatoms[i], tatoms[j]) for i, j in zip(qi.tolist(), pi.tolist())]
+
+    def overlapping_atoms(self, selected, targets, tol):
+        """
+        Return a list of pairs (a1, a2) of real atoms of the same element,
+        a1 of a chunk in selected and a2 of a different chunk in targets,
+        no farther apart than tol, with only the first such a2 in each
+        target chunk (in the order of its atlist) for each a1, ordered
+        like the pairs from bondable_pairs.
+        """
+        qpoints, tpoints, qi, pi, distances = \
+                 self._close_pairs('atoms', selected, targets, tol)
+        same = Numeric.equal(Numeric.take(qpoints.codes, qi),
+                             Numeric.take(tpoints.codes, pi))
+        qi = Numeric.compress(same, qi)
+        pi = Numeric.compress(same, pi)
+        if len(qi):
+            # keep the first pair for each a1 and target chunk
+            towners = Numeric.take(tpoints.owners, pi)
+            first = Numeric.ones(len(qi))
+            first[1:] = Numeric.logical_or(Numeric.not_equal(qi[1:], qi[:-1]),
+                                           Numeric.not_equal(towners[1:],
+                                                             towners[:-1]))
+            qi = Numeric.compress(first, qi)
+            pi = Numeric.compress(first, pi)
+        qatoms = qpoints.atoms
+        tatoms = tpoints.atoms
+        return [(qatoms[i], tatoms[j]) for i, j in zip(qi.tolist(), pi.tolist())]
+
+    # == private helpers
+
+    def _close_pairs(self, kind, selected, targets, tol):
+        """
+        Return (qpoints, tpoints, qi, pi, distances) for all pairs of
+        points of the given kind (see _gather), qpoints.atoms[qi[m]] of a
+        chunk in selected and tpoints.atoms[pi[m]] of a different chunk in
+        targets, no farther apart than tol, sorted by their chunks' indices
+        in selected and targets, then by qi and pi.
+        """
+        if tol > self.radius:
+            # (not used by Fuse Chunks, whose tolerance can't be that large)
+            self.radius = tol * 1.01
+            self._targets = {}
+            self._queries = {}
+        tpoints = self._gather(kind, targets)
+        old = self._targets.get(kind)
+        if old is not None and tpoints.same_points(old[0]):
+            tpoints, index = old
+        else:
+            index = CellIndex(tpoints.positions, self.radius)
+            self._targets[kind] = (tpoints, index)
+        qpoints = self._gather(kind, selected)
+        old = self._queries.get(kind)
+        if old is not None and old[1] is index and qpoints.same_points(old[0]):
+            qpoints, index, qi, pi, distances = old
+        else:
+            qi, pi = index.regions(qpoints.positions)
+            deltas = Numeric.take(qpoints.positions, qi) - \
+                     Numeric.take(tpoints.positions, pi)
+            distances = Numeric.sqrt(Numeric.add.reduce(deltas * deltas, 1))
+            self._queries[kind] = (qpoints, index, qi, pi, distances)
+        # pairs within tol, not within one chunk
+        target_index_of_chunk = {}
+        for i in range(len(targets)):
+            target_index_of_chunk[id(targets[i])] = i
+        selected_as_target = Numeric.array(
+            [target_index_of_chunk.get(id(chunk), -1) for chunk in selected] or
+            [-1])
+        qowners = Numeric.take(qpoints.owners, qi)
+        towners = Numeric.take(tpoints.owners, pi)
+        ok = Numeric.logical_and(
+            Numeric.less_equal(distances, tol),
+            Numeric.not_equal(Numeric.take(selected_as_target, qowners),
+                              towners))
+        qi = Numeric.compress(ok, qi)
+        pi = Numeric.compress(ok, pi)
+        distances = Numeric.compress(ok, distances)
+        qowners = Numeric.compress(ok, qowners)
+        towners = Numeric.compress(ok, towners)
+        order = _pair_order(qowners * float(len(targets)) + towners,
+                            qi, pi, len(tpoints.atoms))
+        return (qpoints, tpoints,
+                Numeric.take(qi, order),
+                Numeric.take(pi, order),
+                Numeric.take(distances, order))
+
+    def _gather(self, kind, chunks):
+        """
+        Return a _Points for the bondpoints (if kind is 'singlets') or
+        the real atoms (if kind is 'atoms') of the given chunks.
+        """
+        chunk_data = {}
+        key = []
+        atoms = []
+        positions = []
+        codes = []
+        owners = []
+        for i in range(len(chunks)):
+            chunk = chunks[i]
+            data = self._chunk_data.get(id(chunk))
+            atlist = chunk.atlist
+            structure = (atlist, chunk.singlets,
+                         chunk.assy.all_change_counters()[0])
+            if data is None or data[0] is not chunk or \
+               not _same_structure(data[1], structure):
+                data = (chunk, structure, {})
+            chunk_data[id(chunk)] = data
+            if not data[2].has_key(kind):
+                data[2][kind] = self._chunk_points(kind, atlist)
+            chunk_atoms, indices, chunk_codes = data[2][kind]
+            key.append((id(chunk), id(atlist), id(structure[1])))
+            if not chunk_atoms:
+                continue
+            atoms.extend(chunk_atoms)
+            positions.append(Numeric.take(chunk.atpos, indices))
+            codes.append(chunk_codes)
+            owners.append(Numeric.zeros(len(chunk_atoms), Int) + i)
+        self._chunk_data.update(chunk_data)
+        if positions:
+            positions = Numeric.concatenate(positions)
+            codes = Numeric.concatenate(codes)
+            owners = Numeric.concatenate(owners)
+        else:
+            positions = Numeric.zeros((0, 3), Float)
+            codes = owners = _EMPTY
+        return _Points(tuple(key), atoms, positions, codes, owners)
+
+    def _chunk_points(self, kind, atlist):
+        """
+        Return (atoms, indices, codes) for the bondpoints or real atoms
+        (depending on kind) in atlist (a chunk's atlist): a list of them,
+        an index array of their positions in atlist, and an array of
+        codes for their elements.
+        """
+        atoms = []
+        indices = []
+        codes = []
+        element_codes = self._element_codes
+        for i in range(len(atlist)):
+            atom = atlist[i]
+            if (atom.element is Singlet) != (kind == 'singlets'):
+                continue
+            atoms.append(atom)
+            indices.append(i)
+            code = element_codes.get(atom.element)
+            if code is None:
+                code = element_codes[atom.element] = len(element_codes)
+            codes.append(code)
+        return atoms, Numeric.array(indices, Int), Numeric.array(codes, Int)
+
+    pass # end of class FuseIndex
+
+def _same_structure(structure1, structure2):
+    """
+    Are two (atlist, singlets, model change counter) tuples the same,
+    comparing the lists by identity?
+    """
+    return structure1[0] is structure2[0] and \
+           structure1[1] is structure2[1] and \
+           structure1[2] == structure2[2]
+
+def _pair_order(groups, qi, pi, npoints):
+    """
+    Return the order which sorts pairs (qi[m], pi[m]) by groups[m]
+    (a Float array), then qi, then pi (where pi[m] < npoints).
+    """
+    n = len(qi)
+    if not n:
+        return _EMPTY
+    # rank of each pair by (qi, pi), which are unique
+    minor = qi * float(npoints) + pi
+    ranks = Numeric.searchsorted(Numeric.sort(minor), minor)
+    return Numeric.argsort(groups * n + ranks)
+
+# ==
+
+def _benchmark(nx = 10, ny = 10, nz = 10, tols = (0.5, 1.0, 1.5, 2.0)):
+    """
+    Time bondable_pairs for a grid of nx * ny * nz chunks, all selected
+    and all targets, whose bondpoints meet those of their neighbors (as
+    if made by fake "chunks" with bondpoints at the middles of the faces
+    of a cube), as when the tolerance slider moves (reusing the index).
+    """
+    import time
+    class FakeAtom:
+        element = Singlet
+        def __init__(self, key):
+            self.key = key
+    class FakeAssy:
+        def all_change_counters(self):
+            return 0, 0, 0
+    class FakeChunk:
+        assy = FakeAssy()
+    offsets = [(0.45, 0, 0), (-0.45, 0, 0), (0, 0.45, 0),
+               (0, -0.45, 0), (0, 0, 0.45), (0, 0, -0.45)]
+    chunks = []
+    key = 0
+    for i in range(nx):
+        for j in range(ny):
+            for k in range(nz):
+                chunk = FakeChunk()
+                chunk.atlist = []
+                for off in offsets:
+                    key += 1
+                    chunk.atlist.append(FakeAtom(key))
+                chunk.singlets = chunk.atlist
+                chunk.atpos = Numeric.array([(i + x, j + y, k + z)
+                                             for x, y, z in offsets]) * 3.0
+                chunks.append(chunk)
+    index = FuseIndex()
+    for tol in tols:
+        t0 = time.time()
+        pairs = index.bondable_pairs(chunks, chunks, tol)
+        t1 = time.time()
+        print "%d chunks, tolerance %.1f: %d bondable pairs in %.3f sec" % \
+              (len(chunks), tol, len(pairs), t1 - t0)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
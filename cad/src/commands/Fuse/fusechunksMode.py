@@ -13,6 +13,8 @@ from commands.Move.modifyMode import modifyMode
 from model.bonds import bond_at_singlets
 from utilities.Log import orangemsg
 from utilities.constants import diINVISIBLE
+from utilities.GlobalPreferences import pref_fuse_chunks_spatial_index
+from commands.Fuse.fuse_index import FuseIndex
 
 def fusechunks_lambda_tol_nbonds(tol, nbonds, mbonds, bondable_pairs):
     """
@@ -74,6 +76,8 @@ class fusechunksBase:
         # For "Make Bonds", tol is the distance between two bondable singlets
         # For "Fuse Atoms", tol is the distance between two atoms to be considered overlapping
 
+    _fuse_index = None # FuseIndex used to find fusables, made when first needed
+
     recompute_fusables = True
         # 'recompute_fusables' is used to optimize redraws by skipping the recomputing of fusables
         # (bondable pairs or overlapping atoms). When set to False, Draw() will not recompute fusables 
@@ -102,6 +106,19 @@ class fusechunksBase:
         if not selmols_list:
             selmols_list = self.o.assy.selmols
             
+        if pref_fuse_chunks_spatial_index():
+            # find the same pairs as the loops below, in bulk
+            selected = [chunk for chunk in selmols_list
+                        if not (chunk.hidden or chunk.display == diINVISIBLE)]
+            targets = [mol for mol in chunk_list
+                       if not (mol.hidden or mol.display == diINVISIBLE) and
+                          not (mol.picked and not ignore_chunk_picked_state)]
+            self.bondable_pairs = self.get_fuse_index().bondable_pairs(
+                selected, targets, self.tol)
+            for s1, s2 in self.bondable_pairs:
+                for key in (s1.key, s2.key):
+                    self.ways_of_bonding[key] = self.ways_of_bonding.get(key, 0) + 1
+            selmols_list = [] # skip the loops
 
         for chunk in selmols_list:
             if chunk.hidden or chunk.display == diINVISIBLE: 
@@ -159,6 +176,14 @@ class fusechunksBase:
         tol_str = fusechunks_lambda_tol_nbonds(self.tol, nbonds, mbonds, singlet_pairs)
         return tol_str
     
+    def get_fuse_index(self):
+        """
+        Return the FuseIndex used to find fusables, making it if necessary.
+        """
+        if self._fuse_index is None:
+            self._fuse_index = FuseIndex()
+        return self._fuse_index
+
     def find_bondable_pairs_in_given_atompairs(self, atomPairs):
         """
         This is just a convience method that doesn't need chunk lists as an 
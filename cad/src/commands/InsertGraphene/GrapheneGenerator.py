@@ -26,6 +26,10 @@ import foundation.env as env
 from utilities.debug import Stopwatch
 from model.elements import PeriodicTable
 from utilities.Log import greenmsg
+from utilities.GlobalPreferences import pref_bulk_hexagonal_generators
+
+from geometry.hexagonal_lattice import graphene_sheet
+from model.bulk_chunk import add_hexagonal_structure, hexagonal_rcov
 
 from commands.InsertGraphene.GrapheneGeneratorPropertyManager import GrapheneGeneratorPropertyManager
 from command_support.GeneratorBaseClass import GeneratorBaseClass
@@ -94,6 +98,10 @@ class GrapheneGenerator( GrapheneGeneratorPropertyManager, GeneratorBaseClass):
         """
         Create a graphene sheet chunk.
         """
+        if pref_bulk_hexagonal_generators() and not TOROIDAL:
+            self._populate_in_bulk(mol, height, width, z, bond_length,
+                                   endings, position)
+            return
 
         def add(element, x, y, atomtype='sp2'):
             atm = Atom(element, V(x, y, z), mol)
@@ -186,3 +194,24 @@ class GrapheneGenerator( GrapheneGeneratorPropertyManager, GeneratorBaseClass):
 
         if num_atoms == len(mol.atoms):
             raise Exception("Graphene sheet too small - no atoms added")
+
+    def _populate_in_bulk(self, mol, height, width, z, bond_length, endings,
+                          position):
+        """
+        Create a graphene sheet chunk like populate does, but computing
+        the positions and bonds of all its atoms at once and making them
+        in bulk.
+        """
+        carbon = PeriodicTable.getElement('C').find_atomtype('sp2')
+        atomtypes = (carbon, carbon)
+        sheet = graphene_sheet(height, width, bond_length,
+                               trim = endings in (1, 2),
+                               rcov = hexagonal_rcov(atomtypes,
+                                                     bond_constants.V_GRAPHITE))
+        if not len(sheet.positions):
+            raise Exception("Graphene sheet too small - no atoms added")
+        sheet.translate(position + V(0, 0, z))
+        add_hexagonal_structure(mol, sheet, atomtypes,
+                                bond_constants.V_GRAPHITE,
+                                {1: "Hydrogen", 2: "Nitrogen"}.get(endings))
+        return
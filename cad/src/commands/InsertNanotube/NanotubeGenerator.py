@@ -35,6 +35,10 @@ from model.bond_constants import atoms_are_bonded
 from commands.InsertNanotube.NanotubeGeneratorPropertyManager import NanotubeGeneratorPropertyManager
 from command_support.GeneratorBaseClass import GeneratorBaseClass
 from utilities.Log import orangemsg, greenmsg ##, redmsg
+from utilities.GlobalPreferences import pref_bulk_hexagonal_generators
+
+from geometry.hexagonal_lattice import nanotube
+from model.bulk_chunk import add_hexagonal_structure, hexagonal_rcov
 
 
 sqrt3 = 3 ** 0.5
@@ -369,6 +373,8 @@ class NanotubeGenerator(NanotubeGeneratorPropertyManager, GeneratorBaseClass):
             if length > 100.0:
                 env.history.message(self.cmd + "This may take a moment...")
         self.chirality = Chirality(n, m, bond_length)
+        if pref_bulk_hexagonal_generators() and endings != "Capped":
+            return self._build_struct_in_bulk(name, params, position, mol)
         PROFILE = False
         if PROFILE:
             sw = Stopwatch()
@@ -475,6 +481,38 @@ class NanotubeGenerator(NanotubeGeneratorPropertyManager, GeneratorBaseClass):
             self.build_struct(name, params, position, mol=mol, createPrinted=True)
 
         return mol
+
+    def _build_struct_in_bulk(self, name, params, position, mol):
+        """
+        Build a nanotube like build_struct does (for endings other than
+        "Capped"), but computing the positions and bonds of all its atoms
+        at once (see geometry/hexagonal_lattice.py) and making them in bulk.
+        """
+        length, n, m, bond_length, zdist, xydist, \
+                twist, bend, members, endings, numwalls, spacing = params
+        if mol == None:
+            mol = Chunk(self.win.assy, name)
+        if members != 0:
+            atomtypes = (PeriodicTable.getElement('B').find_atomtype('sp2'),
+                         PeriodicTable.getElement('N').find_atomtype('sp3'))
+            v6 = V_SINGLE
+        else:
+            carbon = PeriodicTable.getElement('C').find_atomtype('sp2')
+            atomtypes = (carbon, carbon)
+            v6 = V_GRAPHITE
+        tube = nanotube(self.chirality, length, zdist, xydist, twist, bend,
+                        rcov = hexagonal_rcov(atomtypes, v6))
+        # (unlike build_struct, only move the atoms of this wall)
+        tube.translate(position)
+        add_hexagonal_structure(mol, tube, atomtypes, v6, endings)
+
+        if numwalls > 1:
+            n += int(spacing * 3 + 0.5)  # empirical tinkering
+            params = (length + zdist, n, m, bond_length, zdist, xydist,
+                      twist, bend, members, endings, numwalls-1, spacing)
+            self.build_struct(name, params, position, mol=mol, createPrinted=True)
+
+        return mol
     pass
 
 # end
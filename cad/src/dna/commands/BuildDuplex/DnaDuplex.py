@@ -29,6 +29,8 @@ from utilities.prefs_constants import dnaDefaultStrand2Color_prefs_key
 from utilities.prefs_constants import dnaDefaultSegmentColor_prefs_key
 
 from dna.model.Dna_Constants import getDuplexBasesPerTurn
+from dna.commands.BuildDuplex.duplex_templates import make_raw_duplex
+from utilities.GlobalPreferences import pref_dna_duplex_from_templates
 
 ##from dna.updater.dna_updater_prefs import pref_dna_updater_convert_to_PAM3plus5
 
@@ -918,12 +920,18 @@ class Dna:
                            numberOfBasePairs, 
                            basesPerTurn, 
                            duplexRise,
-                           position = V(0, 0, 0)):
+                           position = V(0, 0, 0),
+                           from_templates = None):
         """
         Create a raw dna duplex in the specified group. This will be created 
         along the Z axis. Later it will undergo more operations such as 
         orientation change anc chunk regrouping. 
 
+        @param from_templates: whether to use 
+                               self._create_raw_duplex_from_templates;
+                               if None (the default), use it if
+                               pref_dna_duplex_from_templates is enabled.
+
         @return: A group object containing the 'raw dna duplex'
         @see: self.make()
 
@@ -938,6 +946,17 @@ class Dna:
         theta = 0.0
         z     = 0.5 * duplexRise * (numberOfBasePairs - 1)
 
+        if from_templates is None:
+            from_templates = pref_dna_duplex_from_templates()
+        if from_templates:
+            self._create_raw_duplex_from_templates(subgroup,
+                                                   numberOfBasePairs,
+                                                   twistPerBase,
+                                                   duplexRise,
+                                                   theta, z,
+                                                   position)
+            return
+
         # Create duplex.
         for i in range(numberOfBasePairs):
             basefile, zoffset, thetaOffset = self._strandAinfo(i)
@@ -995,6 +1014,53 @@ class Dna:
 
 
 
+    def _create_raw_duplex_from_templates(self,
+                                          subgroup,
+                                          numberOfBasePairs,
+                                          twistPerBase,
+                                          duplexRise,
+                                          theta,
+                                          z,
+                                          position):
+        """
+        Create the raw dna duplex for self._create_raw_duplex (which see),
+        from base-pair templates which are read only once, with all their
+        atoms and bonds made at once rather than one base-pair at a time
+        (so self.baseList has at most three chunks).
+
+        @see: dna/commands/BuildDuplex/duplex_templates.py
+        """
+        basefiles = []
+        thetas = []
+        zs = []
+        for i in range(numberOfBasePairs):
+            basefile, zoffset, thetaOffset = self._strandAinfo(i)
+            basefiles.append(basefile)
+            thetas.append(theta + thetaOffset)
+            zs.append(z + zoffset)
+            theta -= twistPerBase
+            z     -= duplexRise
+
+        self.baseList.extend( make_raw_duplex(self.assy,
+                                              subgroup,
+                                              basefiles,
+                                              thetas,
+                                              zs,
+                                              position) )
+
+        #see the comments about this in self._create_raw_duplex
+        self._determine_axis_and_strandA_endAtoms_at_end_1(self.baseList[0])
+
+        try:
+            self._postProcess(self.baseList)
+        except:
+            if env.debug():
+                print_compact_traceback( 
+                    "debug: exception in %r._postProcess(self.baseList = %r) \
+                    (reraising): " % (self, self.baseList,))
+            raise
+        return
+
     def _insertBaseFromMmp(self,
                            filename, 
                            subgroup, 
@@ -1044,7 +1110,8 @@ class Dna:
             # base-pair pseudo atoms.
 
             for atm in member.atoms.values():                            
-                atm._posn = tfm(atm._posn) + position
+                atm._setposn_no_chunk_or_bond_invals( tfm(atm._posn) + position)
+                    # (not atm._posn = ..., which would be hidden by an AtomStore)
 
             member.name = "BasePairChunk"
             subgroup.addchild(member)
@@ -0,0 +1,383 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+duplex_templates.py -- build a raw DNA duplex from base-pair templates
+which are each read from their mmp file only once.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written because Dna._create_raw_duplex (in DnaDuplex.py) reads the mmp
+file of a base-pair for every base-pair it inserts, transforms its
+atoms one at a time, and then bonds consecutive base-pairs using
+fusechunksBase, which searches all pairs of their bondpoints; so
+building a long duplex took minutes. Used by it when
+pref_dna_duplex_from_templates is enabled.
+
+Implementation notes:
+
+A BasePairTemplate holds the atoms (atomtypes, positions, dna info)
+and bonds (with bond orders and directions) of one base-pair mmp file.
+The atom positions of all the base-pairs made from one template are
+computed at once by the same helical transform as
+Dna._rotateTranslateXYZ.
+
+Since consecutive base-pairs always have the same relative transform,
+the bondpoints which Dna.fuseBasePairChunks would bond between two
+consecutive base-pairs made from given templates are found once (with
+the same tolerance test as fusechunksBase.find_bondable_pairs), and
+their atoms are bonded directly (with the bond direction that
+bond_atoms would give that bond); those bondpoints are never made.
+"""
+
+import Numeric
+from Numeric import Float
+
+from files.mmp.files_mmp import readmmp
+from command_support.GeneratorBaseClass import PluginBug
+
+from model.chem import Atom
+from model.chunk import Chunk
+from model.bonds import bond_atoms_faster
+
+# ==
+
+class BasePairTemplate:
+    """
+    The atoms and bonds of a base-pair (or base) read from an mmp file,
+    in the order of that file.
+
+    @ivar atomtypes: list of the atomtypes of the atoms.
+    @ivar positions: N x 3 array of their positions.
+    @ivar dnaBaseNames: list of their dnaBaseNames ("" if none).
+    @ivar strandIds: list of their dnaStrandId_for_generators ("" if none).
+    @ivar bonds: list of (i, j, v6, direction) for each bond, where i and j
+                 are atom indices and direction is the bond direction from
+                 atom i (0 if none).
+    @ivar bondpoints: dict from the index of each bondpoint to
+                      (index of its base atom, v6, bond direction from its
+                      base atom).
+    """
+    def __init__(self, assy, filename):
+        """
+        Read the atoms and bonds from the given mmp file
+        (using assy to read it, but not adding anything to it).
+        """
+        try:
+            ok, grouplist = readmmp(assy, filename, isInsert = True)
+        except IOError:
+            raise PluginBug("Cannot read file: " + filename)
+        if not grouplist:
+            raise PluginBug("No atoms in DNA base? " + filename)
+        viewdata, mainpart, shelf = grouplist
+        atoms = []
+        for member in mainpart.members:
+            atoms.extend(member.atoms_in_mmp_file_order())
+        index = {}
+        for atom in atoms:
+            index[atom.key] = len(index)
+        self.atomtypes = [atom.atomtype for atom in atoms]
+        self.positions = Numeric.array([atom.posn() for atom in atoms], Float)
+        self.dnaBaseNames = [atom.getDnaBaseName() or "" for atom in atoms]
+        self.strandIds = [atom.getDnaStrandId_for_generators() or ""
+                          for atom in atoms]
+        self.bonds = []
+        self.bondpoints = {}
+        for atom in atoms:
+            for bond in atom.bonds:
+                if bond.atom1 is not atom:
+                    continue # record each bond once
+                i, j = index[bond.atom1.key], index[bond.atom2.key]
+                direction = bond._direction
+                self.bonds.append( (i, j, bond.v6, direction) )
+                if bond.atom2.is_singlet():
+                    self.bondpoints[j] = (i, bond.v6, direction)
+                elif bond.atom1.is_singlet():
+                    self.bondpoints[i] = (j, bond.v6, - direction)
+        # Clean up.
+        del viewdata
+        for member in mainpart.members[:]:
+            member.kill()
+        shelf.kill()
+        return
+
+    def transformed_positions(self, thetas, zs, position):
+        """
+        Return a K x N x 3 array of the positions of our atoms after each
+        of K transforms like Dna._rotateTranslateXYZ(v, thetas[k], zs[k]),
+        plus position.
+        """
+        thetas = Numeric.array(thetas, Float)
+        c = Numeric.reshape(Numeric.cos(thetas), (-1, 1))
+        s = Numeric.reshape(Numeric.sin(thetas), (-1, 1))
+        x, y, z = self.positions[:,0], self.positions[:,1], self.positions[:,2]
+        res = Numeric.zeros((len(thetas), len(x), 3), Float)
+        res[:,:,0] = c * x + s * y + position[0]
+        res[:,:,1] = - s * x + c * y + position[1]
+        res[:,:,2] = z + Numeric.reshape(Numeric.array(zs, Float), (-1, 1)) + position[2]
+        return res
+
+    pass # end of class BasePairTemplate
+
+_templates = {} # maps mmp filename to BasePairTemplate
+
+def base_pair_template(assy, filename):
+    """
+    Return the BasePairTemplate for the given mmp file,
+    reading it only the first time.
+    """
+    try:
+        return _templates[filename]
+    except KeyError:
+        res = _templates[filename] = BasePairTemplate(assy, filename)
+        return res
+    pass
+
+# ==
+
+def _junction(template1, template2, dtheta, dz, tol):
+    """
+    Return a list of (bp1, bp2) for the pairs of bondpoints (given by
+    atom index) of template1 and of template2 transformed by dtheta and dz
+    (relative to template1) which are within tol of each other, and which
+    have no other such bondpoint (as for fusechunksBase.make_bonds).
+    """
+    p1 = template1.positions
+    p2 = template2.transformed_positions([dtheta], [dz], (0.0, 0.0, 0.0))[0]
+    bps1 = template1.bondpoints.keys()
+    bps1.sort()
+    bps2 = template2.bondpoints.keys()
+    bps2.sort()
+    pairs = []
+    ways = {}
+    for bp2 in bps2:
+        for bp1 in bps1:
+            diff = p2[bp2] - p1[bp1]
+            if Numeric.dot(diff, diff) ** 0.5 <= tol:
+                pairs.append( (bp1, bp2) )
+                ways[(1, bp1)] = ways.get((1, bp1), 0) + 1
+                ways[(2, bp2)] = ways.get((2, bp2), 0) + 1
+    return [(bp1, bp2) for bp1, bp2 in pairs
+            if ways[(1, bp1)] == 1 and ways[(2, bp2)] == 1]
+
+_junctions = {}
+
+def junction(template1, template2, dtheta, dz, tol):
+    """
+    Cached version of _junction (for transforms which differ only by
+    roundoff error).
+    """
+    key = (id(template1), id(template2), round(dtheta, 6), round(dz, 6), tol)
+    try:
+        return _junctions[key]
+    except KeyError:
+        res = _junctions[key] = _junction(template1, template2, dtheta, dz, tol)
+        return res
+    pass
+
+# ==
+
+def make_raw_duplex(assy, subgroup, basefiles, thetas, zs, position,
+                    fuseTolerance = 1.5):
+    """
+    Make the atoms and bonds of a raw DNA duplex with one base-pair from
+    the mmp file basefiles[i], transformed as in
+    Dna._rotateTranslateXYZ(v, thetas[i], zs[i]) plus position, for each
+    i, bonded to each other as Dna.fuseBasePairChunks would, in chunks
+    added to subgroup. Return the list of those chunks: the first and
+    last base-pairs are in their own chunks (so they are the first and
+    last chunks, as Dna._postProcess expects), and the other base-pairs
+    are all in one chunk.
+    """
+    n = len(basefiles)
+    templates = [base_pair_template(assy, filename) for filename in basefiles]
+    # compute the positions of all the base-pairs of each template at once
+    positions = [None] * n
+    indices = {}
+    for i in range(n):
+        indices.setdefault(basefiles[i], []).append(i)
+    for filename, ii in indices.items():
+        tpos = templates[ii[0]].transformed_positions(
+            [thetas[i] for i in ii], [zs[i] for i in ii], position)
+        for k in range(len(ii)):
+            positions[ii[k]] = tpos[k]
+    junctions = [junction(templates[i], templates[i+1],
+                          thetas[i+1] - thetas[i], zs[i+1] - zs[i],
+                          fuseTolerance)
+                 for i in range(n - 1)]
+    # chunks
+    if n <= 2:
+        chunks = [Chunk(assy, "BasePairChunk") for i in range(n)]
+    else:
+        chunks = [Chunk(assy, "BasePairChunk") for i in range(3)]
+    def chunk_for(i):
+        if i == 0:
+            return chunks[0]
+        elif i == n - 1:
+            return chunks[-1]
+        return chunks[1]
+    # atoms and bonds within each base-pair
+    pair_atoms = []
+    for i in range(n):
+        template = templates[i]
+        mol = chunk_for(i)
+        skip = {}
+        if i > 0:
+            for bp1, bp2 in junctions[i-1]:
+                skip[bp2] = 1
+        if i < n - 1:
+            for bp1, bp2 in junctions[i]:
+                skip[bp1] = 1
+        atoms = [None] * len(template.atomtypes)
+        pos = positions[i]
+        for k in range(len(atoms)):
+            if k in skip:
+                continue
+            atom = atoms[k] = Atom(template.atomtypes[k], pos[k], mol)
+            if template.dnaBaseNames[k]:
+                atom.setDnaBaseName(template.dnaBaseNames[k])
+            if template.strandIds[k]:
+                atom.setDnaStrandId_for_generators(template.strandIds[k])
+        for k1, k2, v6, direction in template.bonds:
+            if k1 in skip or k2 in skip:
+                continue
+            bond = bond_atoms_faster(atoms[k1], atoms[k2], v6)
+            if direction:
+                bond.set_bond_direction_from(atoms[k1], direction)
+        pair_atoms.append(atoms)
+    # bonds between consecutive base-pairs, in the same order and with the
+    # same bond directions as bond_at_singlets would make them
+    for i in range(n - 1):
+        template1, template2 = templates[i], templates[i+1]
+        for bp1, bp2 in junctions[i]:
+            k1, v1, dir1 = template1.bondpoints[bp1]
+            k2, v2, dir2 = template2.bondpoints[bp2]
+            atom1 = pair_atoms[i][k1]
+            atom2 = pair_atoms[i+1][k2]
+            want_dir = 0
+            if atom1.element.bonds_can_be_directional and \
+               atom2.element.bonds_can_be_directional:
+                want_dir2 = atom2.desired_new_real_bond_direction() or dir2
+                want_dir1 = atom1.desired_new_real_bond_direction() or dir1
+                want_dir = max(-1, min(1, want_dir2 - want_dir1))
+            bond = bond_atoms_faster(atom2, atom1, min(v1, v2))
+            if want_dir:
+                bond.set_bond_direction_from(atom2, want_dir)
+    for mol in chunks:
+        subgroup.addchild(mol)
+    return chunks
+
+# ==
+
+def _make_raw_duplex_for_benchmark(assy, dnaClass, numberOfBasePairs,
+                                   from_templates):
+    """
+    Make a raw duplex of the given Dna subclass in a new Group (not added
+    to assy's model tree), and return (that group, the time taken).
+    """
+    import time
+    from foundation.Group import Group
+    dna = dnaClass()
+    dna.assy = assy
+    dna.baseList = []
+    dna.axis_atom_end1 = None
+    dna.strandA_atom_end1 = None
+    dna.setNumberOfBasePairs(numberOfBasePairs)
+    group = Group("benchmark duplex", assy, None)
+    t0 = time.time()
+    dna._create_raw_duplex(group,
+                           numberOfBasePairs,
+                           dna.getBasesPerTurn(),
+                           dna.getBaseRise(),
+                           from_templates = from_templates)
+    return group, time.time() - t0
+
+def _counts(group):
+    """
+    Return (element symbol counts, number of bonds, number of directional
+    bonds with a direction set) for the atoms in the chunks in group.
+    """
+    elements = {}
+    nbonds = ndirs = 0
+    for mol in group.members:
+        for atom in mol.atoms.itervalues():
+            sym = atom.element.symbol
+            elements[sym] = elements.get(sym, 0) + 1
+            for bond in atom.bonds:
+                if bond.atom1 is atom:
+                    nbonds += 1
+                    if bond._direction:
+                        ndirs += 1
+    return elements, nbonds, ndirs
+
+def _same_atoms(group1, group2, tol = 0.001):
+    """
+    Do the atoms in the chunks in group1 and group2 have the same
+    elements at the same positions (within tol), in some order?
+    (Compares every pair of atoms, so only use this for small groups.)
+    """
+    def atoms(group):
+        res = []
+        for mol in group.members:
+            res.extend([(atom.element.symbol, atom.posn())
+                        for atom in mol.atoms.itervalues()])
+        return res
+    atoms1 = atoms(group1)
+    atoms2 = atoms(group2)
+    if len(atoms1) != len(atoms2):
+        return False
+    for sym1, pos1 in atoms1:
+        for i in range(len(atoms2)):
+            sym2, pos2 = atoms2[i]
+            if sym1 == sym2 and max(abs(pos1 - pos2)) <= tol:
+                del atoms2[i]
+                break
+        else:
+            return False
+    return True
+
+def _benchmark(assy, numberOfBasePairs = 10000, compare = 1000,
+               compare_atoms = 20):
+    """
+    Print the time to make raw PAM3 and PAM5 B-DNA duplexes of the given
+    number of base-pairs from templates, and of the given smaller number
+    of base-pairs both ways (checking that the results agree, and for
+    compare_atoms base-pairs, that their atoms have the same elements
+    and positions).
+
+    Must be run inside NE1, with its main assy (e.g. from a debug menu
+    command), since reading mmp files requires that; nothing is added
+    to assy's model tree.
+    """
+    from dna.commands.BuildDuplex.DnaDuplex import B_Dna_PAM3, B_Dna_PAM5
+    for dnaClass in (B_Dna_PAM3, B_Dna_PAM5):
+        name = dnaClass.__name__
+        if compare_atoms:
+            old, told = _make_raw_duplex_for_benchmark(assy, dnaClass,
+                                                       compare_atoms, False)
+            new, tnew = _make_raw_duplex_for_benchmark(assy, dnaClass,
+                                                       compare_atoms, True)
+            assert _same_atoms(old, new)
+            old.kill()
+            new.kill()
+        if compare:
+            old, told = _make_raw_duplex_for_benchmark(assy, dnaClass,
+                                                       compare, False)
+            new, tnew = _make_raw_duplex_for_benchmark(assy, dnaClass,
+                                                       compare, True)
+            assert _counts(old) == _counts(new)
+            print "%s, %d base-pairs: %.2f sec fused, %.2f sec from templates" % \
+                  (name, compare, told, tnew)
+            old.kill()
+            new.kill()
+        group, t = _make_raw_duplex_for_benchmark(assy, dnaClass,
+                                                  numberOfBasePairs, True)
+        elements, nbonds, ndirs = _counts(group)
+        print "%s, %d base-pairs from templates: %d atoms, %d bonds in %.2f sec" % \
+              (name, numberOfBasePairs, sum(elements.values()), nbonds, t)
+        group.kill()
+    return
+
+# end
@@ -147,7 +147,8 @@ class Dna:
             for member in mainpart.members:
                 # 'member' is a chunk containing a set of base-pair atoms.
                 for atm in member.atoms.values():
-                    atm._posn = tfm(atm._posn) + position
+                    atm._setposn_no_chunk_or_bond_invals( tfm(atm._posn) + position)
+                        # (not atm._posn = ..., which would be hidden by an AtomStore)
                     if atm.element.symbol in ('Se3', 'Ss3', 'Ss5'):
                         if atm.getDnaBaseName() == "a":
                             baseLetter = currentBaseLetter
@@ -668,10 +668,13 @@ class DnaLadder(object, DnaLadder_pam_conversion_methods):
 
     # == ladder-merge methods
     
-    def can_merge(self):
+    def can_merge(self, permitted_ladders = None):
         """
         Is self valid, and mergeable (end-end) with another valid ladder?
 
+        @param permitted_ladders: if not None, a dict whose keys are the
+                                  ids of the only ladders we may merge with.
+
         @return: If no merge is possible, return None; otherwise, for one
                  possible merge (chosen arbitrarily if more than one is
                  possible), return the tuple (other_ladder, merge_info)
@@ -682,6 +685,9 @@ class DnaLadder(object, DnaLadder_pam_conversion_methods):
         for end in LADDER_ENDS:
             other_ladder_and_merge_info = self._can_merge_at_end(end) # might be None
             if other_ladder_and_merge_info:
+                if permitted_ladders is not None and \
+                   not permitted_ladders.has_key(id(other_ladder_and_merge_info[0])):
+                    continue
                 return other_ladder_and_merge_info
         return None
     
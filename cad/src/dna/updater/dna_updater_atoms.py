@@ -28,6 +28,8 @@ from dna.updater.dna_updater_prefs import pref_permit_bare_axis_atoms
 
 from dna.updater.fix_bond_directions import fix_local_bond_directions
 
+from dna.updater.dna_updater_stats import stage_done
+
 ##from dna.updater.convert_from_PAM5 import convert_from_PAM5
 
 # ==
@@ -72,6 +74,8 @@ def update_PAM_atoms_and_bonds(changed_atoms):
 
     ignore_new_changes( "from fixing atom & bond classes")
 
+    stage_done("fix_atom_classes")
+
     # ==
     
     # fix deprecated elements, and the classes of any new objects this creates
@@ -113,6 +117,8 @@ def update_PAM_atoms_and_bonds(changed_atoms):
         
         ignore_new_changes( "from fixing classes after fixing deprecated elements")
 
+    stage_done("fix_deprecated_elements")
+
     # ==
 
     # delete bare atoms (axis atoms without strand atoms, or vice versa).
@@ -138,6 +144,8 @@ def update_PAM_atoms_and_bonds(changed_atoms):
                 print "dna_updater: will scan %d new changes from delete_bare_atoms" % len(new_atoms)    
             changed_atoms.update( new_atoms )
 
+        stage_done("delete_bare_atoms")
+
     # ==
 
     # Fix local directional bond issues:
@@ -167,6 +175,8 @@ def update_PAM_atoms_and_bonds(changed_atoms):
             print "dna_updater: will scan %d new changes from fix_local_bond_directions" % len(new_atoms)    
         changed_atoms.update( new_atoms )
 
+    stage_done("fix_local_bond_directions")
+
     # ==
     
     remove_killed_atoms( changed_atoms)
@@ -35,6 +35,10 @@ from dna.updater.dna_updater_ladders import dissolve_or_fragment_invalid_ladders
 from dna.updater.dna_updater_ladders import make_new_ladders, merge_and_split_ladders
 
 from dna.updater.dna_updater_prefs import pref_dna_updater_convert_to_PAM3plus5
+from dna.updater.dna_updater_prefs import pref_dna_updater_incremental
+
+from dna.updater.dna_updater_stats import stage_done
+from dna.updater.dna_updater_stats import count_objects
 
 from utilities.constants import MODEL_PAM3, MODEL_PAM5
 
@@ -70,6 +74,10 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
 
     ignore_new_changes("as update_PAM_chunks starts", changes_ok = False )
 
+    incremental = pref_dna_updater_incremental()
+        # (see its comments; only affects ladder merging and wholechain
+        #  making, below)
+
     # Move each DnaMarker in which either atom got killed or changed in
     # structure (e.g. rebonded) onto atoms on the same old wholechain
     # (if it has one) which remain alive. We don't yet know if they'll
@@ -122,6 +130,8 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     ignore_new_changes("from moving DnaMarkers")
         # ignore changes caused by adding/removing marker jigs
         # to their atoms, when the jigs die/move/areborn
+
+    stage_done("move DnaMarkers")
     
     # make sure invalid DnaLadders are recognized as such in the next step,
     # and dissolved [possible optim: also recorded for later destroy??].
@@ -159,11 +169,17 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     # small chains about them.)
 
     ignore_new_changes("from dissolve_or_fragment_invalid_ladders", changes_ok = False)
+
+    stage_done("dissolve_or_fragment_invalid_ladders")
+    count_objects("atoms rescanned", len(changed_atoms))
     
     axis_chains, strand_chains = find_axis_and_strand_chains_or_rings( changed_atoms)
 
     ignore_new_changes("from find_axis_and_strand_chains_or_rings", changes_ok = False )
 
+    stage_done("find_axis_and_strand_chains_or_rings")
+    count_objects("chains found", len(axis_chains) + len(strand_chains))
+
     if debug_flags.DNA_UPDATER_SLOW_ASSERTS:
         assert_unique_chain_baseatoms(axis_chains + strand_chains)
     
@@ -191,6 +207,9 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     
     ignore_new_changes("from make_new_ladders", changes_ok = False)
 
+    stage_done("make_new_ladders")
+    count_objects("new ladders", len(all_new_unmerged_ladders))
+
     if debug_flags.DNA_UPDATER_SLOW_ASSERTS:
         assert_unique_ladder_baseatoms( all_new_unmerged_ladders)
 
@@ -214,6 +233,7 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     if default_pam or _f_baseatom_wants_pam:
         #bruce 080523 optim: don't always call this
         _do_pam_conversions( default_pam, all_new_unmerged_ladders )
+        stage_done("PAM conversions")
     
     if _f_invalid_dna_ladders:
         #bruce 080413
@@ -232,7 +252,8 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     # merge axis ladders (ladders with an axis, and 1 or 2 strands)
     
     merged_axis_ladders = merge_and_split_ladders( new_axis_ladders,
-                                                   debug_msg = "axis" )
+                                                   debug_msg = "axis",
+                                                   merge_with_old = not incremental )
         # note: each returned ladder is either entirely new (perhaps merged),
         # or the result of merging new and old ladders.
 
@@ -244,7 +265,8 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     # (note: not possible for an axis and singlestrand ladder to merge)
     
     merged_singlestrand_ladders = merge_and_split_ladders( new_singlestrand_ladders,
-                                                           debug_msg = "single strand" )
+                                                           debug_msg = "single strand",
+                                                           merge_with_old = not incremental )
         # not sure if singlestrand merge is needed; split is useful though
 
     ignore_new_changes("from merging/splitting singlestrand ladders", changes_ok = False)
@@ -261,6 +283,9 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     if debug_flags.DNA_UPDATER_SLOW_ASSERTS:
         assert_unique_ladder_baseatoms( merged_ladders)
 
+    stage_done("merge_ladders")
+    count_objects("merged ladders", len(merged_ladders))
+
     # Now make or remake chunks as needed, so that each ladder-rail is a chunk.
     # This must be done to all newly made or merged ladders (even if parts are old).
 
@@ -283,6 +308,9 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
         # (changes are from parent chunk of atoms changing;
         #  _f_reposition_baggage shouldn't cause any [#test, using separate loop])
 
+    stage_done("remake_chunks")
+    count_objects("chunks remade", len(all_new_chunks))
+
     # Now make new wholechains on all merged_ladders,
     # let them own their atoms and markers (validating any markers found,
     # moved or not, since they may no longer be on adjacent atoms on same wholechain),
@@ -348,6 +376,7 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
                 #   to do that either in the above method which sets them,
                 #   or in later code which makes them consistent. (As of 080602
                 #   it's now done in the above method which sets them.)
+            count_objects("rails rescanned for neighbors", 1)
             for neighbor_baseatom in rail.neighbor_baseatoms:
                 if neighbor_baseatom is not None:
                     rail1 = _find_rail_of_atom( neighbor_baseatom, ladder_to_rails_function )
@@ -379,6 +408,9 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
     if debug_flags.DNA_UPDATER_SLOW_ASSERTS:
         assert_unique_wholechain_baseatoms(new_wholechains)
 
+    stage_done("make wholechains")
+    count_objects("wholechains made", len(new_wholechains))
+
     # The new WholeChains should have found and fully updated (or killed)
     # all markers we had to worry about. Assert this -- but only with a
     # debug print, since I might be wrong (e.g. for markers on oldchains
@@ -410,6 +442,8 @@ def update_PAM_chunks( changed_atoms, homeless_markers):
         # to their atoms, when the jigs die/move/areborn
         # (in this case, they don't move, but they can die or be born)
 
+    stage_done("own markers")
+
     # TODO: use wholechains and markers to revise base indices if needed
     # (if this info is cached outside of wholechains)
 
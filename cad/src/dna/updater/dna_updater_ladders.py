@@ -24,6 +24,8 @@ from dna.model.dna_model_constants import MAX_LADDER_LENGTH
 
 from model.elements import Pl5
 
+from dna.updater.dna_updater_stats import count_objects
+
 # ==
 
 def dissolve_or_fragment_invalid_ladders( changed_atoms):
@@ -93,6 +95,8 @@ def dissolve_or_fragment_invalid_ladders( changed_atoms):
 
     invalid_ladders = _f_get_invalid_dna_ladders()
 
+    count_objects("ladders dissolved", len(invalid_ladders))
+
     # now that we grabbed invalid ladders, and callers will make new valid
     # ones soon, any uncontrolled/unexpected inval of ladders is a bug --
     # so make it an error except for specific times when we temporarily
@@ -402,11 +406,16 @@ def make_new_ladders(axis_chains, strand_chains):
 
 # ==
 
-def merge_ladders(new_ladders):
+def merge_ladders(new_ladders, merge_with_old = True):
     """
     Merge end-to-end-connected ladders (new/new or new/old) into larger
     ones, when that doesn't make the resulting ladders too long.
 
+    @param merge_with_old: if False, only merge new ladders with each other
+                           (or with ladders made from them by merging),
+                           never with old ladders, so that old ladders
+                           (and their chunks) don't need to be remade.
+
     @return: list of merged (or new and unable to be merged) ladders
 
     @note: each returned ladder is either entirely new (perhaps merged
@@ -422,6 +431,13 @@ def merge_ladders(new_ladders):
     #  with chunks.)
     
     res = [] # collects ladders that can't be merged
+
+    if merge_with_old:
+        permitted_ladders = None # merge with any ladder
+    else:
+        permitted_ladders = {} # id(ladder) -> ladder, for ladders new in this call
+        for ladder in new_ladders:
+            permitted_ladders[id(ladder)] = ladder
     
     while new_ladders: # has ladders untested for can_merge
         
@@ -446,7 +462,7 @@ def merge_ladders(new_ladders):
                 # just skip it (not an error, as explained above)
                 pass
             else:
-                can_merge_info = ladder.can_merge() # (at either end)
+                can_merge_info = ladder.can_merge(permitted_ladders) # (at either end)
                 if can_merge_info:
                     merged_ladder = ladder.do_merge(can_merge_info)
                         # note: this invals the old ladders, one of which is
@@ -460,6 +476,8 @@ def merge_ladders(new_ladders):
                     assert not ladder.valid
                     assert merged_ladder.valid
                     next.append(merged_ladder)
+                    if permitted_ladders is not None:
+                        permitted_ladders[id(merged_ladder)] = merged_ladder
                 else:
                     res.append(ladder)
         new_ladders = next
@@ -480,7 +498,7 @@ def split_ladders(ladders): # STUB but should cause no harm @@@@
             res.append(ladder)
     return res
 
-def merge_and_split_ladders(ladders, debug_msg = ""):
+def merge_and_split_ladders(ladders, debug_msg = "", merge_with_old = True):
     """
     See docstrings of merge_ladders and split_ladders
     (which this does in succession).
@@ -488,10 +506,12 @@ def merge_and_split_ladders(ladders, debug_msg = ""):
     @param ladders: list of 0 or more new DnaLadders
     
     @param debug_msg: string for debug prints
+
+    @param merge_with_old: passed to merge_ladders
     """
     len1 = len(ladders) # only for debug prints
     
-    ladders = merge_ladders(ladders)
+    ladders = merge_ladders(ladders, merge_with_old)
     
     len2 = len(ladders)
     
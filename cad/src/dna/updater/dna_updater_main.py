@@ -29,6 +29,13 @@ from dna.updater.dna_updater_groups import update_DNA_groups
 from dna.updater.dna_updater_debug import debug_prints_as_dna_updater_starts
 from dna.updater.dna_updater_debug import debug_prints_as_dna_updater_ends
 
+from dna.updater.dna_updater_prefs import pref_dna_updater_incremental
+
+from dna.updater.dna_updater_stats import begin_run_stats
+from dna.updater.dna_updater_stats import end_run_stats
+from dna.updater.dna_updater_stats import stage_done
+from dna.updater.dna_updater_stats import count_objects
+
 from dna.model.DnaMarker import _f_are_there_any_homeless_dna_markers
 from dna.model.DnaMarker import _f_get_homeless_dna_markers
 
@@ -61,11 +68,13 @@ def full_dna_update():
     global _runcount
     _runcount += 1
     clear_updater_run_globals()
+    begin_run_stats( _runcount, pref_dna_updater_incremental())
     try:
         _full_dna_update_0( _runcount) # includes debug_prints_as_dna_updater_starts
     finally:
         debug_prints_as_dna_updater_ends( _runcount)
         clear_updater_run_globals()
+        end_run_stats() # timings and counts, see dna_updater_stats.py
     return
 
 def _full_dna_update_0( _runcount):
@@ -92,6 +101,8 @@ def _full_dna_update_0( _runcount):
         # note: adding marker check (2 places) fixed bug 2673 [bruce 080317]
         return # optimization (might not be redundant with caller)
 
+    count_objects("changed atoms", len(changed_atoms))
+
     # print debug info about the set of changed_atoms (and markers needing update)
     if debug_flags.DEBUG_DNA_UPDATER_MINIMAL:
         print "\ndna updater: %d changed atoms to scan%s" % \
@@ -118,9 +129,12 @@ def _full_dna_update_0( _runcount):
             # This should remove all remaining atoms from closed files.
             # Note: only allowed when no killed atoms are present in changed_atoms;
             # raises exceptions otherwise.
+
+    stage_done("remove killed or closed atoms")
         
     if changed_atoms:
         update_PAM_atoms_and_bonds( changed_atoms)
+            # (records its own stages)
             # this can invalidate DnaLadders as it changes various things
             # which call atom._changed_structure -- that's necessary to allow,
             # so we don't change dnaladder_inval_policy until below,
@@ -155,6 +169,7 @@ def _full_dna_update_0( _runcount):
     # review: if not new_chunks, return? wait and see if there are also new_markers, etc...
     
     update_DNA_groups( new_chunks, new_wholechains)
+    stage_done("update_DNA_groups")
         # review:
         # args? a list of nodes, old and new, whose parents should be ok? or just find them all, scanning MT?
         # the underlying nodes we need to place are just chunks and jigs. we can ignore old ones...
@@ -47,6 +47,9 @@ def initialize_prefs():
 
     pref_fix_after_readmmp_before_updaters()
     pref_fix_after_readmmp_after_updaters()
+
+    pref_dna_updater_incremental()
+    pref_print_dna_updater_stats()
     
     _update_our_debug_flags('arbitrary value')
         # makes them appear in the menu,
@@ -222,6 +225,29 @@ def pref_fix_after_readmmp_after_updaters():
 
 # ==
 
+def pref_dna_updater_incremental():
+    # When True, ladders are only merged with other ladders made in the
+    # same updater run (never with untouched old ones, which would remake
+    # their chunks). This makes an edit's cost in merging and chunk remaking
+    # depend on the ladders it touches rather than on their neighbors
+    # (wholechains are still remade from every rail), at the price
+    # of leaving shorter ladders (and more chunks) after many edits.
+    res = debug_pref("DNA: incremental updater?",
+                     Choice_boolean_False,
+                     ## non_debug = True,
+                     prefs_key = True )
+    return res
+
+def pref_print_dna_updater_stats():
+    # see dna_updater_stats.py
+    res = debug_pref("DNA: updater: print timings and counts?",
+                     Choice_boolean_False,
+                     non_debug = True,
+                     prefs_key = True )
+    return res
+
+# ==
+
 def pref_debug_dna_updater(): # 080228; note: accessed using flags matching debug_flags.DEBUG_DNA_UPDATER*
     res = debug_pref("DNA: updater debug prints",
                      Choice(["off", "minimal", "on", "verbose"],
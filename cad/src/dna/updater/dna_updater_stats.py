@@ -0,0 +1,148 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+dna_updater_stats.py -- per-stage timings and object counts
+for each dna updater run
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written to measure the cost of the dna updater after each user edit,
+and to compare its incremental and non-incremental modes
+(see pref_dna_updater_incremental).
+
+Usage:
+
+full_dna_update brackets each run with begin_run_stats and end_run_stats;
+in between, the updater stages call stage_done and count_objects, which
+are noops outside of an updater run. After a run, last_run_stats()
+returns its DnaUpdaterRunStats (e.g. for a benchmark or a debugger),
+and if pref_print_dna_updater_stats is set, a summary is printed.
+"""
+
+import time
+
+from dna.updater.dna_updater_prefs import pref_print_dna_updater_stats
+
+# ==
+
+class DnaUpdaterRunStats:
+    """
+    Timings (in seconds) of the stages of one dna updater run,
+    and counts of the objects it touched.
+    """
+    def __init__(self, runcount, incremental = False):
+        self.runcount = runcount
+        self.incremental = incremental
+        self.stages = [] # list of (stage name, seconds), in the order run
+        self.counts = {} # maps counter name -> number of objects
+        self.seconds = 0.0 # total elapsed time, set by finish
+        self._start_time = self._last_time = time.time()
+        return
+
+    def stage_done(self, name):
+        """
+        Record that the stage of the given name just ended
+        (and began when the prior one ended).
+        """
+        now = time.time()
+        self.stages.append( (name, now - self._last_time) )
+        self._last_time = now
+        return
+
+    def count_objects(self, name, number):
+        self.counts[name] = self.counts.get(name, 0) + number
+        return
+
+    def finish(self):
+        self.seconds = time.time() - self._start_time
+        return
+
+    def stage_seconds(self, name):
+        """
+        Return the total time spent in stages of the given name
+        (0.0 if there were none).
+        """
+        res = 0.0
+        for name1, seconds in self.stages:
+            if name1 == name:
+                res += seconds
+        return res
+
+    def summary(self):
+        """
+        Return a multiline string describing our timings and counts.
+        """
+        mode = self.incremental and "incremental" or "full"
+        lines = ["dna updater run %d (%s): %.4f sec" % \
+                 (self.runcount, mode, self.seconds)]
+        for name, seconds in self.stages:
+            lines.append("  %-40s %.4f sec" % (name, seconds))
+        items = self.counts.items()
+        items.sort()
+        for name, number in items:
+            lines.append("  %-40s %d" % (name, number))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return "<%s for run %d: %.4f sec, %d stages>" % \
+               (self.__class__.__name__, self.runcount,
+                self.seconds, len(self.stages))
+
+    pass
+
+# ==
+
+_current_stats = None # DnaUpdaterRunStats for the run in progress, or None
+
+_last_stats = None # DnaUpdaterRunStats for the most recent finished run, or None
+
+def begin_run_stats(runcount, incremental = False):
+    global _current_stats
+    _current_stats = DnaUpdaterRunStats(runcount, incremental)
+    return _current_stats
+
+def end_run_stats():
+    """
+    Finish recording the current run, making it available as
+    last_run_stats(), and print its summary if the pref says to.
+    """
+    global _current_stats, _last_stats
+    stats = _current_stats
+    _current_stats = None
+    if stats is None:
+        return
+    stats.finish()
+    _last_stats = stats
+    if pref_print_dna_updater_stats():
+        print stats.summary()
+    return
+
+def stage_done(name):
+    """
+    If a dna updater run is in progress, record that its stage
+    of the given name just ended.
+    """
+    if _current_stats is not None:
+        _current_stats.stage_done(name)
+    return
+
+def count_objects(name, number):
+    """
+    If a dna updater run is in progress, add number to its count
+    of the given name (e.g. "ladders dissolved").
+    """
+    if _current_stats is not None:
+        _current_stats.count_objects(name, number)
+    return
+
+def last_run_stats():
+    """
+    Return the DnaUpdaterRunStats of the most recently finished
+    dna updater run, or None if there has been none.
+    """
+    return _last_stats
+
+# end
@@ -0,0 +1,413 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+frame_cache.py -- a memory-bounded LRU cache of decoded movie frames,
+and a thread which fills it ahead of movie playback.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for alist_and_moviefile.play_frame (in simulation/movie.py),
+which used to decode every frame on the GUI thread, as it was played,
+from whichever frames its moviefile happened to have cached (none of
+which were bounded by a memory budget).
+
+Usage:
+
+A FrameCache holds absolute frames (N x 3 Numeric arrays of atom
+positions, which nothing may modify once they're cached), keyed by
+frame index, evicting the least recently used ones to stay within its
+budget (in bytes). It counts hits, misses, and the time spent decoding
+frames, on the GUI thread or in the prefetcher.
+
+A FramePrefetcher is a thread with its own moviefile object (for the
+same file), so it never shares a moviefile's file pointer or cached
+frames with the GUI thread. Each time the GUI thread plays a frame it
+calls prefetch(current, stop, step), and the thread decodes the next
+frames in that direction (FWD or REV, with the given frame skip), up to
+lookahead frames ahead of current, into the cache.
+
+Implementation notes:
+
+Both threads decode frames with decode_frame, which starts from
+whichever frame is nearest: one known to the moviefile, or one in the
+cache. So after the GUI thread jumps (e.g. when the slider is moved),
+the prefetcher doesn't have to scan from its own last frame, and vice
+versa.
+
+Numeric operations hold the interpreter lock, so the prefetcher mainly
+helps by reading the file, and by decoding frames while the GUI thread
+waits for events or for OpenGL, rather than by using another processor.
+"""
+
+import threading
+import time
+
+from utilities.debug import print_compact_traceback
+
+_DEFAULT_FRAME_CACHE_BUDGET = 128 * 1024 * 1024 # bytes
+
+_DEFAULT_LOOKAHEAD = 32 # frames
+
+_BYTES_PER_ATOM = 3 * 8 # in a frame (an N x 3 Numeric Float array)
+
+def frame_bytes(frame):
+    """
+    Return the memory used by frame.
+    """
+    return len(frame) * _BYTES_PER_ATOM
+
+class FrameCache:
+    """
+    A thread-safe LRU cache of immutable absolute frames, limited to
+    budget bytes (though it always keeps the most recent frame).
+    See module docstring for details.
+    """
+    def __init__(self, budget = _DEFAULT_FRAME_CACHE_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._frames = {} # frame index -> frame
+        self._last_used = {} # frame index -> value of self._use_counter
+        self._use_counter = 0
+        self._nbytes = 0
+        self.clear_stats()
+        return
+
+    def clear_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decoded = 0 # frames decoded on the GUI thread
+        self.decode_time = 0.0
+        self.prefetched = 0 # frames decoded by a FramePrefetcher
+        self.prefetch_time = 0.0
+        return
+
+    def __len__(self):
+        return len(self._frames)
+
+    def max_frames(self, natoms):
+        """
+        Return the number of frames of natoms atoms that fit in our
+        budget (at least 1).
+        """
+        return max(1, self.budget / max(1, natoms * _BYTES_PER_ATOM))
+
+    def lookahead(self, natoms):
+        """
+        Return how many frames of natoms atoms a FramePrefetcher should
+        decode ahead of the one being played, leaving room in our budget
+        for frames already played (for playing them again, e.g. in REV).
+        """
+        return max(1, min(_DEFAULT_LOOKAHEAD, self.max_frames(natoms) / 2))
+
+    def get(self, n):
+        """
+        Return the cached frame n (which the caller must not modify),
+        or None, counting this as a hit or miss.
+        """
+        self._lock.acquire()
+        try:
+            frame = self._frames.get(n)
+            if frame is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._touch(n)
+            return frame
+        finally:
+            self._lock.release()
+
+    def peek(self, n):
+        """
+        Like get, but don't count this or mark frame n as recently used.
+        """
+        return self._frames.get(n)
+
+    def has_frame(self, n):
+        return self._frames.has_key(n)
+
+    def nearest(self, n):
+        """
+        Return the index of the cached frame nearest to frame n,
+        or None if we have no frames.
+        """
+        self._lock.acquire()
+        try:
+            if not self._frames:
+                return None
+            items = [(abs(n - n0), n0) for n0 in self._frames.keys()]
+            return min(items)[1]
+        finally:
+            self._lock.release()
+
+    def put(self, n, frame, seconds = 0.0, prefetched = False):
+        """
+        Cache frame n (which nobody may modify from now on), which took
+        the given number of seconds to decode (on the GUI thread, or in a
+        prefetcher if prefetched is true), evicting the least recently
+        used frames as needed to stay within our budget.
+        """
+        self._lock.acquire()
+        try:
+            if prefetched:
+                self.prefetched += 1
+                self.prefetch_time += seconds
+            else:
+                self.decoded += 1
+                self.decode_time += seconds
+            old = self._frames.get(n)
+            if old is not None:
+                self._nbytes -= frame_bytes(old)
+            self._frames[n] = frame
+            self._nbytes += frame_bytes(frame)
+            self._touch(n)
+            while len(self._frames) > 1 and self._nbytes > self.budget:
+                items = [(used, n0) for n0, used in self._last_used.items()]
+                used, n0 = min(items)
+                self._nbytes -= frame_bytes(self._frames[n0])
+                del self._frames[n0]
+                del self._last_used[n0]
+                self.evictions += 1
+        finally:
+            self._lock.release()
+        return
+
+    def _touch(self, n):
+        self._use_counter += 1
+        self._last_used[n] = self._use_counter
+
+    def clear(self):
+        """
+        Forget all cached frames (but not the stats).
+        """
+        self._lock.acquire()
+        try:
+            self._frames = {}
+            self._last_used = {}
+            self._nbytes = 0
+        finally:
+            self._lock.release()
+        return
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def stats_message(self):
+        """
+        Return a one-line summary of our stats, for a history message.
+        """
+        return "Frame cache: %d frames (%.1f MB), %.0f%% hits, " \
+               "%d frames decoded in %.2f sec, %d prefetched in %.2f sec, " \
+               "%d evicted" % \
+               (len(self), self._nbytes / 1048576.0, self.hit_rate() * 100,
+                self.decoded, self.decode_time,
+                self.prefetched, self.prefetch_time, self.evictions)
+
+    pass # end of class FrameCache
+
+# ==
+
+def decode_frame(moviefile, cache, n):
+    """
+    Return a new array of the absolute positions of frame n, read from
+    moviefile starting from the nearest frame known to either moviefile
+    or cache. Never store it in cache (callers do that).
+    """
+    if hasattr(moviefile, 'nearest_knownposns_frame_index'):
+        # (files without key frames, i.e. old-format ones)
+        n0 = cache.nearest(n)
+        if n0 is not None:
+            known = moviefile.nearest_knownposns_frame_index(n)
+            if known is None or abs(n - n0) < abs(n - known):
+                frame0 = cache.peek(n0)
+                if frame0 is not None: # (unless just evicted)
+                    moviefile.donate_mutable_known_frame(n0, + frame0)
+    return + moviefile.ref_to_transient_frame_n(n)
+
+class FramePrefetcher(threading.Thread):
+    """
+    A daemon thread which decodes frames from its own moviefile into a
+    FrameCache, ahead of the frame being played.
+    See module docstring for details.
+    """
+    def __init__(self, moviefile, cache, lookahead = _DEFAULT_LOOKAHEAD):
+        # (see FrameCache.lookahead for a good value of lookahead)
+        """
+        @param moviefile: a moviefile object (see MovieFile in moviefile.py)
+                          which from now on belongs to this thread (which
+                          destroys it when stopped). It must already know
+                          an absolute frame, if its file needs one.
+        """
+        threading.Thread.__init__(self, name = "movie frame prefetcher")
+        self.setDaemon(True)
+        self.moviefile = moviefile
+        self.cache = cache
+        self.lookahead = lookahead
+        self._condition = threading.Condition()
+        self._plan = None # (current, stop, step), or None when paused
+        self._stopped = False
+        return
+
+    def prefetch(self, current, stop, step):
+        """
+        [called by the GUI thread]
+        Frame current is being played, and playing will continue to
+        frame stop, in steps of step frames (negative for REV).
+        """
+        self._set_plan((current, stop, step))
+
+    def pause(self):
+        """
+        [called by the GUI thread]
+        Stop prefetching until the next call of prefetch.
+        """
+        self._set_plan(None)
+
+    def stop(self):
+        """
+        [called by the GUI thread]
+        Make the thread destroy its moviefile and exit, soon.
+        """
+        self._condition.acquire()
+        try:
+            self._stopped = True
+            self._plan = None
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return
+
+    def _set_plan(self, plan):
+        self._condition.acquire()
+        try:
+            self._plan = plan
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return
+
+    def _next_frame(self):
+        """
+        Return the index of the next frame we should decode according to
+        self._plan, or None if all of them (up to self.lookahead frames
+        ahead) are already cached. Caller must hold self._condition.
+        """
+        if self._plan is None:
+            return None
+        current, stop, step = self._plan
+        n = current
+        for i in range(self.lookahead):
+            n += step
+            if (n - stop) * step > 0:
+                # past stop; playing ends at stop itself
+                n = stop
+            if n == current:
+                return None
+            if not self.cache.has_frame(n):
+                return n
+            if n == stop:
+                return None
+        return None
+
+    def run(self):
+        try:
+            try:
+                while 1:
+                    self._condition.acquire()
+                    try:
+                        n = None
+                        while not self._stopped:
+                            n = self._next_frame()
+                            if n is not None:
+                                break
+                            self._condition.wait()
+                        if self._stopped:
+                            return
+                    finally:
+                        self._condition.release()
+                    t0 = time.time()
+                    frame = decode_frame(self.moviefile, self.cache, n)
+                    self.cache.put(n, frame, time.time() - t0,
+                                   prefetched = True)
+                    continue
+            except:
+                print_compact_traceback("exception in movie frame prefetcher " \
+                                        "(no longer prefetching): ")
+        finally:
+            self.moviefile.destroy()
+            self.moviefile = None
+        return
+
+    pass # end of class FramePrefetcher
+
+# ==
+
+def _benchmark(natoms = 20000, nframes = 400):
+    """
+    Write a synthetic old-format movie file, then play it forwards and
+    backwards as play_frame would, with and without a FramePrefetcher,
+    spending a few ms per frame as if drawing it, and print the frame
+    rates and cache stats.
+    """
+    import os, tempfile
+    from struct import pack
+    import numpy
+    import Numeric
+    from files.dpb_trajectory.moviefile import OldFormatMovieFile_startup
+    from files.dpb_trajectory.moviefile import OldFormatMovieFile
+    fd, filename = tempfile.mkstemp(".dpb")
+    fileobj = os.fdopen(fd, "wb")
+    fileobj.write( pack('i', nframes))
+    for i in range(nframes):
+        deltas = numpy.random.randint(-3, 4, natoms * 3).astype(numpy.int8)
+        fileobj.write( deltas.tostring())
+    fileobj.close()
+    frame_0 = Numeric.zeros( (natoms, 3), Numeric.Float)
+    def open_moviefile():
+        reader = OldFormatMovieFile_startup(filename)
+        assert not reader.open_and_read_header_errQ()
+        res = OldFormatMovieFile(reader)
+        res.donate_immutable_cached_frame(0, frame_0)
+        return res
+    draw_time = 0.005
+    try:
+        for use_prefetcher in (False, True):
+            moviefile = open_moviefile()
+            cache = FrameCache()
+            prefetcher = None
+            if use_prefetcher:
+                prefetcher = FramePrefetcher(open_moviefile(), cache)
+                prefetcher.start()
+            t0 = time.time()
+            for start, stop, step in [(0, nframes, 1), (nframes, 0, -1)]:
+                for n in range(start + step, stop + step, step):
+                    if prefetcher:
+                        prefetcher.prefetch(n, stop, step)
+                    frame = cache.get(n)
+                    if frame is None:
+                        t1 = time.time()
+                        frame = decode_frame(moviefile, cache, n)
+                        cache.put(n, frame, time.time() - t1)
+                    time.sleep(draw_time)
+            t1 = time.time()
+            if prefetcher:
+                prefetcher.stop()
+                prefetcher.join()
+            moviefile.destroy()
+            print "prefetcher %s: %.1f frames/sec" % \
+                  (use_prefetcher and "on" or "off", 2 * nframes / (t1 - t0))
+            print "  " + cache.stats_message()
+    finally:
+        os.remove(filename)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
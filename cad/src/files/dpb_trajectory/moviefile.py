@@ -15,9 +15,12 @@ moviefile.py -- classes and other code for interpreting movie files
 
 # these imports are anticipated, perhaps not all needed
 import os, sys
+import mmap
 from struct import unpack # fyi: used for old-format header, no longer for delta frames
 ## from VQT import A
 from Numeric import array, Int8
+import Numeric
+import numpy
 from utilities import debug_flags
 from utilities.debug import print_compact_stack, print_compact_traceback
 import foundation.env as env
@@ -33,12 +36,28 @@ def MovieFile(filename): #bruce 050913 removed history arg, since all callers pa
     for the old format, that's all there is.
        In case of a fatal error, print an appropriate message to env.history
     and return None. We might also print warnings to history (I don't know #k).
-       In future, when new format is available, we'll detect the format in the file
-    and open it in the proper way, perhaps also taking optional arguments for a trace filename,
-    perhaps handling files that have not yet been finished or perhaps not yet even started, etc....
+       We detect the format of the file: for new-format files (which may still
+    be being written), return a NewFormatMovieFile (see new_format_moviefile.py).
+       In future we might also take optional arguments for a trace filename,
+    perhaps handling files that have not yet even been started, etc....
        See also the docstring of class OldFormatMovieFile.
     """
-    # for now, assume old format, and assume file exists and has reached its final size.
+    from files.dpb_trajectory.new_format_moviefile import is_new_format_moviefile
+    if is_new_format_moviefile( filename):
+        from files.dpb_trajectory.new_format_moviefile import NewFormatMovieFile_startup
+        from files.dpb_trajectory.new_format_moviefile import NewFormatMovieFile
+        reader = NewFormatMovieFile_startup( filename)
+        if reader.open_and_read_header_errQ():
+            reader.destroy()
+            return None
+        return NewFormatMovieFile( reader)
+    # otherwise assume old format, and assume file exists and has reached its final size.
+    from utilities.GlobalPreferences import pref_use_mmap_movie_reader
+    if pref_use_mmap_movie_reader():
+        reader = MmapOldFormatMovieFile_startup( filename)
+        if reader.open_and_read_header_errQ():
+            return None
+        return MmapOldFormatMovieFile( reader)
     reader = OldFormatMovieFile_startup( filename)
     if reader.open_and_read_header_errQ():
         return None
@@ -382,3 +401,234 @@ class OldFormatMovieFile: #bruce 050426
     
     pass # end of class MovieFile
 
+# ==
+
+class MmapOldFormatMovieFile_startup(OldFormatMovieFile_startup):
+    """
+    Like OldFormatMovieFile_startup, but read delta frames from a
+    memory map of the file, as numpy Int8 arrays which share memory
+    with it (see delta_frames).
+    """
+    _mmap = None
+    
+    def open_file(self):
+        OldFormatMovieFile_startup.open_file(self)
+        self._mmap = mmap.mmap( self.fileobj.fileno(), 0, access = mmap.ACCESS_READ)
+        return
+    
+    def delta_frames(self, n1, n2):
+        """
+        Return the delta frames with indices n1 through n2 inclusive
+        (1 <= n1 <= n2 <= totalFramesActual) as a numpy Int8 array of
+        shape (n2 - n1 + 1, natoms, 3), in units of 0.01 Angstroms.
+
+        The array refers directly to our memory map of the file, so the
+        caller must not keep it after any other method of self is called
+        (in particular close).
+        """
+        assert 0 < n1 <= n2
+        nbytes = self.natoms * 3
+        nframes = n2 - n1 + 1
+        try:
+            if self._mmap is None:
+                self.open_file() #e check for error? check length still the same, etc?
+            res = numpy.frombuffer( self._mmap, numpy.int8,
+                                    count = nframes * nbytes,
+                                    offset = ((n1 - 1) * nbytes) + 4 )
+        except:
+            # e.g. if file got shorter after we measured its size; treat
+            # missing frames as all 0s, as delta_frame_bytes does
+            if debug_flags.atom_debug:
+                print_compact_traceback( "atom_debug: ignoring exception reading delta_frames %d-%d, returning all 00s: " % (n1, n2))
+            res = numpy.zeros( (nframes * nbytes,), numpy.int8)
+        res.shape = (nframes, self.natoms, 3)
+        return res
+
+    def delta_frame_bytes(self, n):
+        """
+        return the bytes of the delta frame which has index n (assuming our file is open and n is within legal range)
+        """
+        return self.delta_frames(n, n).tostring()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = None
+        OldFormatMovieFile_startup.close(self)
+    close_file = close
+
+    pass
+
+# ==
+
+_DEFAULT_KEYFRAME_INTERVAL = 64 # frames
+
+_DEFAULT_KEYFRAME_BUDGET = 64 * 1024 * 1024 # bytes
+
+def _numpy_to_Numeric(arr):
+    """
+    Return a Numeric Float array with the same shape and values
+    as the given numpy array.
+    """
+    res = Numeric.fromstring( arr.astype(numpy.float64).tostring(), Numeric.Float)
+    res.shape = arr.shape
+    return res
+
+class MmapOldFormatMovieFile(OldFormatMovieFile):
+    """
+    Like OldFormatMovieFile, but reach any frame in time proportional
+    to keyframe_interval (rather than to the distance from the nearest
+    known frame), using a sparse index of keyframes and vectorized
+    sums of delta frames read directly from a memory map of the file.
+
+    The keyframes hold cumulative sums of all delta frames from frame 0,
+    as exact integers (in units of 0.01 Angstroms), so they don't depend
+    on which absolute frames our client donates, and can be built before
+    it donates any. They are kept in memory, in an LRU cache limited to
+    keyframe_budget bytes; the keyframe interval is increased if needed
+    so that a keyframe for the whole file fits in that budget.
+    """
+    def __init__(self, filereader,
+                 keyframe_interval = _DEFAULT_KEYFRAME_INTERVAL,
+                 keyframe_budget = _DEFAULT_KEYFRAME_BUDGET,
+                 build_index = True ):
+        OldFormatMovieFile.__init__(self, filereader)
+        keyframe_bytes = max(1, self.natoms * 3 * 4)
+        max_keyframes = max(1, keyframe_budget / keyframe_bytes)
+        min_interval = (self.totalFramesActual + max_keyframes - 1) / max_keyframes
+        self.keyframe_interval = max(keyframe_interval, min_interval, 1)
+        self.keyframe_budget = keyframe_budget
+        self._keyframe_bytes = keyframe_bytes
+        self._keyframes = {} # frame index (a multiple of keyframe_interval) -> int32 cumulative delta
+        self._keyframe_last_used = {} # frame index -> value of self._use_counter
+        self._use_counter = 0
+        if build_index:
+            self.build_keyframe_index()
+        return
+
+    def destroy(self):
+        self._keyframes = self._keyframe_last_used = None
+        OldFormatMovieFile.destroy(self)
+
+    def build_keyframe_index(self):
+        """
+        Compute and cache all keyframes, in one pass over the file.
+        """
+        n = self.totalFramesActual
+        self._cumulative_delta( n - n % self.keyframe_interval)
+        return
+
+    def _store_keyframe(self, n, cumulative):
+        self._keyframes[n] = cumulative.copy()
+        self._touch_keyframe(n)
+        budget = self.keyframe_budget
+        while len(self._keyframes) > 1 and \
+              len(self._keyframes) * self._keyframe_bytes > budget:
+            # evict the least recently used keyframe
+            items = [(used, n0) for n0, used in self._keyframe_last_used.items()]
+            used, n0 = min(items)
+            del self._keyframes[n0]
+            del self._keyframe_last_used[n0]
+        return
+
+    def _touch_keyframe(self, n):
+        self._use_counter += 1
+        self._keyframe_last_used[n] = self._use_counter
+
+    def _cumulative_delta(self, n):
+        """
+        Return the sum of delta frames 1 through n, as a new numpy int32
+        array of shape (natoms, 3), in units of 0.01 Angstroms.
+        Cache any keyframes passed while computing it.
+        """
+        interval = self.keyframe_interval
+        # find the nearest cached keyframe at or before n
+        pos = n - n % interval
+        while pos > 0 and not self._keyframes.has_key(pos):
+            pos -= interval
+        if pos > 0:
+            self._touch_keyframe(pos)
+            res = self._keyframes[pos].copy()
+        else:
+            res = numpy.zeros( (self.natoms, 3), numpy.int32)
+        while pos < n:
+            # add up the delta frames up to the next keyframe (or n)
+            stop = min(n, pos - pos % interval + interval)
+            deltas = self.filereader.delta_frames(pos + 1, stop)
+            res += deltas.sum(axis = 0, dtype = numpy.int32)
+            del deltas # (don't keep a reference to the file's memory map)
+            pos = stop
+            if pos % interval == 0 and not self._keyframes.has_key(pos):
+                self._store_keyframe(pos, res)
+        return res
+
+    def copy_of_frame(self, n):
+        """
+        Return the array of absolute atom positions corresponding to
+        the specified frame-number (0 = array of initial positions).
+        """
+        assert self.frame_index_in_range(n)
+        n0 = self.nearest_knownposns_frame_index(n)
+        if abs(n - n0) <= 1:
+            # common case when playing frames in sequence; use the
+            # superclass code, which needs to read at most one delta frame
+            return OldFormatMovieFile.copy_of_frame(self, n)
+        frame0 = self.copy_of_known_frame_or_None(n0)
+        assert frame0 is not None
+        delta = self._cumulative_delta(n) - self._cumulative_delta(n0)
+        frame0 += _numpy_to_Numeric(delta * 0.01)
+        return frame0
+
+    def delta_frame(self, n):
+        """
+        return the delta frame with index n, as an appropriately-typed Numeric array
+        """
+        return _numpy_to_Numeric( self.filereader.delta_frames(n, n)[0] * 0.01 )
+
+    pass # end of class MmapOldFormatMovieFile
+
+# ==
+
+def _benchmark(natoms = 50000, nframes = 2000, nseeks = 200):
+    """
+    Write a synthetic old-format movie file, then time random-access
+    frame retrieval from it using OldFormatMovieFile and
+    MmapOldFormatMovieFile, and check that they agree.
+    """
+    import random, tempfile, time
+    from struct import pack
+    fd, filename = tempfile.mkstemp(".dpb")
+    fileobj = os.fdopen(fd, "wb")
+    fileobj.write( pack('i', nframes))
+    for i in range(nframes):
+        deltas = numpy.random.randint(-3, 4, natoms * 3).astype(numpy.int8)
+        fileobj.write( deltas.tostring())
+    fileobj.close()
+    frame_0 = Numeric.zeros( (natoms, 3), Numeric.Float)
+    frames = [random.randint(0, nframes) for i in range(nseeks)]
+    results = []
+    try:
+        for startup_class, file_class in \
+            [(OldFormatMovieFile_startup, OldFormatMovieFile),
+             (MmapOldFormatMovieFile_startup, MmapOldFormatMovieFile)]:
+            t0 = time.time()
+            reader = startup_class(filename)
+            assert not reader.open_and_read_header_errQ()
+            moviefile = file_class(reader)
+            moviefile.donate_immutable_cached_frame(0, frame_0)
+            t1 = time.time()
+            for n in frames:
+                moviefile.ref_to_transient_frame_n(n)
+            t2 = time.time()
+            results.append( moviefile.copy_of_frame(frames[-1]) )
+            moviefile.destroy()
+            print "%s: open %.3f sec, %d random seeks in %.3f sec (%.1f ms/seek)" % \
+                  (file_class.__name__, t1 - t0, nseeks, t2 - t1, (t2 - t1) * 1000.0 / nseeks)
+    finally:
+        os.remove(filename)
+    assert Numeric.alltrue( Numeric.absolute( Numeric.ravel(results[0] - results[1])) < 1e-6 )
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
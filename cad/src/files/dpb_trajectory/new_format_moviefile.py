@@ -0,0 +1,706 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+new_format_moviefile.py -- read "new format" movie (dpb) files,
+which contain key records (absolute atom positions), delta records
+and a trailing index.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+The simulator has long been able to write this format (see writeNew*
+in sim/src/writemovie.c, used when it's given the -N option), but NE1
+could only read the old format (see OldFormatMovieFile in moviefile.py).
+MovieFile now detects the format of a movie file and returns a
+NewFormatMovieFile for files in this one.
+
+Implementation notes:
+
+The file is a text header (whose first two lines identify the format,
+and whose other lines include "NumberOfAtoms = <n>"), padded so it
+ends 4 bytes before a 4 byte boundary, followed by a 4 byte sync word
+and then by a series of records. Each record has a 12 byte header
+(byte order magic, record type magic, record length), then a 4 byte
+frame number, then its data:
+
+- key record: the absolute positions of all atoms, as 3 ints per atom
+  (in units of 0.01 Angstroms);
+
+- delta record: the difference between one frame and the previous one,
+  as 3 signed chars per atom (same units), padded to a multiple of 4;
+
+- index record (at the end of a finished file): the type, frame number
+  and file offset of every record;
+
+- end record (the last 28 bytes of a finished file): the offsets of the
+  first record and of the index record, relative to the end of the file.
+
+Frame 0 is the first key record (the initial positions). The writer
+numbers the delta record which moves frame n to frame n + 1 as n, and
+writes each other key record right after the delta record for the same
+frame, so a key record holds frame n + 1 if it follows delta record n.
+(The final key record, written by writeNewOutputTrailer, is numbered
+one higher than the delta record it follows, so we don't trust key
+record numbers when a delta record precedes them.)
+
+We find the records from the index if the file is finished, or else by
+reading just the header of each record in turn; in the latter case we
+only use the records which are complete, and refresh() finds the ones
+written since then. Any frame is computed from the nearest key frame at
+or before it (or from the last frame computed, if that's nearer) by
+adding up the delta records in between, read with one read per run of
+adjacent delta records.
+"""
+
+import os
+from struct import unpack
+from bisect import bisect_right
+
+import numpy
+
+from utilities import debug_flags
+from utilities.debug import print_compact_traceback
+import foundation.env as env
+
+from files.dpb_trajectory.moviefile import _numpy_to_Numeric
+
+# (these constants are the same as in sim/src/writemovie.c)
+
+DPB_SYNC_WORD = 0xffffffffL
+
+DPB_BYTE_ORDER_MAGIC = 0x01020304
+
+DPB_DELTA_RECORD_MAGIC = 0x44656c01
+DPB_KEY_RECORD_MAGIC = 0x4b657901
+DPB_INDEX_RECORD_MAGIC = 0x496e6401
+DPB_END_RECORD_MAGIC = 0x456f6601
+
+# record types in index entries (the writer uses different values there)
+DPB_DELTA_RECORD_TYPE = 0x44656c02
+DPB_KEY_RECORD_TYPE = 0x4b657902
+DPB_INDEX_RECORD_TYPE = 0x496e6402
+
+NEW_FORMAT_FIRST_LINE_START = "#!"
+NEW_FORMAT_SECOND_LINE_START = "#@ NanoEngineer-1 atom trajectory file"
+
+_RECORD_HEADER_SIZE = 12 # byte order, record type, record length
+_END_RECORD_SIZE = _RECORD_HEADER_SIZE + 16
+
+_MAX_DELTA_RECORDS_PER_READ = 256
+
+_DELTA = 'delta'
+_KEY = 'key'
+
+def is_new_format_moviefile(filename):
+    """
+    Does the file of the given name (which should exist) start like
+    a new-format movie file?
+    """
+    try:
+        fileobj = open(filename, 'rb')
+        try:
+            lines = fileobj.read(256).split("\n")
+        finally:
+            fileobj.close()
+    except IOError:
+        return False
+    return len(lines) > 2 and \
+           lines[0].startswith(NEW_FORMAT_FIRST_LINE_START) and \
+           lines[1].startswith(NEW_FORMAT_SECOND_LINE_START)
+
+def _int64(high, low):
+    """
+    Return the signed 64 bit integer whose high and low halves were
+    written as the given ints.
+    """
+    res = ((high & 0xffffffffL) << 32) | (low & 0xffffffffL)
+    if res >= (1L << 63):
+        res -= (1L << 64)
+    return res
+
+# ==
+
+class NewFormatMovieFile_startup:
+    """
+    Know the filename, header and record offsets of a new-format movie
+    file, and read raw key and delta records from it.
+    (Analogous to OldFormatMovieFile_startup.)
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.fileobj = None
+        self.errcode = None
+        self.header = {} # maps header line keyword -> value string
+        self.natoms = 0
+        self.complete = False # whether we found the index (so we know all the records)
+        self.totalFramesActual = 0
+        self.key_frames = [] # sorted frame numbers of the key records
+        self.key_offsets = {} # frame number -> file offset of key record
+        self.delta_offsets = [None] # [n] is file offset of delta record into frame n, or None
+        self._records = [] # (kind, frame number as written, offset) of each record, in file order
+        self._scan_offset = None # where to look for the next record, if not complete
+        self._index_frame_number = None # frame number in the index record, once we find it
+        return
+
+    def open_and_read_header_errQ(self):
+        self.open_file()
+        self.read_header()
+        if not self.errcode:
+            self.refresh()
+        return self.errcode
+
+    def open_file(self):
+        assert not self.fileobj
+        self.fileobj = open(self.filename, 'rb')
+
+    def error(self, msg):
+        self.errcode = msg or "error"
+        from utilities.Log import redmsg
+        env.history.message( redmsg( msg))
+        return
+
+    def read_header(self):
+        fileobj = self.fileobj
+        fileobj.seek(0)
+        while 1:
+            line = fileobj.readline()
+            if not line.endswith("\n"):
+                self.error( "Movie file [%s] has an incomplete header." % self.filename)
+                return
+            if line.startswith("# pad to 4 byte boundary:"):
+                break
+            if not line.startswith("#") and line.find("=") > 0:
+                key, value = line.split("=", 1)
+                self.header[key.strip()] = value.strip()
+        sync = fileobj.read(4)
+        if len(sync) != 4 or unpack('<I', sync)[0] != DPB_SYNC_WORD:
+            self.error( "Movie file [%s] has no sync word after its header." % self.filename)
+            return
+        self.first_record_offset = self._scan_offset = fileobj.tell()
+        try:
+            self.natoms = int(self.header["NumberOfAtoms"])
+        except (KeyError, ValueError):
+            self.error( "Movie file [%s] has no valid NumberOfAtoms in its header." % self.filename)
+            return
+        # record sizes
+        self.key_record_size = _RECORD_HEADER_SIZE + 4 + self.natoms * 12
+        delta_length = 4 + self.natoms * 3
+        delta_length += (- delta_length) % 4
+        self.delta_record_size = _RECORD_HEADER_SIZE + delta_length
+        # the writer writes everything in its native byte order
+        # (which we learn from the first record, once it's written)
+        self._order = None
+        return
+
+    def _learn_byte_order(self, bytes):
+        """
+        Set self._order to '<' or '>' according to the byte order magic
+        at the start of the given record header; return False if that's
+        not a valid byte order magic.
+        """
+        for order in '<>':
+            if unpack(order + 'i', bytes[:4])[0] == DPB_BYTE_ORDER_MAGIC:
+                self._order = order
+                return True
+        return False
+
+    def refresh(self):
+        """
+        Find any records we don't yet know about (all of them, the first
+        time), using the index if the file is now finished, and update
+        our tables of key and delta records and totalFramesActual.
+        Return true if there are new records.
+        """
+        if self.complete:
+            return False
+        nrecords = len(self._records)
+        try:
+            if not self._read_index():
+                self._scan_records()
+        except:
+            # e.g. if file got shorter, or was replaced; keep the records we know about
+            if debug_flags.atom_debug:
+                print_compact_traceback( "atom_debug: ignoring exception scanning movie file %s: " % self.filename)
+        if len(self._records) == nrecords and not self.complete:
+            return False
+        self._make_tables()
+        return True
+
+    def _read_index(self):
+        """
+        If the file has an end record and the index it points to,
+        replace our list of records with the one from the index, set
+        self.complete, and return True; otherwise return False.
+        """
+        fileobj = self.fileobj
+        filesize = os.path.getsize(self.filename)
+        if filesize < self.first_record_offset + _RECORD_HEADER_SIZE + _END_RECORD_SIZE:
+            return False
+        fileobj.seek(filesize - _END_RECORD_SIZE)
+        bytes = fileobj.read(_END_RECORD_SIZE)
+        if len(bytes) != _END_RECORD_SIZE or not self._learn_byte_order(bytes):
+            return False
+        order = self._order
+        byte_order, record_type, record_length, \
+                    first_high, first_low, index_high, index_low = unpack(order + '7i', bytes)
+        if record_type != DPB_END_RECORD_MAGIC or record_length != 16:
+            return False
+        if filesize + _int64(first_high, first_low) != self.first_record_offset:
+            return False
+        index_offset = filesize + _int64(index_high, index_low)
+        fileobj.seek(index_offset)
+        bytes = fileobj.read(_RECORD_HEADER_SIZE + 8)
+        byte_order, record_type, record_length, frame_number, count = unpack(order + '5i', bytes)
+        if record_type != DPB_INDEX_RECORD_MAGIC or record_length != 8 + count * 16:
+            return False
+        entries = numpy.frombuffer( fileobj.read(count * 16), numpy.dtype(order + 'i4'))
+        entries.shape = (count, 4)
+        records = []
+        kinds = {DPB_DELTA_RECORD_TYPE: _DELTA, DPB_KEY_RECORD_TYPE: _KEY}
+        for record_type, frame_number, offset_high, offset_low in entries.tolist():
+            kind = kinds.get(record_type)
+            if kind is not None:
+                records.append( (kind, frame_number, _int64(offset_high, offset_low)) )
+        self._records = records
+        self._index_frame_number = frame_number # one more than the last delta record's
+        self.complete = True
+        return True
+
+    def _scan_records(self):
+        """
+        Read the header of each record after the last one we know about,
+        stopping at the end of the last complete record (or at the index),
+        and add the key and delta records to our list of records.
+        """
+        fileobj = self.fileobj
+        filesize = os.path.getsize(self.filename)
+        offset = self._scan_offset
+        kinds = {DPB_DELTA_RECORD_MAGIC: _DELTA, DPB_KEY_RECORD_MAGIC: _KEY}
+        while offset + _RECORD_HEADER_SIZE + 4 <= filesize:
+            fileobj.seek(offset)
+            bytes = fileobj.read(_RECORD_HEADER_SIZE + 4)
+            if self._order is None and not self._learn_byte_order(bytes):
+                break
+            byte_order, record_type, record_length, frame_number = unpack(self._order + '4i', bytes)
+            if byte_order != DPB_BYTE_ORDER_MAGIC or record_length < 4:
+                if debug_flags.atom_debug:
+                    print "atom_debug: bad record header at offset %d in movie file %s" % (offset, self.filename)
+                break
+            kind = kinds.get(record_type)
+            if kind is None:
+                break # index or end record (or garbage); refresh will find the index next time
+            if offset + _RECORD_HEADER_SIZE + record_length > filesize:
+                break # record not yet completely written
+            self._records.append( (kind, frame_number, offset) )
+            offset += _RECORD_HEADER_SIZE + record_length
+        self._scan_offset = offset
+        return
+
+    def _make_tables(self):
+        """
+        Work out which frame each record is for (see module docstring),
+        and make our tables of key and delta record offsets.
+        """
+        key_offsets = {}
+        delta_offsets = {}
+        last_frame = 0
+        previous = None
+        for record in self._records:
+            kind, frame_number, offset = record
+            if kind == _DELTA:
+                n = frame_number + 1
+                delta_offsets[n] = offset
+            elif offset == self.first_record_offset:
+                n = 0
+            elif previous is not None and previous[0] == _DELTA:
+                n = previous[1] + 1
+            else:
+                # no delta records (KeyRecordInterval <= 1): each key record
+                # is for the frame after its number, except one written by
+                # writeNewOutputTrailer, which has the index's frame number
+                n = frame_number + 1
+                if self.complete:
+                    n = min(n, self._index_frame_number)
+            if kind == _KEY:
+                key_offsets[n] = offset
+            last_frame = max(last_frame, n)
+            previous = record
+        self.key_offsets = key_offsets
+        self.key_frames = key_offsets.keys()
+        self.key_frames.sort()
+        self.delta_offsets = [None] * (last_frame + 1)
+        for n, offset in delta_offsets.items():
+            self.delta_offsets[n] = offset
+        self.totalFramesActual = last_frame
+        return
+
+    def nearest_key_frame(self, n):
+        """
+        Return the number of the last key frame at or before frame n,
+        or None if there is none.
+        """
+        i = bisect_right(self.key_frames, n)
+        if i == 0:
+            return None
+        return self.key_frames[i - 1]
+
+    def key_positions(self, n):
+        """
+        Return the positions in the key record for frame n, as a new
+        numpy int32 array of shape (natoms, 3), in units of 0.01 Angstroms.
+        """
+        self.fileobj.seek(self.key_offsets[n] + _RECORD_HEADER_SIZE + 4)
+        res = numpy.frombuffer( self.fileobj.read(self.natoms * 12),
+                                numpy.dtype(self._order + 'i4') ).astype(numpy.int32)
+        res.shape = (self.natoms, 3)
+        return res
+
+    def delta_runs(self, n1, n2):
+        """
+        Generate the delta records into frames n1 through n2 inclusive,
+        as pairs (n, deltas) where deltas is a numpy int8 array of shape
+        (m, natoms, 3) for the delta records into frames n through
+        n + m - 1, read with one read per run of adjacent records.
+        A frame with no delta record (only possible in a file written
+        with KeyRecordInterval <= 1) gets a delta of all 0s.
+        """
+        natoms = self.natoms
+        recsize = self.delta_record_size
+        offsets = self.delta_offsets
+        n = n1
+        while n <= n2:
+            offset = offsets[n]
+            if offset is None:
+                yield n, numpy.zeros( (1, natoms, 3), numpy.int8)
+                n += 1
+                continue
+            m = 1
+            while n + m <= n2 and m < _MAX_DELTA_RECORDS_PER_READ and \
+                  offsets[n + m] == offset + m * recsize:
+                m += 1
+            self.fileobj.seek(offset)
+            bytes = self.fileobj.read(m * recsize)
+            assert len(bytes) == m * recsize, "movie file %s got shorter" % self.filename
+            records = numpy.frombuffer(bytes, numpy.int8)
+            records.shape = (m, recsize)
+            deltas = records[:, _RECORD_HEADER_SIZE + 4 : _RECORD_HEADER_SIZE + 4 + natoms * 3]
+            yield n, deltas.reshape( (m, natoms, 3) )
+            n += m
+        return
+
+    def close(self):
+        if self.fileobj:
+            self.fileobj.close()
+        self.fileobj = None
+    close_file = close
+
+    def destroy(self):
+        self.close()
+        self._records = self.key_offsets = self.delta_offsets = None
+        return
+
+    pass
+
+# ==
+
+class NewFormatMovieFile:
+    """
+    Read absolute atom positions for any frame of a new-format movie
+    file, or for a range of its frames at once. Has the same interface
+    as OldFormatMovieFile (for alist_and_moviefile), plus frame_block
+    and iter_frame_blocks.
+
+    Since the file has key records, positions donated by client code are
+    not needed, and are ignored. The file may still be being written;
+    recheck_matches_alist (or refresh) finds any frames added since it
+    was opened (or last refreshed).
+    """
+    def __init__(self, filereader):
+        self.filereader = filereader
+        self.natoms = filereader.natoms
+        self._current = None # (n, int32 positions of frame n) for the last frame we computed
+
+    def get_totalFramesActual(self):
+        return self.filereader.totalFramesActual
+
+    def refresh(self):
+        """
+        Look for frames written since the file was opened or last
+        refreshed; return true if there are any.
+        """
+        return self.filereader.refresh()
+
+    def matches_alist(self, alist):
+        return self.natoms == len(alist)
+
+    def recheck_matches_alist(self, alist):
+        self.refresh()
+        return self.matches_alist(alist)
+
+    def destroy(self):
+        self._current = None
+        self.filereader.destroy()
+        self.filereader = None
+
+    def donate_immutable_cached_frame(self, n, frame):
+        pass # not needed, since we have key frames
+
+    def frame_index_in_range(self, n):
+        assert type(n) == type(1)
+        return 0 <= n <= self.filereader.totalFramesActual and \
+               self.filereader.nearest_key_frame(n) is not None
+
+    def _int_frame(self, n):
+        """
+        Return the positions of frame n as a numpy int32 array
+        (in units of 0.01 Angstroms), which the caller must not modify
+        or keep after the next call of any method of self.
+        """
+        reader = self.filereader
+        n0 = reader.nearest_key_frame(n)
+        assert n0 is not None, "no key frame at or before frame %d" % n
+        if self._current is not None and n0 <= self._current[0] <= n:
+            n0, frame = self._current
+        else:
+            frame = reader.key_positions(n0)
+        if n0 < n:
+            for n1, deltas in reader.delta_runs(n0 + 1, n):
+                frame += deltas.sum(axis = 0, dtype = numpy.int32)
+        self._current = (n, frame)
+        return frame
+
+    def ref_to_transient_frame_n(self, n):
+        """
+        Return a new Numeric array of the absolute atom positions for
+        frame n (which the caller may keep and modify).
+        """
+        return _numpy_to_Numeric( self._int_frame(n) * 0.01 )
+
+    copy_of_frame = ref_to_transient_frame_n
+
+    def iter_frame_blocks(self, n1, n2, maxframes = 64):
+        """
+        Generate the absolute atom positions of frames n1 through n2
+        inclusive, in order, as pairs (n, positions), where positions
+        is a new numpy Float64 array of shape (m, natoms, 3) holding
+        the positions of frames n through n + m - 1 (m <= maxframes),
+        in Angstroms.
+
+        Each frame is the same as ref_to_transient_frame_n would return
+        (i.e. key records are used as they're reached, rather than
+        continuing to add deltas past them). Other methods of self
+        should not be called until the generator is finished.
+        """
+        assert self.frame_index_in_range(n1) and self.frame_index_in_range(n2)
+        reader = self.filereader
+        frame = self._int_frame(n1).copy()
+        block = [frame.reshape((1, self.natoms, 3))]
+        nblock = 1
+        n = n1 # the last frame in block
+        while n < n2:
+            # up to the next key frame (exclusive), or n2, or the end of this block
+            stop = min(n2, n + maxframes - nblock)
+            i = bisect_right(reader.key_frames, n)
+            if i < len(reader.key_frames) and reader.key_frames[i] <= stop:
+                stop = reader.key_frames[i] - 1
+            for n3, deltas in reader.delta_runs(n + 1, stop):
+                sums = deltas.cumsum(axis = 0, dtype = numpy.int32)
+                sums += frame
+                frame = sums[-1]
+                block.append(sums)
+                nblock += len(sums)
+            n = stop
+            if n < n2 and reader.key_offsets.has_key(n + 1) and nblock < maxframes:
+                n += 1
+                frame = reader.key_positions(n)
+                block.append( frame.reshape((1, self.natoms, 3)) )
+                nblock += 1
+            if nblock >= maxframes or n == n2:
+                yield n - nblock + 1, numpy.concatenate(block) * 0.01
+                block = []
+                nblock = 0
+        if block:
+            yield n - nblock + 1, numpy.concatenate(block) * 0.01
+        self._current = (n2, frame.copy())
+        return
+
+    def frame_block(self, n1, n2):
+        """
+        Return the absolute atom positions of frames n1 through n2
+        inclusive, as a numpy Float64 array of shape
+        (n2 - n1 + 1, natoms, 3), in Angstroms.
+        """
+        blocks = [positions for n, positions in
+                  self.iter_frame_blocks(n1, n2, maxframes = n2 - n1 + 1)]
+        return numpy.concatenate(blocks)
+
+    def close_file(self):
+        self.filereader.close_file()
+
+    pass # end of class NewFormatMovieFile
+
+# ==
+
+def _write_test_moviefile(filename, positions, key_record_interval = 32, finish = True):
+    """
+    Write a new-format movie file for the given frames of atom
+    positions (a numpy int32 array of shape (nframes, natoms, 3), in
+    units of 0.01 Angstroms; frame 0 being the initial positions),
+    writing the same records in the same order as sim/src/writemovie.c,
+    and finishing it with the index and end record only if finish is true.
+    """
+    from struct import pack
+    nframes, natoms = positions.shape[:2]
+    f = open(filename, 'wb')
+    f.write("#!/usr/local/bin/NanoEngineer1-viewer\n")
+    f.write("#@ NanoEngineer-1 atom trajectory file, format version 050404\n")
+    f.write("NumberOfAtoms = %d\n" % natoms)
+    f.write("ExpectedFrames = %d\n" % (nframes - 1))
+    f.write("KeyRecordInterval = %d\n" % key_record_interval)
+    f.write("# pad to 4 byte boundary:.")
+    while (f.tell() + 1) % 4:
+        f.write(".")
+    f.write("\n")
+    f.write(pack('I', DPB_SYNC_WORD))
+    first_record_offset = f.tell()
+    index = []
+    state = {'frame_number': 0, 'deltas_before_key': key_record_interval}
+    def write_record(magic, record_type, data):
+        index.append( (record_type, state['frame_number'], f.tell()) )
+        f.write(pack('iiii', DPB_BYTE_ORDER_MAGIC, magic, 4 + len(data), state['frame_number']))
+        f.write(data)
+    def write_key(frame):
+        write_record(DPB_KEY_RECORD_MAGIC, DPB_KEY_RECORD_TYPE, frame.astype(numpy.int32).tostring())
+        state['deltas_before_key'] = key_record_interval
+    write_key(positions[0])
+    for i in range(1, nframes):
+        if key_record_interval > 1:
+            deltas = numpy.clip(positions[i] - positions[i-1], -128, 127).astype(numpy.int8).tostring()
+            deltas += "\0" * ((- len(deltas) - 4) % 4)
+            write_record(DPB_DELTA_RECORD_MAGIC, DPB_DELTA_RECORD_TYPE, deltas)
+        state['deltas_before_key'] -= 1
+        if state['deltas_before_key'] + 1 < 0:
+            write_key(positions[i])
+        state['frame_number'] += 1
+    if finish:
+        if state['deltas_before_key'] != key_record_interval:
+            write_key(positions[-1])
+        index.append( (DPB_INDEX_RECORD_TYPE, state['frame_number'], f.tell()) )
+        index_offset = f.tell()
+        f.write(pack('iiiii', DPB_BYTE_ORDER_MAGIC, DPB_INDEX_RECORD_MAGIC,
+                     8 + 16 * len(index), state['frame_number'], len(index)))
+        for record_type, frame_number, offset in index:
+            f.write(pack('iiiI', record_type, frame_number, offset >> 32, offset & 0xffffffffL))
+        end = f.tell() + _END_RECORD_SIZE
+        f.write(pack('iiiiIiI', DPB_BYTE_ORDER_MAGIC, DPB_END_RECORD_MAGIC, 16,
+                     (first_record_offset - end) >> 32, (first_record_offset - end) & 0xffffffffL,
+                     (index_offset - end) >> 32, (index_offset - end) & 0xffffffffL))
+    f.close()
+    return
+
+def _test_positions(natoms, nframes):
+    """
+    Return random-walk atom positions for _write_test_moviefile,
+    with some steps too large for one delta record.
+    """
+    steps = numpy.random.randint(-20, 21, (nframes, natoms, 3)).astype(numpy.int32)
+    steps[::17, ::5] *= 10
+    steps[0] = numpy.random.randint(-100000, 100000, (natoms, 3))
+    return steps.cumsum(axis = 0, dtype = numpy.int32)
+
+def _expected_positions(positions, key_record_interval):
+    """
+    Return the positions a reader should compute from a finished file
+    written by _write_test_moviefile, given its clamped deltas and where
+    its key records are, as a numpy float64 array in Angstroms.
+    (With key_record_interval <= 1 there are no delta records, so a frame
+    without a key record has the same positions as the one before it.)
+    """
+    res = positions.copy()
+    deltas_before_key = key_record_interval
+    for i in range(1, len(positions)):
+        if key_record_interval > 1:
+            res[i] = res[i-1] + numpy.clip(positions[i] - positions[i-1], -128, 127)
+        else:
+            res[i] = res[i-1]
+        deltas_before_key -= 1
+        if deltas_before_key + 1 < 0:
+            res[i] = positions[i]
+            deltas_before_key = key_record_interval
+    if deltas_before_key != key_record_interval:
+        res[-1] = positions[-1] # final key record
+    return res * 0.01
+
+def _open_test_moviefile(filename):
+    reader = NewFormatMovieFile_startup(filename)
+    assert not reader.open_and_read_header_errQ()
+    return NewFormatMovieFile(reader)
+
+def _benchmark(natoms = 20000, nframes = 1000, nseeks = 200):
+    """
+    Check NewFormatMovieFile against the positions used to write a
+    synthetic new-format movie file (finished or not), then time random
+    and sequential frame access and frame_block, printing the results.
+    """
+    import random, tempfile, time
+    positions = _test_positions(natoms, nframes + 1)
+    expected = _expected_positions(positions, 32)
+    filename = tempfile.mktemp(".dpb")
+    try:
+        # small files with few or no delta records
+        for key_record_interval in [0, 1, 2, 3]:
+            small = _test_positions(10, 41)
+            _write_test_moviefile(filename, small, key_record_interval)
+            moviefile = _open_test_moviefile(filename)
+            assert moviefile.get_totalFramesActual() == 40
+            assert numpy.allclose( moviefile.frame_block(0, 40),
+                                   _expected_positions(small, key_record_interval) )
+            moviefile.destroy()
+
+        # unfinished file, cut off in the middle of a record, then finished
+        _write_test_moviefile(filename, positions[:nframes/2 + 1], finish = False)
+        f = open(filename, 'ab')
+        f.write("\0" * 100)
+        f.close()
+        moviefile = _open_test_moviefile(filename)
+        assert moviefile.get_totalFramesActual() == nframes / 2
+        assert numpy.allclose( moviefile.frame_block(0, nframes / 2), expected[:nframes/2 + 1] )
+        _write_test_moviefile(filename, positions)
+        assert moviefile.refresh()
+        assert moviefile.get_totalFramesActual() == nframes
+        moviefile.destroy()
+
+        t0 = time.time()
+        moviefile = _open_test_moviefile(filename)
+        t1 = time.time()
+        assert moviefile.filereader.complete
+        assert moviefile.get_totalFramesActual() == nframes
+        frames = [random.randint(0, nframes) for i in range(nseeks)]
+        for n in frames:
+            frame = moviefile.ref_to_transient_frame_n(n)
+        t2 = time.time()
+        assert numpy.allclose( numpy.array(frame), expected[frames[-1]] )
+        for n in range(nframes + 1):
+            frame = moviefile.ref_to_transient_frame_n(n)
+        t3 = time.time()
+        block = moviefile.frame_block(0, nframes)
+        t4 = time.time()
+        assert numpy.allclose( block, expected )
+        moviefile.destroy()
+        print "NewFormatMovieFile, %d atoms, %d frames:" % (natoms, nframes)
+        print "  open (using index):     %.3f sec" % (t1 - t0)
+        print "  %d random seeks:       %.3f sec (%.1f ms/seek)" % \
+              (nseeks, t2 - t1, (t2 - t1) * 1000.0 / nseeks)
+        print "  sequential playback:    %.3f sec (%.1f ms/frame)" % \
+              (t3 - t2, (t3 - t2) * 1000.0 / (nframes + 1))
+        print "  frame_block (all):      %.3f sec" % (t4 - t3)
+    finally:
+        os.remove(filename)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
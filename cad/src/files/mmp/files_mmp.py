@@ -48,6 +48,7 @@ from utilities.Log import redmsg, orangemsg, quote_html
 from model.elements import PeriodicTable
 from model.elements import Pl5
 from model.bonds import bond_atoms
+from model.bonds import bond_atoms_faster
 from model.chunk import Chunk
 from foundation.Utility import Node
 from foundation.Group import Group
@@ -61,6 +62,7 @@ from utilities.constants import interpret_dispName
 from utilities.constants import SUCCESS, ABORTED, READ_ERROR
 
 from model.bond_constants import find_bond
+from model.bond_constants import atoms_are_bonded
 from model.bond_constants import V_SINGLE
 from model.bond_constants import V_DOUBLE
 from model.bond_constants import V_TRIPLE
@@ -154,6 +156,11 @@ atom1pat = re.compile("atom (\d+) \((\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)")
 ##atom2pat = re.compile("atom \d+ \(\d+\) \(.*\) (\S\S\S)")
 atom2pat = re.compile("atom \d+ \(\d+\) \(.*\) (\w+)") # \w == [a-zA-Z0-9_]
 
+# Used by the fast reader (readmmp_fast_records) for the usual form of atom
+# records, with nothing after the display name. Atom records this doesn't
+# match are read by the usual per-line code.
+_fast_atompat = re.compile("atom (\d+) \((\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)(?: (\w+))?\s*$")
+
 # Old Rotary Motor record format: 
 # rmotor (name) (r, g, b) torque speed (cx, cy, cz) (ax, ay, az)
 old_rmotpat = re.compile("rmotor \((.+)\) \((\d+), (\d+), (\d+)\) (-?\d+\.\d+) (-?\d+\.\d+) \((-?\d+), (-?\d+), (-?\d+)\) \((-?\d+), (-?\d+), (-?\d+)\)")
@@ -278,6 +285,55 @@ def decode_atom_coordinates(xs, ys, zs): #bruce 080521
 
 # ==
 
+# The mmp record types which the fast reader handles, mapped to the bond
+# valence for bond records, or None for the others. Runs of consecutive
+# records of these types are passed to _readmmp_state.readmmp_fast_records.
+_FAST_RECORDS = {
+    'atom': None,
+    'bond1': V_SINGLE,
+    'bond2': V_DOUBLE,
+    'bond3': V_TRIPLE,
+    'bonda': V_AROMATIC,
+    'bondg': V_GRAPHITE,
+    'bondc': V_CARBOMERIC,
+    'bond_direction': None,
+    'bond_chain': None,
+    'directional_bond_chain': None,
+    'dna_rung_bonds': None,
+ }
+
+# largest number of lines in one batch, so progress and abort
+# are still noticed often enough while reading large files
+_MAX_FAST_BATCH = 5000
+
+def _mmp_record_batches(lines, fast_records):
+    """
+    Yield a sequence of lists of lines, which together contain all
+    the given lines in order. Each run of consecutive lines whose
+    record names are in fast_records is yielded as a list of at most
+    _MAX_FAST_BATCH lines (a "fast batch"); every other line is
+    yielded alone. Yielded lists are paired with a boolean which says
+    whether they're a fast batch.
+    """
+    batch = []
+    for card in lines:
+        key_m = keypat.match(card) # as in readmmp_line
+        if key_m and fast_records.has_key(key_m.group(0)):
+            batch.append(card)
+            if len(batch) >= _MAX_FAST_BATCH:
+                yield True, batch
+                batch = []
+            continue
+        if batch:
+            yield True, batch
+            batch = []
+        yield False, [card]
+    if batch:
+        yield True, batch
+    return
+
+# ==
+
 class _readmmp_state:
     """
     Hold the state needed by _readmmp between lines;
@@ -381,6 +437,144 @@ class _readmmp_state:
         # (only it knows whether the line passed to us was made up or really in the file)
         return linemethod(card)
 
+    def fast_records(self):
+        """
+        Return the dict of mmp record names (mapped to bond valences,
+        or None) which readmmp_fast_records can handle, which is
+        _FAST_RECORDS minus any that have registered parsers.
+        """
+        res = {}
+        for recordname, valence in _FAST_RECORDS.items():
+            if not self._find_registered_parser_object(recordname):
+                res[recordname] = valence
+        return res
+
+    def _readmmp_line_catching_bugs(self, card):
+        """
+        Like readmmp_line, but handle exceptions like _readmmp does
+        for each line, by printing them and returning an error message.
+        """
+        try:
+            errmsg = self.readmmp_line( card)
+        except:
+            # note: the following two error messages are similar but not identical
+            errmsg = "bug while reading this mmp line: %s" % (card,)
+            print_compact_traceback("bug while reading this mmp line:\n  %s\n" % (card,) )
+        return errmsg
+
+    def readmmp_fast_records(self, cards, fast_records):
+        """
+        Read a sequence of consecutive mmp lines, all of whose record names
+        are keys in fast_records (as returned by self.fast_records()), with
+        the same effect as calling readmmp_line on each one (as _readmmp
+        would do), but much faster for large files.
+
+        Atom records are matched and their coordinates decoded in bulk
+        before any atoms are made; then atoms and bonds are made in file
+        order without per-line record dispatch. Any line which is unusual
+        (e.g. which would cause an error message) is read by the usual
+        per-line code instead, so the result (including error messages)
+        is the same either way.
+
+        @return: None, or an error message which should stop the reading
+                 of the file (after which the remaining lines in cards
+                 have not been read).
+        """
+        # bulk decode of atom records
+        recordnames = [keypat.match(card).group(0) for card in cards]
+        atom_cards = [card for card, recordname in zip(cards, recordnames)
+                      if recordname == 'atom']
+        matches = map(_fast_atompat.match, atom_cards)
+        coords = []
+        for m in matches:
+            if m:
+                coords.extend(m.group(3, 4, 5))
+            else:
+                coords.extend(('0', '0', '0')) # this atom card will be read by readmmp_line
+        if coords:
+            posns = A(map(float, coords)) / 1000.0
+            posns.shape = (-1, 3)
+        else:
+            posns = ()
+
+        # (optimization: local copies of attributes used per line)
+        ndix = self.ndix
+        listOfAtomsInFileOrder = self.listOfAtomsInFileOrder
+        elements = {} # element number (string) -> element, or None if unsupported
+        disps = {} # display name -> display style code
+        prevatom = self.prevatom
+        prevcard = self.prevcard
+        atom_index = 0
+        errmsg = None
+        for card, recordname in zip(cards, recordnames):
+            if recordname == 'atom':
+                m = matches[atom_index]
+                posn = posns[atom_index]
+                atom_index += 1
+                element = None
+                if m and self.prevchunk is not None:
+                    elementcode = m.group(2)
+                    try:
+                        element = elements[elementcode]
+                    except KeyError:
+                        try:
+                            element = PeriodicTable.getElement(int(elementcode))
+                        except:
+                            element = None # let readmmp_line report the error
+                        elements[elementcode] = element
+                if element is None:
+                    # unusual atom record -- read it the usual way
+                    errmsg = self._readmmp_line_catching_bugs(card)
+                    if errmsg:
+                        return errmsg
+                    prevatom = self.prevatom
+                    prevcard = self.prevcard
+                    continue
+                a = Atom(element.symbol, posn, self.prevchunk)
+                listOfAtomsInFileOrder.append(a)
+                a.unset_atomtype()
+                dispname = m.group(6)
+                if dispname:
+                    try:
+                        disp = disps[dispname]
+                    except KeyError:
+                        disp = disps[dispname] = interpret_dispName(dispname)
+                    a.setDisplay(disp)
+                ndix[int(m.group(1))] = a
+                prevatom = a
+                prevcard = card
+                continue
+            valence = fast_records[recordname]
+            if valence is not None:
+                # bond1 etc; see read_bond_record
+                atoms = None
+                try:
+                    atoms = [ndix[int(code)] for code in card[5:].split()]
+                except (KeyError, ValueError):
+                    pass
+                if atoms and prevatom is not None:
+                    others = {}
+                    for a in atoms:
+                        if a is prevatom or others.has_key(a.key) or \
+                           atoms_are_bonded(prevatom, a):
+                            atoms = None # let read_bond_record handle this
+                            break
+                        others[a.key] = a
+                if atoms:
+                    for a in atoms:
+                        bond_atoms_faster(prevatom, a, valence)
+                    continue
+            # bond chains or directions, or an unusual bond record
+            self.prevatom = prevatom
+            self.prevcard = prevcard
+            errmsg = self._readmmp_line_catching_bugs(card)
+            if errmsg:
+                return errmsg
+            continue
+        self.prevatom = prevatom
+        self.prevcard = prevcard
+        return None
+
     def _find_linemethod(self, recordname):
         """
         [private]
@@ -1511,7 +1705,8 @@ _readmmp_aborted = False
 
 _reference_to_readmmp_abort_function = None #bruce 080606 precaution
 
-def _readmmp(assy, filename, isInsert = False, showProgressDialog = False): 
+def _readmmp(assy, filename, isInsert = False, showProgressDialog = False,
+             fast = None): 
     """
     Read an mmp file, print errors and warnings to history,
     modify assy in various ways (a bad design, see comment in insertmmp)
@@ -1543,6 +1738,11 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
                                a file. Default is False.
     @type  showProgressDialog: boolean
 
+    @param fast: whether to read runs of atom and bond records using
+                 the fast reader (readmmp_fast_records). Default None
+                 means to use debug_pref_read_mmp_fast().
+    @type  fast: boolean or None
+
     @return: the tuple (ok, grouplist or None, listOfAtomsInFileOrder), where
              ok is one of the string constants named (in utilities.constants)
              SUCCESS, ABORTED, or READ_ERROR. (If ok is not SUCCESS, grouplist
@@ -1637,17 +1837,23 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
 
         pass
     
-    for card in lines:
+    if fast is None:
+        from utilities.GlobalPreferences import debug_pref_read_mmp_fast
+        fast = debug_pref_read_mmp_fast()
+    if fast:
+        fast_records = state.fast_records()
+    else:
+        fast_records = {}
+    
+    for is_fast_batch, cards in _mmp_record_batches(lines, fast_records):
         if _readmmp_aborted: # User aborted while reading the MMP file.
             _readmmp_aborted = False # (precaution, not really needed, since not
                 # sufficient to replace the reset earlier in this function)
             return ABORTED, None, []
-        try:
-            errmsg = state.readmmp_line( card) # None or an error message
-        except:
-            # note: the following two error messages are similar but not identical
-            errmsg = "bug while reading this mmp line: %s" % (card,) #e include line number; note, two lines might be identical
-            print_compact_traceback("bug while reading this mmp line:\n  %s\n" % (card,) )
+        if is_fast_batch:
+            errmsg = state.readmmp_fast_records( cards, fast_records)
+        else:
+            errmsg = state._readmmp_line_catching_bugs( cards[0])
         #e assert errmsg is None or a string
         if errmsg:
             ###e general history msg for stopping early on error
@@ -1655,7 +1861,7 @@ def _readmmp(assy, filename, isInsert = False, showProgressDialog = False):
             break
         
         if showProgressDialog: # Update the progress dialog.
-            _progressValue += 1
+            _progressValue += len(cards)
             if _progressValue >= _progressFinishValue:
                 win.progressDialog.setLabelText("Building model...")
             elif _progressDialogDisplayed:
@@ -1757,6 +1963,11 @@ def readmmp(assy,
                                a file. Default is False.
     @type  showProgressDialog: boolean
 
+    @param fast: whether to read runs of atom and bond records using
+                 the fast reader (readmmp_fast_records). Default None
+                 means to use debug_pref_read_mmp_fast().
+    @type  fast: boolean or None
+
     @param returnListOfAtoms: if True, return value contains a list of all
                               atoms in the file, in the order they
                               appeared.  If False (the default),
@@ -2035,4 +2246,32 @@ def fix_assy_and_glpane_views_after_readmmp( assy, glpane):
         ## done by that: glpane._setInitialViewFromPart( mainpart)
     return
 
+# ==
+
+def _benchmark_readmmp(filename, repeat = 1):
+    """
+    Read the given mmp file with and without the fast reader
+    (readmmp_fast_records) and print records (lines) per second for each.
+    Must be run with NE1's modules importable (e.g. from cad/src).
+    """
+    from model.assembly import Assembly
+    nlines = len(open(filename, "rU").readlines())
+    for fast in (False, True):
+        best = None
+        for i in range(repeat):
+            assy = Assembly(None, run_updaters = False)
+            t0 = time.time()
+            ok, grouplist, atoms = _readmmp(assy, filename, fast = fast)
+            duration = time.time() - t0
+            if best is None or duration < best:
+                best = duration
+        print "readmmp (fast = %r): %d records, %d atoms, %.3f sec, %d records/sec" % \
+              (fast, nlines, len(atoms), best, nlines / max(best, 1e-6))
+    return
+
+if __name__ == '__main__':
+    import sys
+    for filename in sys.argv[1:]:
+        _benchmark_readmmp(filename)
+
 # end
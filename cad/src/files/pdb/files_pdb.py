@@ -18,10 +18,13 @@ identical in both, so doing that should not cause a problem.)
 """
 
 import os, time
+import Numeric
 from model.chunk import Chunk
 from model.chem import Atom
 from model.bonds import bond_atoms
 from operations.bonds_from_atoms import inferBonds
+from operations.bonds_from_atoms import infer_bonds_from_covalent_radii
+from operations.bonds_from_atoms import bond_inference_processes
 from string import capitalize
 from model.elements import PeriodicTable, Singlet
 from platform_dependent.PlatformDependent import fix_plurals
@@ -37,6 +40,11 @@ from model.assembly import Group
 import foundation.env as env
 
 from utilities.constants import gensym
+from utilities.GlobalPreferences import pref_streaming_pdb_io
+
+from files.pdb.pdb_stream import read_pdb_records
+from files.pdb.pdb_stream import pdb_atom_name_field
+from files.pdb.pdb_stream import format_atom_records, format_conect_records
 
 from protein.model.Protein import Residuum, Protein
 
@@ -241,7 +249,7 @@ def _readpdb(assy,
         # let user see message right away (bond inference can take significant 
         # time) [bruce 060620]
         env.history.h_update() 
-        inferBonds(mol)
+        inferBonds(mol, processes = bond_inference_processes())
     return mol
     
 
@@ -330,7 +338,7 @@ def _readpdb_new(assy,
                 #    env.history.h_update() 
 
                 # For protein - infer the bonds anyway.
-                inferBonds(mol)
+                inferBonds(mol, processes = bond_inference_processes())
                     
                 mol.protein.set_chain_id(chainId)
                 mol.protein.set_pdb_id(pdbid)
@@ -640,6 +648,259 @@ def _readpdb_new(assy,
     return (mollist, comment_text)
     
 
+# Element symbols for PDB atom records, as found by _pdb_element_symbol
+# (None for unknown elements), memoized by (key, atom name field,
+# element field), since large files have only a few distinct ones.
+_pdb_element_symbols = {}
+
+# (the same guesses as in _readpdb_new; see comments there)
+_pdb_atomname_exceptions = {
+    "HB":"H",
+    "CA":"C",
+    "HN":"H",
+ }
+
+def _pdb_element_symbol(key, name, elementField):
+    """
+    Return the element symbol for a PDB ATOM or HETATM record, given its
+    record key ("atom" or "hetatm"), atom name field (columns 13-16) and
+    element field (column 78), as found by _readpdb_new, or None if no
+    element is recognized.
+    """
+    memokey = (key, name, elementField)
+    try:
+        return _pdb_element_symbols[memokey]
+    except KeyError:
+        pass
+    def nodigits(name):
+        for bad in "0123456789":
+            name = name.replace(bad, "")
+        return name
+    name4 = name.replace(" ", "").replace("_", "")
+    name3 = name[:3].replace(" ", "").replace("_", "")
+    name2 = name[:2].replace(" ", "").replace("_", "")
+    res = None
+    for sym in [elementField] + \
+        [_pdb_atomname_guess(key, atomname)
+         for atomname in [name4, name3, name2,
+                          nodigits(name4), nodigits(name3), nodigits(name2)]]:
+        if sym is None:
+            continue
+        try:
+            PeriodicTable.getElement(sym)
+        except:
+            continue
+        res = sym
+        break
+    _pdb_element_symbols[memokey] = res
+    return res
+
+def _pdb_atomname_guess(key, atomname):
+    if not atomname:
+        return None
+    atomname = _pdb_atomname_exceptions.get(atomname, atomname)
+    if atomname[0] == 'H' and key == "atom":
+        atomname = "H"
+    return capitalize(atomname)
+
+def _readpdb_streaming(assy, 
+                       filename, 
+                       isInsert = False, 
+                       showProgressDialog = False, 
+                       chainId = None):
+    """
+    Read a Protein DataBank-format file, like _readpdb_new (see its
+    docstring for details), but reading the file one line at a time and
+    parsing its ATOM and HETATM records in blocks (see pdb_stream.py),
+    and inferring bonds from covalent radii, in bulk, rather than by
+    inferBonds.
+
+    @return: (list of new chunks or groups, comment text)
+    """
+    from protein.model.Protein import is_water
+
+    mollist = []
+
+    # Secondary structure, as dicts whose keys are (res_id, chain_id)
+    helix = {}
+    sheet = {}
+    turn = {}
+    
+    dir, nodename = os.path.split(filename)
+    if not isInsert:
+        assy.filename = filename
+
+    ndix = {}
+    water = Chunk(assy, nodename)
+    comment_text = ""
+    _read_rosetta_info = False
+    pdbid = nodename.replace(".pdb","").lower()
+
+    # each chain: [chunk, list of its atoms, list of their position arrays]
+    chain = [None, [], []]
+
+    def _new_chain():
+        mol = Chunk(assy, nodename)
+        mol.protein = Protein()
+        return [mol, [], []]
+
+    def _finish_chain(chain):
+        """
+        Like _finish_molecule in _readpdb_new.
+        """
+        mol, atoms, positions = chain
+        if mol is None:
+            return
+        if not mol.atoms:
+            env.history.message( redmsg( "Warning: Pdb file contained no atoms"))
+            env.history.h_update()
+            return
+        mol.name = pdbid.lower() + chainId
+        if mol.protein.count_c_alpha_atoms() == 0:
+            # not a protein -- split it into hetero groups
+            res_list = mol.protein.get_amino_acids()
+            assy.part.ensure_toplevel_group()
+            hetgroup = Group("Heteroatoms", assy, assy.part.topnode) 
+            for res in res_list:
+                hetmol = Chunk(assy, 
+                               res.get_three_letter_code().replace(" ", "") + \
+                               "[" + str(res.get_id()) + "]")
+                for atom in res.get_atom_list():
+                    Atom(atom.element.symbol, atom.posn(), hetmol)
+                infer_bonds_from_covalent_radii(hetmol.atoms.values())
+                hetgroup.addchild(hetmol)
+            mollist.append(hetgroup)
+        else:
+            infer_bonds_from_covalent_radii(atoms, Numeric.concatenate(positions),
+                                            processes = bond_inference_processes())
+            mol.protein.set_chain_id(chainId)
+            mol.protein.set_pdb_id(pdbid)
+            mollist.append(mol)
+        return
+
+    if showProgressDialog:
+        # progress is measured in bytes, since we don't read all the lines first
+        _progressValue = 0
+        _progressFinishValue = os.path.getsize(filename)
+        win = env.mainwindow()
+        win.progressDialog.setLabelText("Reading file...")
+        win.progressDialog.setRange(0, _progressFinishValue)
+        _progressDialogDisplayed = False
+        _timerStart = time.time()
+
+    chain = _new_chain()
+    fi = open(filename, "rU")
+    for key, record in read_pdb_records(fi):
+        if key == "atom":
+            block = record
+            mol, atoms, positions = chain
+            protein = mol.protein
+            keep = []
+            for i in range(len(block)):
+                alt = block.alts[i]
+                if alt != ' ' and alt != 'A':
+                    continue # skip non-standard alternate location
+                name = block.names[i]
+                chainId = block.chainIds[i]
+                resId = block.resIds[i]
+                resName = block.resNames[i]
+                sym = _pdb_element_symbol(block.keys[i], name, block.elementFields[i])
+                if sym is None:
+                    msg = "Warning: Pdb file: will use Carbon in place of unknown element %s in: %s" \
+                        % (name.replace(" ", "").replace("_", ""), block.cards[i])
+                    print msg
+                    env.history.message( redmsg( msg ))
+                    sym = "C"
+                name4 = name.replace(" ", "").replace("_", "")
+                if is_water(resName, name4):
+                    ndix[block.serials[i]] = Atom(sym, block.positions[i], water)
+                    continue
+                a = Atom(sym, block.positions[i], mol)
+                ndix[block.serials[i]] = a
+                atoms.append(a)
+                keep.append(i)
+                protein.add_pdb_atom(a, name4, resId, resName)
+                resKey = (resId, chainId)
+                if helix.has_key(resKey):
+                    protein.assign_helix(resId)
+                if sheet.has_key(resKey):
+                    protein.assign_strand(resId)
+                if turn.has_key(resKey):
+                    protein.assign_turn(resId)
+            positions.append(Numeric.take(block.positions, keep))
+        elif key == "conect":
+            card = record
+            try:
+                a1 = ndix[int(card[6:11])]
+            except:
+                env.history.message( redmsg( "Warning: Pdb file: can't find first atom in CONECT record: %s" % (card,) ))
+            else:
+                for i in range(11, 70, 5):
+                    try:
+                        a2 = ndix[int(card[i:i+5])]
+                    except ValueError:
+                        break
+                    except KeyError:
+                        env.history.message( redmsg( "Warning: Pdb file: can't find atom %s in: %s" % (card[i:i+5], card) ))
+                        continue
+                    bond_atoms(a1, a2)
+        elif key == "ter":
+            _finish_chain(chain)
+            chain = _new_chain()
+        elif key in ["header", "compnd", "remark"]:
+            if key == "header":
+                pdbid = record[62:66].lower()
+            comment_text += record
+        elif key == "model":
+            # ignore everything other than MODEL 1
+            if int(record[6:20]) > 1:
+                break
+        elif key in ["helix", "sheet", "turn"]:
+            card = record
+            if key == "helix":
+                begin, end, chainId, table = int(card[22:25]), int(card[34:37]), card[19], helix
+            elif key == "sheet":
+                begin, end, chainId, table = int(card[23:26]), int(card[34:37]), card[21], sheet
+            else:
+                begin, end, chainId, table = int(card[23:26]), int(card[34:37]), card[19], turn
+            for s in range(begin, end+1):
+                table[(s, chainId)] = True
+        else:
+            if record[7:15] == "ntrials:":
+                _read_rosetta_info = True
+                comment_text += "Rosetta Scoring Analysis\n"
+            if _read_rosetta_info:
+                comment_text += record
+        
+        if showProgressDialog: # Update the progress dialog.
+            if key == "atom":
+                _progressValue += sum(map(len, record.cards))
+            else:
+                _progressValue += len(record)
+            if _progressValue >= _progressFinishValue:
+                win.progressDialog.setLabelText("Building model...")
+            elif _progressDialogDisplayed:
+                win.progressDialog.setValue(_progressValue)
+            else:
+                _timerDuration = time.time() - _timerStart
+                if _timerDuration > 0.25: 
+                    win.progressDialog.setValue(_progressValue)
+                    _progressDialogDisplayed = True
+    fi.close()
+
+    if showProgressDialog: # Make the progress dialog go away.
+        win.progressDialog.setValue(_progressFinishValue) 
+
+    _finish_chain(chain)
+
+    if water.atoms:
+        water.name = "Solvent"
+        water.hide()
+        mollist.append(water)
+
+    return (mollist, comment_text)
+
+
 # read oa Protein DataBank-format file or insert it into a single Chunk
 # piotr 080715 refactored "read" and "insert" code so they both call
 # this method instead having a redundant code (the only difference is
@@ -668,7 +929,11 @@ def read_or_insert_pdb(assy,
     
     if enableProteins:
         
-        molecules, comment_text  = _readpdb_new(assy, 
+        if pref_streaming_pdb_io():
+            readpdb_function = _readpdb_streaming
+        else:
+            readpdb_function = _readpdb_new
+        molecules, comment_text  = readpdb_function(assy, 
                         filename, 
                         isInsert = isInsert, 
                         showProgressDialog = showProgressDialog,
@@ -886,6 +1151,77 @@ def writepdb(part,
     f = open(filename, mode) 
     # doesn't yet detect errors in opening file [bruce 050927 comment]
     
+    if mode == 'w':
+        writePDB_Header(f)
+        
+    if pref_streaming_pdb_io():
+        excluded = _writepdb_molecules_bulk(f, part.molecules, excludeFlags)
+    else:
+        excluded = _writepdb_molecules(f, part.molecules, excludeFlags)
+            
+    f.write("END\n")
+    
+    f.close()
+    
+    if excluded:
+        msg  = "Warning: excluded %d open bond(s) from saved PDB file; " \
+             % excluded
+        msg += "consider Hydrogenating and resaving." 
+        msg  = fix_plurals(msg)
+        env.history.message( orangemsg(msg))
+    return # from writepdb
+
+def _exclude_from_pdb(atm, excludeFlags): #bruce 050318
+    """
+    Exclude this atom (and bonds to it) from the file under the following
+    conditions (as selected by excludeFlags):
+        - if it is a singlet
+        - if it is not visible
+        - if it is a member of a hidden chunk
+        - some dna-related conditions (see code for details)
+    """
+    # Added not visible and hidden member of chunk. This effectively deletes
+    # these atoms, which might be considered a bug.
+    # Suggested solutions:
+    # - if the current file is a PDB and has hidden atoms/chunks, warn user
+    #   before quitting NE1 (suggest saving as MMP).
+    # - do not support native PDB. Open PDBs as MMPs; only allow export of
+    #   PDB.
+    # Fixes bug 2329. Mark 070423
+    
+    if excludeFlags & EXCLUDE_BONDPOINTS:
+        if atm.element == Singlet: 
+            return True # Exclude
+    if excludeFlags & EXCLUDE_HIDDEN_ATOMS:
+        if not atm.visible():
+            return True # Exclude
+    if excludeFlags & EXCLUDE_DNA_AXIS_ATOMS:
+##            if atm.element.symbol in ('Ax3', 'Ae3'):
+        #bruce 080320 bugfix: revise to cover new elements and PAM5.
+        if atm.element.role == 'axis':
+            return True # Exclude
+    if excludeFlags & EXCLUDE_DNA_ATOMS:
+        # PAM5 atoms begin at 200.
+        #
+        # REVIEW: better to check atom.element.pam?
+        # What about "carbon nanotube pseudoatoms"?
+        # [bruce 080320 question]
+        if atm.element.eltnum >= 200:
+            return True # Exclude
+    # Always exclude singlets connected to DNA p-atoms.
+    if atm.element == Singlet: 
+        for a in atm.neighbors():
+            if a.element.eltnum >= 200:
+                # REVIEW: see above comment about atom.element.pam vs >= 200
+                return True
+    return False # Don't exclude.
+
+def _writepdb_molecules(f, molecules, excludeFlags):
+    """
+    Write the ATOM, TER and CONECT records for the given chunks into the
+    open PDB file f, one atom at a time, for writepdb (see its docstring
+    for details). Return the number of atoms excluded.
+    """
     # Atom object's key is the key, the atomSerialNumber is the value  
     atomsTable = {}
     # Each element of connectLists is a list of atoms to be connected with the
@@ -896,64 +1232,16 @@ def writepdb(part,
 
     from protein.model.Protein import enableProteins
     
-    def exclude(atm): #bruce 050318
-        """
-        Exclude this atom (and bonds to it) from the file under the following
-        conditions (as selected by excludeFlags):
-            - if it is a singlet
-            - if it is not visible
-            - if it is a member of a hidden chunk
-            - some dna-related conditions (see code for details)
-        """
-        # Added not visible and hidden member of chunk. This effectively deletes
-        # these atoms, which might be considered a bug.
-        # Suggested solutions:
-        # - if the current file is a PDB and has hidden atoms/chunks, warn user
-        #   before quitting NE1 (suggest saving as MMP).
-        # - do not support native PDB. Open PDBs as MMPs; only allow export of
-        #   PDB.
-        # Fixes bug 2329. Mark 070423
-        
-        if excludeFlags & EXCLUDE_BONDPOINTS:
-            if atm.element == Singlet: 
-                return True # Exclude
-        if excludeFlags & EXCLUDE_HIDDEN_ATOMS:
-            if not atm.visible():
-                return True # Exclude
-        if excludeFlags & EXCLUDE_DNA_AXIS_ATOMS:
-##            if atm.element.symbol in ('Ax3', 'Ae3'):
-            #bruce 080320 bugfix: revise to cover new elements and PAM5.
-            if atm.element.role == 'axis':
-                return True # Exclude
-        if excludeFlags & EXCLUDE_DNA_ATOMS:
-            # PAM5 atoms begin at 200.
-            #
-            # REVIEW: better to check atom.element.pam?
-            # What about "carbon nanotube pseudoatoms"?
-            # [bruce 080320 question]
-            if atm.element.eltnum >= 200:
-                return True # Exclude
-        # Always exclude singlets connected to DNA p-atoms.
-        if atm.element == Singlet: 
-            for a in atm.neighbors():
-                if a.element.eltnum >= 200:
-                    # REVIEW: see above comment about atom.element.pam vs >= 200
-                    return True
-        return False # Don't exclude.
-
     excluded = 0
     molnum   = 1
     chainIdChar  = 65 # ASCII "A"
     
-    if mode == 'w':
-        writePDB_Header(f)
-        
-    for mol in part.molecules:
+    for mol in molecules:
         if mol.hidden:
             # Atoms and bonds of hidden chunks are never written.
             continue
         for a in mol.atoms.itervalues():
-            if exclude(a):
+            if _exclude_from_pdb(a, excludeFlags):
                 excluded += 1
                 continue
             atomConnectList = []
@@ -993,7 +1281,7 @@ def writepdb(part,
                             continue
                         
                 if a2.key in atomsTable:
-                    assert not exclude(a2) # see comment below
+                    assert not _exclude_from_pdb(a2, excludeFlags) # see comment below
                     atomConnectList.append(a2)
                 #bruce 050318 comment: the old code wrote every bond twice
                 # (once from each end). I doubt we want that, so now I only
@@ -1035,17 +1323,88 @@ def writepdb(part,
         # End CONECT record ----------------------------------
         connectLists = []
             
-    f.write("END\n")
-    
-    f.close()
+    return excluded
+
+def _writepdb_molecules_bulk(f, molecules, excludeFlags):
+    """
+    Like _writepdb_molecules, writing the same records, but formatting
+    and writing each chunk's ATOM records, and all CONECT records, in bulk
+    (see pdb_stream.py).
+    """
+    from protein.model.Protein import enableProteins
     
-    if excluded:
-        msg  = "Warning: excluded %d open bond(s) from saved PDB file; " \
-             % excluded
-        msg += "consider Hydrogenating and resaving." 
-        msg  = fix_plurals(msg)
-        env.history.message( orangemsg(msg))
-    return # from writepdb
+    atomsTable = {} # atom key -> atom serial number
+    connectLists = [] # lists of serial numbers for CONECT records
+    atomSerialNumber = 1
+    excluded = 0
+    molnum   = 1
+    chainIdChar  = 65 # ASCII "A"
+    axis_bonds_excluded = excludeFlags & EXCLUDE_DNA_AXIS_BONDS
+
+    for mol in molecules:
+        if mol.hidden:
+            # Atoms and bonds of hidden chunks are never written.
+            continue
+        atoms = []
+        for a in mol.atoms.itervalues():
+            if _exclude_from_pdb(a, excludeFlags):
+                excluded += 1
+            else:
+                atoms.append(a)
+        natoms = len(atoms)
+        serials = range(atomSerialNumber, atomSerialNumber + natoms)
+        atomSerialNumber += natoms
+        chainId = chr(chainIdChar)
+        atpos = mol.atpos
+        positions = Numeric.take(atpos, [a.index for a in atoms])
+        if enableProteins:
+            resIds = [1] * natoms
+            resNames = ["UNK"] * natoms
+            atomNames = [a.element.symbol for a in atoms]
+            if mol.protein:
+                for a, i in zip(atoms, range(natoms)):
+                    res = mol.protein.get_residuum(a)
+                    if res:
+                        resIds[i] = res.get_id()
+                        resNames[i] = res.get_three_letter_code()
+                        atomNames[i] = res.get_atom_name(a)
+            f.write(format_atom_records(serials,
+                                        map(pdb_atom_name_field, atomNames),
+                                        resNames, [chainId] * natoms, resIds,
+                                        positions,
+                                        [a.element.symbol for a in atoms]))
+        else:
+            symbols = [a.element.symbol for a in atoms]
+            f.write(format_atom_records(serials,
+                                        [" %-3s" % symbol for symbol in symbols],
+                                        ["   "] * natoms, [chainId] * natoms, [1] * natoms,
+                                        positions,
+                                        [symbol[:2].upper() for symbol in symbols],
+                                        plain = True))
+        for a, serial in zip(atoms, serials):
+            atomsTable[a.key] = serial
+            atomConnectList = [serial]
+            for b in a.bonds:
+                a2 = b.other(a)
+                if axis_bonds_excluded and \
+                   a.element.role == 'axis' and a2.element.role == 'axis':
+                    continue
+                serial2 = atomsTable.get(a2.key)
+                if serial2 is not None:
+                    atomConnectList.append(serial2)
+            if len(atomConnectList) > 1:
+                connectLists.append(atomConnectList)
+
+        # TER record (see _writepdb_molecules)
+        f.write("TER   %5d          %1s\n" % (molnum, chainId))
+
+        molnum += 1
+        chainIdChar += 1
+        if chainIdChar > 126: # ASCII "~", end of PDB-acceptable chain chars
+            chainIdChar = 32 # Rollover to ASCII " "
+
+    f.write(format_conect_records(connectLists))
+    return excluded
 
 
 def writePDB_Header(fileHandle):
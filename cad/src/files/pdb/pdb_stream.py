@@ -0,0 +1,247 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+pdb_stream.py -- read PDB records in blocks, and write PDB ATOM
+records in bulk.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for the streaming PDB reader and bulk PDB writer in files_pdb.py
+(used when pref_streaming_pdb_io is enabled), so that large PDB files
+(e.g. of protein assemblies) are not read into one list of lines, and
+each ATOM or HETATM line is not parsed (or written) by its own series
+of slicing, formatting and string concatenation operations.
+
+Usage:
+
+read_pdb_records(file) yields the records of a PDB file in order, except
+that each run of consecutive ATOM and HETATM records (up to blocksize of
+them) is yielded as one PdbAtomBlock, which holds the fields of those
+records in parallel lists and arrays (e.g. their positions as one N x 3
+array).
+
+format_atom_records returns the text of many ATOM records, given the
+same fields in parallel sequences.
+"""
+
+import Numeric
+from Numeric import Float
+
+ATOM_BLOCK_SIZE = 20000 # max number of ATOM/HETATM records per PdbAtomBlock
+
+# ==
+
+class PdbAtomBlock:
+    """
+    The fields of a run of consecutive ATOM and HETATM records from
+    a PDB file, in parallel lists (one element per record), except for
+    positions, which is an N x 3 Numeric array.
+
+    The field slices (and names) follow
+    U{B{ATOM Record Format}<http://www.wwpdb.org/documentation/format23/sect9.html#ATOM>}.
+    """
+    def __init__(self, cards):
+        """
+        @param cards: a list of ATOM or HETATM lines
+        """
+        self.cards = cards
+        self.keys = [card[:6].lower().replace(" ", "") for card in cards] # "atom" or "hetatm"
+        self.serials = [int(card[6:11]) for card in cards]
+        self.names = [card[12:16] for card in cards] # unstripped
+        self.alts = [card[16] for card in cards]
+        self.resNames = [card[17:20] for card in cards]
+        self.chainIds = [card[21] for card in cards]
+        self.resIds = [_int_or_0(card[22:26]) for card in cards]
+        self.elementFields = [card[77:78] for card in cards] # see files_pdb for why only one column
+        self.positions = Numeric.array(
+            [(float(card[30:38]), float(card[38:46]), float(card[46:54]))
+             for card in cards], Float)
+        if not cards:
+            self.positions = Numeric.zeros((0, 3), Float)
+        return
+
+    def __len__(self):
+        return len(self.cards)
+
+    pass
+
+def _int_or_0(field):
+    field = field.strip()
+    if field:
+        return int(field)
+    return 0
+
+def read_pdb_records(file, blocksize = ATOM_BLOCK_SIZE):
+    """
+    Generate the records of the PDB file (an open file object), in order,
+    as pairs (key, record). For each run of consecutive ATOM and HETATM
+    records (split into runs of at most blocksize records), key is "atom"
+    and record is a PdbAtomBlock. For all other records, key is the
+    record name in lowercase with spaces removed (e.g. "conect", "ter"),
+    and record is the line itself.
+
+    The file is read one line at a time, so the records of a large file
+    are never all in memory at once.
+    """
+    cards = []
+    for card in file:
+        key = card[:6].lower().replace(" ", "")
+        if key == "atom" or key == "hetatm":
+            cards.append(card)
+            if len(cards) >= blocksize:
+                yield "atom", PdbAtomBlock(cards)
+                cards = []
+            continue
+        if cards:
+            yield "atom", PdbAtomBlock(cards)
+            cards = []
+        yield key, card
+    if cards:
+        yield "atom", PdbAtomBlock(cards)
+    return
+
+# ==
+
+# The ATOM record as written by files_pdb.writepdb_atom, as one format.
+# Its fields are: serial number, atom name (already padded to 4 columns),
+# residue name, chain id, residue number, x, y, z, element symbol.
+_ATOM_RECORD_FORMAT = "ATOM  %5d %4s %3s %1s%4d    %8.3f%8.3f%8.3f  1.00  0.00          %2s  \n"
+
+# The same for Atom.writepdb, which leaves out occupancy and temperature factor.
+_PLAIN_ATOM_RECORD_FORMAT = "ATOM  %5d %4s %3s %1s%4d    %8.3f%8.3f%8.3f                      %2s  \n"
+
+def pdb_atom_name_field(atomName):
+    """
+    Return the 4-column atom name field (columns 13-16) of an ATOM record
+    for the given atom name, as writepdb_atom writes it.
+    """
+    if len(atomName) == 4:
+        return "%-4s" % atomName[:4]
+    return " %-3s" % atomName[:3]
+
+def format_atom_records(serials, nameFields, resNames, chainIds, resIds,
+                        positions, symbols, plain = False):
+    """
+    Return the text of a series of PDB ATOM records (the same text that
+    writepdb_atom would write for each one), given their fields in
+    parallel sequences.
+
+    If plain is true, use the format of Atom.writepdb instead (which
+    leaves out occupancy and temperature factor; its callers should pass
+    the names, residue names and numbers it writes, and uppercase symbols).
+
+    @param nameFields: the atom names, already passed through
+                       pdb_atom_name_field
+
+    @param positions: N x 3 array of atom positions, in Angstroms
+
+    @param symbols: element symbols
+    """
+    positions = Numeric.array(positions, Float)
+    if not len(positions):
+        return ""
+    # (tolist makes Python floats, which format much faster than array elements)
+    xs = positions[:,0].tolist()
+    ys = positions[:,1].tolist()
+    zs = positions[:,2].tolist()
+    format = plain and _PLAIN_ATOM_RECORD_FORMAT or _ATOM_RECORD_FORMAT
+    return "".join([format % fields for fields in
+                    zip(serials, nameFields, resNames,
+                        [chainId.upper() for chainId in chainIds],
+                        resIds, xs, ys, zs,
+                        [symbol[:2] for symbol in symbols])])
+
+def format_conect_records(connectLists):
+    """
+    Return the text of the CONECT records for the given lists of
+    atom serial numbers (each list giving one atom and the atoms bonded
+    to it).
+    """
+    return "".join(["CONECT" + "".join(["%5d" % serial for serial in serials]) + "\n"
+                    for serials in connectLists])
+
+# ==
+
+def _write_test_pdb(filename, nresidues):
+    """
+    Write a PDB file of a synthetic protein-like structure, with
+    nresidues residues of 10 atoms each (in chains of 500 residues)
+    and no CONECT records, for _benchmark.
+    """
+    # a residue's atoms, relative to its N atom (loosely like serine
+    # with its hydrogens)
+    residue = [(" N  ", "N", (0.0, 0.0, 0.0)),
+               (" CA ", "C", (1.46, 0.0, 0.0)),
+               (" C  ", "C", (2.55, 0.95, 0.0)),
+               (" O  ", "O", (2.55, 2.18, 0.0)),
+               (" CB ", "C", (1.46, -0.9, -1.2)),
+               (" OG ", "O", (1.46, -0.9, -2.63)),
+               (" H  ", "H", (-0.5, -0.87, 0.0)),
+               (" HA ", "H", (1.82, -0.52, 0.89)),
+               (" HB2", "H", (1.46, -1.9, -0.9)),
+               (" HG ", "H", (1.46, -1.85, -2.9))]
+    f = open(filename, "w")
+    serial = 1
+    for r in range(nresidues):
+        chain = chr(ord('A') + (r / 500) % 26)
+        # residues go along x (with peptide bonds), rows of 20 along y,
+        # layers of 400 along z
+        x0 = 3.5 * (r % 20)
+        y0 = 6.0 * ((r / 20) % 20)
+        z0 = 6.0 * (r / 400)
+        for name, symbol, (x, y, z) in residue:
+            f.write("ATOM  %5d %4s SER %1s%4d    %8.3f%8.3f%8.3f  1.00  0.00          %2s  \n" %
+                    (serial % 100000, name, chain, r % 10000,
+                     x0 + x, y0 + y, z0 + z, symbol))
+            serial += 1
+        if r % 500 == 499 or r == nresidues - 1:
+            f.write("TER\n")
+    f.write("END\n")
+    f.close()
+    return
+
+def _benchmark(nresidues = 2000):
+    """
+    Compare the time to read (including bond inference) and write a
+    synthetic PDB file of 10 * nresidues atoms using the per-line
+    reader and per-atom writer, and using the streaming reader and bulk
+    writer, printing atom and bond counts to show they match.
+    """
+    import os, tempfile, time
+    from model.assembly import Assembly
+    import files.pdb.files_pdb as files_pdb
+    Assembly.initialize()
+    filename = tempfile.mktemp(".pdb")
+    outname = tempfile.mktemp(".pdb")
+    _write_test_pdb(filename, nresidues)
+    print "PDB benchmark, %d atoms:" % (10 * nresidues)
+    for name, reader, writer in \
+            [("per-line", files_pdb._readpdb_new, files_pdb._writepdb_molecules),
+             ("streaming", files_pdb._readpdb_streaming, files_pdb._writepdb_molecules_bulk)]:
+        assy = Assembly(None, run_updaters = False)
+        t0 = time.time()
+        mollist, comment_text = reader(assy, filename, isInsert = True)
+        t1 = time.time()
+        natoms = nbonds = 0
+        for mol in mollist:
+            natoms += len(mol.atoms)
+            for atom in mol.atoms.itervalues():
+                nbonds += len(atom.bonds)
+        f = open(outname, "w")
+        t2 = time.time()
+        writer(f, mollist, files_pdb.EXCLUDE_BONDPOINTS)
+        t3 = time.time()
+        f.close()
+        print "  %-9s read %7.2f sec (%d atoms, %d bonds), write %6.2f sec (%d bytes)" % \
+              (name, t1 - t0, natoms, nbonds / 2, t3 - t2, os.path.getsize(outname))
+    os.remove(filename)
+    os.remove(outname)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -35,6 +35,7 @@ from utilities.constants import genKey
 from foundation.state_utils import copy_val, StateMixin
 from utilities.Log import redmsg, orangemsg
 from foundation.state_constants import S_PARENT, S_DATA, S_CHILD
+from foundation.changedicts import register_changedict
 
 from utilities.icon_utilities import imagename_to_pixmap
 
@@ -44,6 +45,21 @@ debug_undoable_attrs = False
 
 # ==
 
+# Changedict for Nodes whose own undoable attributes (not those of their
+# atoms, which chem.py tracks separately) might have changed; maps id(node)
+# to node. Most nodes get into it via Node.changed or Node.changed_selection,
+# which also tell the assy that the change was recorded here. Incremental
+# Undo checkpoints use this to rescan only these nodes, rather than all of
+# them, when all the changes since the last checkpoint were recorded.
+# Like the Atom changedicts, it's periodically processed and cleared
+# (by Undo), and may contain nodes from more than one assy.
+
+_changed_Nodes = {}
+
+register_changedict( _changed_Nodes, '_changed_Nodes', () )
+
+# ==
+
 # Unique id for all Nodes -- might generalize to other objects too.
 # Unlike python builtin id(node), this one will never be reused
 # when an old node dies.
@@ -152,6 +168,11 @@ class Node( StateMixin):
         # foolishly set to None, which is a change we need to undo when we
         # revive them. TODO: stop doing that, have a killed flag instead.
 
+    _s_undo_changes_recorded = True
+        # tells incremental Undo checkpoints that changes to our undoable
+        # attrs are recorded in _changed_Nodes, so we needn't be rescanned
+        # unless we're in there (other state-holding objects always are)
+
     def _undo_update(self): #bruce 060223
         # no change to .part, since that's declared as S_CHILD
         self.prior_part = None
@@ -455,7 +476,8 @@ class Node( StateMixin):
         than not calling it when needed.
         """
         if self.part is not None:
-            self.part.changed()
+            _changed_Nodes[id(self)] = self
+            self.part.changed(node_recorded = True)
                 #e someday we'll do self.changed which will do dad.changed....
         elif self.assy is not None:
             pass
@@ -1034,7 +1056,20 @@ class Node( StateMixin):
         (Group members or Chunk atoms) might have changed.
         """
         if self.assy is not None:
-            self.assy.changed_selection()
+            _changed_Nodes[id(self)] = self
+            self.assy.changed_selection(node_recorded = True)
+        return
+
+    def _f_changed_for_undo(self):
+        """
+        [friend method, for code which changes undoable state of self
+         without calling self.changed() or self.changed_selection()]
+
+        Record that some undoable attribute of self might have changed,
+        so incremental Undo checkpoints will rescan self. This doesn't
+        mark the model as modified.
+        """
+        _changed_Nodes[id(self)] = self
         return
 
     def unpick_all_except(self, node):
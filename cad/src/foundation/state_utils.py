@@ -466,6 +466,8 @@ class InstanceClassification(Classification): #k used to be called StateHolderIn
                 pass
             elif name == '_s_undo_class_alias':
                 pass
+            elif name == '_s_undo_changes_recorded':
+                pass # used by modify_and_diff_snap_for_changed_nodes
             elif name.startswith('_s_categorize_'):
                 #060227; #e should we rename it _s_category_ ?? do we still need it, now that we have _s_attrlayer_ ? (we do use it)
                 attr_its_about = name[len('_s_categorize_'):]
@@ -1031,6 +1033,11 @@ class StateSnapshot:
     the same for all objects in one attrdict.
     """
     #e later we'll have one for whole state and one for differential state and decide if they're different classes, etc
+
+    _childobj_dict = None # set by mmp_state_by_scan, and kept valid by incremental checkpoints (see diff_and_copy_state)
+
+    _unrecorded_change_counter = None # value of assy.unrecorded_change_counter() when we were made to equal current state
+
     def __init__(self, attrcodes = (), debugname = ""):
         self.debugname = debugname
         self.attrdicts = {} # maps attrcodes to their dicts; each dict maps objkeys to values; public attribute for efficiency(??)
@@ -1291,17 +1298,24 @@ def diffdicts(d1, d2, dflt = None, whatret = 0, val_diff_func = None):
 ##            print "one place we can make a %s priorstate like %r is: %s" % (what, priorstate, stack)
 ##    return
 
-def diff_and_copy_state(archive, assy, priorstate): #060228 (#e maybe this is really an archive method? 060408 comment & revised docstring)
+def diff_and_copy_state(archive, assy, priorstate, incremental = False, costs = None): #060228 (#e maybe this is really an archive method? 060408 comment & revised docstring)
     """
     Figure out how the current actual model state (of assy) differs from the last model state we archived (in archive/priorstate).
     Return a new StatePlace (representing a logically immutable snapshot of the current model state)
     which presently owns a complete copy of that state (a mutable StateSnapshot which always tracks our most recent snapshot
     of the actual state), but is willing to give that up (and redefine itself (equivalently) as a diff from a changed version of that)
     when this function is next called.
+
+    If incremental is true, and all changes since priorstate was made were recorded in changedicts
+    (see assy.unrecorded_change_counter), only rescan the nodes recorded as changed (and the few
+    state-holding objects which aren't nodes), rather than all reachable objects. (Atoms and bonds
+    are always handled incrementally.)
+
+    If costs is provided, it should be a CheckpointCosts object (see undo_archive), which we'll fill in.
     """
     # background: we keep a mutable snapshot of the last checkpointed state. right now it's inside priorstate (and defines
     # that immutable-state-object's state), but we're going to grab it out of there and modify it to equal actual current state
-    # (as derived from assy using archive), and make a diffobject which records how we had to change it. Then we'll donate it
+    # (as derived from assy using archive), and make a diffobj which records how we had to change it. Then we'll donate it
     # to a new immutable-state-object we make and return (<new>). But we don't want to make priorstate unusable
     # or violate its logical immutability, so we'll tell it to define itself (until further notice) based on <new> and <diffobj>.
 
@@ -1310,29 +1324,122 @@ def diff_and_copy_state(archive, assy, priorstate): #060228 (#e maybe this is re
     new = StatePlace() # will be given stewardship of our maintained copy of almost-current state, and returned
     # diffobj is not yet needed now, just returned from diff_snapshots_oneway:
     ## diffobj = DiffObj() # will record diff from new back to priorstate (one-way diff is ok, if traversing it also reverses it)
+    # (grab these before steal_lastsnap discards the childobj dict:)
+    prior_childobj_dict = priorstate.lastsnap._childobj_dict
+    prior_unrecorded_change_counter = priorstate.lastsnap._unrecorded_change_counter
     steal_lastsnap_method = priorstate.steal_lastsnap
     lastsnap = steal_lastsnap_method( ) # and we promise to replace it with (new, diffobj) later, so priorstate is again defined
     assert isinstance(lastsnap, StateSnapshot) # remove when works, eventually ###@@@
     # now we own lastsnap, and we'll modify it to agree with actual current state, and record the changes required to undo this...
     # 060329: this (to end of function) is where we have to do things differently when we only want to scan changed objects.
     # So we do the old full scan for most kinds of things, but not for the 'atoms layer' (atoms, bonds, Chunk.atoms attr).
-    import foundation.undo_archive as undo_archive #e later, we'll inline this until we reach a function in this file
-    cursnap = undo_archive.current_state(archive, assy, use_060213_format = True, exclude_layers = ('atoms',)) # cur state of child objs
+    unrecorded_change_counter = getattr(assy, 'unrecorded_change_counter', lambda: None)()
+    changed_nodes = archive.get_and_clear_changed_nodes() # get these even if we won't use them, so they don't pile up
     lastsnap_diffscan_layers = lastsnap.extract_layers( ('atoms',) ) # prior state of atoms & bonds, leaving only childobjs in lastsnap
-    diffobj = diff_snapshots_oneway( cursnap, lastsnap ) # valid for everything except the 'atoms layer' (atoms & bonds)
-    ## lastsnap.become_copy_of(cursnap) -- nevermind, just use cursnap
-    lastsnap = cursnap
-    del cursnap
-
-    modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers, ('atoms',), diffobj, lastsnap._childobj_dict ) #060404
+    diffobj = None
+    if incremental and prior_childobj_dict is not None and \
+       unrecorded_change_counter is not None and \
+       unrecorded_change_counter == prior_unrecorded_change_counter:
+        # the set of reachable objects can only have changed if some node's
+        # children did, and we'll notice that when we rescan it
+        diffobj = modify_and_diff_snap_for_changed_nodes( archive, lastsnap, changed_nodes, prior_childobj_dict, costs )
+            # (this returns None, without modifying lastsnap, if it can't finish)
+        if diffobj is not None:
+            lastsnap._childobj_dict = prior_childobj_dict
+    if diffobj is None:
+        # full scan of all objects except the atoms layer
+        import foundation.undo_archive as undo_archive #e later, we'll inline this until we reach a function in this file
+        cursnap = undo_archive.current_state(archive, assy, use_060213_format = True, exclude_layers = ('atoms',)) # cur state of child objs
+        diffobj = diff_snapshots_oneway( cursnap, lastsnap ) # valid for everything except the 'atoms layer' (atoms & bonds)
+        ## lastsnap.become_copy_of(cursnap) -- nevermind, just use cursnap
+        lastsnap = cursnap
+        del cursnap
+        if costs is not None:
+            costs.mode = 'full'
+            costs.scanned_objs = len(lastsnap._childobj_dict)
+
+    modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers, ('atoms',), diffobj, lastsnap._childobj_dict,
+                                              costs = costs ) #060404
     
     lastsnap.insert_layers(lastsnap_diffscan_layers)
+    lastsnap._unrecorded_change_counter = unrecorded_change_counter
     new.own_this_lastsnap(lastsnap)
     priorstate.define_by_diff_from_stateplace(diffobj, new)        
     new.really_changed = not not diffobj.nonempty() # remains correct even when new's definitional content changes
+    if costs is not None:
+        costs.diff_size = diffobj.size()
     return new
 
-def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers, layers, diffobj, childobj_dict ): #060404
+def modify_and_diff_snap_for_changed_nodes( archive, lastsnap, changed_nodes, childobj_dict, costs = None ):
+    """
+    [private helper for diff_and_copy_state, for incremental checkpoints]
+
+    Assuming that lastsnap (a StateSnapshot without its atoms layer) was
+    made when the objects reachable from our assy were the values of
+    childobj_dict, and that since then, only the nodes in changed_nodes
+    (a dict from id(node) to node, perhaps also containing nodes we don't
+    own) and the state-holding objects which aren't nodes might have
+    changed, modify lastsnap to agree with the current state of those
+    objects, and return a DiffObj which records how to undo that.
+
+    If any of them has changed which objects it has as children (e.g. a
+    Group's members), the reachable objects might have changed, so we
+    give up (leaving lastsnap unmodified) and return None; the caller
+    should do a full scan instead.
+    """
+    objclsfr = archive.obj_classifier
+    ci = objclsfr.classify_instance
+    # which objects to rescan
+    rescan = {}
+    for idobj, obj in childobj_dict.iteritems():
+        if not getattr(obj, '_s_undo_changes_recorded', False):
+            rescan[idobj] = obj
+    for idobj, obj in changed_nodes.iteritems():
+        if childobj_dict.get(idobj) is obj:
+            # (nodes not in childobj_dict are either not ours or not
+            #  reachable; in the latter case, they can only become reachable
+            #  by a change to some node's children, which is never recorded,
+            #  so it would have prevented us from being called)
+            rescan[idobj] = obj
+    cursnap = objclsfr.collect_state( rescan, archive.objkey_allocator, exclude_layers = ('atoms',) )
+    # find the differences, without yet modifying lastsnap
+    key4obj = archive.objkey_allocator.key4obj_maybe_new # (all these objs got keys from collect_state)
+    cur_attrdicts = cursnap.attrdicts
+    state_attrdicts = lastsnap.attrdicts
+    changes = [] # list of (attrcode, key, newval, oldval)
+    for obj in rescan.itervalues():
+        key = key4obj(obj)
+        clas = ci(obj)
+        for attrcode in clas.dict_of_all_state_attrcodes.iterkeys():
+            attr, acode_unused = attrcode
+            if clas.exclude(attr, ('atoms',)):
+                continue
+            newval = cur_attrdicts.get(attrcode, {}).get(key, _UNSET_)
+            oldval = state_attrdicts.get(attrcode, {}).get(key, _UNSET_)
+            if not same_vals(oldval, newval):
+                if attr in clas.S_CHILDREN_attrs:
+                    if costs is not None:
+                        costs.fallback_reason = "children of %s changed" % clas.class1.__name__
+                    return None
+                changes.append( (attrcode, key, newval, oldval) )
+    # modify lastsnap (newval is already a copy, made by collect_state)
+    diffobj = DiffObj()
+    diff_attrdicts = diffobj.attrdicts
+    for attrcode, key, newval, oldval in changes:
+        state_attrdict = state_attrdicts.setdefault(attrcode, {})
+        if newval is _UNSET_:
+            state_attrdict.pop(key, None)
+        else:
+            state_attrdict[key] = newval
+        diff_attrdicts.setdefault(attrcode, {})[key] = oldval
+    if costs is not None:
+        costs.mode = 'incremental'
+        costs.scanned_objs = len(rescan)
+        costs.changed_nodes = len(changed_nodes)
+    return diffobj
+
+def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers, layers, diffobj, childobj_dict,
+                                               costs = None ): #060404
     #e rename lastsnap_diffscan_layers
     """
     [this might become a method of the undo_archive; it will certainly be generalized, as its API suggests]
@@ -1340,6 +1447,7 @@ def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers,
     - Use those to modify lastsnap_diffscan_layers to cover changes tracked
       in the layers specified (for now only 'atoms' is supported),
     - and record the diffs from that into diffobj.
+    - If costs is provided, record how many changed atoms and bonds we saw in it.
     """
     assert len(layers) == 1 and layers[0] == 'atoms' # this is all that's supported for now
     # Get the sets of possibly changed objects... for now, this is hardcoded as 2 dicts, for atoms and bonds,
@@ -1352,6 +1460,9 @@ def modify_and_diff_snap_for_changed_objects( archive, lastsnap_diffscan_layers,
     #  which knows the attrs it contains? yes, that would be good... for some pseudocode
     #  related to this, see commented-out method xxx, just below.]
     chgd_atoms, chgd_bonds = archive.get_and_clear_changed_objs()
+    if costs is not None:
+        costs.changed_atoms = len(chgd_atoms)
+        costs.changed_bonds = len(chgd_bonds)
     if (env.debug() or DEBUG_PYREX_ATOMS):
         print "\nchanged objects: %d atoms, %d bonds" % (len(chgd_atoms), len(chgd_bonds))
     # discard wrong assy atoms... can we tell by having an objkey? ... imitate collect_s_children and (mainly) collect_state
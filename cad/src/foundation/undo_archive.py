@@ -1426,6 +1426,30 @@ class MergingDiff(Delegator): ###@@@ this is in use, but has no effect [as of bf
 
 # ==
 
+class CheckpointCosts:
+    """
+    Counters describing the work done by one undo checkpoint
+    (see AssyUndoArchive.last_checkpoint_costs).
+    """
+    mode = 'unchanged' # 'full' or 'incremental' (how non-atom state was scanned), or 'unchanged'
+    fallback_reason = "" # why an incremental checkpoint had to do a full scan instead, if it did
+    scanned_objs = 0 # number of non-atom-layer objects whose state was collected
+    changed_nodes = 0 # number of nodes recorded as changed (incremental mode only)
+    changed_atoms = 0 # number of atoms reported by changedicts (perhaps including other assys' atoms)
+    changed_bonds = 0 # same, for bonds
+    diff_size = 0 # number of attribute values in the diff from the prior checkpoint
+    seconds = 0.0 # elapsed time for the whole checkpoint
+    def __repr__(self):
+        res = "<%s %s: %d objs scanned" % (self.__class__.__name__, self.mode, self.scanned_objs)
+        if self.mode == 'incremental':
+            res += " (%d changed nodes)" % self.changed_nodes
+        res += ", %d atoms, %d bonds, diff size %d, %.4f sec" % \
+               (self.changed_atoms, self.changed_bonds, self.diff_size, self.seconds)
+        if self.fallback_reason:
+            res += " (not incremental since %s)" % self.fallback_reason
+        return res + ">"
+    pass
+
 class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_older # TODO: maybe assy.changed will tell us...
     """
     #docstring is in older code... maintains a series (or graph) of checkpoints and diffs connecting them....
@@ -1456,6 +1480,8 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
     copy_val = state_utils.copy_val #060216, might turn out to be a temporary kluge ###@@@
 
     _undo_archive_initialized = False
+
+    last_checkpoint_costs = None # a CheckpointCosts for our most recent checkpoint (public, for debugging and benchmarks)
     
     def __init__(self, assy):
         """
@@ -1483,7 +1509,8 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         ## self.all_changed_objs = {} # this one dict subscribes to all changes on all attrs of all classes of object (for now)
         self.all_changed_Atoms = {} # atom.key -> atom, for all changed Atoms (all attrs lumped together; this could be changed)
         self.all_changed_Bonds = {} # id(bond) -> bond, for all changed Bonds (all attrs)
-        self.ourdicts = (self.all_changed_Atoms, self.all_changed_Bonds,) #e use this more
+        self.all_changed_Nodes = {} # id(node) -> node, for Nodes recorded as changed (see Utility._changed_Nodes)
+        self.ourdicts = (self.all_changed_Atoms, self.all_changed_Bonds, self.all_changed_Nodes,) #e use this more
         # rest of init is done later, by self.initial_checkpoint, when caller is more ready [060223]
         ###e not sure were really initialized enough to return... we'll see
         return
@@ -1585,11 +1612,29 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         self._changedicts = [] # ditto
         self.sub_or_unsub_changedicts(True)
         self.setup_changedicts() # do this after sub_or_unsub, to test its system for hearing about redefined classes later [060330]
+        self._subscribe_to_changed_Nodes()
+        self.clear_changed_object_sets()
+            # Changes still pending in the global changedicts happened before
+            # the scan above, so they're already in cp. Without this, the first
+            # real checkpoint would rescan all atoms made before this one
+            # (e.g. all atoms read from a file, if no updater drained them).
         self._undo_archive_initialized = True # should come before _setup_next_cp
         self._setup_next_cp() # don't know cptype yet (I hope it's 'begin_cmd'; should we say that to the call? #k)
         ## self.notify_observers() # current API doesn't permit this to do anything during __init__, since subs is untouched then
         return
 
+    def _subscribe_to_changed_Nodes(self):
+        """
+        [private]
+        Subscribe to the changedict of Nodes recorded as changed.
+        (Unlike the per-class changedicts, this one is not found by
+        _archive_meet_class, since Nodes are not change-tracked per attr.)
+        """
+        from foundation.Utility import _changed_Nodes
+        self._changedicts.append( (_changed_Nodes, self.all_changed_Nodes) )
+        self.sub_or_unsub_to_one_changedict(True, _changed_Nodes, self.all_changed_Nodes)
+        return
+
     def setup_changedicts(self):
         assert not self._changedicts, "somehow setup_changedicts got called twice, since we already have some, "\
                "and calling code didn't kluge this to be ok like it does in initial_checkpoint in case it's called from self._clear"
@@ -1823,6 +1868,18 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
         self.all_changed_Atoms.clear()
         self.all_changed_Bonds.clear()
         return res
+
+    def get_and_clear_changed_nodes(self):
+        """
+        Clear, and return a copy of, the changed-nodes dict (id -> node).
+        (It might contain nodes which are not ours.)
+        """
+        for changedict, ourdict_junk in self._changedicts:
+            cdp = changedicts._cdproc_for_dictid[id(changedict)]
+            cdp.process_changes()
+        res = dict(self.all_changed_Nodes)
+        self.all_changed_Nodes.clear()
+        return res
     
     def destroy(self): #060126 precaution
         """
@@ -1901,6 +1958,7 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
 
     def clear_changed_object_sets(self): #060407
         self.get_and_clear_changed_objs(want_retval = False)
+        self.all_changed_Nodes.clear()
         
     def clear_undo_stack(self): #bruce 060126 to help fix bug 1398 (open file left something on Undo stack) [060304 removed *args, **kws]
         # note: see also: comments in self.initial_checkpoint,
@@ -1939,6 +1997,23 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
                          prefs_key = "_debug_pref_key:" + "undo/report all checkpoints")
         return res
 
+    def pref_incremental_checkpoints(self):
+        """
+        whether to let checkpoints rescan only the nodes recorded as changed
+        (when all changes were recorded), rather than all reachable nodes
+        """
+        res = debug_pref("undo: incremental checkpoints?", Choice_boolean_False,
+                         prefs_key = "A10-devel/undo incremental checkpoints")
+        return res
+
+    def pref_report_checkpoint_costs(self):
+        """
+        whether to print the costs of every checkpoint which sees changes
+        """
+        res = debug_pref("undo: print checkpoint costs?", Choice_boolean_False,
+                         prefs_key = "A10-devel/undo print checkpoint costs")
+        return res
+
     def debug_histmessage(self, msg):
         env.history.message(msg, quote_html = True, color = 'gray')
 
@@ -1987,6 +2062,9 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
                 print_compact_stack("debug note: undo_archive not yet initialized (maybe not an error)")
             return
 
+        costs = CheckpointCosts()
+        start_time = time.time()
+
 ##        if 0: # bug 1440 debug code 060320, and 1747 060323
 ##            print_compact_stack("undo cp, merge=%r: " % merge_with_future)
         
@@ -2108,7 +2186,9 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
                 else:
                     #060228
                     assert self.format_options == dict(use_060213_format = True), "nim for mmp kluge code" #e in fact, remove that code when new bugs gone
-                    state = diff_and_copy_state(self, self.assy, self.last_cp.state)
+                    state = diff_and_copy_state(self, self.assy, self.last_cp.state,
+                                                incremental = self.pref_incremental_checkpoints(),
+                                                costs = costs )
 #obs, it's fixed now [060301]
 ##                        # note: last_cp.state is no longer current after an Undo!
 ##                        # so this has a problem when we're doing the end-cmd checkpoint after an Undo command.
@@ -2194,6 +2274,10 @@ class AssyUndoArchive: # modified from UndoArchive_older and AssyUndoArchive_old
     ##        self.last_cp_arrival_reason = cptype # affects semantics of Undo/Redo user-level ops
     ##            # (this is not redundant, since it might differ if we later revisit same cp as self.last_cp)
             self._setup_next_cp() # sets self.next_cp and self.current_diff
+        costs.seconds = time.time() - start_time
+        self.last_checkpoint_costs = costs
+        if costs.mode != 'unchanged' and self.pref_report_checkpoint_costs():
+            print "undo checkpoint %r costs: %r" % (cptype, costs)
         return
 
     def clear_redo_stack( self, from_cp = None, except_diff = None ): #060309 (untested)
@@ -2436,4 +2520,45 @@ def make_assy_varid(assy_debug_name):
     ## return 'varid_stub_' + (assy_debug_name or "") #e will come from assy itself
     return ASSY_VARID_STUB # stub, but should work
 
+# ==
+
+def _benchmark_checkpoints(sizes = (1000, 10000, 100000), nedits = 20):
+    """
+    Time undo checkpoints after single-atom edits in a one-chunk model
+    of each given size, with and without incremental checkpoints.
+    With them, the time per checkpoint should not depend on model size.
+    """
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from geometry.VQT import V
+    Assembly.initialize()
+    for n in sizes:
+        for incremental in (False, True):
+            assy = Assembly(None, run_updaters = False)
+            mol = Chunk(assy, "bench")
+            for i in range(n):
+                Atom('C', V(i * 1.5, (i % 7) * 1.1, (i % 13) * 1.3), mol)
+            assy.addmol(mol)
+            archive = AssyUndoArchive(assy)
+            # bypass the debug_pref, so we don't change the user's prefs db
+            archive.pref_incremental_checkpoints = lambda: incremental
+            archive.initial_checkpoint()
+            atoms = mol.atoms.values()
+            def edit(atom):
+                atom.setposn(atom.posn() + V(0.1, 0, 0))
+                archive.checkpoint(cptype = 'end_cmd')
+            edit(atoms[-1]) # warm up (the first one after a full scan is never incremental)
+            t0 = time.time()
+            for atom in atoms[:nedits]:
+                edit(atom)
+            per_cp = (time.time() - t0) / nedits
+            print "%7d atoms, incremental = %-5r: %.5f sec per checkpoint; last: %r" % \
+                  (n, incremental, per_cp, archive.last_checkpoint_costs)
+            archive.destroy()
+    return
+
+if __name__ == '__main__':
+    _benchmark_checkpoints()
+
 # end
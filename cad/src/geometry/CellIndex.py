@@ -0,0 +1,306 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+CellIndex.py -- array-backed spatial index for finding nearby points
+in bulk.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written as a vectorized replacement for the per-atom dict buckets
+in NeighborhoodGenerator, which is now a thin compatibility layer
+that uses this class for its bulk-loaded atoms.
+
+Implementation notes:
+
+Space is divided into cubic cells at least as large as the largest
+query radius. Each point gets an integer cell id; the points are
+sorted by cell id once (one argsort), after which the points in any
+cell form a contiguous run of the sorted order, found by searchsorted.
+A query over many points or centers then becomes, for each of the 27
+(or, for pairs, 14) neighboring cell offsets, a handful of whole-array
+operations, with no Python code per point.
+
+The cell grid has one cell of padding on each side, so that neighbor
+cell ids of occupied cells never alias other occupied cells. Query
+centers outside the grid are clamped into the padding layer; this can
+only add candidates which the distance test then removes.
+
+All results are returned as Numeric index arrays into the positions
+passed to the constructor.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+# largest cell id we allow, to avoid overflowing Numeric.Int on platforms
+# where it's 32 bits; if exceeded, cells are made larger (which is always
+# correct, only slower)
+_MAX_CELL_ID = 2**31 - 1
+
+# cell offsets (di, dj, dk) for all 27 neighbors of a cell, including itself
+_ALL_OFFSETS = [(i, j, k)
+                for i in (-1, 0, 1)
+                for j in (-1, 0, 1)
+                for k in (-1, 0, 1)]
+
+# a "half shell" of 13 neighbor offsets, such that for every pair of
+# adjacent distinct cells exactly one sees the other; used with the
+# zero offset to enumerate each pair of points once
+_HALF_OFFSETS = [off for off in _ALL_OFFSETS if off > (0, 0, 0)]
+
+_EMPTY = Numeric.zeros((0,), Int)
+
+def _expand_ranges(starts, counts):
+    """
+    Given equal-length Int arrays of range starts and counts, return
+    (owners, indices), where owners[m] is the index (into starts) of the
+    range that contains the m-th element of the concatenation of all the
+    ranges, and indices[m] is that element. Empty ranges contribute
+    nothing.
+    """
+    total = Numeric.add.reduce(counts)
+    if not total:
+        return _EMPTY, _EMPTY
+    owners = Numeric.repeat(Numeric.arange(len(counts)), counts)
+    # position of each element within its own range
+    firsts = Numeric.add.accumulate(counts) - counts
+    within = Numeric.arange(total) - Numeric.take(firsts, owners)
+    indices = Numeric.take(starts, owners) + within
+    return owners, indices
+
+class CellIndex:
+    """
+    Spatial index over a fixed N x 3 array of points, for answering
+    fixed-radius neighbor queries in bulk.
+
+    Construction sorts the points by cell, in O(N log N) time but with
+    only a few array operations. Queries return index arrays into the
+    original points, and never call Python code per point.
+
+    The index is immutable; to index moved points, make a new one.
+    (For a mutable, per-atom interface, see NeighborhoodGenerator.)
+    """
+    def __init__(self, positions, cellsize):
+        """
+        @param positions: N x 3 array (or sequence of 3-vectors) of points.
+
+        @param cellsize: edge length of a cell; must be at least as large
+                         as the largest radius that will be queried.
+                         (Cells may be made larger if needed.)
+        """
+        assert cellsize > 0
+        positions = Numeric.array(positions, Float)
+        if len(positions) == 0:
+            positions = Numeric.zeros((0, 3), Float)
+        self.positions = positions
+        self.cellsize = 1.0 * cellsize
+        n = len(positions)
+        if not n:
+            self._origin = Numeric.zeros((3,), Float)
+            self._dims = (1, 1, 1)
+            self._order = _EMPTY
+            self._sorted_ids = _EMPTY
+            return
+        self._origin = Numeric.minimum.reduce(positions)
+        extent = Numeric.maximum.reduce(positions) - self._origin
+        while 1:
+            # +1 for the last occupied cell, +2 for padding on both sides
+            dims = tuple([int(x / self.cellsize) + 3 for x in extent])
+            if float(dims[0]) * dims[1] * dims[2] < _MAX_CELL_ID:
+                break
+            self.cellsize *= 2.0
+        self._dims = dims
+        ids = self._cell_ids(self._cell_coords(positions))
+        self._order = Numeric.argsort(ids)
+        self._sorted_ids = Numeric.take(ids, self._order)
+        return
+
+    def __len__(self):
+        return len(self.positions)
+
+    # == private helpers
+
+    def _cell_coords(self, points):
+        """
+        Return the padded integer cell coordinates (an M x 3 Int array)
+        of the given M x 3 array of points, clamped into the padded grid.
+        """
+        ijk = Numeric.floor((points - self._origin) / self.cellsize)
+        ijk = ijk.astype(Int) + 1
+        nx, ny, nz = self._dims
+        ijk = Numeric.clip(ijk, 0, Numeric.array([nx - 1, ny - 1, nz - 1]))
+        return ijk
+
+    def _cell_ids(self, ijk, offset = (0, 0, 0)):
+        """
+        Return the cell ids of the given padded cell coordinates,
+        after adding offset to each one.
+        """
+        nx, ny, nz = self._dims
+        di, dj, dk = offset
+        return ((ijk[:,0] + di) * ny + (ijk[:,1] + dj)) * nz + (ijk[:,2] + dk)
+
+    def _cell_ranges(self, ids):
+        """
+        Return (starts, counts) giving the runs of sorted point order
+        which lie in the cells with the given ids.
+        """
+        sorted_ids = self._sorted_ids
+        starts = Numeric.searchsorted(sorted_ids, ids)
+        ends = Numeric.searchsorted(sorted_ids, ids + 1)
+        return starts, ends - starts
+
+    def _check_radius(self, radius):
+        if radius is None:
+            return self.cellsize
+        assert radius <= self.cellsize, \
+               "radius %r is larger than cellsize %r" % (radius, self.cellsize)
+        return radius
+
+    def _within(self, points1, points2, radius):
+        """
+        Return an array which is true where corresponding points
+        in the two M x 3 arrays are closer than radius.
+        """
+        delta = points1 - points2
+        dist2 = Numeric.add.reduce(delta * delta, 1)
+        return Numeric.less(dist2, radius * radius)
+
+    # == public queries
+
+    def cell_candidates(self, center):
+        """
+        Return an index array of all points in the 27 cells around the
+        given center, without testing their distance. (This is used by
+        callers which want to test distances using other positions than
+        the ones which were indexed.)
+        """
+        if not len(self):
+            return _EMPTY
+        ijk = self._cell_coords(Numeric.array([center], Float))
+        ids = Numeric.array([self._cell_ids(ijk, off)[0]
+                             for off in _ALL_OFFSETS])
+        starts, counts = self._cell_ranges(ids)
+        junk, sorted_indices = _expand_ranges(starts, counts)
+        return Numeric.take(self._order, sorted_indices)
+
+    def regions(self, centers, radius = None):
+        """
+        For each of the given centers (an M x 3 array), find all points
+        closer than radius (default self.cellsize) to it.
+
+        @return: (center_indices, point_indices), two equal-length Int
+                 arrays which list every (center, point) pair found,
+                 ordered by center index.
+        """
+        radius = self._check_radius(radius)
+        centers = Numeric.array(centers, Float)
+        if not len(self) or not len(centers):
+            return _EMPTY, _EMPTY
+        centers.shape = (-1, 3)
+        ijk = self._cell_coords(centers)
+        positions = self.positions
+        found_centers = []
+        found_points = []
+        for off in _ALL_OFFSETS:
+            starts, counts = self._cell_ranges(self._cell_ids(ijk, off))
+            qi, sorted_indices = _expand_ranges(starts, counts)
+            if not len(qi):
+                continue
+            pi = Numeric.take(self._order, sorted_indices)
+            close = self._within(Numeric.take(centers, qi),
+                                 Numeric.take(positions, pi),
+                                 radius)
+            found_centers.append(Numeric.compress(close, qi))
+            found_points.append(Numeric.compress(close, pi))
+        if not found_centers:
+            return _EMPTY, _EMPTY
+        qi = Numeric.concatenate(found_centers)
+        pi = Numeric.concatenate(found_points)
+        order = Numeric.argsort(qi)
+        return Numeric.take(qi, order), Numeric.take(pi, order)
+
+    def region(self, center, radius = None):
+        """
+        Return an index array of all points closer than radius
+        (default self.cellsize) to the given center.
+        """
+        return self.regions([center], radius)[1]
+
+    def pairs_within(self, radius = None):
+        """
+        Find all pairs of distinct indexed points closer than radius
+        (default self.cellsize) to each other.
+
+        @return: (indices1, indices2), two equal-length Int arrays,
+                 with indices1[m] < indices2[m], listing each close pair
+                 exactly once (in no particular order).
+        """
+        radius = self._check_radius(radius)
+        n = len(self)
+        if n < 2:
+            return _EMPTY, _EMPTY
+        order = self._order
+        positions = self.positions
+        # cell coords of the points in sorted order
+        ijk = self._cell_coords(Numeric.take(positions, order))
+        found1 = []
+        found2 = []
+        for off in [(0, 0, 0)] + _HALF_OFFSETS:
+            starts, counts = self._cell_ranges(self._cell_ids(ijk, off))
+            if off == (0, 0, 0):
+                # within one cell, only pair each point with later ones
+                ends = starts + counts
+                starts = Numeric.arange(n) + 1
+                counts = ends - starts
+            s1, s2 = _expand_ranges(starts, counts)
+            if not len(s1):
+                continue
+            i1 = Numeric.take(order, s1)
+            i2 = Numeric.take(order, s2)
+            close = self._within(Numeric.take(positions, i1),
+                                 Numeric.take(positions, i2),
+                                 radius)
+            i1 = Numeric.compress(close, i1)
+            i2 = Numeric.compress(close, i2)
+            found1.append(Numeric.minimum(i1, i2))
+            found2.append(Numeric.maximum(i1, i2))
+        if not found1:
+            return _EMPTY, _EMPTY
+        return Numeric.concatenate(found1), Numeric.concatenate(found2)
+
+    pass # end of class CellIndex
+
+# ==
+
+def _benchmark(n = 100000, density = 0.1, radius = 2.0):
+    """
+    Time construction and queries of a CellIndex over n random points
+    at the given density (points per cubic Angstrom), and compare
+    region queries against the old per-atom NeighborhoodGenerator path.
+    """
+    import time
+    from RandomArray import uniform
+    side = (n / density) ** (1.0 / 3)
+    positions = uniform(0.0, side, (n, 3))
+    t0 = time.time()
+    index = CellIndex(positions, radius)
+    t1 = time.time()
+    i1, i2 = index.pairs_within(radius)
+    t2 = time.time()
+    qi, pi = index.regions(positions, radius)
+    t3 = time.time()
+    print "CellIndex: %d points, build %.3f sec, " \
+          "pairs_within %.3f sec (%d pairs), regions %.3f sec (%d hits)" % \
+          (n, t1 - t0, t2 - t1, len(i1), t3 - t2, len(qi))
+    # each pair is seen twice by regions, and each point sees itself
+    assert len(qi) == 2 * len(i1) + n
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
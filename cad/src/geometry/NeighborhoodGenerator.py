@@ -16,13 +16,19 @@ since it's essentially purely geometric (and could easily
 be generalized to be entirely so) -- all it assumes about
 "atoms" is that they have a few methods like .posn()
 and .is_singlet(), and it needs no imports from model.
+
+Atoms given to the constructor (or to the new add_atoms method) are
+now indexed in bulk by CellIndex (see that module); the per-atom
+add/atom_moved/region API is kept for compatibility. The new regions
+method answers many queries at once.
 """
 
 import struct
 
 from Numeric import floor
 
-from geometry.VQT import vlen
+from geometry.VQT import vlen, A
+from geometry.CellIndex import CellIndex
 
 # ==
 
@@ -41,14 +47,25 @@ class NeighborhoodGenerator:
     point is done in O(1) time. So this is a pretty efficient method
     for finding neighborhoods, especially if the same generator can
     be used many times.
+
+    Atoms passed to the constructor or to add_atoms are indexed in bulk
+    by CellIndex objects; atoms passed to add (or moved, using atom_moved)
+    are kept in per-atom buckets. For many queries at once, use regions,
+    or use CellIndex directly (e.g. its pairs_within method).
     """
     def __init__(self, atomlist, maxradius, include_singlets = False):
         self._buckets = { }
         self._oldkeys = { }
         self._maxradius = 1.0 * maxradius
         self.include_singlets = include_singlets
-        for atom in atomlist:
-            self.add(atom)
+        # bulk-loaded atoms: a list of (CellIndex, atoms) pairs, kept with
+        # decreasing sizes (each less than half the size of the prior one)
+        # so that there are only O(log n) of them to query
+        self._blocks = []
+        # atom.key -> atom, for bulk-loaded atoms which were later moved
+        # (and are now in self._buckets) or removed
+        self._unindexed = { }
+        self.add_atoms(atomlist)
 
     def _quantize(self, vec):
         """
@@ -61,6 +78,32 @@ class NeighborhoodGenerator:
                 int(floor(vec[1] / maxradius)),
                 int(floor(vec[2] / maxradius)))
 
+    def add_atoms(self, atomlist):
+        """
+        Add all the given atoms at once, indexing them in bulk.
+        This is much faster than calling add on each one.
+        """
+        if not self.include_singlets:
+            atomlist = [atom for atom in atomlist if not atom.is_singlet()]
+        else:
+            atomlist = list(atomlist)
+        if not atomlist:
+            return
+        # merge with smaller-or-equal blocks, so block sizes keep decreasing
+        # geometrically (the "logarithmic method" for static structures)
+        unindexed = self._unindexed
+        while self._blocks and len(self._blocks[-1][1]) <= 2 * len(atomlist):
+            index_junk, atoms = self._blocks.pop()
+            for atom in atoms:
+                if unindexed.has_key(atom.key):
+                    # it's been moved into self._buckets, or removed
+                    del unindexed[atom.key]
+                else:
+                    atomlist.append(atom)
+        positions = A([atom.posn() for atom in atomlist])
+        self._blocks.append( (CellIndex(positions, self._maxradius), atomlist) )
+        return
+
     def add(self, atom, _pack = struct.pack):
         buckets = self._buckets
         if self.include_singlets or not atom.is_singlet():
@@ -80,15 +123,63 @@ class NeighborhoodGenerator:
         generator's position information. This only needs to be done
         during the useful lifecycle of the generator.
         """
-        oldkey = self._oldkeys[atom.key]
-        self._buckets[oldkey].remove(atom)
+        if self._oldkeys.has_key(atom.key):
+            oldkey = self._oldkeys[atom.key]
+            self._buckets[oldkey].remove(atom)
+        else:
+            # it was bulk-loaded; hide it there and add it to a bucket
+            self._unindexed[atom.key] = atom
         self.add(atom)
 
-    def region(self, center, _pack = struct.pack):
+    def region(self, center):
         """
         Given a position in space, return the list of atoms that
         are within the neighborhood radius of that position.
         """
+        radius = self._maxradius
+        lst = [ ]
+        unindexed = self._unindexed
+        for index, atoms in self._blocks:
+            # note: we test distance using current atom positions, as the
+            # per-atom buckets do, not the ones which were indexed
+            for i in index.cell_candidates(center):
+                atm = atoms[i]
+                if not unindexed.has_key(atm.key) and \
+                   vlen(atm.posn() - center) < radius:
+                    lst.append(atm)
+        if self._buckets:
+            lst += self._bucket_region(center)
+        return lst
+
+    def regions(self, centers):
+        """
+        Given a sequence (or N x 3 array) of positions, return a list
+        of lists of atoms, containing for each position the atoms
+        within the neighborhood radius of it.
+
+        This is equivalent to [self.region(center) for center in centers],
+        except that bulk-loaded atoms are tested using the positions
+        they had when they were added, and it's much faster for many
+        centers.
+        """
+        centers = A(centers)
+        res = [[] for center in centers]
+        unindexed = self._unindexed
+        for index, atoms in self._blocks:
+            qi, pi = index.regions(centers)
+            for q, p in zip(qi, pi):
+                atm = atoms[p]
+                if not unindexed.has_key(atm.key):
+                    res[q].append(atm)
+        if self._buckets:
+            for q in range(len(centers)):
+                res[q] += self._bucket_region(centers[q])
+        return res
+
+    def _bucket_region(self, center, _pack = struct.pack):
+        """
+        Like region, but only for the atoms in self._buckets.
+        """
         buckets = self._buckets
         def closeEnough(atm, radius = self._maxradius):
             return vlen(atm.posn() - center) < radius
@@ -97,18 +188,24 @@ class NeighborhoodGenerator:
         for x in range(x0 - 1, x0 + 2):
             for y in range(y0 - 1, y0 + 2):
                 for z in range(z0 - 1, z0 + 2):
-                    # keys are 12-byte strings, see rationale above
+                    # keys are 12-byte strings, see rationale in add
                     key = _pack('lll', x, y, z)
                     if buckets.has_key(key):
                         lst += filter(closeEnough, buckets[key])
         return lst
 
     def remove(self, atom):
-        key = self._quantize(atom.posn())
-        try:
-            self._buckets[key].remove(atom)
-        except:
-            pass
+        oldkey = self._oldkeys.get(atom.key)
+        if oldkey is not None:
+            del self._oldkeys[atom.key]
+            try:
+                self._buckets[oldkey].remove(atom)
+            except ValueError:
+                pass
+        else:
+            # it was bulk-loaded (or never added, which is harmless)
+            self._unindexed[atom.key] = atom
+        return
 
     pass # end of class NeighborhoodGenerator
 
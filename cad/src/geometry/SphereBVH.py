@@ -0,0 +1,320 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+SphereBVH.py -- a bounding volume hierarchy of spheres, for culling
+many spheres against a set of planes (e.g. a view frustum) at once.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for culling chunks against the view frustum
+(see graphics/drawing/chunk_culling.py), so that a zoomed-in view of
+a model with many chunks doesn't test every chunk's bounding sphere
+against every frustum plane, one at a time, in Python.
+
+Implementation notes:
+
+The tree is a binary tree whose nodes are stored in parallel Numeric
+arrays (in preorder, so each node's children come after it). Each node
+covers a contiguous range of self.order (a permutation of the item
+indices), made by splitting its parent's range at the median of the
+item centers along their longest axis, until there are at most leafsize
+items in a range. Each node has a bounding sphere which encloses the
+spheres of all its items (leaves get one from the bounding box of their
+item spheres, other nodes by merging their children's spheres).
+
+cull() tests a whole level of nodes against all the planes at once;
+nodes entirely outside some plane are dropped along with all their
+items, nodes entirely inside all planes contribute all their items at
+once, and only the items of leaves which straddle a plane are tested
+individually.
+
+hit_by_line() works in the same way, for the items whose spheres
+intersect a line (e.g. a line of sight, for picking).
+
+refit() updates the spheres of some items (e.g. moved chunks) and
+of their leaves and those leaves' ancestors, keeping the same tree;
+callers should rebuild (i.e. make a new SphereBVH) after most items
+have moved, since a refitted tree can have much larger nodes than a
+new one.
+"""
+
+import heapq
+
+import Numeric
+from Numeric import Float, Int
+
+DEFAULT_LEAFSIZE = 8
+
+# ==
+
+def _merge_spheres(c1, r1, c2, r2):
+    """
+    Return (center, radius) of a sphere enclosing the spheres
+    (c1, r1) and (c2, r2), given as Python sequences and floats.
+    """
+    d = [c2[0] - c1[0], c2[1] - c1[1], c2[2] - c1[2]]
+    dist = (d[0] * d[0] + d[1] * d[1] + d[2] * d[2]) ** 0.5
+    if dist + r2 <= r1:
+        return c1, r1
+    if dist + r1 <= r2:
+        return c2, r2
+    radius = 0.5 * (dist + r1 + r2)
+    t = (radius - r1) / dist
+    return [c1[0] + d[0] * t, c1[1] + d[1] * t, c1[2] + d[2] * t], radius
+
+class SphereBVH:
+    """
+    A bounding volume hierarchy over a fixed number of spheres
+    (our items, identified by their index in the arrays passed to
+    the constructor). See module docstring for details.
+    """
+    def __init__(self, centers, radii, leafsize = DEFAULT_LEAFSIZE):
+        """
+        @param centers: N x 3 array or sequence of sphere centers
+
+        @param radii: sequence of N sphere radii
+        """
+        self.centers = Numeric.array(centers, Float)
+        self.radii = Numeric.array(radii, Float)
+        self.nitems = n = len(self.radii)
+        self.centers.shape = (n, 3)
+        self.leafsize = max(1, leafsize)
+        self._build()
+        return
+
+    def _build(self):
+        n = self.nitems
+        order = Numeric.arange(n)
+        starts = []
+        ends = []
+        lefts = []
+        rights = []
+        parents = []
+        stack = [(0, n, -1)] # (start, end, parent node) of nodes to make
+        while stack:
+            start, end, parent = stack.pop()
+            node = len(starts)
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            parents.append(parent)
+            if parent >= 0:
+                if lefts[parent] < 0:
+                    lefts[parent] = node
+                else:
+                    rights[parent] = node
+            if end - start <= self.leafsize:
+                continue
+            # split at the median along the longest axis of the item centers
+            items = order[start:end]
+            centers = Numeric.take(self.centers, items)
+            extent = Numeric.maximum.reduce(centers) - Numeric.minimum.reduce(centers)
+            axis = Numeric.argmax(extent)
+            items = Numeric.take(items, Numeric.argsort(centers[:, axis]))
+            order[start:end] = items
+            middle = (start + end) / 2
+            # (pushed in reverse, so the left child is made first)
+            stack.append( (middle, end, node) )
+            stack.append( (start, middle, node) )
+        self.order = order
+        self.starts = Numeric.array(starts, Int)
+        self.ends = Numeric.array(ends, Int)
+        self.lefts = Numeric.array(lefts, Int)
+        self.rights = Numeric.array(rights, Int)
+        self.parents = parents
+        nnodes = len(starts)
+        self.nnodes = nnodes
+        self.node_centers = Numeric.zeros((nnodes, 3), Float)
+        self.node_radii = Numeric.zeros((nnodes,), Float)
+        self.leaf_of_item = Numeric.zeros((n,), Int)
+        for node in range(nnodes - 1, -1, -1):
+            # (children are made after their parents, so this visits them first)
+            self._fit_node(node)
+            if lefts[node] < 0:
+                Numeric.put(self.leaf_of_item, order[starts[node]:ends[node]], node)
+        return
+
+    def _fit_node(self, node):
+        """
+        Recompute the bounding sphere of one node, from its items' spheres
+        if it's a leaf, or else from its children's spheres.
+        """
+        left = self.lefts[node]
+        if left < 0:
+            items = self.order[self.starts[node]:self.ends[node]]
+            if not len(items):
+                return
+            centers = Numeric.take(self.centers, items)
+            radii = Numeric.reshape(Numeric.take(self.radii, items), (-1, 1))
+            center = 0.5 * (Numeric.maximum.reduce(centers + radii) +
+                            Numeric.minimum.reduce(centers - radii))
+            deltas = centers - center
+            dists = Numeric.sqrt(Numeric.add.reduce(deltas * deltas, 1))
+            self.node_centers[node] = center
+            self.node_radii[node] = Numeric.maximum.reduce(dists + radii[:, 0])
+            return
+        right = self.rights[node]
+        center, radius = _merge_spheres(
+            self.node_centers[left].tolist(), float(self.node_radii[left]),
+            self.node_centers[right].tolist(), float(self.node_radii[right]) )
+        self.node_centers[node] = center
+        self.node_radii[node] = radius
+        return
+
+    def refit(self, items, centers, radii):
+        """
+        Change the spheres of the given items (a sequence of item indices)
+        to the given centers and radii (parallel sequences), and update
+        the bounding spheres of all nodes containing them.
+        """
+        if not len(items):
+            return
+        dirty = {}
+        for i, center, radius in zip(items, centers, radii):
+            self.centers[i] = center
+            self.radii[i] = radius
+            dirty[int(self.leaf_of_item[i])] = 1
+        # refit leaves first, then their ancestors (which have lower node
+        # numbers), by popping the highest node number each time
+        parents = self.parents
+        heap = [- node for node in dirty.keys()]
+        heapq.heapify(heap)
+        while heap:
+            node = - heapq.heappop(heap)
+            self._fit_node(node)
+            parent = parents[node]
+            if parent >= 0 and not dirty.has_key(parent):
+                dirty[parent] = 1
+                heapq.heappush(heap, - parent)
+        return
+
+    def cull(self, planes, stats = None):
+        """
+        Return (items, inside), where items is a Numeric array of the
+        indices of the items whose spheres are not entirely outside any
+        of the given planes, and inside is a parallel array which is
+        true for the items whose spheres are entirely inside all of them.
+
+        @param planes: sequence of planes (a, b, c, d), each one
+                       meaning the half-space a*x + b*y + c*z + d >= 0,
+                       with (a, b, c) a unit vector
+
+        @param stats: if provided, a dict in which to add the counts
+                      'nodes tested', 'spheres tested', 'subtrees culled'
+                      and 'subtrees accepted'
+        """
+        planes = Numeric.array(planes, Float)
+        normals = Numeric.transpose(planes[:, :3])
+        offsets = planes[:, 3]
+        order = self.order
+        result_items = []
+        result_inside = []
+        nodes_tested = spheres_tested = culled = accepted = 0
+        frontier = Numeric.array([0], Int)
+        if not self.nitems:
+            frontier = frontier[:0]
+        while len(frontier):
+            nodes_tested += len(frontier)
+            dists = Numeric.dot(Numeric.take(self.node_centers, frontier), normals) + offsets
+            radii = Numeric.reshape(Numeric.take(self.node_radii, frontier), (-1, 1))
+            outside = Numeric.sometrue(dists < - radii, 1)
+            inside = Numeric.alltrue(dists >= radii, 1)
+            culled += Numeric.add.reduce(outside)
+            # nodes entirely inside: all their items are visible
+            for node in Numeric.compress(inside, frontier):
+                accepted += 1
+                items = order[self.starts[node]:self.ends[node]]
+                result_items.append(items)
+                result_inside.append(Numeric.ones((len(items),), Int))
+            straddling = Numeric.compress(Numeric.logical_not(outside | inside), frontier)
+            lefts = Numeric.take(self.lefts, straddling)
+            # straddling leaves: test their items individually
+            leaves = Numeric.compress(lefts < 0, straddling)
+            if len(leaves):
+                items = Numeric.concatenate(
+                    [order[self.starts[node]:self.ends[node]] for node in leaves] )
+                spheres_tested += len(items)
+                dists = Numeric.dot(Numeric.take(self.centers, items), normals) + offsets
+                radii = Numeric.reshape(Numeric.take(self.radii, items), (-1, 1))
+                visible = Numeric.logical_not(Numeric.sometrue(dists < - radii, 1))
+                result_items.append( Numeric.compress(visible, items) )
+                result_inside.append( Numeric.compress(visible,
+                                                       Numeric.alltrue(dists >= radii, 1)) )
+            # straddling internal nodes: test their children next
+            internal = Numeric.compress(lefts >= 0, straddling)
+            frontier = Numeric.concatenate( (Numeric.take(self.lefts, internal),
+                                             Numeric.take(self.rights, internal)) )
+        if stats is not None:
+            for key, count in [('nodes tested', nodes_tested),
+                               ('spheres tested', spheres_tested),
+                               ('subtrees culled', culled),
+                               ('subtrees accepted', accepted)]:
+                stats[key] = stats.get(key, 0) + int(count)
+        if not result_items:
+            return Numeric.zeros((0,), Int), Numeric.zeros((0,), Int)
+        return Numeric.concatenate(result_items), Numeric.concatenate(result_inside)
+
+    def hit_by_line(self, point, direction, stats = None, radius_scale = 1.0):
+        """
+        Return a Numeric array of the indices of the items whose spheres,
+        with their radii multiplied by radius_scale, intersect the
+        (infinite) line through point along direction (a unit vector).
+
+        @param stats: if provided, a dict in which to add the counts
+                      'nodes tested' and 'spheres tested'
+        """
+        point = Numeric.array(point, Float)
+        direction = Numeric.array(direction, Float)
+        order = self.order
+        result_items = []
+        nodes_tested = spheres_tested = 0
+        frontier = Numeric.array([0], Int)
+        if not self.nitems:
+            frontier = frontier[:0]
+        while len(frontier):
+            nodes_tested += len(frontier)
+            hit = _line_hits_spheres(point, direction,
+                                     Numeric.take(self.node_centers, frontier),
+                                     Numeric.take(self.node_radii, frontier) * radius_scale)
+            hit = Numeric.compress(hit, frontier)
+            lefts = Numeric.take(self.lefts, hit)
+            # leaves which were hit: test their items individually
+            leaves = Numeric.compress(lefts < 0, hit)
+            if len(leaves):
+                items = Numeric.concatenate(
+                    [order[self.starts[node]:self.ends[node]] for node in leaves] )
+                spheres_tested += len(items)
+                hit_items = _line_hits_spheres(point, direction,
+                                               Numeric.take(self.centers, items),
+                                               Numeric.take(self.radii, items) * radius_scale)
+                result_items.append( Numeric.compress(hit_items, items) )
+            # internal nodes which were hit: test their children next
+            internal = Numeric.compress(lefts >= 0, hit)
+            frontier = Numeric.concatenate( (Numeric.take(self.lefts, internal),
+                                             Numeric.take(self.rights, internal)) )
+        if stats is not None:
+            for key, count in [('nodes tested', nodes_tested),
+                               ('spheres tested', spheres_tested)]:
+                stats[key] = stats.get(key, 0) + int(count)
+        if not result_items:
+            return Numeric.zeros((0,), Int)
+        return Numeric.concatenate(result_items)
+
+    pass # end of class SphereBVH
+
+def _line_hits_spheres(point, direction, centers, radii):
+    """
+    Return a Numeric array which is true for the spheres (given by an
+    N x 3 array of centers and an array of N radii) which intersect the
+    line through point along direction (a unit vector).
+    """
+    deltas = centers - point
+    along = Numeric.dot(deltas, direction)
+    dist2 = Numeric.add.reduce(deltas * deltas, 1) - along * along
+    return dist2 <= radii * radii
+
+# end
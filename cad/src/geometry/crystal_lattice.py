@@ -0,0 +1,171 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+crystal_lattice.py -- the atom sites and bonds of a diamond or
+lonsdaleite lattice within a box, as Numeric arrays.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for the vectorized crystal cutter (see
+commands/BuildCrystal/crystal_cutter.py), to replace genDiam, which
+returns one array of bond endpoint pairs per lattice cell, after which
+the cookie cutter identified the atoms shared by neighboring cells by
+hashing their positions one at a time.
+
+Implementation notes:
+
+The unit cells are the ones genDiam tiles out (digrid and lonsEdges,
+from shape_vertices). Each endpoint of a bond of the unit cell is
+either one of the cell's own sites or one of a neighboring cell's sites; LatticeCell finds the distinct sites of one cell and,
+for each bond end, which site it is and the offset (in cells) of the
+cell it belongs to. Every site of a box of cells then has an integer
+id computed from its cell and site index, so the sites shared by
+bonds of different cells are found by sorting those ids, and the
+bonds of the box are the precomputed bonds of one cell, offset to
+each cell, with no Python code per cell, site or bond.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+from graphics.drawing.shape_vertices import digrid, DiGridSp
+from graphics.drawing.shape_vertices import lonsEdges, XLen, YLen, ZLen
+    # (shape_vertices has no OpenGL dependencies)
+
+DIAMOND = 'DIAMOND'
+LONSDALEITE = 'LONSDALEITE'
+
+# largest site id we allow, to avoid overflowing Numeric.Int on platforms
+# where it's 32 bits (as in CellIndex)
+_MAX_SITE_ID = 2**31 - 1
+
+# Tolerance (in Angstroms) for deciding that two bond endpoints of
+# the unit cell are the same site, or that one lies on a cell boundary.
+_SITE_TOLERANCE = 1e-3
+
+_EMPTY_POSITIONS = Numeric.zeros((0, 3), Float)
+_EMPTY_BONDS = Numeric.zeros((0, 2), Int)
+
+# ==
+
+class LatticeCell:
+    """
+    The unit cell of a lattice, as the distinct atom sites of one cell
+    and the bonds of one cell between those sites and the sites of
+    neighboring cells.
+
+    @ivar size: the cell size along x, y and z (a Numeric array).
+    @ivar sites: S x 3 array of the site positions, relative to the
+                 cell's origin (and within its bounds).
+    @ivar bond_sites: E x 2 array of the site index (into sites) of
+                      each end of each bond of one cell.
+    @ivar bond_shifts: E x 2 x 3 array of the offset, in cells, of the
+                       cell which each end of each bond belongs to.
+    """
+    def __init__(self, size, edges):
+        """
+        @param size: the cell size along x, y and z.
+        @param edges: the bonds of one cell, as a sequence of pairs of
+                      endpoint positions (as in shape_vertices.digrid).
+        """
+        self.size = size = Numeric.array(size, Float)
+        edges = Numeric.reshape(Numeric.array(edges, Float), (-1, 2, 3))
+        shifts = Numeric.floor(edges / size + _SITE_TOLERANCE).astype(Int)
+        canonical = edges - shifts * size
+        sites = []
+        site_of_key = {}
+        bond_sites = []
+        for point in Numeric.reshape(canonical, (-1, 3)).tolist():
+            key = tuple([int(round(x / _SITE_TOLERANCE)) for x in point])
+            if not site_of_key.has_key(key):
+                site_of_key[key] = len(sites)
+                sites.append(point)
+            bond_sites.append(site_of_key[key])
+        self.sites = Numeric.array(sites, Float)
+        self.bond_sites = Numeric.reshape(Numeric.array(bond_sites, Int), (-1, 2))
+        self.bond_shifts = shifts
+        return
+
+    def cell_range(self, bblo, bbhi):
+        """
+        Return (lo, hi), Int arrays of the indices along x, y and z of
+        the first cell and of one past the last cell which genDiam would
+        tile out to cover the box from point bblo to point bbhi.
+        """
+        lo = Numeric.floor(Numeric.array(bblo, Float) / self.size).astype(Int)
+        hi = Numeric.ceil(Numeric.array(bbhi, Float) / self.size).astype(Int)
+        return lo, Numeric.maximum(hi, lo)
+
+    pass # end of class LatticeCell
+
+_cells = {}
+
+def lattice_cell(latticeType):
+    """
+    Return the LatticeCell for latticeType ('DIAMOND' or 'LONSDALEITE',
+    as used by cookieMode).
+    """
+    try:
+        return _cells[latticeType]
+    except KeyError:
+        pass
+    if latticeType == DIAMOND:
+        cell = LatticeCell((DiGridSp, DiGridSp, DiGridSp), digrid)
+    elif latticeType == LONSDALEITE:
+        cell = LatticeCell((XLen, YLen, ZLen), lonsEdges)
+    else:
+        raise ValueError, "unknown lattice type %r" % (latticeType,)
+    _cells[latticeType] = cell
+    return cell
+
+def lattice_sites_and_bonds(bblo, bbhi, latticeType):
+    """
+    Return (positions, bonds) for the bonds of the lattice cells which
+    genDiam(bblo, bbhi, latticeType) would return: positions is an N x 3
+    array of the distinct sites at the ends of those bonds, and bonds an
+    M x 2 array of indices into positions, listing each bond once.
+    The sites are in order of the x, y and z indices of their cells,
+    then of their index in LatticeCell.sites.
+    """
+    cell = lattice_cell(latticeType)
+    lo, hi = cell.cell_range(bblo, bbhi)
+    counts = hi - lo
+    ncells = counts[0] * counts[1] * counts[2]
+    if not ncells:
+        return _EMPTY_POSITIONS, _EMPTY_BONDS
+    nsites = len(cell.sites)
+    # site ids are computed in a grid of cells padded by one cell on each
+    # side, since bonds reach into neighboring cells
+    dims = counts + 2
+    if float(dims[0]) * dims[1] * dims[2] * nsites > _MAX_SITE_ID:
+        raise ValueError, "box too large for lattice: %r to %r" % (tuple(bblo), tuple(bbhi))
+    strides = Numeric.array([dims[1] * dims[2] * nsites, dims[2] * nsites, nsites])
+    cells = Numeric.arange(ncells)
+    ijk = Numeric.transpose(Numeric.array([cells / (counts[1] * counts[2]),
+                                           (cells / counts[2]) % counts[1],
+                                           cells % counts[2]]))
+    base = Numeric.dot(ijk + 1, strides) # id of site 0 of each cell
+    delta = Numeric.dot(cell.bond_shifts, strides) + cell.bond_sites # E x 2
+    ids = Numeric.ravel(Numeric.add.outer(base, Numeric.ravel(delta)))
+    # number the distinct ids in increasing order
+    order = Numeric.argsort(ids)
+    sorted_ids = Numeric.take(ids, order)
+    new = Numeric.ones(len(sorted_ids), Int)
+    new[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    numbers = Numeric.add.accumulate(new) - 1
+    bonds = Numeric.zeros(len(ids), Int)
+    Numeric.put(bonds, order, numbers)
+    bonds = Numeric.reshape(bonds, (-1, 2))
+    # positions of the distinct sites, from their ids
+    site_ids = Numeric.compress(new, sorted_ids)
+    site_ijk = Numeric.transpose(Numeric.array([site_ids / strides[0],
+                                                (site_ids / strides[1]) % dims[1],
+                                                (site_ids / strides[2]) % dims[2]]))
+    positions = (site_ijk + (lo - 1)) * cell.size + \
+                Numeric.take(cell.sites, site_ids % nsites)
+    return positions, bonds
+
+# end
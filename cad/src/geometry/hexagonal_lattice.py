@@ -0,0 +1,476 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+hexagonal_lattice.py -- atom positions and bonds of graphene sheets and
+nanotubes (flat or rolled hexagonal lattices), as Numeric arrays.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that inserting a long multi-walled nanotube or a large
+graphene sheet doesn't take a very long time. The Build Graphene and
+Build Nanotube commands (GrapheneGenerator.populate, Chirality.populate
+and NanotubeGenerator.build_struct, and Nanotube.populate and build)
+make one Atom at a time, bond them using dicts of lattice indices,
+and then deform and trim the structure by moving and killing atoms one
+at a time (which makes and kills bondpoints). Used by them when
+pref_bulk_hexagonal_generators is enabled, with the atoms and bonds
+then made by add_atoms_from_arrays (see model/bulk_chunk.py).
+
+Usage:
+
+graphene_sheet and nanotube return a HexagonalStructure, which has
+the positions of the atoms, their bonds (as pairs of atom indices),
+and the positions of the bondpoints they would have after that
+trimming, computed for all atoms at once. They don't use the model
+(Atoms, Chunks or atomtypes), so they can be used as library functions.
+
+Implementation notes:
+
+The lattices and the order of deforming and trimming them are the
+same as in those commands, so the atoms and bonds (and, up to the
+order in which dangling atoms are trimmed, the bondpoints) are the
+same. Each bondpoint is placed where Bond.ubp would place it when the
+atom on the other end of its bond is killed, i.e. at a distance rcov
+from its atom along that bond, using the positions at the time that
+would happen (before bending, for the atoms trimmed by length).
+"""
+
+from math import pi
+
+import Numeric
+from Numeric import Float, Int
+
+sqrt3 = 3 ** 0.5
+
+# Positions of the four atoms of one repeating unit of a graphene sheet,
+# in units of the bond length (as in GrapheneGenerator).
+_quartet = ((0, sqrt3 / 2), (0.5, 0), (1.5, 0), (2, sqrt3 / 2))
+
+# ==
+
+class HexagonalStructure:
+    """
+    The atoms, bonds and bondpoints of a graphene sheet or nanotube.
+
+    @ivar positions: N x 3 array of atom positions.
+    @ivar sublattice: length N array of 0 or 1, saying which of the two
+                      sublattices each atom is in (every bond joins
+                      atoms from both; for a boron nitride nanotube,
+                      the borons are in sublattice 0).
+    @ivar bonds: M x 2 array of pairs of atom indices.
+    @ivar bondpoint_owners: length K array of the indices of the atoms
+                            which have bondpoints (repeated for atoms
+                            with more than one).
+    @ivar bondpoint_positions: K x 3 array of the bondpoint positions.
+    """
+    def __init__(self, positions, sublattice, bonds, keep,
+                 bondpoint_owners, bondpoint_positions):
+        """
+        Renumber the atoms of a lattice for which keep is true,
+        and keep only their bonds and bondpoints.
+        """
+        kept = Numeric.nonzero(keep)
+        number = Numeric.zeros(len(positions), Int) - 1
+        Numeric.put(number, kept, Numeric.arange(len(kept)))
+        self.positions = Numeric.take(positions, kept)
+        self.sublattice = Numeric.take(sublattice, kept)
+        bonds = _live_bonds(bonds, keep)
+        self.bonds = Numeric.reshape(Numeric.take(number, Numeric.ravel(bonds)), (-1, 2))
+        self.bondpoint_owners = Numeric.take(number, bondpoint_owners)
+        self.bondpoint_positions = bondpoint_positions
+        return
+
+    def degrees(self):
+        """
+        Return an array of the number of bonds of each atom
+        (not counting bondpoints).
+        """
+        return _degrees(len(self.positions), self.bonds, Numeric.ones(len(self.positions)))
+
+    def translate(self, offset):
+        """
+        Move all the atoms and bondpoints by offset.
+        """
+        self.positions = self.positions + offset
+        self.bondpoint_positions = self.bondpoint_positions + offset
+        return
+
+    pass # end of class HexagonalStructure
+
+# == helpers for trimming
+
+def _live_bonds(bonds, keep):
+    """
+    Return the bonds (an M x 2 array of atom indices) of which both
+    atoms are kept (i.e. keep is true for them).
+    """
+    live = Numeric.logical_and(Numeric.take(keep, bonds[:,0]),
+                               Numeric.take(keep, bonds[:,1]))
+    return Numeric.compress(live, bonds, 0)
+
+def _degrees(natoms, bonds, keep):
+    """
+    Return an array of the number of bonds between kept atoms
+    that each of natoms atoms has.
+    """
+    ends = Numeric.sort(Numeric.ravel(_live_bonds(bonds, keep)))
+    atoms = Numeric.arange(natoms)
+    return Numeric.searchsorted(ends, atoms + 1) - Numeric.searchsorted(ends, atoms)
+
+def trim_dangling_atoms(natoms, bonds, keep, passes = 2):
+    """
+    Return a copy of keep (an array which is true for the atoms that
+    are kept, of natoms atoms with the given bonds) which is also false
+    for the atoms with only one bond to a kept atom, removing them
+    (all at once) the given number of times, as the trimCarbons function
+    in the Build Graphene and Build Nanotube commands does.
+    """
+    keep = Numeric.not_equal(keep, 0)
+    for i in range(passes):
+        dangling = Numeric.equal(_degrees(natoms, bonds, keep), 1)
+        keep = Numeric.logical_and(keep, Numeric.logical_not(dangling))
+    return keep
+
+def open_bonds(bonds, keep, killed):
+    """
+    Return (owners, others) for the bonds between a kept atom (owner)
+    and an atom which is killed (i.e. for which killed is true).
+    """
+    keep0 = Numeric.take(keep, bonds[:,0])
+    keep1 = Numeric.take(keep, bonds[:,1])
+    killed0 = Numeric.take(killed, bonds[:,0])
+    killed1 = Numeric.take(killed, bonds[:,1])
+    open0 = Numeric.compress(Numeric.logical_and(keep0, killed1), bonds, 0)
+    open1 = Numeric.compress(Numeric.logical_and(keep1, killed0), bonds, 0)
+    owners = Numeric.concatenate((open0[:,0], open1[:,1]))
+    others = Numeric.concatenate((open0[:,1], open1[:,0]))
+    return owners, others
+
+def bondpoint_positions(positions, sublattice, owners, others, rcov):
+    """
+    Return the positions of bondpoints on the owners, each in the
+    direction of one of the others, at the distance given by rcov
+    (a pair of distances, for owners in sublattice 0 or 1).
+    """
+    start = Numeric.take(positions, owners)
+    vec = Numeric.take(positions, others) - start
+    lengths = Numeric.sqrt(Numeric.add.reduce(vec * vec, 1))
+    dist = Numeric.where(Numeric.take(sublattice, owners), rcov[1], rcov[0])
+    scale = dist / Numeric.where(lengths > 0, lengths, 1.0)
+    return start + vec * Numeric.reshape(scale, (-1, 1))
+
+# == graphene
+
+def graphene_lattice(height, width, bond_length):
+    """
+    Return (positions, sublattice, bonds) for the untrimmed lattice of
+    a graphene sheet of the given dimensions, centered on the origin in
+    the z = 0 plane, as made by GrapheneGenerator.populate.
+    """
+    # the rows and columns of repeating units (found by the same loops,
+    # so floating point roundoff gives the same numbers of them)
+    ys = []
+    y = -0.5 * height - 2 * bond_length
+    while y < 0.5 * height + 2 * bond_length:
+        ys.append(y)
+        y += sqrt3 * bond_length
+    xs = []
+    x = -0.5 * width - 2 * bond_length
+    while x < 0.5 * width + 2 * bond_length:
+        xs.append(x)
+        x += 3 * bond_length
+    imax, jmax = len(xs), len(ys)
+    quartet = Numeric.array(_quartet, Float) * bond_length
+    # units are in order of j, then i; atom index is 4 * unit + q
+    units = Numeric.arange(imax * jmax)
+    i = units % imax
+    j = units / imax
+    corners = Numeric.transpose(Numeric.array([Numeric.take(Numeric.array(xs, Float), i),
+                                               Numeric.take(Numeric.array(ys, Float), j)]))
+    xy = Numeric.reshape(Numeric.reshape(corners, (-1, 1, 2)) + quartet, (-1, 2))
+    positions = Numeric.concatenate((xy, Numeric.zeros((len(xy), 1), Float)), 1)
+    sublattice = Numeric.resize(Numeric.array([0, 1, 0, 1]), (len(positions),))
+    first = 4 * units
+    bonds = [Numeric.transpose(Numeric.array([first, first + 1])),
+             Numeric.transpose(Numeric.array([first + 1, first + 2])),
+             Numeric.transpose(Numeric.array([first + 2, first + 3]))]
+    up = Numeric.compress(j < jmax - 1, first) # (i, j) to (i, j + 1)
+    bonds.append( Numeric.transpose(Numeric.array([up, up + 4 * imax + 1])) )
+    bonds.append( Numeric.transpose(Numeric.array([up + 3, up + 4 * imax + 2])) )
+    right = Numeric.compress(i < imax - 1, first) # (i, j) to (i + 1, j)
+    bonds.append( Numeric.transpose(Numeric.array([right + 3, right + 4])) )
+    bonds = Numeric.concatenate([Numeric.reshape(b, (-1, 2)) for b in bonds])
+    return positions, sublattice, bonds
+
+def graphene_sheet(height, width, bond_length, trim = False, rcov = (0.0, 0.0)):
+    """
+    Return a HexagonalStructure for a graphene sheet of the given
+    dimensions, centered on the origin in the z = 0 plane, as made by
+    GrapheneGenerator.populate (not counting its endings or TOROIDAL
+    options), with its edge atoms trimmed if trim is true (as that does
+    for hydrogen or nitrogen endings). rcov gives the distance of the
+    bondpoints from their atoms (see bondpoint_positions).
+    """
+    positions, sublattice, bonds = graphene_lattice(height, width, bond_length)
+    xdim, ydim = width + bond_length, height + bond_length
+    x = positions[:,0]
+    y = positions[:,1]
+    keep = Numeric.logical_and(
+        Numeric.logical_and(x >= -0.5 * xdim, x <= 0.5 * xdim),
+        Numeric.logical_and(y >= -0.5 * ydim, y <= 0.5 * ydim))
+    return _trim(positions, sublattice, bonds, keep,
+                 Numeric.logical_not(keep), trim, rcov)
+
+def _trim(positions, sublattice, bonds, keep, killed, trim, rcov,
+          bondpoints = None):
+    """
+    Return a HexagonalStructure for the atoms of a lattice for which
+    keep is true, after adding bondpoints for their bonds to killed atoms
+    (to those in bondpoints, an optional pair of arrays of owners and
+    bondpoint positions) and then (if trim is true) trimming the
+    dangling atoms.
+    """
+    owners, others = open_bonds(bonds, keep, killed)
+    points = bondpoint_positions(positions, sublattice, owners, others, rcov)
+    if bondpoints is not None:
+        owners = Numeric.concatenate((bondpoints[0], owners))
+        points = Numeric.concatenate((bondpoints[1], points))
+    if trim:
+        keep2 = trim_dangling_atoms(len(positions), bonds, keep)
+        # bondpoints of trimmed atoms are killed with them
+        survivors = Numeric.take(keep2, owners)
+        owners = Numeric.compress(survivors, owners)
+        points = Numeric.compress(survivors, points, 0)
+        return _trim(positions, sublattice, bonds, keep2,
+                     Numeric.logical_and(keep, Numeric.logical_not(keep2)),
+                     False, rcov, (owners, points))
+    return HexagonalStructure(positions, sublattice, bonds, keep, owners, points)
+
+# == nanotubes
+
+def _xyz_array(chirality, n, m):
+    """
+    Like chirality.xyz, but for arrays of n and m; return an N x 3 array.
+    """
+    x1, y1 = chirality.x1y1(n, m)
+    x2, y2 = chirality.A * x1, chirality.B * y1
+    R = chirality.R
+    return Numeric.transpose(Numeric.array([R * Numeric.sin(x2 / R),
+                                            R * Numeric.cos(x2 / R),
+                                            y2]))
+
+def nanotube_lattice(chirality, length):
+    """
+    Return (positions, sublattice, bonds) for the untrimmed lattice of a
+    nanotube centered on the origin with its axis along z, with atoms
+    with z within about length/2 of 0, as made by Chirality.populate.
+
+    @param chirality: a Chirality (see NanotubeGenerator.py) or Nanotube
+                      (see cnt/model/Nanotube.py), which provides the math
+                      for the nanotube's chirality (n, m) and bond length
+                      (we use its n, x1y1, mlimits, A, B, R and maxlensq).
+    """
+    nn = chirality.n
+    mfirst = []
+    counts = []
+    for n in range(nn):
+        mmin, mmax = chirality.mlimits(-.5 * length, .5 * length, n)
+        mfirst.append(mmin)
+        counts.append(mmax + 1 - mmin)
+    mfirst = Numeric.array(mfirst)
+    counts = Numeric.array(counts)
+    ends = Numeric.add.accumulate(counts)
+    starts = ends - counts
+    # the even atom of (n, m) has index 2 * cell, and the odd one
+    # 2 * cell + 1, where cell = starts[n] + m - mfirst[n]
+    ncells = ends[-1]
+    cells = Numeric.arange(ncells)
+    ns = Numeric.searchsorted(ends, cells + 1)
+    ms = cells - Numeric.take(starts, ns) + Numeric.take(mfirst, ns)
+    positions = Numeric.zeros((2 * ncells, 3), Float)
+    positions[0::2] = _xyz_array(chirality, ns * 1.0, ms * 1.0)
+    positions[1::2] = _xyz_array(chirality, ns + 1.0 / 3, ms + 1.0 / 3)
+    sublattice = Numeric.resize(Numeric.array([0, 1]), (2 * ncells,))
+
+    def even(n, m):
+        # index of the even atom (n, m), or -1 if there is none
+        ok = Numeric.logical_and(n >= 0, n < nn)
+        n = Numeric.where(ok, n, 0)
+        first = Numeric.take(mfirst, n)
+        ok = Numeric.logical_and(ok, Numeric.logical_and(
+            m >= first, m < first + Numeric.take(counts, n)))
+        return Numeric.where(ok, 2 * (Numeric.take(starts, n) + m - first), -1)
+
+    # m goes axially along the nanotube, n spirals around the tube;
+    # the strip between the n = nn - 1 row and the n = 0 row is zipped
+    # up using an m offset found by hunting for a bonded pair, as in
+    # Chirality.populate
+    n = nn - 1
+    mmid = (2 * mfirst[n] + counts[n] - 1) / 2
+    atm = positions[2 * (starts[n] + mmid - mfirst[n]) + 1]
+    diff = positions[0 : 2 * counts[0] : 2] - atm
+    close = Numeric.nonzero(Numeric.add.reduce(diff * diff, 1) < chirality.maxlensq)
+    if not len(close):
+        # If this ever happens, it indicates a bug.
+        raise Exception, "can't find m offset"
+    moffset = mfirst[0] + close[0] - mmid
+
+    odd = 2 * cells + 1
+    seam = Numeric.compress(ns == n, cells)
+    bonds = [(2 * cells, odd),
+             (odd, even(ns + 1, ms)),
+             (odd, even(ns, ms + 1)),
+             (2 * seam + 1, even(seam * 0, Numeric.take(ms, seam) + moffset))]
+    pairs = Numeric.concatenate([Numeric.transpose(Numeric.array(b)) for b in bonds])
+    pairs = Numeric.compress(pairs[:,1] >= 0, pairs, 0)
+    # for small n the same bond can be found twice; keep only one
+    keys = Numeric.minimum(pairs[:,0], pairs[:,1]) * (2 * ncells) + \
+           Numeric.maximum(pairs[:,0], pairs[:,1])
+    order = Numeric.argsort(keys)
+    keys = Numeric.take(keys, order)
+    first = Numeric.ones(len(keys))
+    first[1:] = Numeric.not_equal(keys[1:], keys[:-1])
+    pairs = Numeric.take(pairs, Numeric.compress(first, order))
+    return positions, sublattice, pairs
+
+def nanotube(chirality, length, zdist = 0.0, xydist = 0.0, twist = 0.0, bend = 0.0,
+             rcov = (0.0, 0.0)):
+    """
+    Return a HexagonalStructure for a nanotube with the given
+    chirality (see nanotube_lattice), length and distortions
+    (see NanotubeGenerator),
+    with its dangling atoms trimmed, centered on the origin with its
+    axis along z (before bending), as made by
+    NanotubeGenerator.build_struct (not counting its endings or
+    position). rcov gives the distance of the bondpoints from their
+    atoms (see bondpoint_positions).
+    """
+    # populate the tube with some extra atoms on the ends
+    # so that we can trim them later
+    positions, sublattice, bonds = nanotube_lattice(chirality, length + 4 * chirality.maxlen)
+    x, y, z = positions[:,0], positions[:,1], positions[:,2]
+    # twist
+    twistRadians = twist * z
+    c, s = Numeric.cos(twistRadians), Numeric.sin(twistRadians)
+    x, y = x * c + y * s, -x * s + y * c
+    # z distortion
+    z = z * ((zdist + length) / length)
+    length += zdist
+    # xy distortion
+    radius = chirality.R
+    x = x * ((radius + 0.5 * xydist) / radius)
+    y = y * ((radius - 0.5 * xydist) / radius)
+    positions = Numeric.transpose(Numeric.array([x, y, z]))
+    # trim the atoms outside our desired length (plus a bond length,
+    # as in NanotubeGenerator)
+    limit = .5 * (length + chirality.bond_length)
+    keep = Numeric.logical_and(z <= limit, z >= - limit)
+    owners, others = open_bonds(bonds, keep, Numeric.logical_not(keep))
+    points = bondpoint_positions(positions, sublattice, owners, others, rcov)
+    # bend (after those bondpoints were made, so they're bent too)
+    if abs(bend) > pi / 360:
+        positions = _bend(positions, length / bend)
+        points = _bend(points, length / bend)
+    # trim dangling atoms
+    keep2 = trim_dangling_atoms(len(positions), bonds, keep)
+    survivors = Numeric.take(keep2, owners)
+    owners = Numeric.compress(survivors, owners)
+    points = Numeric.compress(survivors, points, 0)
+    return _trim(positions, sublattice, bonds, keep2,
+                 Numeric.logical_and(keep, Numeric.logical_not(keep2)),
+                 False, rcov, (owners, points))
+
+def _bend(positions, R):
+    """
+    Return positions bent around a circle of radius R, as in
+    NanotubeGenerator.build_struct.
+    """
+    x, y, z = positions[:,0], positions[:,1], positions[:,2]
+    theta = z / R
+    return Numeric.transpose(Numeric.array([R - (R - x) * Numeric.cos(theta),
+                                            y,
+                                            (R - x) * Numeric.sin(theta)]))
+
+# ==
+
+def _check(structure):
+    """
+    Assert that every atom of structure has at most 3 bonds and
+    bondpoints in all, and return its numbers of atoms, bonds and
+    bondpoints.
+    """
+    natoms = len(structure.positions)
+    nbp = _degrees(natoms,
+                   Numeric.transpose(Numeric.array([structure.bondpoint_owners,
+                                                    structure.bondpoint_owners])),
+                   Numeric.ones(natoms)) / 2
+    assert Numeric.add.reduce(Numeric.greater(structure.degrees() + nbp, 3)) == 0
+    return natoms, len(structure.bonds), len(structure.bondpoint_owners)
+
+def _benchmark(size = 1620.0, bond_length = 1.42, chunk_size = 150.0):
+    """
+    Print the time to compute a square graphene sheet of the given size
+    (in Angstroms; the default gives about a million atoms), and the
+    times to make a Chunk for a square sheet of chunk_size in bulk (by
+    add_hexagonal_structure) and one atom at a time (making each Atom,
+    bonding them and killing the atoms outside the sheet, as
+    GrapheneGenerator.populate does).
+    """
+    import time
+    t0 = time.time()
+    sheet = graphene_sheet(size, size, bond_length, trim = True,
+                           rcov = (0.71, 0.71))
+    t1 = time.time()
+    print "graphene %g x %g: %d atoms, %d bonds, %d bondpoints in %.2f sec" % \
+          ((size, size) + _check(sheet) + (t1 - t0,))
+
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from model.bonds import bond_atoms
+    from model.bond_constants import V_GRAPHITE
+    from model.elements import PeriodicTable
+    from model.bulk_chunk import add_hexagonal_structure, hexagonal_rcov
+    from geometry.VQT import V
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    carbon = PeriodicTable.getElement('C').find_atomtype('sp2')
+    atomtypes = (carbon, carbon)
+
+    def counts(mol):
+        nbp = len([atom for atom in mol.atoms.itervalues() if atom.is_singlet()])
+        return len(mol.atoms) - nbp, nbp
+
+    t0 = time.time()
+    mol = Chunk(assy, "bulk")
+    sheet = graphene_sheet(chunk_size, chunk_size, bond_length,
+                           rcov = hexagonal_rcov(atomtypes, V_GRAPHITE))
+    add_hexagonal_structure(mol, sheet, atomtypes, V_GRAPHITE)
+    t1 = time.time()
+    print "chunk of graphene %g x %g in bulk: %d atoms, %d bondpoints in %.2f sec" % \
+          ((chunk_size, chunk_size) + counts(mol) + (t1 - t0,))
+
+    t0 = time.time()
+    mol = Chunk(assy, "per atom")
+    positions, sublattice, bonds = graphene_lattice(chunk_size, chunk_size,
+                                                    bond_length)
+    atoms = [Atom(carbon, V(x, y, z), mol) for x, y, z in positions.tolist()]
+    for i, j in bonds.tolist():
+        bond_atoms(atoms[i], atoms[j], V_GRAPHITE)
+    xdim = ydim = chunk_size + bond_length
+    for atom in atoms:
+        x, y, z = atom.posn()
+        if x < -0.5 * xdim or x > 0.5 * xdim or y < -0.5 * ydim or y > 0.5 * ydim:
+            atom.kill()
+    t1 = time.time()
+    print "chunk of graphene %g x %g atom by atom: %d atoms, %d bondpoints in %.2f sec" % \
+          ((chunk_size, chunk_size) + counts(mol) + (t1 - t0,))
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -29,6 +29,8 @@ I'd be more confident that a package import cycle was unlikely.)
 """
 
 from Numeric import array, zeros, maximum, minimum, ceil, dot, floor
+from Numeric import ones, logical_and, logical_not, transpose, reshape
+from Numeric import where, nonzero, take, put, ravel, Int
 
 from geometry.VQT import A, vlen, V
 
@@ -53,6 +55,8 @@ from utilities.prefs_constants import LightBackgroundContrastColor_prefs_key
 
 from geometry.BoundingBox import BBox
 
+from utilities.GlobalPreferences import pref_indexed_picking
+
 def get_selCurve_color(selSense, bgcolor = white):
     """
     [public]
@@ -235,6 +239,77 @@ class simple_shape_2d:
         return p[0]>=self.bboxlo[0] and p[1]>=self.bboxlo[1] \
             and p[0]<=self.bboxhi[0] and p[1]<=self.bboxhi[1]
 
+    def project_2d_array(self, points):
+        """
+        Like project_2d, but for an N x 3 array of points; return (res, p),
+        where p is an N x 2 array of the projected points and res is
+        a Numeric array which is true for the points that are in the
+        optional slab and can be projected.
+        """
+        points = array(points)
+        res = ones((len(points),))
+        if self.slab:
+            d = dot(points - self.slab.point, self.slab.normal)
+            res = logical_and(d >= 0, d <= self.slab.thickness)
+        p = dot(points, transpose(array([self.right, self.up])))
+        if self.eyeball:
+            # like project_2d, for all points at once
+            pfix = self.project_2d_noeyeball(self.org)
+            d = dot(points - self.eyeball, self.normal) / self.eye2Pov
+            res = logical_and(res, d != 0) # (too close to eyeball to be projected)
+            d = reshape(where(d != 0, d, 1.0), (-1, 1))
+            p = (p - pfix) / d + pfix
+        return res, p
+
+    def isin_bbox_array(self, points):
+        """
+        Like isin_bbox, but for an N x 3 array of points; return
+        a Numeric array which is true for the points that are in.
+        """
+        res, p = self.project_2d_array(points)
+        for i in (0, 1):
+            res = logical_and(res, logical_and(p[:,i] >= self.bboxlo[i],
+                                               p[:,i] <= self.bboxhi[i]))
+        return res, p
+
+    def bounding_planes(self):
+        """
+        Return a list of planes (a, b, c, d), each one meaning the
+        half-space a*x + b*y + c*z + d >= 0 with (a, b, c) a unit vector,
+        whose intersection contains all the points in our bbox (i.e. our
+        slab, if any, and the region which projects inside our 2d bbox).
+        For use as a prefilter for isin_bbox_array; when we have an
+        eyeball, this also excludes points behind it.
+        """
+        planes = []
+        if self.slab:
+            n = self.slab.normal
+            offset = dot(self.slab.point, n)
+            planes.append( list(n) + [- offset] )
+            planes.append( list(- n) + [offset + self.slab.thickness] )
+        axes = (self.right, self.up)
+        if not self.eyeball:
+            for i in (0, 1):
+                planes.append( list(axes[i]) + [- self.bboxlo[i]] )
+                planes.append( list(- axes[i]) + [self.bboxhi[i]] )
+            return planes
+        # Points in front of the eyeball (d > 0, with d as in project_2d)
+        # project to p with p[i] >= lo iff
+        #   dot(pt, axis) - pfix[i] - (lo - pfix[i]) * d >= 0,
+        # which is a half-space bounded by a plane through the eyeball.
+        pfix = self.project_2d_noeyeball(self.org)
+        n = self.normal
+        eye_offset = dot(self.eyeball, n)
+        planes.append( list(n) + [- eye_offset] )
+        for i in (0, 1):
+            for bound, sign in ((self.bboxlo[i], 1), (self.bboxhi[i], -1)):
+                k = (bound - pfix[i]) / self.eye2Pov
+                normal = sign * (axes[i] - k * n)
+                offset = sign * (- pfix[i] + k * eye_offset)
+                length = vlen(normal)
+                planes.append( list(normal / length) + [offset / length] )
+        return planes
+
     pass # end of class simple_shape_2d
 
 
@@ -246,6 +321,12 @@ class rectangle(simple_shape_2d): # bruce 041214 factored out simple_shape_2d
         simple_shape_2d.__init__( self, shp, [pt1, pt2], origin, selSense, opts)        
     def isin(self, pt):
         return self.isin_bbox(pt)
+    def isin_array(self, points):
+        """
+        Like isin, but for an N x 3 array of points; return a Numeric
+        array which is true for the points that are in.
+        """
+        return self.isin_bbox_array(points)[0]
     def draw(self):
         """
         Draw the rectangle
@@ -327,6 +408,21 @@ class curve(simple_shape_2d): # bruce 041214 factored out simple_shape_2d
         ij = map(int, p * 8)-self.matbase
         return not self.matrix[ij]
 
+    def isin_array(self, points):
+        """
+        Like isin, but for an N x 3 array of points; return a Numeric
+        array which is true for the points that are in.
+        """
+        res, p = self.isin_bbox_array(points)
+        inds = nonzero(res)
+        if not len(inds):
+            return res
+        # as in isin, for the points in our bbox
+        ij = (take(p, inds) * 8).astype(Int) - self.matbase
+        flat = ij[:,0] * self.matrix.shape[1] + ij[:,1]
+        put(res, inds, logical_not(take(ravel(self.matrix), flat)))
+        return res
+
     def xdraw(self):
         """
         draw the actual grid of the matrix in 3-space.
@@ -457,6 +553,9 @@ class SelectionShape(shape): # review: split this into its own file? [bruce 0712
         Select all atoms inside the shape according to its selection selSense.
         """    
         c = self.curve
+        if pref_indexed_picking() and c.selSense != SUBTRACT_FROM_SELECTION:
+            self._atomsSelect_indexed(assy)
+            return
         if c.selSense == ADD_TO_SELECTION:
             for mol in assy.molecules:
                 if mol.hidden:
@@ -500,6 +599,34 @@ class SelectionShape(shape): # review: split this into its own file? [bruce 0712
             print "Error in shape._atomsSelect(): Invalid selSense =", c.selSense
             #& debug method. mark 060211.
 
+    def _atomsSelect_indexed(self, assy):
+        """
+        Do what _atomsSelect does (except for SUBTRACT_FROM_SELECTION,
+        whose loop is only over the selected atoms), finding the atoms
+        inside the shape using assy.part's PickIndex.
+        """
+        c = self.curve
+        inside = {}
+        for mol, atoms in assy.part.get_pick_index().atoms_in_region(assy.part, c):
+            for a in atoms:
+                inside[a.key] = a
+        if c.selSense == START_NEW_SELECTION:
+            for a in assy.selatoms.values():
+                if not a.molecule.hidden and not inside.has_key(a.key):
+                    a.unpick()
+        if c.selSense == ADD_TO_SELECTION or c.selSense == START_NEW_SELECTION:
+            for a in inside.itervalues():
+                a.pick()
+        elif c.selSense == DELETE_SELECTION:
+            todo = [a for a in inside.itervalues() if not a.is_singlet()]
+            for a in todo:
+                if a.filtered():
+                    continue
+                a.kill()
+        else:
+            print "Error in shape._atomsSelect_indexed(): Invalid selSense =", c.selSense
+        return
+
     def _chunksSelect(self, assy):
         """
         Loop thru all the atoms that are visible and select any
@@ -509,6 +636,9 @@ class SelectionShape(shape): # review: split this into its own file? [bruce 0712
         #bruce 041214 conditioned this on a.visible() to fix part of bug 235;
         # also added .hidden check to the last of 3 cases. Same in self.select().
         c = self.curve
+        if pref_indexed_picking():
+            self._chunksSelect_indexed(assy)
+            return
         if c.selSense == START_NEW_SELECTION:
             # drag selection: unselect any selected Chunk not in the area, 
             # modified by Huaicai to fix the selection bug 10/05/04
@@ -554,6 +684,29 @@ class SelectionShape(shape): # review: split this into its own file? [bruce 0712
             for mol in todo:
                 mol.kill()
         return
+
+    def _chunksSelect_indexed(self, assy):
+        """
+        Do what _chunksSelect does, finding the chunks with atoms inside
+        the shape using assy.part's PickIndex.
+        """
+        c = self.curve
+        mols = [mol for mol, atoms in
+                assy.part.get_pick_index().atoms_in_region(assy.part, c)]
+        if c.selSense == START_NEW_SELECTION:
+            for m in assy.selmols[:]:
+                m.unpick()
+        if c.selSense == ADD_TO_SELECTION or c.selSense == START_NEW_SELECTION:
+            for mol in mols:
+                mol.pick()
+        if c.selSense == SUBTRACT_FROM_SELECTION:
+            for mol in mols:
+                if mol.picked:
+                    mol.unpick()
+        if c.selSense == DELETE_SELECTION:
+            for mol in mols:
+                mol.kill()
+        return
     
     def findObjInside(self, assy):
         """
@@ -563,6 +716,14 @@ class SelectionShape(shape): # review: split this into its own file? [bruce 0712
         
         c = self.curve
         
+        if pref_indexed_picking():
+            for mol, atoms in assy.part.get_pick_index().atoms_in_region(assy.part, c):
+                if assy.selwhat: ##Chunks
+                    rst.append(mol)
+                else: ##Atoms
+                    rst.extend(atoms)
+            return rst
+        
         if assy.selwhat: ##Chunks
            rstMol = {} 
            for mol in assy.molecules:
@@ -54,11 +54,15 @@ from math import sin, cos, pi
 from Numeric import dot, argmax, argmin, sqrt
 
 from graphics.display_styles.displaymodes import ChunkDisplayMode
+from graphics.display_styles.spline_geometry import make_curved_strand
+from graphics.display_styles.spline_geometry import make_discrete_polycone
+from graphics.display_styles.spline_geometry import geometry_key
 
 from geometry.VQT import V, Q, norm, cross, angleBetween
 
 from utilities.debug import print_compact_traceback
 from utilities.debug_prefs import debug_pref, Choice, Choice_boolean_True, Choice_boolean_False
+from utilities.GlobalPreferences import pref_cache_display_style_geometry
 
 from utilities.prefs_constants import hoverHighlightingColor_prefs_key
 from utilities.prefs_constants import selectionColor_prefs_key
@@ -453,37 +457,10 @@ class DnaCylinderChunks(ChunkDisplayMode):
     def _make_curved_strand(self, points, colors, radii):
         """
         Converts a polycylinder tube to a smooth, curved tube
-        using spline interpolation of points, colors and radii.
+        using spline interpolation of points, colors and radii
+        (see make_curved_strand in spline_geometry.py).
         """
-        n = len(points)
-        if n > 3:
-            new_points = [ None ] * (4*(n-2)-1)
-            new_colors = [ None ] * (4*(n-2)-1)
-            new_radii = [ 0.0 ] * (4*(n-2)-1)
-            for p in range(0, (4*(n-2)-1)):
-                new_points[p] = [ 0.0 ] * 3
-                new_colors[p] = [ 0.0 ] * 3
-            o = 1
-            for p in range (1, n-2):
-                for m in range (0, 4):
-                    t = 0.25 * m
-                    new_points[o] = self._compute_spline(points, p, t)
-                    new_colors[o] = self._compute_spline(colors, p, t)
-                    new_radii[o] = self._compute_spline(radii, p, t)
-                    o += 1        
-            new_points[o] = self._compute_spline(points, p, 1.0)
-            new_colors[o] = self._compute_spline(colors, p, 1.0)
-            new_radii[o] = self._compute_spline(radii, p, 1.0)
-            o += 1
-            new_points[0] = 3.0 * new_points[1] - 3.0 * new_points[2] + new_points[3] 
-            new_points[o] = 3.0 * new_points[o-1] - 3.0 * new_points[o-2] + new_points[o-3] 
-            new_colors[0] = new_colors[1]
-            new_colors[o] = new_colors[o - 1]
-            new_radii[0] = new_radii[1]
-            new_radii[o] = new_radii[o - 1]
-            return (new_points, new_colors, new_radii)
-        else:
-            return (points, colors, radii)
+        return make_curved_strand(points, colors, radii)
 
     def _get_axis_positions(self, chunk, atom_list, color_style):
         """
@@ -714,26 +691,7 @@ class DnaCylinderChunks(ChunkDisplayMode):
         gradient to discrete (sharp edged) color scheme.
         The number of nodes will be duplicated.
         """
-        n = len(positions)
-        new_positions = []
-        new_colors = []
-        new_radii = []
-        #new_positions.append(positions[0])
-        #new_colors.append(colors[0])
-        #new_radii.append(radii[0])
-        for i in range(0, n - 1):
-            new_positions.append(positions[i])
-            new_positions.append(positions[i])
-            new_colors.append(colors[i])
-            new_colors.append(colors[i+1])
-            new_radii.append(radii[i])
-            new_radii.append(radii[i])
-        #new_positions.append(positions[i+1])
-        #new_colors.append(colors[i+1])
-        #new_radii.append(radii[i+1])
-        print "colors = ", colors
-        print "new colors = ", new_colors
-        return (new_positions, new_colors, new_radii)
+        return make_discrete_polycone(positions, colors, radii)
     pass
 
 
@@ -1842,12 +1800,21 @@ class DnaCylinderChunks(ChunkDisplayMode):
                     self.dnaStyleStrandsScale)
     
                 if self.dnaStyleStrandsShape == 2:
-                    positions, \
-                    colors, \
-                    radii = self._make_curved_strand( 
-                        positions, 
-                        colors, 
-                        radii )
+                    if pref_cache_display_style_geometry():
+                        key = geometry_key(positions, colors, radii)
+                        positions, \
+                        colors, \
+                        radii = self.cached_geometry( 
+                            chunk, key, 
+                            lambda: self._make_curved_strand( 
+                                positions, colors, radii ))
+                    else:
+                        positions, \
+                        colors, \
+                        radii = self._make_curved_strand( 
+                            positions, 
+                            colors, 
+                            radii )
     
                 # Find external bonds, if there are any.
                 # Moved drawing to draw_realtime otherwise the struts won't be updated.
@@ -25,6 +25,8 @@ from model.chunk import Chunk
 from geometry.VQT import V, norm, cross
 
 from graphics.display_styles.displaymodes import ChunkDisplayMode
+from graphics.display_styles.spline_geometry import make_tube
+from graphics.display_styles.spline_geometry import geometry_key
 
 from graphics.drawing.CS_draw_primitives import drawcylinder
 from graphics.drawing.CS_draw_primitives import drawpolycone
@@ -47,6 +49,8 @@ from graphics.drawing.gl_lighting import apply_material
 
 from utilities.constants import blue, cyan, green, orange, red, white, black, gray
 
+from utilities.GlobalPreferences import pref_cache_display_style_geometry
+
 try:
     from OpenGL.GLE import glePolyCone
     from OpenGL.GLE import gleGetNumSides 
@@ -195,51 +199,6 @@ def compute_spline(data, idx, t):
                  t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
     return res
 
-def make_tube(points, colors, radii, dpos, resolution=8, trim=True):
-    """
-    Converts a polycylinder tube into a smooth, curved tube
-    using spline interpolation of points, colors and radii.
-    """
-    n = len(points)
-    if n > 3:
-        new_points = []
-        new_colors = []
-        new_radii = []
-        new_dpos = []
-        o = 1
-        ir = 1.0/float(resolution)
-        for p in range (1, n-2):
-            start_spline = 0
-            end_spline = resolution
-            if p == 1:
-                start_spline = int(resolution / 2 - 1)
-            if p == n-3:
-                end_spline = int(resolution / 2 + 1)
-            for m in range (start_spline, end_spline):
-                t = ir * m
-                sp = compute_spline(points, p, t)
-                sc = compute_spline(colors, p, t)
-                sr = compute_spline(radii, p, t)
-                sd = compute_spline(dpos, p, t)
-                new_points.append(sp)
-                new_colors.append(sc)
-                new_radii.append(sr)
-                new_dpos.append(sd)
-
-        t = ir * (m + 1)
-        sp = compute_spline(points, p, t)
-        sc = compute_spline(colors, p, t)
-        sr = compute_spline(radii, p, t)
-        sd = compute_spline(dpos, p, t)
-
-        new_points.append(sp)
-        new_colors.append(sc)
-        new_radii.append(sr)
-        new_dpos.append(sd)
-        return (new_points, new_colors, new_radii, new_dpos)
-    else:
-        return (points, colors, radii, dpos)
-
 def get_rainbow_color(hue, saturation, value):
     """
     Gets a color of a hue range limited to 0 - 0.667 (red - blue)
@@ -265,6 +224,25 @@ def get_rainbow_color_in_range(pos, count, saturation, value):
         hue = 1.0
     return get_rainbow_color(hue, saturation, value)
 
+class _RecordedDrawing:
+    """
+    A list of calls of drawing functions (drawcylinder, drawline, etc),
+    made by ProteinChunks._record_drawing, which can be replayed as
+    often as needed (see ProteinChunks.drawchunk).
+    """
+    def __init__(self):
+        self.calls = []
+
+    def add(self, func, *args, **kws):
+        self.calls.append((func, args, kws))
+
+    def replay(self):
+        for func, args, kws in self.calls:
+            func(*args, **kws)
+        return
+
+    pass
+
 class ProteinChunks(ChunkDisplayMode):
 
     # mmp_code must be a unique 3-letter code, distinct from the values in 
@@ -319,17 +297,49 @@ class ProteinChunks(ChunkDisplayMode):
         """
         Draws reduced representation of a protein chunk.
         """
+        gleSetJoinStyle(TUBE_JN_ANGLE | TUBE_NORM_PATH_EDGE | TUBE_JN_CAP | TUBE_CONTOUR_CLOSED ) 
+
+        if pref_cache_display_style_geometry():
+            structure, total_length, ca_list, n_sec = memo
+            key = geometry_key(structure, total_length, n_sec,
+                               self._style_settings(), chunk.color)
+            drawing = self.cached_geometry(
+                chunk, key, lambda: self._record_drawing(chunk, memo))
+        else:
+            drawing = self._record_drawing(chunk, memo)
+        drawing.replay()
+        return
+
+    def _style_settings(self):
+        """
+        Returns the style settings used by _record_drawing.
+        """
+        return (self.proteinStyle,
+                self.proteinStyleScaleFactor,
+                self.proteinStyleQuality,
+                self.proteinStyleScaling,
+                self.proteinStyleSmooth,
+                self.proteinStyleColors,
+                self.proteinStyleHelixColor,
+                self.proteinStyleStrandColor,
+                self.proteinStyleCoilColor)
+
+    def _record_drawing(self, chunk, memo):
+        """
+        Returns a _RecordedDrawing of the reduced representation of
+        a protein chunk.
+        """
 
         structure, total_length, ca_list, n_sec = memo
 
+        drawing = _RecordedDrawing()
+
         style = self.proteinStyle
         scaleFactor = self.proteinStyleScaleFactor
         resolution = self.proteinStyleQuality
         scaling = self.proteinStyleScaling
         smooth = self.proteinStyleSmooth
 
-        gleSetJoinStyle(TUBE_JN_ANGLE | TUBE_NORM_PATH_EDGE | TUBE_JN_CAP | TUBE_CONTOUR_CLOSED ) 
-
         current_sec = 0
         for sec, secondary in structure:
             # Number of atoms in SS element including dummy atoms.
@@ -353,36 +363,36 @@ class ProteinChunks(ChunkDisplayMode):
                                                    n_sec)
                         if style == PROTEIN_STYLE_CA_WIRE:
                             if pos0:
-                                drawline(color, 
-                                         pos1 + 0.5 * (pos0 - pos1), 
-                                         pos1,
-                                         width=5,
-                                         isSmooth=True)
+                                drawing.add(drawline, color, 
+                                            pos1 + 0.5 * (pos0 - pos1), 
+                                            pos1,
+                                            width=5,
+                                            isSmooth=True)
                             if pos2:
-                                drawline(color, 
-                                         pos1, 
-                                         pos1 + 0.5 * (pos2 - pos1),
-                                         width=5, 
-                                         isSmooth=True)
+                                drawing.add(drawline, color, 
+                                            pos1, 
+                                            pos1 + 0.5 * (pos2 - pos1),
+                                            width=5, 
+                                            isSmooth=True)
                         else:
                             if pos0:
-                                drawcylinder(color, 
-                                             pos1 + 0.5 * (pos0 - pos1), 
-                                             pos1,
-                                             0.25 * scaleFactor, 
-                                             capped=1)
+                                drawing.add(drawcylinder, color, 
+                                            pos1 + 0.5 * (pos0 - pos1), 
+                                            pos1,
+                                            0.25 * scaleFactor, 
+                                            capped=1)
 
                             if style == PROTEIN_STYLE_CA_BALL_STICK:
-                                drawsphere(color, pos1, 0.5 * scaleFactor, 2)
+                                drawing.add(drawsphere, color, pos1, 0.5 * scaleFactor, 2)
                             else:
-                                drawsphere(color, pos1, 0.25 * scaleFactor, 2)
+                                drawing.add(drawsphere, color, pos1, 0.25 * scaleFactor, 2)
 
                             if pos2:
-                                drawcylinder(color, 
-                                             pos1, 
-                                             pos1 + 0.5 * (pos2 - pos1),
-                                             0.25 * scaleFactor, 
-                                             capped=1)
+                                drawing.add(drawcylinder, color, 
+                                            pos1, 
+                                            pos1 + 0.5 * (pos2 - pos1),
+                                            0.25 * scaleFactor, 
+                                            capped=1)
 
                 elif style == PROTEIN_STYLE_PEPTIDE_TILES:
                     for n in range( 1, n_atoms-2 ):
@@ -447,8 +457,8 @@ class ProteinChunks(ChunkDisplayMode):
 
 
                         if style == PROTEIN_STYLE_LADDER:
-                            drawcylinder(color, pos1, cbpos1, rad * 0.75)
-                            drawsphere(color, cbpos1, rad * 1.5, 2)
+                            drawing.add(drawcylinder, color, pos1, cbpos1, rad * 0.75)
+                            drawing.add(drawsphere, color, cbpos1, rad * 1.5, 2)
 
                         if pos1:
                             tube_pos.append(pos1)
@@ -576,11 +586,11 @@ class ProteinChunks(ChunkDisplayMode):
                                         reset = False
 
                                     if self.proteinStyle == PROTEIN_STYLE_ZIGZAG:
-                                        drawline(col, last_pos-dpos1, pos-dpos2, width=3)
-                                        drawline(col, last_pos+dpos1, pos+dpos2, width=3)
-                                        drawline(col, last_pos-dpos1, pos+dpos2, width=1)
-                                        drawline(col, pos-dpos2, pos+dpos2, width=1)
-                                        drawline(col, last_pos-dpos1, last_pos+dpos1, width=1)
+                                        drawing.add(drawline, col, last_pos-dpos1, pos-dpos2, width=3)
+                                        drawing.add(drawline, col, last_pos+dpos1, pos+dpos2, width=3)
+                                        drawing.add(drawline, col, last_pos-dpos1, pos+dpos2, width=1)
+                                        drawing.add(drawline, col, pos-dpos2, pos+dpos2, width=1)
+                                        drawing.add(drawline, col, last_pos-dpos1, last_pos+dpos1, width=1)
 
                                     if self.proteinStyle == PROTEIN_STYLE_FLAT_RIBBON:
                                         if pos != last_pos:
@@ -717,20 +727,20 @@ class ProteinChunks(ChunkDisplayMode):
                         ###drawcylinder(white, tube_pos[0], tube_pos[10], 1.0)
 
                         if self.proteinStyle == PROTEIN_STYLE_FLAT_RIBBON:
-                            drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
+                            drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
 
                         if self.proteinStyle == PROTEIN_STYLE_SOLID_RIBBON or \
                            self.proteinStyle == PROTEIN_STYLE_SIMPLE_CARTOONS or \
                            self.proteinStyle == PROTEIN_STYLE_FANCY_CARTOONS:
                             if secondary == 0:
-                                drawpolycone_multicolor([0,0,0,-2], tube_pos, tube_col, tube_rad)
+                                drawing.add(drawpolycone_multicolor, [0,0,0,-2], tube_pos, tube_col, tube_rad)
                             else:
                                 if (secondary == 1 and self.proteinStyle == PROTEIN_STYLE_SOLID_RIBBON) or \
                                    secondary == 2:
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr1, nor_arr1, col_arr1)
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr2, nor_arr2, col_arr2)
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr3, nor_arr3, col_arr3)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr1, nor_arr1, col_arr1)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr2, nor_arr2, col_arr2)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr3, nor_arr3, col_arr3)
                                     # Fill in the strand N-terminal end.
                                     quad_tri = []
                                     quad_nor = []
@@ -747,11 +757,11 @@ class ProteinChunks(ChunkDisplayMode):
                                     quad_col.append(col_arr3[0])
                                     quad_col.append(col_arr2[1])
                                     quad_col.append(col_arr3[1])
-                                    drawtriangle_strip([1.0,1.0,1.0,-2.0],quad_tri,quad_nor,quad_col)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,1.0,-2.0],quad_tri,quad_nor,quad_col)
 
                                 if (secondary == 1 and self.proteinStyle == PROTEIN_STYLE_FANCY_CARTOONS):
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
-                                    drawtriangle_strip([1.0,1.0,0.0,-2.0], tri_arr1, nor_arr1, col_arr1)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr0, nor_arr0, col_arr0)
+                                    drawing.add(drawtriangle_strip, [1.0,1.0,0.0,-2.0], tri_arr1, nor_arr1, col_arr1)
                                     tube_pos_left = []
                                     tube_pos_right = []
                                     new_tube_dpos[0] *= 0.1
@@ -762,22 +772,24 @@ class ProteinChunks(ChunkDisplayMode):
                                         tube_pos_left.append(tube_pos[p] - new_tube_dpos[p])
                                         tube_pos_right.append(tube_pos[p] + new_tube_dpos[p])
                                         tube_rad[p] *= 0.75
-                                    drawpolycone_multicolor([0,0,0,-2], tube_pos_left, tube_col, tube_rad)
-                                    drawpolycone_multicolor([0,0,0,-2], tube_pos_right, tube_col, tube_rad)
+                                    drawing.add(drawpolycone_multicolor, [0,0,0,-2], tube_pos_left, tube_col, tube_rad)
+                                    drawing.add(drawpolycone_multicolor, [0,0,0,-2], tube_pos_right, tube_col, tube_rad)
 
 #                    else:                               
                     if (secondary == 1 and style == PROTEIN_STYLE_SIMPLE_CARTOONS):
-                        drawcylinder(tube_col[0][0], tube_pos[1], tube_pos[-3], 2.5, capped=1)
+                        drawing.add(drawcylinder, tube_col[0][0], tube_pos[1], tube_pos[-3], 2.5, capped=1)
                         #print "hopsa"
 
                     if style == PROTEIN_STYLE_LADDER or \
                        style == PROTEIN_STYLE_TUBE:
                         # Draw tube.
-                        drawpolycone_multicolor([0,0,0,-2], tube_pos, tube_col, tube_rad)
+                        drawing.add(drawpolycone_multicolor, [0,0,0,-2], tube_pos, tube_col, tube_rad)
 
             # increase Sec. Str. element counter
             current_sec += 1
 
+        return drawing
+
     def drawchunk_selection_frame(self, glpane, chunk, selection_frame_color, memo, highlighted):
         """
         Given the same arguments as drawchunk, plus selection_frame_color, 
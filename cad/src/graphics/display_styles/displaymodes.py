@@ -222,7 +222,24 @@ class ChunkDisplayMode(DisplayMode):
             memoplace['memo_validity_data'] = memo_validity_data
             memoplace['memo'] = memo
         return memoplace['memo']
-    
+
+    def cached_geometry(self, chunk, key, compute):
+        """
+        Return compute(), or the value it returned the last time we were
+        called for chunk with an equal key (a string, e.g. from
+        spline_geometry.geometry_key, made from everything that value
+        depends on, such as positions and style settings).
+
+        The value is saved next to our memo for chunk, but unlike the
+        memo, it's kept when chunk's display list is invalidated, so
+        unchanged chunks needn't recompute it.
+        """
+        memoplace = chunk.memo_dict.setdefault(id(self), {})
+        if memoplace.get('geometry_key') != key:
+            memoplace['geometry'] = compute()
+            memoplace['geometry_key'] = key
+        return memoplace['geometry']
+
     pass # end of class ChunkDisplayMode
     
 # end
@@ -0,0 +1,241 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+spline_geometry.py -- Catmull-Rom spline interpolation of tubes for the
+DNA Cylinder and Protein display styles, computed for all control points
+at once, and keys for caching the results.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written to replace DnaCylinderChunks._make_curved_strand and
+ProteinChunks.make_tube, which evaluated the spline one point (and one
+coordinate array) at a time, calling _compute_spline or compute_spline
+four times per output point.
+
+Usage:
+
+make_curved_strand and make_tube take and return the same lists as the
+functions they replace (lists of 3-vectors, and lists of floats for
+radii), and return the same values, computed with the same arithmetic.
+
+geometry_key returns a string which is equal for equal arguments (nested
+lists and tuples of Numeric arrays, numbers, strings, None), for use as
+the key of ChunkDisplayMode.cached_geometry.
+
+Implementation notes:
+
+The control points of a tube are put into one array for each of its
+properties (points, colors, radii, ...), and the spline is evaluated
+for all output points at once, from arrays of their segment indices and
+parameters.
+"""
+
+import Numeric
+from Numeric import Float
+
+_ARRAY_TYPE = type(Numeric.array((1.0,)))
+_TUPLE_TYPE = type(())
+_LIST_TYPE = type([])
+
+def catmull_rom(data, idx, t):
+    """
+    Return an array of points on the Catmull-Rom spline through data
+    (an array of n control points, or of n numbers), the m-th one between
+    data[idx[m]] and data[idx[m] + 1], at parameter t[m] (0.0 to 1.0).
+    Each idx[m] must be from 1 to n - 3.
+    """
+    if len(data.shape) > 1:
+        t = Numeric.reshape(t, (-1, 1))
+    t2 = t*t
+    t3 = t2*t
+    x0 = Numeric.take(data, idx - 1)
+    x1 = Numeric.take(data, idx)
+    x2 = Numeric.take(data, idx + 1)
+    x3 = Numeric.take(data, idx + 2)
+    res = 0.5 * ((2.0 * x1) +
+                 t * (-x0 + x2) +
+                 t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
+                 t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
+    return res
+
+def make_curved_strand(points, colors, radii):
+    """
+    Converts a polycylinder tube to a smooth, curved tube
+    using spline interpolation of points, colors and radii,
+    with 4 output points per segment. The first and last points
+    (which are not drawn) are extrapolated from their neighbors.
+    """
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii)
+    nout = 4 * (n - 3)
+    m = Numeric.arange(nout)
+    idx = Numeric.concatenate([m / 4 + 1, [n - 3]])
+    t = Numeric.concatenate([0.25 * (m % 4), [1.0]])
+    new_points = catmull_rom(Numeric.array(points, Float), idx, t)
+    new_colors = catmull_rom(Numeric.array(colors, Float), idx, t)
+    new_radii = catmull_rom(Numeric.array(radii, Float), idx, t)
+    first = 3.0 * new_points[0] - 3.0 * new_points[1] + new_points[2]
+    last = 3.0 * new_points[-1] - 3.0 * new_points[-2] + new_points[-3]
+    new_points = [first] + list(new_points) + [last]
+    new_colors = list(new_colors)
+    new_colors = new_colors[:1] + new_colors + new_colors[-1:]
+    new_radii = new_radii.tolist()
+    new_radii = new_radii[:1] + new_radii + new_radii[-1:]
+    return (new_points, new_colors, new_radii)
+
+def make_discrete_polycone(positions, colors, radii):
+    """
+    Converts a polycone_multicolor colors from smoothly interpolated
+    gradient to discrete (sharp edged) color scheme.
+    The number of nodes will be duplicated.
+    """
+    n = len(positions)
+    new_positions = []
+    new_colors = []
+    new_radii = []
+    for i in range(n - 1):
+        new_positions.extend([positions[i], positions[i]])
+        new_colors.extend([colors[i], colors[i+1]])
+        new_radii.extend([radii[i], radii[i]])
+    return (new_positions, new_colors, new_radii)
+
+def make_tube(points, colors, radii, dpos, resolution = 8, trim = True):
+    """
+    Converts a polycylinder tube into a smooth, curved tube
+    using spline interpolation of points, colors, radii and
+    peptide plane vectors (dpos), with resolution output points per
+    segment, but only about half of that for the first and last
+    segments. (trim is ignored.)
+    """
+    n = len(points)
+    if n <= 3:
+        return (points, colors, radii, dpos)
+    nseg = n - 3
+    start_spline = int(resolution / 2 - 1) # in the first segment
+    end_spline = int(resolution / 2 + 1) # in the last segment
+    ir = 1.0/float(resolution)
+    m = Numeric.arange(nseg * resolution)
+    lo = start_spline
+    hi = (nseg - 1) * resolution + end_spline
+    idx = Numeric.concatenate([(m / resolution + 1)[lo:hi], [n - 3]])
+    t = Numeric.concatenate([ir * (m % resolution)[lo:hi], [ir * end_spline]])
+    new_points = catmull_rom(Numeric.array(points, Float), idx, t)
+    new_colors = catmull_rom(Numeric.array(colors, Float), idx, t)
+    new_radii = catmull_rom(Numeric.array(radii, Float), idx, t)
+    new_dpos = catmull_rom(Numeric.array(dpos, Float), idx, t)
+    return (list(new_points), list(new_colors), new_radii.tolist(),
+            list(new_dpos))
+
+# ==
+
+def geometry_key(*items):
+    """
+    Return a string made from items (nested lists and tuples of Numeric
+    arrays, numbers, strings and None), which is equal for equal items.
+    """
+    parts = []
+    _add_key_parts(items, parts)
+    return "".join(parts)
+
+def _add_key_parts(item, parts):
+    t = type(item)
+    if t is _ARRAY_TYPE:
+        data = item.tostring()
+        parts.append("<%d:" % len(data))
+        parts.append(data)
+    elif t is _TUPLE_TYPE or t is _LIST_TYPE:
+        parts.append("(")
+        for x in item:
+            _add_key_parts(x, parts)
+        parts.append(")")
+    else:
+        parts.append(repr(item))
+        parts.append(",")
+    return
+
+# ==
+
+def _catmull_rom_point(data, idx, t):
+    # as in the old DnaCylinderChunks._compute_spline
+    t2 = t*t
+    t3 = t2*t
+    x0 = data[idx-1]
+    x1 = data[idx]
+    x2 = data[idx+1]
+    x3 = data[idx+2]
+    return 0.5 * ((2.0 * x1) +
+                  t * (-x0 + x2) +
+                  t2 * (2.0 * x0 - 5.0 * x1 + 4.0 * x2 - x3) +
+                  t3 * (-x0 + 3.0 * x1 - 3.0 * x2 + x3))
+
+def _make_tube_pointwise(points, colors, radii, dpos, resolution):
+    # as in the old ProteinChunks.make_tube, for _benchmark
+    n = len(points)
+    res = ([], [], [], [])
+    ir = 1.0/float(resolution)
+    for p in range(1, n-2):
+        start_spline = 0
+        end_spline = resolution
+        if p == 1:
+            start_spline = int(resolution / 2 - 1)
+        if p == n-3:
+            end_spline = int(resolution / 2 + 1)
+        ts = [ir * m for m in range(start_spline, end_spline)]
+        if p == n-3:
+            ts.append(ir * end_spline)
+        for t in ts:
+            for data, out in zip((points, colors, radii, dpos), res):
+                out.append(_catmull_rom_point(data, p, t))
+    return res
+
+def _benchmark(nresidues = 5000, resolution = 16, repeat = 3):
+    """
+    Time make_tube and make_curved_strand, and the pointwise spline
+    evaluation they replace, on a random walk of nresidues control
+    points, checking that they agree; and time geometry_key for the
+    same control points (the cost of a cache lookup).
+    """
+    import time
+    from RandomArray import uniform
+    steps = Numeric.array(uniform(-2.0, 2.0, (nresidues, 3)))
+    points = list(Numeric.add.accumulate(steps))
+    colors = list(Numeric.array(uniform(0.0, 1.0, (nresidues, 3))))
+    radii = [0.5] * nresidues
+    dpos = list(Numeric.array(uniform(-1.0, 1.0, (nresidues, 3))))
+
+    def timed(func):
+        t0 = time.time()
+        for i in range(repeat):
+            res = func()
+        return res, (time.time() - t0) / repeat
+
+    old, t_old = timed(lambda: _make_tube_pointwise(points, colors, radii,
+                                                    dpos, resolution))
+    new, t_new = timed(lambda: make_tube(points, colors, radii, dpos,
+                                         resolution = resolution))
+    for a, b in zip(old, new):
+        assert len(a) == len(b)
+        assert Numeric.alltrue(Numeric.ravel(Numeric.array(a) ==
+                                             Numeric.array(b)))
+    print "make_tube, %d points, resolution %d: %d output points; " \
+          "pointwise %.3f sec, vectorized %.3f sec" % \
+          (nresidues, resolution, len(new[0]), t_old, t_new)
+
+    strand, t_strand = timed(lambda: make_curved_strand(points, colors,
+                                                        radii))
+    print "make_curved_strand, %d points: %d output points in %.3f sec" % \
+          (nresidues, len(strand[0]), t_strand)
+
+    key, t_key = timed(lambda: geometry_key(points, colors, radii, dpos,
+                                            resolution))
+    print "geometry_key for the same control points: %.3f sec" % t_key
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -0,0 +1,470 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+CS_batches.py - The ColorSorter's batched sphere and cylinder primitives.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written as an alternative to recording each sphere and cylinder as a
+(func, params, glname) tuple in ColorSorter.sorted_by_color and replaying
+it through drawsphere_worker etc. (See drawing_globals.use_batched_primitives.)
+
+Implementation notes:
+
+A PrimitiveBatches records spheres and cylinders per color, as columns
+(centers, radii, endpoints, glnames) in Python lists, or as whole arrays
+when scheduled in bulk. finish() turns those into typed numpy arrays, and
+geometry() expands them into one indexed triangle mesh per color (vertices,
+normals, indices, and the runs of indices which belong to each glname),
+using a few array operations per color rather than any Python code per
+primitive.
+
+Nothing in this module uses OpenGL, so all of that can be run and tested
+without a GL context. The meshes are copied into GLBufferObjects and drawn
+by draw_primitive_batches in CS_workers.py.
+
+Spheres use the same triangle strips as drawsphere_worker (converted to
+triangles); cylinders use the same 13-gon cross-section as CylList.
+"""
+
+import numpy
+
+from graphics.drawing.shape_vertices import getSphereTriStrips
+from graphics.drawing.shape_vertices import indexVerts
+
+# number of sides of the cylinder cross-section (as in init_cyls)
+CYLINDER_SIDES = 13
+
+_sphere_meshes = {} # detailLevel -> (verts, triangle indices)
+_cylinder_meshes = {} # capped -> (verts, normals, triangle indices)
+
+def strip_to_triangles(index):
+    """
+    Convert a triangle strip, given as a sequence of vertex indices,
+    into a flat uint32 array of indices of separate triangles with the
+    same winding, leaving out degenerate triangles (such as those used
+    to join sub-strips).
+    """
+    index = numpy.asarray(index, numpy.uint32)
+    if len(index) < 3:
+        return numpy.zeros((0,), numpy.uint32)
+    ntri = len(index) - 2
+    tris = numpy.empty((ntri, 3), numpy.uint32)
+    tris[:,0] = index[:-2]
+    tris[:,1] = index[1:-1]
+    tris[:,2] = index[2:]
+    # every other triangle of a strip has reversed winding
+    odd = tris[1::2].copy()
+    tris[1::2,0] = odd[:,1]
+    tris[1::2,1] = odd[:,0]
+    keep = ((tris[:,0] != tris[:,1]) &
+            (tris[:,1] != tris[:,2]) &
+            (tris[:,0] != tris[:,2]))
+    return tris[keep].ravel()
+
+def unit_sphere_mesh(detailLevel):
+    """
+    Return (verts, indices) for a unit sphere at the given level of detail:
+    an N x 3 float32 array of vertices (which are also their normals),
+    and a flat uint32 array of triangle indices into them.
+    """
+    try:
+        return _sphere_meshes[detailLevel]
+    except KeyError:
+        pass
+    index, verts = indexVerts(getSphereTriStrips(detailLevel), .0001)
+    res = (numpy.array(verts, numpy.float32), strip_to_triangles(index))
+    _sphere_meshes[detailLevel] = res
+    return res
+
+def unit_cylinder_mesh(capped):
+    """
+    Return (verts, normals, indices) for a cylinder of radius 1 along the
+    z axis from z = 0 to z = 1, with flat end caps if capped.
+    """
+    try:
+        return _cylinder_meshes[capped]
+    except KeyError:
+        pass
+    n = CYLINDER_SIDES
+    angles = numpy.arange(n) * (2 * numpy.pi / n)
+    ring = numpy.zeros((n, 3))
+    ring[:,0] = numpy.cos(angles)
+    ring[:,1] = numpy.sin(angles)
+    up = numpy.array([0.0, 0.0, 1.0])
+    this = numpy.arange(n)
+    nxt = (this + 1) % n
+    # sides: a bottom ring and a top ring, with radial normals
+    verts = [ring, ring + up]
+    normals = [ring, ring]
+    tris = [numpy.array([this, nxt, this + n]).T,
+            numpy.array([nxt, nxt + n, this + n]).T]
+    base = 2 * n
+    if capped:
+        # each cap has its own center and copy of its ring, for flat normals
+        for z in (0.0, 1.0):
+            verts += [[z * up], ring + z * up]
+            normals += [numpy.resize(up * (2 * z - 1), (n + 1, 3))]
+            center = numpy.zeros((n,), int) + base
+            r1 = base + 1 + this
+            r2 = base + 1 + nxt
+            if z:
+                tris.append(numpy.array([center, r1, r2]).T)
+            else:
+                tris.append(numpy.array([center, r2, r1]).T)
+            base += n + 1
+            continue
+    res = (numpy.concatenate(verts).astype(numpy.float32),
+           numpy.concatenate(normals).astype(numpy.float32),
+           numpy.concatenate(tris).ravel().astype(numpy.uint32))
+    _cylinder_meshes[capped] = res
+    return res
+
+def _cylinder_frames(pos1, pos2):
+    """
+    Given M x 3 arrays of cylinder endpoints, return (axis, u, v, length):
+    unit axis vectors, two unit vectors perpendicular to them and each other,
+    and the axis lengths. Zero-length cylinders get the z axis.
+    """
+    vec = pos2 - pos1
+    length = numpy.sqrt(numpy.sum(vec * vec, 1))
+    safe = numpy.where(length > 0, length, 1.0)
+    axis = vec / safe[:,numpy.newaxis]
+    axis[length == 0] = (0.0, 0.0, 1.0)
+    # any vector not parallel to the axis
+    helper = numpy.zeros(axis.shape)
+    mostly_x = numpy.absolute(axis[:,0]) > 0.9
+    helper[mostly_x, 1] = 1.0
+    helper[~mostly_x, 0] = 1.0
+    u = numpy.cross(axis, helper)
+    u /= numpy.sqrt(numpy.sum(u * u, 1))[:,numpy.newaxis]
+    v = numpy.cross(axis, u)
+    return axis, u, v, length
+
+def _instance_mesh(mesh_verts, mesh_tris, count):
+    """
+    Return the indices for count copies of a mesh with len(mesh_verts)
+    vertices and triangle indices mesh_tris, whose vertices are stored
+    one copy after another.
+    """
+    offsets = numpy.arange(count, dtype = numpy.uint32) * len(mesh_verts)
+    return (offsets[:,numpy.newaxis] + mesh_tris[numpy.newaxis,:]).ravel()
+
+def sphere_geometry(centers, radii, detailLevel):
+    """
+    Return (verts, normals, indices, indices_per_sphere) for a mesh of the
+    spheres with the given N x 3 centers and N radii.
+    """
+    unit, tris = unit_sphere_mesh(detailLevel)
+    n = len(centers)
+    verts = (centers[:,numpy.newaxis,:] +
+             radii[:,numpy.newaxis,numpy.newaxis] * unit[numpy.newaxis,:,:])
+    normals = numpy.resize(unit, (n * len(unit), 3))
+    indices = _instance_mesh(unit, tris, n)
+    return (verts.reshape((-1, 3)).astype(numpy.float32),
+            normals, indices, len(tris))
+
+def cylinder_geometry(pos1, pos2, radii, capped):
+    """
+    Return (verts, normals, indices, indices_per_cylinder) for a mesh of the
+    cylinders with the given M x 3 endpoints and M radii (all capped or not).
+    """
+    unit, unit_normals, tris = unit_cylinder_mesh(capped)
+    axis, u, v, length = _cylinder_frames(pos1, pos2)
+    new = numpy.newaxis
+    # local coordinates of the unit mesh, broadcast over the cylinders
+    x = unit[new,:,0:1]
+    y = unit[new,:,1:2]
+    z = unit[new,:,2:3]
+    r = radii[:,new,new]
+    verts = (pos1[:,new,:] +
+             r * (x * u[:,new,:] + y * v[:,new,:]) +
+             z * length[:,new,new] * axis[:,new,:])
+    nx = unit_normals[new,:,0:1]
+    ny = unit_normals[new,:,1:2]
+    nz = unit_normals[new,:,2:3]
+    normals = nx * u[:,new,:] + ny * v[:,new,:] + nz * axis[:,new,:]
+    indices = _instance_mesh(unit, tris, len(pos1))
+    return (verts.reshape((-1, 3)).astype(numpy.float32),
+            normals.reshape((-1, 3)).astype(numpy.float32),
+            indices, len(tris))
+
+class ColorBatchGeometry:
+    """
+    The mesh of all batched primitives of one color: float32 vertex and
+    normal arrays, a uint32 triangle index array, and, for drawing with
+    GL_SELECT names, the glnames of consecutive runs of primitives with
+    the same glname and the start and length of each run in indices.
+    """
+    def __init__(self, color, verts, normals, indices,
+                 run_names, run_starts, run_counts):
+        self.color = color
+        self.verts = verts
+        self.normals = normals
+        self.indices = indices
+        self.run_names = run_names
+        self.run_starts = run_starts
+        self.run_counts = run_counts
+        return
+    pass
+
+def _name_runs(names, index_counts):
+    """
+    Given per-primitive glnames and index counts (in the order of the
+    primitives in the index array), return (run_names, run_starts,
+    run_counts) for the runs of consecutive primitives with equal names.
+    """
+    if not len(names):
+        empty = numpy.zeros((0,), numpy.uint32)
+        return empty, empty, empty
+    starts = numpy.cumsum(index_counts) - index_counts
+    new_run = numpy.ones((len(names),), bool)
+    new_run[1:] = names[1:] != names[:-1]
+    firsts = numpy.nonzero(new_run)[0]
+    run_starts = starts[firsts]
+    run_ends = numpy.concatenate((run_starts[1:], [numpy.sum(index_counts)]))
+    return names[firsts], run_starts, run_ends - run_starts
+
+class PrimitiveBatches:
+    """
+    Records spheres and cylinders per color, and turns them into
+    indexed triangle meshes using whole-array operations.
+    See module docstring for details.
+    """
+    def __init__(self):
+        # color4 -> [centers, radii, names], each a list of single values
+        # or of whole arrays (see _column)
+        self._spheres = {}
+        # color4 -> [pos1s, pos2s, radii, cappeds, names]
+        self._cylinders = {}
+        self.sphereLevel = -1
+        self.count = 0 # number of primitives added
+        self._finished = False
+        self.gl_buffers = None # for use by draw_primitive_batches
+        return
+
+    def _set_sphereLevel(self, detailLevel):
+        # As for ShapeList_inplace, one detailLevel is used for all spheres.
+        if self.sphereLevel > -1 and self.sphereLevel != detailLevel:
+            raise ValueError, \
+                  "unexpected different sphere LOD levels within same frame"
+        self.sphereLevel = detailLevel
+
+    def add_sphere(self, color4, pos, radius, detailLevel, name = 0):
+        """
+        Add a sphere. "color4" must be a tuple of 4 elements.
+        "name" is the GL selection name.
+        """
+        assert not self._finished
+        self._set_sphereLevel(detailLevel)
+        columns = self._spheres.get(color4)
+        if columns is None:
+            columns = self._spheres[color4] = [[], [], []]
+        columns[0].append(pos)
+        columns[1].append(radius)
+        columns[2].append(name)
+        self.count += 1
+
+    def add_spheres(self, color4, centers, radii, detailLevel, names):
+        """
+        Add many spheres of one color, given as an N x 3 array of centers,
+        and N radii and glnames (as arrays, or single values for all).
+        """
+        assert not self._finished
+        self._set_sphereLevel(detailLevel)
+        n = len(centers)
+        columns = self._spheres.get(color4)
+        if columns is None:
+            columns = self._spheres[color4] = [[], [], []]
+        columns[0].append(_Block(centers, n))
+        columns[1].append(_Block(radii, n))
+        columns[2].append(_Block(names, n))
+        self.count += n
+
+    def add_cylinder(self, color4, pos1, pos2, radius, capped = 0, name = 0):
+        """
+        Add a cylinder. "color4" must be a tuple of 4 elements.
+        "name" is the GL selection name.
+        """
+        assert not self._finished
+        columns = self._cylinders.get(color4)
+        if columns is None:
+            columns = self._cylinders[color4] = [[], [], [], [], []]
+        columns[0].append(pos1)
+        columns[1].append(pos2)
+        columns[2].append(radius)
+        columns[3].append(not not capped)
+        columns[4].append(name)
+        self.count += 1
+
+    def add_cylinders(self, color4, pos1, pos2, radii, capped, names):
+        """
+        Add many cylinders of one color, given as M x 3 arrays of endpoints,
+        and M radii, capped flags and glnames (as arrays, or single values
+        for all).
+        """
+        assert not self._finished
+        n = len(pos1)
+        columns = self._cylinders.get(color4)
+        if columns is None:
+            columns = self._cylinders[color4] = [[], [], [], [], []]
+        for column, values in zip(columns, (pos1, pos2, radii, capped, names)):
+            column.append(_Block(values, n))
+        self.count += n
+
+    def __len__(self):
+        return self.count
+
+    def finish(self):
+        """
+        Convert what was recorded into typed arrays, in self.spheres
+        (color4 -> (centers, radii, names)) and self.cylinders
+        (color4 -> (pos1, pos2, radii, capped, names)).
+        No more primitives can be added after this.
+        """
+        assert not self._finished
+        self._finished = True
+        self.spheres = {}
+        for color, (centers, radii, names) in self._spheres.iteritems():
+            self.spheres[color] = (_column(centers, numpy.float32, 3),
+                                   _column(radii, numpy.float32),
+                                   _column(names, numpy.uint32))
+        self.cylinders = {}
+        for color, columns in self._cylinders.iteritems():
+            pos1, pos2, radii, capped, names = columns
+            self.cylinders[color] = (_column(pos1, numpy.float32, 3),
+                                     _column(pos2, numpy.float32, 3),
+                                     _column(radii, numpy.float32),
+                                     _column(capped, bool),
+                                     _column(names, numpy.uint32))
+        del self._spheres, self._cylinders
+        return
+
+    def colors(self):
+        """
+        Return a list of the colors with any primitives (after finish).
+        """
+        res = dict.fromkeys(self.spheres.keys())
+        res.update(dict.fromkeys(self.cylinders.keys()))
+        return res.keys()
+
+    def geometry(self):
+        """
+        Return a list of one ColorBatchGeometry for each color (after finish).
+        """
+        res = []
+        for color in self.colors():
+            parts = [] # (verts, normals, indices, names, index_counts)
+            if self.spheres.has_key(color):
+                centers, radii, names = self.spheres[color]
+                verts, normals, indices, per = sphere_geometry(
+                    centers, radii, self.sphereLevel)
+                parts.append((verts, normals, indices, names,
+                              numpy.zeros((len(names),), numpy.uint32) + per))
+            if self.cylinders.has_key(color):
+                pos1, pos2, radii, capped, names = self.cylinders[color]
+                for capped_flag in (False, True):
+                    which = (capped == capped_flag)
+                    if not numpy.sometrue(which):
+                        continue
+                    verts, normals, indices, per = cylinder_geometry(
+                        pos1[which], pos2[which], radii[which], capped_flag)
+                    subnames = names[which]
+                    parts.append((verts, normals, indices, subnames,
+                                  numpy.zeros((len(subnames),), numpy.uint32) + per))
+            # concatenate the parts, offsetting the indices of later ones
+            offset = 0
+            all_indices = []
+            for verts, normals, indices, names, counts in parts:
+                all_indices.append(indices + numpy.uint32(offset))
+                offset += len(verts)
+            names = numpy.concatenate([part[3] for part in parts])
+            counts = numpy.concatenate([part[4] for part in parts])
+            run_names, run_starts, run_counts = _name_runs(names, counts)
+            res.append(ColorBatchGeometry(
+                color,
+                numpy.concatenate([part[0] for part in parts]),
+                numpy.concatenate([part[1] for part in parts]),
+                numpy.concatenate(all_indices),
+                run_names, run_starts, run_counts))
+        return res
+
+    pass # end of class PrimitiveBatches
+
+class _Block:
+    """
+    A run of n values for one column of a PrimitiveBatches, added in bulk.
+    """
+    def __init__(self, values, n):
+        self.values = values
+        self.n = n
+
+def _column(items, dtype, width = None):
+    """
+    Return a numpy array of the values in items (a list of single values
+    and _Blocks, in order), with the given dtype and (if not None) row width.
+    """
+    if not [item for item in items if isinstance(item, _Block)]:
+        res = numpy.array(items, dtype)
+    else:
+        pieces = []
+        singles = []
+        for item in items:
+            if isinstance(item, _Block):
+                if singles:
+                    pieces.append(numpy.array(singles, dtype))
+                    singles = []
+                values = numpy.asarray(item.values, dtype)
+                if values.ndim == (width and 2 or 1):
+                    pieces.append(values)
+                else:
+                    # a single value for the whole block
+                    pieces.append(numpy.resize(values, (item.n,) + values.shape))
+            else:
+                singles.append(item)
+            continue
+        if singles:
+            pieces.append(numpy.array(singles, dtype))
+        res = numpy.concatenate(pieces)
+    if width is not None:
+        res = res.reshape((-1, width))
+    return res
+
+# ==
+
+def _benchmark(n = 200000, detailLevel = 1):
+    """
+    Time scheduling n spheres and n cylinders (as for drawing a chunk of
+    n atoms in ball and stick style) one at a time, then finishing and
+    building the meshes, without a GL context.
+    """
+    import time
+    centers = numpy.random.uniform(0.0, 100.0, (n, 3))
+    ends = centers + numpy.random.uniform(-1.0, 1.0, (n, 3))
+    colors = [(0.5, 0.5, 0.5, 1.0), (1.0, 0.0, 0.0, 1.0), (0.0, 0.0, 1.0, 1.0)]
+    t0 = time.time()
+    batches = PrimitiveBatches()
+    for i in xrange(n):
+        color = colors[i % 3]
+        batches.add_sphere(color, centers[i], 0.5, detailLevel, i + 1)
+        batches.add_cylinder(color, centers[i], ends[i], 0.2, 0, i + 1)
+    t1 = time.time()
+    batches.finish()
+    t2 = time.time()
+    geometry = batches.geometry()
+    t3 = time.time()
+    nverts = sum([len(g.verts) for g in geometry])
+    ntris = sum([len(g.indices) for g in geometry]) / 3
+    print "PrimitiveBatches: %d spheres and %d cylinders:" % (n, n)
+    print "  schedule %.3f sec, finish %.3f sec, meshes %.3f sec " \
+          "(%d vertices, %d triangles)" % \
+          (t1 - t0, t2 - t1, t3 - t2, nverts, ntris)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
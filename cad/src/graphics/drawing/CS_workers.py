@@ -90,6 +90,18 @@ from OpenGL.GL import glVertex3fv
 from OpenGL.GL import GL_VERTEX_ARRAY
 from OpenGL.GL import glVertexPointer
 from OpenGL.GL import GL_TRUE
+from OpenGL.GL import GL_ARRAY_BUFFER_ARB
+from OpenGL.GL import GL_ELEMENT_ARRAY_BUFFER_ARB
+from OpenGL.GL import glGetInteger
+from OpenGL.GL import glPopName
+from OpenGL.GL import glPushName
+from OpenGL.GL import GL_RENDER_MODE
+from OpenGL.GL import GL_SELECT
+from OpenGL.GL import GL_STATIC_DRAW
+from OpenGL.GL import GL_TRIANGLES
+from OpenGL.GL import GL_UNSIGNED_INT
+
+import ctypes
 
 from geometry.VQT import norm, vlen, V, Q, A
 
@@ -97,6 +109,8 @@ import graphics.drawing.drawing_globals as drawing_globals
 from graphics.drawing.drawers import renderSurface
 from graphics.drawing.gl_GLE import glePolyCone
 from graphics.drawing.gl_Scale import glScale
+from graphics.drawing.gl_buffers import GLBufferObject
+from graphics.drawing.gl_lighting import apply_material
 
 ### Substitute this for drawsphere_worker to test drawing a lot of spheres.
 def drawsphere_worker_loop(params):
@@ -375,3 +389,57 @@ def drawtriangle_strip_worker(params):
 
     return
 
+def draw_primitive_batches(batches, colored = True):
+    """
+    Draw the spheres and cylinders recorded in a finished PrimitiveBatches
+    (see CS_batches.py), one glDrawElements per color, from vertex, normal
+    and index GLBufferObjects which are made on the first call and kept in
+    batches.gl_buffers. In GL_SELECT render mode, draw each run of
+    primitives with the same glname separately, with that name pushed.
+
+    @param colored: if true, apply each color's material before drawing it;
+                    otherwise use the current material for everything
+                    (as for the selection and highlighting overrides).
+    """
+    if batches.gl_buffers is None:
+        buffers = []
+        for geom in batches.geometry():
+            buffers.append(
+                (geom.color,
+                 GLBufferObject(GL_ARRAY_BUFFER_ARB, geom.verts, GL_STATIC_DRAW),
+                 GLBufferObject(GL_ARRAY_BUFFER_ARB, geom.normals, GL_STATIC_DRAW),
+                 GLBufferObject(GL_ELEMENT_ARRAY_BUFFER_ARB, geom.indices,
+                                GL_STATIC_DRAW),
+                 (geom.run_names, geom.run_starts, geom.run_counts)))
+            continue
+        batches.gl_buffers = buffers
+    selecting = (glGetInteger(GL_RENDER_MODE) == GL_SELECT)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    for color, vbo, nbo, ibo, runs in batches.gl_buffers:
+        if colored:
+            apply_material(color)
+        vbo.bind()
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        nbo.bind()
+        glNormalPointer(GL_FLOAT, 0, None)
+        ibo.bind()
+        if not selecting:
+            glDrawElements(GL_TRIANGLES, ibo.size, GL_UNSIGNED_INT, None)
+        else:
+            run_names, run_starts, run_counts = runs
+            for name, start, count in zip(run_names, run_starts, run_counts):
+                if name:
+                    glPushName(int(name))
+                # the index buffer offset is in bytes, 4 per index
+                glDrawElements(GL_TRIANGLES, int(count), GL_UNSIGNED_INT,
+                               ctypes.c_void_p(int(start) * 4))
+                if name:
+                    glPopName()
+                continue
+        ibo.unbind()
+        vbo.unbind()
+        continue
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    return
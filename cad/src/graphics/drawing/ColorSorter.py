@@ -81,6 +81,8 @@ if drawing_globals.quux_module_import_succeeded:
     import quux
 
 from graphics.drawing.CS_ShapeList import ShapeList_inplace
+from graphics.drawing.CS_batches import PrimitiveBatches
+from graphics.drawing.CS_workers import draw_primitive_batches
 from graphics.drawing.CS_workers import drawcylinder_worker
 from graphics.drawing.CS_workers import drawline_worker
 from graphics.drawing.CS_workers import drawpolycone_multicolor_worker
@@ -91,6 +93,18 @@ from graphics.drawing.CS_workers import drawwiresphere_worker
 from graphics.drawing.CS_workers import drawtriangle_strip_worker
 from graphics.drawing.gl_lighting import apply_material
 
+def _nth(values, i):
+    """
+    Return values[i], or values itself if it's a single value
+    (which stands for the same value for every i).
+    """
+    try:
+        return values[i]
+    except TypeError:
+        return values
+
+# ==
+
 class ColorSortedDisplayList:         #Russ 080225: Added.
     """
     The ColorSorter's parent uses one of these to store color-sorted display
@@ -149,9 +163,11 @@ class ColorSortedDisplayList:         #Russ 080225: Added.
                 # patterned, the selected_dl does first normal drawing and then
                 # draws an overlay.
                 glCallList(self.selected_dl)
+                self._draw_batches(selected = True)
             else:
                 # Plain, old, solid drawing of the base object appearance.
                 glCallList(self.color_dl)
+                self._draw_batches()
                 pass
 
         if highlighted:
@@ -163,7 +179,7 @@ class ColorSortedDisplayList:         #Russ 080225: Added.
             # Draw a highlight overlay (solid, or in an overlay pattern.)
             apply_material(highlight_color is not None and highlight_color
                            or env.prefs[hoverHighlightingColor_prefs_key])
-            glCallList(self.nocolor_dl)
+            self.draw_nocolor()
 
             if patterned_highlighting:
                 # Reset from a patterned drawing mode set up above.
@@ -173,6 +189,49 @@ class ColorSortedDisplayList:         #Russ 080225: Added.
             pass
         return
 
+    def draw_nocolor(self,
+                     callList = glCallList,
+                     drawBatches = draw_primitive_batches):
+        """
+        Draw our contents with no colors (for a color set by the caller,
+        e.g. for hover highlighting): our nocolor_dl, then our batched
+        spheres and cylinders, if any.
+
+        @param callList, drawBatches: replacements for glCallList and
+                                      draw_primitive_batches (for testing).
+        """
+        callList(self.nocolor_dl)
+        self._draw_batches(colored = False, drawBatches = drawBatches)
+        return
+
+    def _draw_batches(self, colored = True, selected = False,
+                      drawBatches = draw_primitive_batches):
+        """
+        Draw our batched spheres and cylinders, if any, in the same way
+        as our display lists: in their own colors (if colored), with no
+        colors (for a color set by the caller), or selected (like the
+        contents of selected_dl).
+
+        @param drawBatches: replacement for draw_primitive_batches
+                            (for testing).
+        """
+        batches = self.batches
+        if batches is None:
+            return
+        if not selected:
+            drawBatches(batches, colored = colored)
+            return
+        patterned = isPatternedDrawing(select = True)
+        if patterned:
+            drawBatches(batches)
+            startPatternedDrawing(select = True)
+            pass
+        apply_material(env.prefs[selectionColor_prefs_key])
+        drawBatches(batches, colored = False)
+        if patterned:
+            endPatternedDrawing(select = True)
+        return
+
     # ==
     # CSDL state maintenance.
 
@@ -188,6 +247,7 @@ class ColorSortedDisplayList:         #Russ 080225: Added.
         self.selected_dl = 0    # DL with a single (selected) over-ride color.
         self.nocolor_dl = 0     # DL of lower-level calls for color over-rides.
         self.per_color_dls = [] # Lower level, per-color primitive sublists.
+        self.batches = None     # PrimitiveBatches drawn after those, or None.
         return
 
     def not_clear(self):
@@ -226,6 +286,7 @@ class ColorSortedDisplayList:         #Russ 080225: Added.
         else:
             # Call a normal OpenGL display list.
             glCallList(self.dl)
+            self._draw_batches(selected = self.selected)
         return
 
     def selectPick(self, boolVal):
@@ -319,6 +380,7 @@ class ColorSorter:
     _immediate = 0      # Number of calls to _invoke_immediately since last
                         # _printstats
     _gl_name_stack = [0]     # internal record of GL name stack; 0 is a sentinel
+    _cur_batches = None # PrimitiveBatches for spheres and cylinders, or None
 
     def pushName(glname):
         """
@@ -445,6 +507,12 @@ class ColorSorter:
                 lcolor = (color[0], color[1], color[2], opacity)
             else:
                 lcolor = color	
+            if ColorSorter._batchable(lcolor):
+                ColorSorter._cur_batches.add_sphere(
+                    tuple(lcolor), pos, radius, detailLevel,
+                    ColorSorter._gl_name_stack[-1])
+                ColorSorter._sorted += 1
+                return
             ColorSorter.schedule(
                 lcolor,
                 drawsphere_worker, ### drawsphere_worker_loop ### Testing.
@@ -497,12 +565,96 @@ class ColorSorter:
             else:
                 lcolor = color		    
 
+            if ColorSorter._batchable(lcolor):
+                ColorSorter._cur_batches.add_cylinder(
+                    tuple(lcolor), pos1, pos2, radius, capped,
+                    ColorSorter._gl_name_stack[-1])
+                ColorSorter._sorted += 1
+                return
             ColorSorter.schedule(lcolor,
                                  drawcylinder_worker,
                                  (pos1, pos2, radius, capped))
 
     schedule_cylinder = staticmethod(schedule_cylinder)
 
+    def schedule_spheres(color, centers, radii, detailLevel, names = None):
+        """
+        Schedule many opaque spheres of one color, given an N x 3 array of
+        centers and a sequence of N radii (or one radius for all of them),
+        and optionally a sequence of N GL names (0 for none) to use
+        instead of the current one, or one GL name for all of them.
+
+        When batched primitives are in use, this costs a few array
+        operations rather than a call per sphere.
+        """
+        if len(color) == 3:
+            color = (color[0], color[1], color[2], 1.0)
+        if ColorSorter._batchable(color):
+            n = len(centers)
+            if names is None:
+                names = ColorSorter._gl_name_stack[-1]
+            ColorSorter._cur_batches.add_spheres(
+                tuple(color), centers, radii, detailLevel, names)
+            ColorSorter._sorted += n
+            return
+        for i in range(len(centers)):
+            radius = _nth(radii, i)
+            name = names is not None and _nth(names, i)
+            if name:
+                ColorSorter.pushName(name)
+            ColorSorter.schedule_sphere(color, centers[i], radius, detailLevel)
+            if name:
+                ColorSorter.popName()
+        return
+
+    schedule_spheres = staticmethod(schedule_spheres)
+
+    def schedule_cylinders(color, pos1s, pos2s, radii, capped = 0,
+                           names = None):
+        """
+        Schedule many opaque cylinders of one color, given N x 3 arrays of
+        their endpoints and a sequence of N radii (or one radius for all of
+        them), and optionally a sequence of N GL names (0 for none), or one
+        GL name for all of them, to use instead of the current one.
+        (See also schedule_spheres.)
+        """
+        if len(color) == 3:
+            color = (color[0], color[1], color[2], 1.0)
+        if ColorSorter._batchable(color):
+            n = len(pos1s)
+            if names is None:
+                names = ColorSorter._gl_name_stack[-1]
+            ColorSorter._cur_batches.add_cylinders(
+                tuple(color), pos1s, pos2s, radii, capped, names)
+            ColorSorter._sorted += n
+            return
+        for i in range(len(pos1s)):
+            radius = _nth(radii, i)
+            name = names is not None and _nth(names, i)
+            if name:
+                ColorSorter.pushName(name)
+            ColorSorter.schedule_cylinder(color, pos1s[i], pos2s[i], radius,
+                                          capped)
+            if name:
+                ColorSorter.popName()
+        return
+
+    schedule_cylinders = staticmethod(schedule_cylinders)
+
+    def _batchable(lcolor):
+        """
+        [private]
+        Can a sphere or cylinder of the given RGBA color be added to our
+        PrimitiveBatches, rather than scheduled as a worker call?
+        """
+        # Unshaded (-1) and multicolor (-2) pseudo-opacities, and real
+        # transparency, need the per-primitive GL state in schedule.
+        return (ColorSorter._cur_batches is not None and
+                ColorSorter.sorting and
+                lcolor[3] == 1.0)
+
+    _batchable = staticmethod(_batchable)
+
     def schedule_polycone(color, pos_array, rad_array,
                           capped = 0, opacity = 1.0):
         """
@@ -640,11 +792,22 @@ class ColorSorter:
         assert not ColorSorter.sorting, \
                "Called ColorSorter.start but already sorting?!"
         ColorSorter.sorting = True
+        ColorSorter._cur_batches = None
         if drawing_globals.use_c_renderer and ColorSorter.sorting:
             ColorSorter._cur_shapelist = ShapeList_inplace()
             ColorSorter.sphereLevel = -1
         else:
             ColorSorter.sorted_by_color = {}
+            if (csdl is not None and
+                drawing_globals.use_batched_primitives and
+                drawing_globals.allow_color_sorting and
+                drawing_globals.use_color_sorted_dls and
+                not (ColorSortedDisplayList.cache_ColorSorter and
+                     drawing_globals.use_color_sorted_vbos)):
+                # Spheres and cylinders go into array buffers drawn after
+                # the per-color display lists made by finish (see its
+                # matching test).
+                ColorSorter._cur_batches = PrimitiveBatches()
 
     start = staticmethod(start)
 
@@ -693,6 +856,12 @@ class ColorSorter:
                           or 'is NOT'))
             color_groups = len(ColorSorter.sorted_by_color)
             objects_drawn = 0
+            batches = ColorSorter._cur_batches
+            ColorSorter._cur_batches = None
+            if batches is not None:
+                batches.finish()
+                if not len(batches):
+                    batches = None
 
             if (not (drawing_globals.allow_color_sorting and
                      drawing_globals.use_color_sorted_dls)
@@ -727,6 +896,7 @@ class ColorSorter:
             else: #russ 080225
 
                 parent_csdl.reset()
+                parent_csdl.batches = batches
                 selColor = env.prefs[selectionColor_prefs_key]
 
                 # First build the lower level per-color sublists of primitives.
@@ -913,3 +1083,34 @@ class ColorSorter:
     draw_sorted = staticmethod(draw_sorted)
 
     pass # End of class ColorSorter.
+
+# ==
+
+def _test_draw_nocolor():
+    """
+    Check, without a GL context, that a CSDL with batched spheres and
+    cylinders draws them (with no colors) when drawn highlighted,
+    not just its nocolor_dl.
+    """
+    calls = []
+    def fake_glCallList(dl):
+        calls.append(('glCallList', dl))
+    def fake_draw_primitive_batches(batches, colored = True):
+        calls.append(('draw_primitive_batches', batches, colored))
+    csdl = ColorSortedDisplayList()
+    csdl.nocolor_dl = 7
+    csdl.batches = batches = PrimitiveBatches()
+    csdl.draw_nocolor(fake_glCallList, fake_draw_primitive_batches)
+    assert calls == [('glCallList', 7),
+                     ('draw_primitive_batches', batches, False)], calls
+    del calls[:]
+    csdl.batches = None
+    csdl.draw_nocolor(fake_glCallList, fake_draw_primitive_batches)
+    assert calls == [('glCallList', 7)], calls
+    print "ColorSorter: ok"
+    return
+
+if __name__ == '__main__':
+    _test_draw_nocolor()
+
+# end
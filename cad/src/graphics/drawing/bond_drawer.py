@@ -13,6 +13,8 @@ file, in preparation for further extending Bond.draw (and someday Bond.writepov)
 for higher-order bonds.
 """
 
+import Numeric
+
 from OpenGL.GL import glPushName
 from OpenGL.GL import glPopName
 from OpenGL.GL import GL_LIGHTING
@@ -21,7 +23,7 @@ from OpenGL.GL import glEnable
 
 from PyQt4.Qt import QFont, QString, QColor
 
-from geometry.VQT import V
+from geometry.VQT import V, A
 from geometry.VQT import norm, vlen
 
 from graphics.drawing.ColorSorter import ColorSorter
@@ -33,6 +35,11 @@ from graphics.drawing.CS_draw_primitives import drawpolycone
 from graphics.drawing.special_drawing import USE_CURRENT
 from graphics.drawing.special_drawing import SPECIAL_DRAWING_STRAND_END
 
+from graphics.drawing.bond_geometry import multicyl_pvecs
+from graphics.drawing.bond_geometry import multicyl_ends
+from graphics.drawing.bond_geometry import bond_ends
+from graphics.drawing.bond_geometry import bond_cylinders
+
 import foundation.env as env
 from utilities import debug_flags
 
@@ -71,6 +78,7 @@ from model.bond_constants import bond_letter_from_v6
 from model.bond_constants import V_AROMATIC
 from model.bond_constants import V_GRAPHITE
 from model.bond_constants import V_CARBOMERIC
+from model.bond_constants import bond_params
 
 ## not yet in prefs db?
 from utilities.prefs_constants import _default_toolong_hicolor
@@ -291,6 +299,244 @@ def draw_bond(self,
     
     return # from draw_bond, implem of Bond.draw
 
+# ==
+
+def _band_info(v6):
+    """
+    Return (band_order, band_color) for the band which draw_bond_cyl
+    draws around an unhighlighted bond cylinder of bond order v6,
+    or (0, None) if it draws none.
+    """
+    if v6 == V_AROMATIC:
+        banding = V_AROMATIC
+        band_color = ave_colors(0.5, green, yellow)
+    elif v6 == V_GRAPHITE:
+        banding = V_GRAPHITE
+        band_color = ave_colors(0.8, green, yellow)
+    elif v6 == V_CARBOMERIC:
+        banding = V_AROMATIC
+        band_color = ave_colors(0.7, red, white)
+    else:
+        return 0, None
+    band_order = float(banding - V_SINGLE)/V_SINGLE
+    return band_order, ave_colors(0.8, band_color, black)
+
+def draw_bonds_in_bulk(bonds, dispdef, col, glpane, positions = None):
+    """
+    Draw those of bonds (a sequence of Bonds) which draw_bond would draw
+    as plain cylinders in ball and stick or tubes display style, as
+    Bond.draw would draw them (not highlighted), but by computing all
+    their cylinders at once (see bulk_bond_cylinders) and scheduling them
+    in ColorSorter with one call per color. Return a list of the other
+    bonds, which the caller should draw using Bond.draw.
+    """
+    cylinders, others = bulk_bond_cylinders(bonds, dispdef, col, glpane,
+                                            positions = positions)
+    schedule_bond_cylinders(cylinders)
+    return others
+
+def schedule_bond_cylinders(cylinders):
+    """
+    Schedule cylinders (as returned by bulk_bond_cylinders) in
+    ColorSorter, with one call per color.
+    """
+    for color, pos1, pos2, radii, names in cylinders:
+        ColorSorter.schedule_cylinders(color, pos1, pos2, radii,
+                                       names = names)
+    return
+
+def bulk_bond_cylinders(bonds, dispdef, col, glpane, positions = None):
+    """
+    Compute the cylinders of those of bonds (a sequence of Bonds) which
+    draw_bond would draw as plain cylinders in ball and stick or tubes
+    display style, as Bond.draw would draw them (not highlighted), all at
+    once (see bond_geometry.py), without drawing or scheduling anything.
+    Return (cylinders, others), where cylinders is a list of (color,
+    pos1, pos2, radii, names) for each color (for schedule_bond_cylinders),
+    and others is a list of the other bonds, which the caller should draw
+    using Bond.draw.
+
+    If positions is given, bonds must all be internal bonds of one chunk,
+    and positions its atom positions in its own coordinate system, in the
+    order of its atlist (i.e. its basepos); otherwise the absolute atom
+    positions are used (as for external bonds).
+
+    Not handled here (so returned) are bonds drawn in other display styles,
+    bonds to invisible atoms, bonds with a bond direction (which might
+    be drawn with arrows, or deferred to a special_drawing_handler),
+    bonds with dna updater errors, pi bonds not drawn as multiple
+    cylinders or labeled with letters, and pi bonds to PAM atoms.
+    """
+    others = []
+
+    palette = []
+    color_index = {}
+    def index_of_color(color):
+        key = tuple(color)
+        try:
+            return color_index[key]
+        except KeyError:
+            res = color_index[key] = len(palette)
+            palette.append(color)
+            return res
+
+    multicyl = (env.prefs[pibondStyle_prefs_key] == 'multicyl')
+    bond_letters = env.prefs[pibondLetters_prefs_key]
+    ball_radius = diBALL_SigmaBondRadius * \
+                  env.prefs[diBALL_BondCylinderRadius_prefs_key]
+    pam_radius = TubeRadius * env.prefs[dnaStrutScaleFactor_prefs_key]
+    if env.prefs[showBondStretchIndicators_prefs_key]:
+        toolong_color = index_of_color(
+            env.prefs.get(bondStretchColor_prefs_key))
+    else:
+        toolong_color = -1
+    ball_color = index_of_color(col or
+                                env.prefs.get(diBALL_bondcolor_prefs_key))
+
+    # one row per bond (see bond_cylinders for the meaning of these)
+    ends = [] # pairs of atom indices, or of absolute atom positions
+    rcov = []
+    radii = []
+    colors1 = []
+    colors2 = []
+    names = []
+    tubes = []
+    band_orders = []
+    band_colors = []
+    howmanys = [] # number of cylinders (1, 2 or 3)
+    pi_rows = {2: [], 3: []} # howmany -> (pi vectors, offset) per bond
+    atom_colors = {} # atom key -> palette index
+
+    for bond in bonds:
+        atom1 = bond.atom1
+        atom2 = bond.atom2
+        disp = max(atom1.display, atom2.display)
+        if disp == diDEFAULT:
+            disp = dispdef
+        if (disp not in (diBALL, diTUBES) or
+            atom1.display == diINVISIBLE or
+            atom2.display == diINVISIBLE or
+            bond._direction or
+            atom1._dna_updater__error or
+            atom2._dna_updater__error):
+            others.append(bond)
+            continue
+        pam = atom1.element.pam or atom2.element.pam
+        v6 = bond.v6
+        howmany = 1
+        band_order, band_color = 0, None
+        if disp == diBALL:
+            radius = ball_radius
+        else:
+            radius = TubeRadius
+        if v6 != V_SINGLE:
+            if not multicyl or bond_letters or pam:
+                others.append(bond)
+                continue
+            howmany = { V_DOUBLE: 2, V_TRIPLE: 3 }.get(v6, 1)
+            if howmany > 1:
+                pi_info = bond.get_pi_info()
+                if pi_info is None:
+                    # should never happen (see draw_bond_main)
+                    howmany = 1
+                else:
+                    ((a1py, a1pz), (a2py, a2pz), ord_pi_y, ord_pi_z) = pi_info
+                    if disp == diBALL:
+                        offset = 2 * radius
+                    else:
+                        offset = 0.333 * 2 * radius
+                        radius = 0.333 * radius
+                    pi_rows[howmany].append(((a1py, a1pz, a2py, a2pz), offset))
+            if howmany == 1:
+                band_order, band_color = _band_info(v6)
+        if pam:
+            if atom1.element.role == 'axis' and atom2.element.role == 'axis':
+                radius = pam_radius * 2.0
+            else:
+                radius = pam_radius
+        if positions is None:
+            ends.append((atom1.posn(), atom2.posn()))
+        else:
+            ends.append((atom1.index, atom2.index))
+        rcov.append(bond_params(atom1.atomtype, atom2.atomtype, v6))
+        radii.append(radius)
+        if disp == diBALL:
+            colors1.append(ball_color)
+            colors2.append(ball_color)
+        else:
+            for atom, colors in ((atom1, colors1), (atom2, colors2)):
+                try:
+                    color = atom_colors[atom.key]
+                except KeyError:
+                    color = atom_colors[atom.key] = \
+                            index_of_color(col or atom.drawing_color())
+                colors.append(color)
+        if atom1.element is Singlet:
+            names.append(atom1.get_glname(glpane))
+        elif atom2.element is Singlet:
+            names.append(atom2.get_glname(glpane))
+        else:
+            names.append(bond.glname)
+        tubes.append(disp == diTUBES)
+        band_orders.append(band_order)
+        if band_color is None:
+            band_colors.append(-1)
+        else:
+            band_colors.append(index_of_color(band_color))
+        howmanys.append(howmany)
+        continue
+
+    if not howmanys:
+        return [], others
+
+    if positions is None:
+        ends = A(ends)
+        a1pos, a2pos = ends[:,0], ends[:,1]
+    else:
+        a1pos, a2pos = bond_ends(positions, Numeric.array(ends))
+    rcov, radii, band_orders = map(A, (rcov, radii, band_orders))
+    colors1, colors2, names, tubes, band_colors, howmanys = \
+             map(Numeric.array, (colors1, colors2, names, tubes,
+                                 band_colors, howmanys))
+
+    # bonds drawn as one cylinder (perhaps with a band)
+    rows = Numeric.nonzero(howmanys == 1)
+    take = Numeric.take
+    cylinders = [
+        bond_cylinders(take(a1pos, rows), take(a2pos, rows),
+                       take(rcov, rows), take(radii, rows),
+                       take(colors1, rows), take(colors2, rows),
+                       take(names, rows), toolong_color, take(tubes, rows),
+                       take(band_orders, rows), take(band_colors, rows))
+     ]
+
+    # double and triple bonds, drawn as 2 or 3 cylinders offset from
+    # their axes (each with its own stretch indicator if needed)
+    for howmany in (2, 3):
+        rows = Numeric.nonzero(howmanys == howmany)
+        if not len(rows):
+            continue
+        pi_vectors = A([pv for pv, off in pi_rows[howmany]])
+        offsets = A([off for pv, off in pi_rows[howmany]])
+        a1posm, a2posm = multicyl_ends(
+            take(a1pos, rows), take(a2pos, rows), howmany,
+            (pi_vectors[:,0], pi_vectors[:,1],
+             pi_vectors[:,2], pi_vectors[:,3]),
+            offsets)
+        rows = Numeric.concatenate([rows] * howmany)
+        cylinders.append(
+            bond_cylinders(a1posm, a2posm,
+                           take(rcov, rows), take(radii, rows),
+                           take(colors1, rows), take(colors2, rows),
+                           take(names, rows), toolong_color,
+                           take(tubes, rows)))
+
+    res = []
+    for cyls in cylinders:
+        for color, pos1, pos2, cylradii, cylnames in cyls.by_color():
+            res.append((palette[color], pos1, pos2, cylradii, cylnames))
+    return res, others
+
 def draw_bond_main(self,
                    glpane,
                    disp,
@@ -731,17 +977,6 @@ def draw_bond_main(self,
             pass
     return # from draw_bond_main
 
-def multicyl_pvecs(howmany, a2py, a2pz):
-    if howmany == 2:
-        # note, for proper double-bond alignment, this has to be a2py, not a2pz!
-        return [a2py, -a2py]
-    elif howmany == 3:
-        # 0.866 is sqrt(3)/2
-        return [a2py, - a2py * 0.5 + a2pz * 0.866, - a2py * 0.5 - a2pz * 0.866]
-    else:
-        assert 0
-    pass
-
 def draw_bond_cyl(atom1, atom2, disp, v1, v2, color1, color2,
                   bondcolor, highlighted, level,
                   sigmabond_cyl_radius, shorten_tubes, geom, v6,
@@ -0,0 +1,262 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+bond_geometry.py -- compute the cylinders which draw many bonds at once,
+as Numeric arrays.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that the plain bonds of a chunk (see draw_bonds_in_bulk in
+bond_drawer.py) can be drawn by computing the geometry of all of them
+in a few array operations, and scheduling their cylinders with one
+ColorSorter.schedule_cylinders call per color, rather than by running
+draw_bond_main and draw_bond_cyl (and Bond.geom_from_posns and the
+vector functions they use) for each bond.
+
+Usage:
+
+Bonds are given as an M x 2 array of indices into an N x 3 array of
+atom positions, and colors as indices into a palette kept by the
+caller. bond_cylinders returns a BondCylinders (columns of endpoints,
+radii, colors and glnames), whose by_color method groups them for
+ColorSorter.
+
+Implementation notes:
+
+Nothing here uses OpenGL, env.prefs or model classes, so all of it
+can be run and timed without a GL context (see _benchmark).
+
+The formulas are the same as in Bond.geom_from_posns (for c1, center,
+c2 and toolong), multicyl_pvecs (for the offsets of the cylinders of
+double and triple bonds), and draw_bond_cyl (for which cylinders are
+drawn in ball and stick and tubes display styles, when neither atom
+is invisible and the bond is not highlighted, and for the bands of
+aromatic, graphite and carbomeric bonds).
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+def _column(values):
+    """
+    Return values (a sequence of M numbers) as an M x 1 array,
+    to scale the rows of an M x 3 array.
+    """
+    return Numeric.reshape(values, (-1, 1))
+
+def bond_ends(positions, bonds):
+    """
+    Return (a1pos, a2pos), the M x 3 arrays of the positions
+    of the atoms of bonds (an M x 2 array of indices into positions).
+    """
+    return Numeric.take(positions, bonds[:,0]), \
+           Numeric.take(positions, bonds[:,1])
+
+def bond_geometry(a1pos, a2pos, rcov):
+    """
+    Given M x 3 arrays of the atom positions of M bonds, and an M x 2
+    array of their covalent radii (as returned by bond_params for each
+    bond), return (c1, center, c2, toolong) for all of them, as computed
+    by Bond.geom_from_posns for one bond.
+    """
+    vec = a2pos - a1pos
+    length = Numeric.sqrt(Numeric.add.reduce(vec * vec, 1))
+    # like norm, leave zero-length vectors as they are
+    unit = vec / _column(length + (length == 0))
+    rcov1 = rcov[:,0]
+    rcov2 = rcov[:,1]
+    c1 = a1pos + unit * _column(rcov1)
+    c2 = a2pos - unit * _column(rcov2)
+    toolong = 0.98 * length > rcov1 + rcov2
+    center = (c1 + c2) / 2.0
+    return c1, center, c2, toolong
+
+def multicyl_pvecs(howmany, a2py, a2pz):
+    """
+    Return the list of howmany (2 or 3) unit vectors along which the
+    cylinders of a double or triple bond are offset from its axis,
+    at the end with pi orbital vectors a2py and a2pz. These can also
+    be K x 3 arrays (for K bonds), giving K x 3 arrays.
+    """
+    if howmany == 2:
+        # note, for proper double-bond alignment, this has to be a2py, not a2pz!
+        return [a2py, -a2py]
+    elif howmany == 3:
+        # 0.866 is sqrt(3)/2
+        return [a2py, - a2py * 0.5 + a2pz * 0.866, - a2py * 0.5 - a2pz * 0.866]
+    else:
+        assert 0
+    pass
+
+def multicyl_ends(a1pos, a2pos, howmany, pi_vectors, offsets):
+    """
+    Return (a1posm, a2posm), the atom-end positions of the howmany
+    (2 or 3) cylinders which draw each of K double or triple bonds
+    whose atom positions are in the K x 3 arrays a1pos and a2pos,
+    given their pi orbital vectors (a1py, a1pz, a2py, a2pz) as K x 3
+    arrays, and the distances of the cylinders from the bond axes.
+    The results have howmany * K rows: the first cylinder of each bond,
+    then the second one of each bond, etc.
+    """
+    a1py, a1pz, a2py, a2pz = pi_vectors
+    offsets = _column(offsets)
+    pvecs1 = multicyl_pvecs(howmany, a1py, a1pz)
+    pvecs2 = multicyl_pvecs(howmany, a2py, a2pz)
+    a1posm = [a1pos + offsets * pvec for pvec in pvecs1]
+    a2posm = [a2pos + offsets * pvec for pvec in pvecs2]
+    return Numeric.concatenate(a1posm), Numeric.concatenate(a2posm)
+
+# ==
+
+class BondCylinders:
+    """
+    Columns describing many cylinders: pos1 and pos2 (their endpoints,
+    M x 3), radii, colors (indices into a palette kept by the caller)
+    and names (GL names).
+    """
+    def __init__(self, pos1, pos2, radii, colors, names):
+        self.pos1 = pos1
+        self.pos2 = pos2
+        self.radii = radii
+        self.colors = colors
+        self.names = names
+
+    def __len__(self):
+        return len(self.radii)
+
+    def by_color(self):
+        """
+        Return a list of (color, pos1, pos2, radii, names) for the
+        cylinders of each color, in increasing order of color.
+        """
+        if not len(self):
+            return []
+        order = Numeric.argsort(self.colors)
+        colors = Numeric.take(self.colors, order)
+        firsts = Numeric.searchsorted(colors, colors)
+        starts = Numeric.compress(firsts == Numeric.arange(len(colors)),
+                                  firsts)
+        ends = list(starts[1:]) + [len(colors)]
+        res = []
+        for start, end in zip(starts, ends):
+            rows = order[start:end]
+            res.append((colors[start],
+                        Numeric.take(self.pos1, rows),
+                        Numeric.take(self.pos2, rows),
+                        Numeric.take(self.radii, rows),
+                        Numeric.take(self.names, rows)))
+        return res
+
+    pass
+
+def bond_cylinders(a1pos, a2pos, rcov, radii, colors1, colors2, names,
+                   toolong_color = -1, tubes = 1,
+                   band_orders = None, band_colors = None):
+    """
+    Return a BondCylinders for the cylinders which draw_bond_cyl would
+    draw for M bond cylinders (each one of the cylinders which draws a
+    bond, for a bond drawn as more than one) with both atoms visible,
+    not highlighted.
+
+    a1pos and a2pos are M x 3 arrays of their ends, rcov an M x 2 array
+    of the covalent radii of their atoms (from bond_params), and radii,
+    colors1, colors2 (palette indices of the colors of their halves)
+    and names (GL names) have M elements.
+
+    Cylinders with tubes true (which can be an array or one value for
+    all of them) and toolong (see bond_geometry) are drawn as a stretch
+    indicator of color toolong_color with the halves drawn only between
+    the atoms and c1 or c2, unless toolong_color is -1. (For cylinders
+    drawn in ball and stick display style, pass tubes = 0, and the same
+    bond color in colors1 and colors2.) Cylinders whose halves have the
+    same color are drawn as one cylinder.
+
+    If band_orders is given, cylinders for which it is nonzero also get
+    a band of the corresponding band_colors around their center, as for
+    aromatic, graphite or carbomeric bonds.
+    """
+    c1, center, c2, toolong = bond_geometry(a1pos, a2pos, rcov)
+    if toolong_color == -1:
+        toolong = Numeric.zeros(len(radii))
+    else:
+        toolong = Numeric.logical_and(toolong, tubes)
+    same = Numeric.equal(colors1, colors2)
+    whole = Numeric.logical_and(Numeric.logical_not(toolong), same)
+    halves = Numeric.logical_and(Numeric.logical_not(toolong),
+                                 Numeric.logical_not(same))
+    colors1 = Numeric.asarray(colors1)
+    colors2 = Numeric.asarray(colors2)
+    toolong_colors = Numeric.zeros(len(radii), Int) + toolong_color
+    pieces = [ (whole, a1pos, a2pos, colors1, 1.0),
+               (halves, a1pos, center, colors1, 1.0),
+               (halves, center, a2pos, colors2, 1.0),
+               (toolong, c1, c2, toolong_colors, 1.0),
+               (toolong, a1pos, c1, colors1, 1.0),
+               (toolong, c2, a2pos, colors2, 1.0) ]
+    if band_orders is not None:
+        band_orders = Numeric.asarray(band_orders)
+        bands = Numeric.not_equal(band_orders, 0)
+        # band_orders are measured between atom centers, not c1 and c2
+        bandvec = (a2pos - a1pos) / 2.0 * _column(band_orders / 2.5)
+        # bands are a bit wider than their cylinders
+        pieces.append((bands, center - bandvec, center + bandvec,
+                       Numeric.asarray(band_colors), 1.2))
+    pos1 = []
+    pos2 = []
+    cylradii = []
+    colors = []
+    cylnames = []
+    for which, p1, p2, pcolors, scale in pieces:
+        pos1.append(Numeric.compress(which, p1, 0))
+        pos2.append(Numeric.compress(which, p2, 0))
+        cylradii.append(Numeric.compress(which, radii) * scale)
+        colors.append(Numeric.compress(which, pcolors))
+        cylnames.append(Numeric.compress(which, names))
+    return BondCylinders(Numeric.concatenate(pos1),
+                         Numeric.concatenate(pos2),
+                         Numeric.concatenate(cylradii),
+                         Numeric.concatenate(colors),
+                         Numeric.concatenate(cylnames))
+
+# ==
+
+def _benchmark(counts = (10000, 100000, 1000000)):
+    """
+    Print the time to compute the cylinders for a chain of bonds of
+    each of the given counts, with half of them having colored halves
+    and some of them stretched, without a GL context.
+    """
+    import time
+    for count in counts:
+        natoms = count + 1
+        positions = Numeric.zeros((natoms, 3), Float)
+        positions[:,0] = Numeric.arange(natoms) * 1.5
+        positions[::7,1] = 1.0 # a few stretched bonds
+        bonds = Numeric.zeros((count, 2), Int)
+        bonds[:,0] = Numeric.arange(count)
+        bonds[:,1] = Numeric.arange(count) + 1
+        rcov = Numeric.zeros((count, 2), Float) + 0.77
+        radii = Numeric.zeros(count, Float) + 0.3
+        colors1 = Numeric.arange(count) % 2
+        colors2 = Numeric.zeros(count, Int)
+        names = Numeric.arange(count) + 1
+        t0 = time.time()
+        a1pos, a2pos = bond_ends(positions, bonds)
+        cyls = bond_cylinders(a1pos, a2pos, rcov, radii, colors1, colors2,
+                              names, toolong_color = 2)
+        t1 = time.time()
+        groups = cyls.by_color()
+        t2 = time.time()
+        print "%d bonds: %d cylinders in %d colors, " \
+              "geometry %.3f sec, by color %.3f sec (%.2f usec per bond)" % \
+              (count, len(cyls), len(groups), t1 - t0, t2 - t1,
+               (t2 - t0) * 1e6 / count)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -0,0 +1,318 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+chunk_culling.py -- cull all the chunks of a Part against the view
+frustum at once, using a bounding volume hierarchy of their bounding
+spheres.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that frustum culling a model with many chunks (e.g. a large
+DNA design) doesn't cost one GLPane.is_sphere_visible call (a Python
+loop over six planes) per chunk per redraw. Used by GLPane when
+pref_bvh_frustum_culling is enabled; see GLPane.is_chunk_visible.
+
+Usage:
+
+A ChunkCuller is kept by a GLPane. Each time the GLPane computes its
+frustum planes, it calls visible_chunks(part, planes), which brings its
+SphereBVH up to date with the part's chunks (rebuilding it if the set
+of chunks changed, and otherwise refitting it for the chunks whose
+bbox changed, as detected by bbox object identity), culls it, and
+returns a dict from id(chunk) to CHUNK_INSIDE or CHUNK_STRADDLING for
+the visible chunks.
+
+chunks_in_planes and chunks_hit_by_line use the same hierarchy to
+find chunks for picking (see operations/pick_index.py).
+
+visible_atom_keys(chunk, planes) culls the atoms of one chunk, for
+drawing its atoms one at a time (not into a display list) when it
+straddles the frustum (if pref_per_atom_frustum_culling is enabled).
+"""
+
+import operator
+
+import Numeric
+from Numeric import Float
+
+from geometry.SphereBVH import SphereBVH
+from geometry.BoundingBox import BBox
+from utilities.constants import MAX_ATOM_SPHERE_RADIUS, BBOX_MIN_RADIUS
+
+# Margin added to a chunk's bbox.scale() to get the radius of a sphere
+# enclosing all its atoms as drawn. (Comment moved from Chunk.draw:)
+# piotr 080402: Added a correction for the true maximum
+# DNA CPK atom radius.
+# Maximum VdW atom radius in PAM3/5 = 5.0 * 1.25 + 0.2 = 6.2
+# = MAX_ATOM_SPHERE_RADIUS
+# The default radius used by BBox is equal to sqrt(3*(1.8)^2) =
+# = 3.11 A, so the difference = approx. 3.1 A = BBOX_MIN_RADIUS
+# The '0.5' is another 'fuzzy' safety margin, added here just
+# to be sure that all objects are within the sphere.
+CHUNK_RADIUS_MARGIN = (MAX_ATOM_SPHERE_RADIUS - BBOX_MIN_RADIUS) + 0.5
+
+# visibility of a chunk which is not culled
+CHUNK_STRADDLING = 1 # (its bounding sphere crosses some frustum plane)
+CHUNK_INSIDE = 2
+
+# Rebuild the hierarchy (rather than refitting it) when more than this
+# fraction of the chunks moved since it was built.
+_REBUILD_FRACTION = 0.5
+
+def chunk_bounding_sphere(chunk):
+    """
+    Return (center, radius) of a sphere enclosing all of chunk's atoms
+    as they might be drawn, in absolute model coordinates.
+    """
+    bbox = chunk.bbox
+    return bbox.center(), bbox.scale() + CHUNK_RADIUS_MARGIN
+
+def visible_atom_keys(chunk, planes):
+    """
+    Return a dict whose keys are the keys of those atoms of chunk
+    whose spheres (of radius MAX_ATOM_SPHERE_RADIUS) are not entirely
+    outside any of the given planes (as in SphereBVH.cull).
+    """
+    planes = Numeric.array(planes, Float)
+    atlist = chunk.atlist
+    dists = Numeric.dot(chunk.atpos, Numeric.transpose(planes[:, :3])) + planes[:, 3]
+    visible = Numeric.logical_not(Numeric.sometrue(dists < - MAX_ATOM_SPHERE_RADIUS, 1))
+    res = {}
+    for i in Numeric.nonzero(visible):
+        res[atlist[i].key] = 1
+    return res
+
+# ==
+
+class ChunkCuller:
+    """
+    Keep a SphereBVH of the bounding spheres of one Part's chunks,
+    and use it to find which of them are visible in a view frustum.
+    """
+    def __init__(self):
+        self._molecules = None # the part.molecules list our chunks came from
+        self._chunks = [] # our chunks, in order of their index in self._bvh
+        self._bboxes = [] # the bbox each chunk had when its sphere was last computed
+        self._ids = [] # id(chunk) for our chunks
+        self._index = {} # id(chunk) -> index, for our chunks
+        self._bvh = None
+        self._moved_since_build = 0
+        self.stats = {} # counts from the last call of visible_chunks
+        return
+
+    def has_chunk(self, chunk):
+        """
+        Was chunk in the part, the last time we culled it?
+        """
+        return self._index.has_key(id(chunk))
+
+    def _rebuild(self, molecules):
+        self._molecules = molecules
+        self._chunks = list(molecules)
+        centers = []
+        radii = []
+        for chunk in self._chunks:
+            center, radius = chunk_bounding_sphere(chunk)
+            centers.append(center)
+            radii.append(radius)
+        self._bboxes = [chunk.bbox for chunk in self._chunks]
+        self._ids = [id(chunk) for chunk in self._chunks]
+        self._index = dict(zip(self._ids, range(len(self._ids))))
+        self._bvh = SphereBVH(Numeric.reshape(Numeric.array(centers, Float), (-1, 3)), radii)
+        self._moved_since_build = 0
+        self.stats['rebuilds'] = self.stats.get('rebuilds', 0) + 1
+        return
+
+    def update(self, part):
+        """
+        Bring our hierarchy up to date with part's chunks
+        and their bboxes.
+        """
+        molecules = part.molecules
+        if molecules is not self._molecules:
+            self._rebuild(molecules)
+            return
+        # find the chunks whose bbox was replaced or invalidated
+        # (Chunk.move replaces its bbox, rather than moving it in place,
+        #  so identity is enough)
+        chunks = self._chunks
+        bboxes = [chunk.__dict__.get('bbox') for chunk in chunks]
+        changed = map(operator.is_not, bboxes, self._bboxes)
+        if not True in changed:
+            return
+        moved = Numeric.nonzero(changed).tolist()
+        self._moved_since_build += len(moved)
+        if self._moved_since_build > _REBUILD_FRACTION * len(chunks):
+            self._rebuild(molecules)
+            return
+        centers = []
+        radii = []
+        for i in moved:
+            chunk = chunks[i]
+            center, radius = chunk_bounding_sphere(chunk) # (recomputes bbox if needed)
+            centers.append(center)
+            radii.append(radius)
+            self._bboxes[i] = chunk.bbox
+        self._bvh.refit(moved, centers, radii)
+        self.stats['refits'] = self.stats.get('refits', 0) + len(moved)
+        return
+
+    def visible_chunks(self, part, planes):
+        """
+        Return a dict from id(chunk) to CHUNK_INSIDE or CHUNK_STRADDLING,
+        for those chunks of part whose bounding spheres are not entirely
+        outside any of the given planes. Set self.stats to counts about
+        this culling.
+        """
+        self.stats = {}
+        self.update(part)
+        items, inside = self._bvh.cull(planes, self.stats)
+        ids = self._ids
+        res = dict(zip( [ids[i] for i in items.tolist()],
+                        Numeric.where(inside, CHUNK_INSIDE, CHUNK_STRADDLING).tolist() ))
+        self.stats['chunks'] = len(ids)
+        self.stats['chunks visible'] = len(res)
+        return res
+
+    def chunks_in_planes(self, part, planes):
+        """
+        Return a list of pairs (chunk, inside) for those chunks of part
+        whose bounding spheres are not entirely outside any of the given
+        planes, with inside true if the sphere is entirely inside all of
+        them. Set self.stats as visible_chunks does.
+        """
+        self.stats = {}
+        self.update(part)
+        items, inside = self._bvh.cull(planes, self.stats)
+        chunks = self._chunks
+        return [(chunks[i], flag) for i, flag in zip(items.tolist(), inside.tolist())]
+
+    def chunks_hit_by_line(self, part, point, direction, radius_scale = 1.0):
+        """
+        Return a list of those chunks of part whose bounding spheres
+        (with radii multiplied by radius_scale) intersect the line through
+        point along direction (a unit vector). Set self.stats to counts
+        about this test.
+        """
+        self.stats = {}
+        self.update(part)
+        items = self._bvh.hit_by_line(point, direction, self.stats, radius_scale)
+        chunks = self._chunks
+        return [chunks[i] for i in items.tolist()]
+
+    pass # end of class ChunkCuller
+
+# ==
+
+class _BenchmarkChunk:
+    """
+    Stand-in for a Chunk, with only what ChunkCuller uses.
+    """
+    def __init__(self, points):
+        self.bbox = BBox(points)
+
+    def move(self, offset):
+        # replace bbox, as Chunk.move does
+        bbox = BBox()
+        bbox.data = self.bbox.data + offset
+        self.bbox = bbox
+
+    pass
+
+class _BenchmarkPart:
+    def __init__(self, molecules):
+        self.molecules = molecules
+    pass
+
+def _box_planes(lo, hi):
+    """
+    Return the planes (as for SphereBVH.cull) of the axis-aligned box
+    from point lo to point hi (a stand-in for a view frustum).
+    """
+    planes = []
+    for axis in range(3):
+        normal = [0.0, 0.0, 0.0]
+        normal[axis] = 1.0
+        planes.append( normal + [- lo[axis]] )
+        normal = [0.0, 0.0, 0.0]
+        normal[axis] = -1.0
+        planes.append( normal + [hi[axis]] )
+    return planes
+
+def _is_sphere_visible(planes, center, radius):
+    """
+    The per-sphere test of GLPane.is_sphere_visible.
+    """
+    for p in range(0, 6):
+        dist = (planes[p][0] * center[0] +
+                planes[p][1] * center[1] +
+                planes[p][2] * center[2] +
+                planes[p][3])
+        if dist < -radius:
+            return False
+    return True
+
+def _benchmark(nchunks = 20000, natoms_per_chunk = 20, nframes = 20):
+    """
+    Print the time per frame and culling statistics for culling
+    nchunks chunks (in a grid, like many DNA segments) one at a time
+    (as Chunk.draw does when pref_bvh_frustum_culling is off) and using
+    a ChunkCuller, in a zoomed-in view and a whole-model view, and
+    after moving some chunks.
+    """
+    import random, time
+    from geometry.VQT import A
+    chunks = []
+    side = int(round(nchunks ** (1.0 / 3))) + 1
+    for i in range(nchunks):
+        base = A([(i % side) * 25.0, ((i / side) % side) * 25.0, (i / side / side) * 25.0])
+        points = [base + A([random.uniform(0, 20), random.uniform(0, 20), random.uniform(0, 20)])
+                  for j in range(natoms_per_chunk)]
+        chunks.append( _BenchmarkChunk(points) )
+    part = _BenchmarkPart(chunks)
+    size = side * 25.0
+    views = [("zoomed in", _box_planes([0.4 * size] * 3, [0.5 * size] * 3)),
+             ("whole model", _box_planes([-10.0] * 3, [size + 10.0] * 3))]
+    culler = ChunkCuller()
+    culler.visible_chunks(part, views[0][1]) # build it
+    print "chunk culling benchmark, %d chunks:" % nchunks
+    for name, planes in views:
+        t0 = time.time()
+        for frame in range(nframes):
+            visible = 0
+            for chunk in chunks:
+                center, radius = chunk_bounding_sphere(chunk)
+                if _is_sphere_visible(planes, center, radius):
+                    visible += 1
+        t1 = time.time()
+        for frame in range(nframes):
+            res = culler.visible_chunks(part, planes)
+        t2 = time.time()
+        assert len(res) == visible, "culling mismatch: %d vs %d" % (len(res), visible)
+        print "  %-12s per chunk: %7.2f ms/frame; ChunkCuller: %6.2f ms/frame" % \
+              (name, (t1 - t0) * 1000.0 / nframes, (t2 - t1) * 1000.0 / nframes)
+        items = culler.stats.items()
+        items.sort()
+        print "  %-12s stats: %s" % ("", ", ".join(["%s %d" % item for item in items]))
+    # move a few chunks each frame, as when dragging a selection
+    planes = views[0][1]
+    t0 = time.time()
+    for frame in range(nframes):
+        for chunk in random.sample(chunks, 20):
+            chunk.move(A([random.uniform(-5, 5) for k in range(3)]))
+        res = culler.visible_chunks(part, planes)
+    t1 = time.time()
+    visible = len([chunk for chunk in chunks
+                   if _is_sphere_visible(planes, *chunk_bounding_sphere(chunk))])
+    assert len(res) == visible, "culling mismatch after moves: %d vs %d" % (len(res), visible)
+    print "  moving 20 chunks per frame: ChunkCuller: %6.2f ms/frame (%d chunks visible)" % \
+          ((t1 - t0) * 1000.0 / nframes, len(res))
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -29,6 +29,10 @@ use_color_sorted_dls_prefs_key = "use_color_sorted_dls"
 #russ 080320: Added.
 use_color_sorted_vbos = use_color_sorted_vbos_default = False
 use_color_sorted_vbos_prefs_key = "use_color_sorted_vbos"
+# Batch spheres and cylinders into per-color arrays and vertex buffers
+# (see CS_batches.py), when also using color sorted display lists.
+use_batched_primitives = use_batched_primitives_default = False
+use_batched_primitives_prefs_key = "use_batched_primitives"
 #russ 080403: Added drawing variant selection.
 use_drawing_variant = use_drawing_variant_default = 1 # DrawArrays from CPU RAM.
 use_drawing_variant_prefs_key = "use_drawing_variant"
@@ -125,6 +125,10 @@ class glprefs:
             drawing_globals.use_color_sorted_vbos_prefs_key,
             drawing_globals.use_color_sorted_vbos_default)
 
+        drawing_globals.use_batched_primitives = env.prefs.get(
+            drawing_globals.use_batched_primitives_prefs_key,
+            drawing_globals.use_batched_primitives_default)
+
         drawing_globals.use_drawing_variant = env.prefs.get(
             drawing_globals.use_drawing_variant_prefs_key,
             drawing_globals.use_drawing_variant_default)
@@ -167,6 +171,8 @@ class glprefs:
                               drawing_globals.use_color_sorted_dls_default),)
         res += (env.prefs.get(drawing_globals.use_color_sorted_vbos_prefs_key,
                               drawing_globals.use_color_sorted_vbos_default),)
+        res += (env.prefs.get(drawing_globals.use_batched_primitives_prefs_key,
+                              drawing_globals.use_batched_primitives_default),)
         res += (env.prefs.get(drawing_globals.use_drawing_variant_prefs_key,
                               drawing_globals.use_drawing_variant_default),)
 
@@ -394,6 +394,10 @@ def setup_drawer():
     drawing_globals.use_color_sorted_vbos_pref = debug_pref(
         "Use Color-sorted Vertex Buffer Objects?", initial_choice,
         prefs_key = drawing_globals.use_color_sorted_vbos_prefs_key)
+    initial_choice = choices[drawing_globals.use_batched_primitives_default]
+    drawing_globals.use_batched_primitives_pref = debug_pref(
+        "Use batched sphere/cylinder buffers?", initial_choice,
+        prefs_key = drawing_globals.use_batched_primitives_prefs_key)
 
     #russ 080403: Added drawing variant selection
     variants = [
@@ -446,6 +446,8 @@ def init_diamond():
     drawing_globals.DiGridSp = sp4
     return
 init_diamond()
+digrid = drawing_globals.digrid
+DiGridSp = drawing_globals.DiGridSp
 
 def init_cube():
     drawing_globals.cubeVertices = cubeVertices = [
@@ -521,4 +523,4 @@ def _makeLonsCell():
             [lVp[13], lVp[15]]
             ]
     return res
-drawing_globals.lonsEdges = _makeLonsCell()
+drawing_globals.lonsEdges = lonsEdges = _makeLonsCell()
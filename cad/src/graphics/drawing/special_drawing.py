@@ -24,7 +24,6 @@ from foundation.changes import SubUsageTrackingMixin
 
 from utilities.debug import print_compact_traceback
 
-from OpenGL.GL import glCallList
 
 DEBUG_COMPARATOR = False
 
@@ -308,7 +307,7 @@ class ExtraChunkDisplayList(object, SubUsageTrackingMixin):
 
     def draw_nocolor_dl(self):
         if self.csdl.nocolor_dl:
-            glCallList(self.csdl.nocolor_dl)
+            self.csdl.draw_nocolor()
         else:
             print "unexpected: %r.draw_nocolor_dl with no nocolor_dl" % self
         return
@@ -18,6 +18,7 @@ since it now only supports those two formats. [bruce 072009]
 """
 
 import math
+import gzip
 
 import foundation.env as env
 from geometry.VQT import V, Q, A, vlen
@@ -37,8 +38,12 @@ def writepovfile(part, glpane, filename):
     """
     write the given part into a new POV-Ray file with the given name,
     using glpane for lighting, color, etc
+    (gzipped, if the name ends with ".gz")
     """
-    f = open(filename,"w")
+    if filename.endswith(".gz"):
+        f = gzip.open(filename, "wb")
+    else:
+        f = open(filename,"w")
 
     # POV-Ray images now look correct when Projection = ORTHOGRAPHIC.  Mark 051104.
     if glpane.ortho == PERSPECTIVE:
@@ -0,0 +1,309 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+bulk_writepov.py -- write the atoms and bonds of a chunk into a POV-Ray
+file in bulk, grouped by radius and color.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for Chunk.writepov, which wrote each atom (with Atom.writepov)
+and each bond (with writepov_bond, by running draw_bond_main with a
+writepov_to_file object) as its own macro call, with its own texture,
+in many small writes, formatting every coordinate with str() (12
+significant digits). For multi-million-atom models the POV-Ray file
+took minutes to write and was gigabytes in size.
+
+Usage:
+
+If use_bulk_writer() is true, Chunk.writepov calls writepov_chunk
+instead of writing each atom and bond itself. Bonds which can't be
+written in bulk (see _write_bonds) are still written with Bond.writepov,
+but into the same buffer, so each chunk still takes one file.write call.
+
+writepovfile (in fileIO.py) gzips its output if its filename ends with
+".gz", e.g. for movie frames to be rendered elsewhere (POV-Ray can't
+read those directly).
+
+Implementation notes:
+
+Atoms are grouped by (radius, color) and written as plain spheres in
+one union per group, which has the group's texture (see the
+bulk_texture macro in povheader.py), so POV-Ray parses one texture per
+group rather than one per atom. Bonds are grouped by color the same
+way, as plain cylinders, computed for all of a chunk's bonds at once
+by bond_cylinders (see bond_geometry.py). Coordinates are written with
+4 decimal places (0.0001 Angstroms), formatted for a whole group with
+one string formatting operation.
+
+The spheres and cylinders written (and their radii and colors) are the
+same as Atom.writepov and writepov_bond would write; only their order
+in the file, and the precision of their coordinates, differ.
+"""
+
+import cStringIO
+import time
+
+import Numeric
+
+import foundation.env as env
+
+from graphics.drawing.bond_geometry import bond_cylinders
+from model.bond_constants import V_SINGLE
+from model.bond_constants import bond_params
+from model.elements import Singlet
+
+from utilities.constants import diDEFAULT
+from utilities.constants import diINVISIBLE
+from utilities.constants import diBALL
+from utilities.constants import diTUBES
+from utilities.constants import diTrueCPK
+from utilities.constants import TubeRadius
+from utilities.constants import diBALL_SigmaBondRadius
+from utilities.constants import red
+
+from utilities.prefs_constants import diBALL_BondCylinderRadius_prefs_key
+from utilities.prefs_constants import showBondStretchIndicators_prefs_key
+
+from utilities.GlobalPreferences import pref_bulk_povray_writer
+from utilities.Printing import Vector3ToString
+
+_force_bulk_writer = None # if not None, overrides the debug_pref (for _benchmark)
+
+def use_bulk_writer():
+    """
+    Should Chunk.writepov use writepov_chunk?
+    """
+    if _force_bulk_writer is not None:
+        return _force_bulk_writer
+    return pref_bulk_povray_writer()
+
+_POV_FLIP = Numeric.array([1.0, 1.0, -1.0]) # as in povpoint (POV-Ray is left-handed)
+
+_DELTA = 1.0E-5 # as in old_writepov_bondcyl
+
+# ==
+
+def writepov_chunk(chunk, file, dispdef, drawn):
+    """
+    Write chunk's atoms, and those of its bonds not already in drawn
+    (a dict from id(bond) to bond, to which we add them), into file
+    (an open POV-Ray file), as Chunk.writepov would, given dispdef (the
+    display style it uses for chunk), but in bulk, with one file.write.
+    """
+    col = chunk.color
+    buf = cStringIO.StringIO()
+    _write_atoms(buf, chunk, dispdef, col)
+    bonds = []
+    for atom in chunk.atlist:
+        for bond in atom.bonds:
+            if id(bond) not in drawn:
+                drawn[id(bond)] = bond
+                bonds.append(bond)
+    others = _write_bonds(buf, bonds, dispdef, col)
+    for bond in others:
+        bond.writepov(buf, dispdef, col)
+    file.write(buf.getvalue())
+    return
+
+def _write_atoms(buf, chunk, dispdef, col):
+    """
+    [private helper for writepov_chunk]
+    Write chunk's atoms into buf, as Atom.writepov would.
+    """
+    atlist = chunk.atlist
+    molcolor = chunk.drawing_color()
+    howdraw = {} # (element, display) -> (disp, rad), for real atoms
+    groups = {} # (rad, color) -> list of atom indices in atlist
+    for i in range(len(atlist)):
+        atom = atlist[i]
+        element = atom.element
+        if element is Singlet:
+            # (its howdraw depends on its base atom)
+            disp, rad = atom.howdraw(dispdef)
+        else:
+            key = (element, atom.display)
+            try:
+                disp, rad = howdraw[key]
+            except KeyError:
+                disp, rad = howdraw[key] = atom.howdraw(dispdef)
+        if disp not in (diTrueCPK, diBALL, diTUBES):
+            continue
+        # same as col or atom.drawing_color()
+        color = col or molcolor or element.color
+        key = (rad, tuple(color))
+        try:
+            groups[key].append(i)
+        except KeyError:
+            groups[key] = [i]
+    if not groups:
+        return
+    positions = chunk.atpos * _POV_FLIP
+    items = groups.items()
+    items.sort()
+    for (rad, color), indices in items:
+        fmt = "sphere{<%.4f,%.4f,%.4f>," + str(rad) + "}\n"
+        rows = Numeric.take(positions, indices)
+        _write_union(buf, fmt, rows, color)
+    return
+
+def _write_bonds(buf, bonds, dispdef, col):
+    """
+    [private helper for writepov_chunk]
+    Write those of bonds (a list of Bonds) which writepov_bond would
+    write as plain cylinders into buf, as it would, and return a list
+    of the others.
+
+    Not handled here (so returned) are bonds written in display styles
+    other than ball and stick or tubes, bonds to invisible atoms, bonds
+    of higher order than single (which might be written as several
+    cylinders, or with bands), bonds with a bond direction or dna updater
+    errors (which might be written in another color, or not at all), and
+    bonds to PAM atoms (which have other radii).
+    """
+    others = []
+
+    palette = []
+    color_index = {}
+    def index_of_color(color):
+        key = tuple(color)
+        try:
+            return color_index[key]
+        except KeyError:
+            res = color_index[key] = len(palette)
+            palette.append(color)
+            return res
+
+    ball_radius = diBALL_SigmaBondRadius * \
+                  env.prefs[diBALL_BondCylinderRadius_prefs_key]
+    if env.prefs[showBondStretchIndicators_prefs_key]:
+        # (the tube1 macro which wrote these always used Red)
+        toolong_color = index_of_color(red)
+    else:
+        toolong_color = -1
+
+    # one row per bond (see bond_cylinders for the meaning of these)
+    ends = []
+    rcov = []
+    radii = []
+    colors1 = []
+    colors2 = []
+    tubes = []
+    atom_colors = {} # atom key -> palette index
+
+    for bond in bonds:
+        atom1 = bond.atom1
+        atom2 = bond.atom2
+        disp = max(atom1.display, atom2.display)
+        if disp == diDEFAULT or disp < 0:
+            disp = dispdef
+        if (disp not in (diBALL, diTUBES) or
+            bond.v6 != V_SINGLE or
+            atom1.display == diINVISIBLE or
+            atom2.display == diINVISIBLE or
+            bond._direction or
+            atom1._dna_updater__error or
+            atom2._dna_updater__error or
+            atom1.element.pam or
+            atom2.element.pam):
+            others.append(bond)
+            continue
+        color12 = []
+        for atom in (atom1, atom2):
+            try:
+                color = atom_colors[atom.key]
+            except KeyError:
+                color = atom_colors[atom.key] = \
+                        index_of_color(col or atom.drawing_color())
+            color12.append(color)
+        color1, color2 = color12
+        tube = 0
+        if disp == diBALL:
+            radius = ball_radius
+            # (col or color1, as in old_writepov_bondcyl)
+            color2 = color1
+        else:
+            radius = TubeRadius
+            if atom2.atomtype.rcovalent < _DELTA:
+                color2 = color1
+            elif atom1.atomtype.rcovalent < _DELTA:
+                color1 = color2
+            else:
+                tube = 1
+        ends.append((atom1.posn(), atom2.posn()))
+        rcov.append(bond_params(atom1.atomtype, atom2.atomtype, V_SINGLE))
+        radii.append(radius)
+        colors1.append(color1)
+        colors2.append(color2)
+        tubes.append(tube)
+        continue
+
+    if not ends:
+        return others
+
+    ends = Numeric.array(ends) * _POV_FLIP
+    names = Numeric.zeros(len(radii))
+    cyls = bond_cylinders(ends[:,0], ends[:,1], Numeric.array(rcov),
+                          Numeric.array(radii),
+                          Numeric.array(colors1), Numeric.array(colors2),
+                          names, toolong_color, Numeric.array(tubes))
+    fmt = "cylinder{<%.4f,%.4f,%.4f>,<%.4f,%.4f,%.4f>,%.4f}\n"
+    for color, pos1, pos2, cylradii, junk in cyls.by_color():
+        rows = Numeric.concatenate([pos1, pos2,
+                                    Numeric.reshape(cylradii, (-1, 1))], 1)
+        _write_union(buf, fmt, rows, palette[color])
+    return others
+
+_ROWS_PER_FORMAT = 10000 # limits the size of temporary format strings
+
+def _write_union(buf, fmt, rows, color):
+    """
+    Write a union of one object per row of rows (a 2d array), each one
+    formatted by fmt from that row, with the texture of color.
+    """
+    buf.write("union{\n")
+    for start in range(0, len(rows), _ROWS_PER_FORMAT):
+        block = rows[start:start + _ROWS_PER_FORMAT]
+        buf.write((fmt * len(block)) % tuple(Numeric.ravel(block).tolist()))
+    buf.write("bulk_texture(" + Vector3ToString(color) + ")\n}\n")
+    return
+
+# ==
+
+def _benchmark(glpane):
+    """
+    Write glpane's part into POV-Ray files with the old writer, the bulk
+    writer, and the bulk writer with gzip, and print the time each took
+    and the size of its file into the history.
+    """
+    import os, tempfile
+    from graphics.rendering.fileIO import writepovfile
+    global _force_bulk_writer
+    part = glpane.assy.part
+    workdir = tempfile.mkdtemp()
+    try:
+        for name, bulk, ext in [("old writer", False, ".pov"),
+                                ("bulk writer", True, ".pov"),
+                                ("bulk writer with gzip", True, ".pov.gz")]:
+            filename = os.path.join(workdir, "benchmark" + ext)
+            _force_bulk_writer = bulk
+            try:
+                t0 = time.time()
+                writepovfile(part, glpane, filename)
+                t1 = time.time()
+            finally:
+                _force_bulk_writer = None
+            size = os.path.getsize(filename)
+            os.remove(filename)
+            env.history.message("POV-Ray %s: %.2f sec, %d bytes" %
+                                (name, t1 - t0, size))
+    finally:
+        os.rmdir(workdir)
+    return
+
+from utilities.debug import register_debug_menu_command
+register_debug_menu_command("Benchmark POV-Ray writers", _benchmark)
+
+# end
@@ -0,0 +1,386 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+movie_export.py -- write a movie as a series of POV-Ray files using
+several processes, and optionally render each one as it's written.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for Movie._write_povray_series (in simulation/movie.py), which
+plays each frame and writes its POV-Ray file, one at a time, on the GUI
+thread, leaving the rendering of those files as a separate manual step.
+
+Usage:
+
+A PovrayMovieExport is made from a list of frame indices and three
+functions supplied by the caller:
+
+- snapshot(n) returns a new array of the atom positions of frame n
+  (called in this process, in order of the frames);
+
+- write_pov(n, frame, filename) writes the POV-Ray file for frame n,
+  given those positions (called in a forked child process, so it may
+  move atoms or change other state as it likes, since those changes are
+  lost when the child exits);
+
+- filename_for(n) returns the name of the POV-Ray file for frame n.
+
+Its write_files method snapshots the frames and writes their files in
+batches, returning the number of files written; then its finish method
+waits for any renderers still running and returns a summary of the
+timings of each stage (snapshot, writing, rendering), for a history
+message. Progress messages go to an optional progress function.
+
+If it's given a RenderQueue, each file is queued for rendering as soon
+as its batch is written. A RenderQueue runs a renderer command (normally
+POV-Ray, but any program taking the same arguments, e.g. a stub for
+testing) on each file, with at most max_running of them at once.
+
+Implementation notes:
+
+Each batch has frames_per_process frames for each process. Its frames
+are snapshotted first (so the children never read the movie file, whose
+file pointer they'd share with this process), then written by
+parallel_map in forked children, which share the snapshots with this
+process rather than copying them. Where os.fork is not available, or
+processes is 1, write_pov is called in this process instead.
+
+Renderers run as independent processes (started with subprocess.Popen
+in the directory of their POV-Ray file, with their output discarded),
+so they keep running while later batches are written. The queue only
+starts more of them between batches, though, so while a batch is being
+written, fewer than max_running renderers may be running.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+from processes.parallel_map import parallel_map, number_of_processors
+
+RENDER_OUTPUT_EXT = '.png'
+
+def povray_render_args(povfile, width, height, include_dir = None):
+    """
+    Return the command-line arguments for POV-Ray (or MegaPOV, or a stub
+    renderer) to render povfile (a filename relative to the renderer's
+    working directory) into a PNG file of the same basename, with the
+    given image size, without displaying it or pausing when done.
+    """
+    base, ext = os.path.splitext(povfile)
+    args = ['+I' + povfile,
+            '+O' + base + RENDER_OUTPUT_EXT,
+            '+W%d' % width,
+            '+H%d' % height,
+            '+A', # anti-aliasing
+            '+FN', # PNG output
+            '-D', # no display
+            '-P', # no pause when done
+            ]
+    if include_dir:
+        args.append('+L' + include_dir)
+    return args
+
+# ==
+
+class RenderQueue:
+    """
+    Render POV-Ray files, running at most max_running renderer processes
+    at once. See module docstring for details.
+    """
+    def __init__(self, command, width, height,
+                 include_dir = None, extra_args = (), max_running = None):
+        """
+        @param command: the renderer program and any arguments it needs
+                        before the ones from povray_render_args
+        @type command: list of strings
+
+        @param extra_args: arguments to follow the ones from
+                           povray_render_args (e.g. "/EXIT" for POV-Ray
+                           on Windows)
+        @type extra_args: sequence of strings
+
+        @param max_running: the most renderers to run at once (default
+                            number_of_processors())
+        """
+        self.command = list(command)
+        self.width = width
+        self.height = height
+        self.include_dir = include_dir
+        self.extra_args = list(extra_args)
+        if max_running is None:
+            max_running = number_of_processors()
+        self.max_running = max(1, max_running)
+        self._waiting = [] # povfiles not yet started, in order
+        self._running = [] # (povfile, process, start time)
+        self.queued = 0
+        self.rendered = 0
+        self.failed = [] # (povfile, exitcode or error message)
+        self.render_time = 0.0 # summed over renderers
+        self.first_start = None
+        self.last_finish = None
+        return
+
+    def add(self, povfile):
+        """
+        Queue povfile (an absolute filename) for rendering.
+        """
+        self._waiting.append(povfile)
+        self.queued += 1
+        self.poll()
+        return
+
+    def pending(self):
+        """
+        Return the number of files not yet rendered (or failed).
+        """
+        return len(self._waiting) + len(self._running)
+
+    def poll(self):
+        """
+        Note which renderers have finished, and start waiting ones while
+        fewer than max_running are running. Never blocks.
+        """
+        still_running = []
+        for povfile, process, start in self._running:
+            exitcode = process.poll()
+            if exitcode is None:
+                still_running.append((povfile, process, start))
+                continue
+            now = time.time()
+            self.render_time += now - start
+            self.last_finish = now
+            if exitcode:
+                self.failed.append((povfile, exitcode))
+            else:
+                self.rendered += 1
+        self._running = still_running
+        while self._waiting and len(self._running) < self.max_running:
+            povfile = self._waiting.pop(0)
+            self._start(povfile)
+        return
+
+    def _start(self, povfile):
+        workdir, relfile = os.path.split(povfile)
+        args = self.command + \
+               povray_render_args(relfile, self.width, self.height,
+                                  self.include_dir) + \
+               self.extra_args
+        devnull = open(os.devnull, 'r+')
+        try:
+            try:
+                process = subprocess.Popen(args, cwd = workdir or None,
+                                           stdin = devnull,
+                                           stdout = devnull,
+                                           stderr = devnull)
+            except (OSError, ValueError), e:
+                self.failed.append((povfile, str(e)))
+                return
+        finally:
+            devnull.close() # (the child has its own copy)
+        now = time.time()
+        if self.first_start is None:
+            self.first_start = now
+        self._running.append((povfile, process, now))
+        return
+
+    def wait(self, progress = None, interval = 0.25):
+        """
+        Wait until all queued files are rendered (or failed), calling
+        progress (if given) with a message about every interval seconds.
+        """
+        while self.pending():
+            self.poll()
+            if not self.pending():
+                break
+            if progress:
+                progress("Rendering POV-Ray files: %d of %d done" %
+                         (self.rendered + len(self.failed), self.queued))
+            time.sleep(interval)
+        return
+
+    def stats_message(self):
+        """
+        Return a summary of rendering so far, for a history message.
+        """
+        wall = 0.0
+        if self.first_start is not None and self.last_finish is not None:
+            wall = self.last_finish - self.first_start
+        msg = "rendered %d of %d files in %.2f sec (%.2f sec of renderer " \
+              "time, up to %d at once)" % \
+              (self.rendered, self.queued, wall, self.render_time,
+               self.max_running)
+        if self.failed:
+            povfile, error = self.failed[0]
+            msg += "; %d failed, e.g. %s (%s)" % \
+                   (len(self.failed), os.path.basename(povfile), error)
+        return msg
+
+    pass # end of class RenderQueue
+
+# ==
+
+class PovrayMovieExport:
+    """
+    Write POV-Ray files for movie frames in batches, in forked processes,
+    optionally queueing each one for rendering.
+    See module docstring for details.
+    """
+    def __init__(self, frames, snapshot, write_pov, filename_for,
+                 processes = None, frames_per_process = 4,
+                 render_queue = None, progress = None):
+        if processes is None:
+            processes = number_of_processors()
+        self.frames = list(frames)
+        self.snapshot = snapshot
+        self.write_pov = write_pov
+        self.filename_for = filename_for
+        self.processes = max(1, processes)
+        self.frames_per_process = max(1, frames_per_process)
+        self.render_queue = render_queue
+        self.progress = progress
+        self.nfiles = 0 # files written so far
+        self.snapshot_time = 0.0
+        self.write_time = 0.0 # wall time of writing
+        self.write_process_time = 0.0 # summed over frames
+        self.render_wait_time = 0.0 # wall time of finish
+        self._start_time = None
+        return
+
+    def write_files(self):
+        """
+        Snapshot all our frames and write their files (queueing each one
+        for rendering, if we have a render queue). Return the number of
+        files written.
+
+        @raise ParallelMapError: if write_pov raised an exception (in
+                                 which case the files in earlier batches
+                                 are written, and counted in self.nfiles)
+        """
+        self._start_time = time.time()
+        batch_size = self.processes * self.frames_per_process
+        frames = self.frames
+        for start in range(0, len(frames), batch_size):
+            self._progress("Writing POV-Ray files: %d of %d written" %
+                           (self.nfiles, len(frames)))
+            t0 = time.time()
+            items = []
+            for n in frames[start:start + batch_size]:
+                items.append((n, self.snapshot(n), self.filename_for(n)))
+            t1 = time.time()
+            seconds = parallel_map(self._write_item, items, self.processes)
+            t2 = time.time()
+            self.snapshot_time += t1 - t0
+            self.write_time += t2 - t1
+            for s in seconds:
+                self.write_process_time += s
+            self.nfiles += len(items)
+            if self.render_queue is not None:
+                for n, frame, filename in items:
+                    self.render_queue.add(os.path.abspath(filename))
+            del items # free the snapshots
+        return self.nfiles
+
+    def _write_item(self, item):
+        """
+        [runs in a child process, unless we have only one]
+        Write one frame's POV-Ray file; return the time that took.
+        """
+        n, frame, filename = item
+        t0 = time.time()
+        self.write_pov(n, frame, filename)
+        return time.time() - t0
+
+    def finish(self):
+        """
+        Wait for any renderers still running (showing progress), and
+        return a summary of the timings of each stage, for a history
+        message.
+        """
+        if self.render_queue is not None:
+            t0 = time.time()
+            self.render_queue.wait(self.progress)
+            self.render_wait_time = time.time() - t0
+        return self.stats_message()
+
+    def stats_message(self):
+        total = 0.0
+        if self._start_time is not None:
+            total = time.time() - self._start_time
+        msg = "POV-Ray export: %d files; snapshots %.2f sec, writing " \
+              "%.2f sec (%.2f sec of process time, up to %d at once)" % \
+              (self.nfiles, self.snapshot_time, self.write_time,
+               self.write_process_time, self.processes)
+        if self.render_queue is not None:
+            msg += ", " + self.render_queue.stats_message()
+            msg += ", %.2f sec waiting after writing" % self.render_wait_time
+        msg += "; total %.2f sec" % total
+        return msg
+
+    def _progress(self, msg):
+        if self.progress:
+            self.progress(msg)
+        return
+
+    pass # end of class PovrayMovieExport
+
+# ==
+
+# a renderer for _test, which just writes the output file POV-Ray would
+_STUB_RENDERER = """
+import sys, time
+args = sys.argv[1:]
+input = [a[2:] for a in args if a.startswith('+I')][0]
+output = [a[2:] for a in args if a.startswith('+O')][0]
+data = open(input).read()
+time.sleep(0.05)
+open(output, 'w').write('rendered %d bytes' % len(data))
+"""
+
+def _test(natoms = 2000, nframes = 40):
+    """
+    Export random frames with a simple write_pov and a stub renderer
+    command, and check that every POV-Ray file and image was written.
+    """
+    import tempfile, shutil
+    import Numeric
+    from graphics.rendering.povray.povheader import povpoint
+    workdir = tempfile.mkdtemp()
+    def snapshot(n):
+        return Numeric.ones((natoms, 3), Numeric.Float) * n
+    def write_pov(n, frame, filename):
+        f = open(filename, "w")
+        for pos in frame:
+            f.write("sphere { %s, 0.5 }\n" % povpoint(pos))
+        f.close()
+    def filename_for(n):
+        return os.path.join(workdir, "test.%06d.pov" % n)
+    def progress(msg):
+        print msg
+    try:
+        frames = range(0, nframes * 2, 2)
+        queue = RenderQueue([sys.executable, '-c', _STUB_RENDERER], 64, 48)
+        export = PovrayMovieExport(frames, snapshot, write_pov, filename_for,
+                                   render_queue = queue, progress = progress)
+        assert export.write_files() == len(frames)
+        print export.finish()
+        for n in frames:
+            povfile = filename_for(n)
+            assert os.path.exists(povfile)
+            assert open(povfile).readline().startswith("sphere { <%d" % n)
+            assert os.path.exists(os.path.splitext(povfile)[0] +
+                                  RENDER_OUTPUT_EXT)
+        assert queue.rendered == len(frames) and not queue.failed
+    finally:
+        shutil.rmtree(workdir)
+    print "movie_export: ok"
+    return
+
+if __name__ == '__main__':
+    _test()
+
+# end
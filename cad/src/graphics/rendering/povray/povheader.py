@@ -192,6 +192,14 @@ povheader = """
 #end
 
 
+// texture of a union of the spheres or cylinders of one color
+// (used by bulk_writepov.py)
+
+#macro bulk_texture(col)
+  pigment { rgb col }
+  finish {Atomic}
+#end
+
 #macro line(pos1, pos2, col) 
   cylinder {pos1, pos2, 0.05
     pigment { rgb col }
@@ -226,10 +226,15 @@ from utilities.debug_prefs import Choice_boolean_False, Choice_boolean_True
 
 from utilities.GlobalPreferences import DEBUG_BAREMOTION
 from utilities.GlobalPreferences import use_frustum_culling
+from utilities.GlobalPreferences import pref_bvh_frustum_culling
+from utilities.GlobalPreferences import pref_per_atom_frustum_culling
 from utilities.GlobalPreferences import pref_show_highlighting_in_MT
 from utilities.GlobalPreferences import pref_skip_redraws_requested_only_by_Qt
 
 from graphics.widgets.GLPane_minimal import GLPane_minimal
+from graphics.drawing.chunk_culling import ChunkCuller
+from graphics.drawing.chunk_culling import CHUNK_STRADDLING
+from graphics.drawing.chunk_culling import visible_atom_keys
 from utilities.constants import black, gray, darkgray, lightgray, white
 from utilities.constants import bluesky, eveningsky, bg_seagreen
 import utilities.qt4transition as qt4transition
@@ -976,6 +981,7 @@ class GLPane(GLPane_minimal, modeMixin, DebugMenuMixin, SubUsageTrackingMixin,
         """
         if self.part is not part:
             self.gl_update() # we depend on this not doing the redraw until after we return
+            self._chunk_culler = None # (don't keep the old part's chunks)
         self._close_part() # saves view into old part (if not None)
         self.part = part
         self._open_part() # loads view from new part (if not None)
@@ -3295,6 +3301,10 @@ class GLPane(GLPane_minimal, modeMixin, DebugMenuMixin, SubUsageTrackingMixin,
             # and we want the same answer used throughout
             # one call of paintGL
             # piotr 080402: uses GlobalPreferences
+        self._use_bvh_culling = self._use_frustum_culling and \
+                                pref_bvh_frustum_culling()
+        self._use_per_atom_culling = self._use_frustum_culling and \
+                                     pref_per_atom_frustum_culling()
         assert not self._frustum_planes_available
 
         
@@ -3641,10 +3651,21 @@ class GLPane(GLPane_minimal, modeMixin, DebugMenuMixin, SubUsageTrackingMixin,
 
     vdist = property(get_vdist)
 
+    # frustum culling of all chunks at once (see pref_bvh_frustum_culling)
+    _use_bvh_culling = False
+    _use_per_atom_culling = False
+    _chunk_culler = None # a ChunkCuller, made when first needed
+    _visible_chunks = None # its result for the current frustum planes, or None
+
+    # chunks with fewer atoms are always drawn whole (see visible_atom_keys)
+    _MIN_ATOMS_FOR_PER_ATOM_CULLING = 500
+
     def _compute_frustum_planes(self): # Piotr 080331
         """
         Compute six planes to be used for frustum culling
-        (if the use of that feature is enabled).
+        (if the use of that feature is enabled),
+        and cull all chunks of self.part against them at once
+        if pref_bvh_frustum_culling is enabled.
 
         @note: this must only be called when the matrices are set up
                to do drawing in absolute model space coordinates.
@@ -3701,8 +3722,45 @@ class GLPane(GLPane_minimal, modeMixin, DebugMenuMixin, SubUsageTrackingMixin,
         # cause self.is_sphere_visible() to use these planes
         self._frustum_planes_available = True # [bruce 080331]
 
+        self._visible_chunks = None
+        if self._use_bvh_culling and self.part is not None:
+            if self._chunk_culler is None:
+                self._chunk_culler = ChunkCuller()
+            self._visible_chunks = \
+                self._chunk_culler.visible_chunks(self.part, self.fplanes)
         return
 
+    def is_chunk_visible(self, chunk):
+        """
+        Perform a frustum culling test on a chunk (see is_sphere_visible),
+        using the result of culling all chunks of self.part at once
+        (when _compute_frustum_planes did that, and chunk was in self.part).
+        """
+        if self._frustum_planes_available and self._visible_chunks is not None:
+            if self._visible_chunks.has_key(id(chunk)):
+                return True
+            if self._chunk_culler.has_chunk(chunk):
+                return False
+        return GLPane_minimal.is_chunk_visible(self, chunk)
+
+    def visible_atom_keys(self, chunk):
+        """
+        [overrides GLPane_minimal method]
+
+        If per-atom frustum culling is enabled and chunk is large and
+        only partly inside the view frustum, return a dict whose keys are
+        the keys of its atoms which are not entirely outside it;
+        otherwise return None (meaning that all its atoms should be drawn).
+        """
+        if not (self._use_per_atom_culling and
+                self._frustum_planes_available and
+                self._visible_chunks is not None):
+            return None
+        if self._visible_chunks.get(id(chunk)) != CHUNK_STRADDLING or \
+           len(chunk.atoms) < self._MIN_ATOMS_FOR_PER_ATOM_CULLING:
+            return None
+        return visible_atom_keys(chunk, self.fplanes)
+
     def is_sphere_visible(self, center, radius): # Piotr 080331
         """
         Perform a simple frustum culling test against a spherical object
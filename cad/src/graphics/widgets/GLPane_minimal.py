@@ -35,6 +35,7 @@ import foundation.env as env
 
 from graphics.drawing.setup_draw import setup_drawer
 from graphics.drawing.draw_grid_lines import setup_draw_grid_lines
+from graphics.drawing.chunk_culling import chunk_bounding_sphere
 
 DEPTH_TWEAK_UNITS = (2.0)**(-32)
 DEPTH_TWEAK_VALUE = 100000
@@ -191,6 +192,25 @@ class GLPane_minimal(QGLWidget, object): #bruce 070914
 
     # ==
 
+    def is_chunk_visible(self, chunk):
+        """
+        Frustum culling test for a chunk, using a sphere enclosing all its
+        atoms as drawn. Subclasses can override it to use precomputed
+        results for many chunks at once.
+        """
+        center, radius = chunk_bounding_sphere(chunk)
+        return self.is_sphere_visible(center, radius)
+
+    def visible_atom_keys(self, chunk):
+        """
+        Return None, or a dict whose keys are the keys of the atoms of chunk
+        which should be drawn (when they are drawn one at a time), if
+        subclasses know that its other atoms are outside the view frustum.
+        """
+        return None
+
+    # ==
+
     def _call_whatever_waits_for_gl_context_current(self): #bruce 071103
         """
         For whatever functions have been registered to be called (once)
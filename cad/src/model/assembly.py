@@ -187,6 +187,11 @@ class Assembly( StateMixin, Assembly_API):
     
     _view_change_counter = 0 # also includes changing current part, glpane display mode [mostly nim as of 060228]
 
+    _unrecorded_change_counter = 0 # counts calls of changed, changed_selection and changed_view
+        # from callers which didn't record the changed node in Utility._changed_Nodes
+        # (see Node.changed); incremental Undo checkpoints can only be used when this
+        # hasn't changed since the last checkpoint
+
     def all_change_counters(self): #bruce 060227; 071116 added guarantees to docstring
         """
         Return a tuple of all our change counters, suitable for later passing
@@ -199,6 +204,16 @@ class Assembly( StateMixin, Assembly_API):
         """
         return self._model_change_counter, self._selection_change_counter, self._view_change_counter
 
+    def unrecorded_change_counter(self):
+        """
+        Return a counter which increases whenever our model, selection or
+        view is changed by code which didn't record the changed node in
+        Utility._changed_Nodes. If it hasn't changed since the last Undo
+        checkpoint, all changes since then were recorded, so the next
+        checkpoint only needs to rescan the recorded nodes.
+        """
+        return self._unrecorded_change_counter
+
     # state declarations:
     # (the change counters above should not have ordinary state decls -- for now, they should have none)
     
@@ -1450,14 +1465,17 @@ class Assembly( StateMixin, Assembly_API):
 
     # == tracking undoable changes that aren't saved
 
-    def changed_selection(self): #bruce 060129; this will need revision if we make it part-specific
-        # see also same-named Node method
+    def changed_selection(self, node_recorded = False): #bruce 060129; this will need revision if we make it part-specific
+        # see also same-named Node method, which passes node_recorded = True
+        if not node_recorded:
+            self._unrecorded_change_counter += 1
         if self._suspend_noticing_changes:
             return
         self._selection_change_counter = env.change_counter_for_changed_objects()
         return
 
     def changed_view(self): #bruce 060129 ###@@@ not yet called enough
+        self._unrecorded_change_counter += 1
         if self._suspend_noticing_changes:
             return
         self._view_change_counter = env.change_counter_for_changed_objects()
@@ -1477,7 +1495,7 @@ class Assembly( StateMixin, Assembly_API):
         """
         return self._modified
     
-    def changed(self): # by analogy with other methods this would be called changed_model(), but we won't rename it [060227]
+    def changed(self, node_recorded = False): # by analogy with other methods this would be called changed_model(), but we won't rename it [060227]
         """
         Record the fact that this Assembly (or something it contains)
         has been changed, in the sense that saving it into a file would
@@ -1494,6 +1512,12 @@ class Assembly( StateMixin, Assembly_API):
         from lower-level methods than it is now, making complete coverage
         easier. #e]
            See also: changed_selection, changed_view.
+
+        @param node_recorded: whether our caller (e.g. Node.changed) has
+                              recorded the changed node in
+                              Utility._changed_Nodes (used to decide
+                              whether Undo can make an incremental
+                              checkpoint; see unrecorded_change_counter).
         """
         # bruce 050107 added this method; as of now, all method names (in all
         # classes) of the form 'changed' or 'changed_xxx' (for any xxx) are
@@ -1501,6 +1525,9 @@ class Assembly( StateMixin, Assembly_API):
         # uniform system for efficiently recording and propogating change-
         # notices of that kind, as part of implementing Undo (among other uses).]
 
+        if not node_recorded:
+            self._unrecorded_change_counter += 1
+        
         if self._suspend_noticing_changes:
             return #bruce 060121 -- this changes effective implem of begin/end_suspend_noticing_changes; should be ok
         
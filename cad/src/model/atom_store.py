@@ -0,0 +1,174 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+atom_store.py -- columnar storage of atom positions for one Chunk.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that large chunks can keep their atom positions in one
+contiguous array, rather than in one small Numeric array per atom.
+
+Implementation notes:
+
+When enabled (see pref_use_columnar_atom_store), Chunk._recompute_atlist
+makes an AtomStore for the new atlist, which "adopts" those atoms: it
+copies their positions into its positions array (in atlist order) and
+removes each atom's own _posn attribute, leaving in the atom a reference
+to the store and its row in it. From then on:
+
+- Atom.__getattr__ returns a row of store.positions for atom._posn
+  (a view, which must not be modified in place -- as has always been
+  true of atom._posn);
+
+- Atom._setposn_no_chunk_or_bond_invals writes into that row
+  (and discards any _posn attribute directly assigned to the atom,
+  e.g. by Undo, which then calls setposn_batch for each atom it changed,
+  so other code should set positions using setposn);
+
+- Chunk._recompute_atpos copies store.positions in one operation, and
+  Chunk.set_atom_posns_from_atpos (used by chunk moves and rotations)
+  stores the whole array in one operation, instead of looping over atoms.
+
+An atom keeps working with its store when it leaves the chunk; its next
+chunk adopts it into a new store when that chunk's atlist is recomputed
+(or not, if the pref was turned off, which is harmless). The store
+keeps the atoms' keys, in the same order, for callers which want to
+match its rows to other per-atom data.
+
+Element, atomtype, display style and selection state are left in the
+atoms, since many methods assign those attributes directly, and Undo
+tracks them per attribute.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+from model.global_model_changedicts import _changed_posn_Atoms
+
+class AtomStore:
+    """
+    Contiguous arrays holding the positions (and keys) of one chunk's
+    atoms, in the order of its atlist. See module docstring for details.
+    """
+    def __init__(self, atlist):
+        """
+        Adopt the atoms in atlist (a sequence of Atoms, typically
+        a chunk's atlist), which must all be distinct.
+        """
+        self.atlist = atlist
+        n = len(atlist)
+        # Note: these reads of atom._posn might come from a prior store.
+        self.positions = Numeric.array([atom._posn for atom in atlist], Float)
+        if not n:
+            self.positions = Numeric.zeros((0, 3), Float)
+        self.keys = Numeric.array([atom.key for atom in atlist], Int)
+        for atom, row in zip(atlist, range(n)):
+            dict1 = atom.__dict__
+            dict1.pop('_posn', None)
+            dict1['_f_atom_store'] = self
+            dict1['_f_store_row'] = row
+        return
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return "<%s for %d atoms at %#x>" % (self.__class__.__name__, len(self), id(self))
+
+    def get_positions(self):
+        """
+        Return a copy of our positions array (N x 3, in atlist order).
+        """
+        return + self.positions
+
+    def set_positions(self, positions, atoms):
+        """
+        Set the positions of all our atoms from an N x 3 array in atlist order,
+        recording them as changed for Undo and telling their jigs, but doing
+        no chunk or bond invalidations (like Atom._setposn_no_chunk_or_bond_invals,
+        for all our atoms at once).
+
+        @param atoms: a dict from atom.key to atom for the same atoms as our
+                      atlist (e.g. our chunk's atoms dict, which has just
+                      those atoms as long as its atlist is ours).
+
+        @warning: an atom's _posn attribute which was directly assigned
+                  (rather than set by setposn) since that atom last
+                  called setposn would hide the new position.
+        """
+        assert len(positions) == len(self.positions)
+        self.positions[:] = positions
+        _changed_posn_Atoms.update(atoms)
+        for atom in [atom for atom in self.atlist if atom.jigs]:
+            for jig in atom.jigs[:]:
+                jig.moved_atom(atom)
+        return
+
+    pass # end of class AtomStore
+
+# ==
+
+def _rss_kbytes():
+    """
+    Return the resident set size of this process in kilobytes,
+    or None if we can't find it (works on Linux).
+    """
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+def _benchmark(n = 200000):
+    """
+    Compare the memory per atom, and the time to rebuild atpos and basepos
+    and to move the chunk, for chunks of n atoms with and without an
+    AtomStore.
+    """
+    import gc, time
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from geometry.VQT import V
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    print "AtomStore benchmark for %d atoms:" % n
+    for use_store in (False, True):
+        gc.collect()
+        rss0 = _rss_kbytes()
+        mol = Chunk(assy, "bench")
+        for i in xrange(n):
+            Atom('C', V(i * 1.5, (i % 7) * 1.1, (i % 13) * 1.3), mol)
+            if use_store and i % 10000 == 9999:
+                # adopt the atoms made so far, so the memory of their own
+                # position arrays is reused by the next ones
+                mol._atom_store = AtomStore(mol.atlist)
+        assy.addmol(mol)
+        mol._atom_store = None
+        if use_store:
+            mol._atom_store = AtomStore(mol.atlist)
+        mol.atlist
+        gc.collect()
+        rss1 = _rss_kbytes()
+        mol.invalidate_attr('atpos')
+        t0 = time.time()
+        mol.basepos
+        t1 = time.time()
+        mol.move(V(1.0, 0, 0))
+        t2 = time.time()
+        print "  %s: atpos/basepos rebuild %.4f sec, chunk move %.4f sec" % \
+              (use_store and "columnar" or "per-atom", t1 - t0, t2 - t1),
+        if rss0 is not None and rss1 is not None:
+            print "%.1f bytes per atom" % ((rss1 - rss0) * 1024.0 / n),
+        print
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -0,0 +1,94 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+bulk_chunk.py -- add many atoms and bonds to a Chunk, given as arrays.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for generators which compute the positions and bonds of all
+their atoms at once (see geometry/hexagonal_lattice.py), so they don't
+need to make atoms one at a time and then kill some of them (which
+makes and kills bondpoints one at a time).
+
+Implementation notes:
+
+The atoms are made directly with the given atomtypes, and bonded by
+bond_atoms_faster, so no bondpoints are made or removed except those
+given explicitly.
+"""
+
+import Numeric
+
+from model.chem import Atom
+from model.bonds import bond_atoms_faster
+from model.bond_constants import bond_params
+from model.elements import Singlet, PeriodicTable
+
+def add_atoms_from_arrays(mol, atomtypes, positions, bonds, v6):
+    """
+    Make atoms in mol, one at each of positions (an N x 3 array), with
+    the corresponding atomtypes (a sequence, or one AtomType for all of
+    them), and bond them with bonds (an M x 2 array of indices of those
+    atoms), of bond order v6. Return the list of new atoms.
+    """
+    if not isinstance(atomtypes, (list, tuple)):
+        atomtypes = [atomtypes] * len(positions)
+    atoms = map(lambda atomtype, pos: Atom(atomtype, pos, mol),
+                atomtypes, positions)
+    for i, j in bonds.tolist():
+        bond_atoms_faster(atoms[i], atoms[j], v6)
+    return atoms
+
+def add_bondpoints_from_arrays(mol, atoms, owners, positions, v6):
+    """
+    Make bondpoints in mol at positions (a K x 3 array), bonded to
+    the corresponding atoms in atoms given by owners (an array of
+    indices into atoms), with bonds of order v6. Return the list of
+    new bondpoints.
+    """
+    singlet = Singlet.atomtypes[0]
+    bondpoints = []
+    for i, pos in zip(owners.tolist(), positions):
+        bp = Atom(singlet, pos, mol)
+        bond_atoms_faster(atoms[i], bp, v6)
+        bondpoints.append(bp)
+    return bondpoints
+
+def hexagonal_rcov(atomtypes, v6):
+    """
+    Return the distances of bondpoints from atoms of each of the pair of
+    atomtypes (for sublattices 0 and 1 of a HexagonalStructure) along
+    their bonds of order v6 to each other, as Bond.ubp would place them.
+    """
+    return bond_params(atomtypes[0], atomtypes[1], v6)
+
+def add_hexagonal_structure(mol, structure, atomtypes, v6, endings = None):
+    """
+    Make the atoms, bonds and bondpoints of structure
+    (a HexagonalStructure, see geometry/hexagonal_lattice.py) in mol,
+    with the pair of atomtypes for its sublattices 0 and 1 and bonds of
+    order v6. If endings is "Hydrogen", change the bondpoints to
+    hydrogens; if it's "Nitrogen", transmute the atoms with two bonds
+    to nitrogen (sp2). Return the list of new atoms (not including
+    bondpoints or hydrogens).
+    """
+    types = map(lambda s: atomtypes[s], structure.sublattice.tolist())
+    atoms = add_atoms_from_arrays(mol, types, structure.positions,
+                                  structure.bonds, v6)
+    bondpoints = add_bondpoints_from_arrays(mol, atoms,
+                                            structure.bondpoint_owners,
+                                            structure.bondpoint_positions, v6)
+    if endings == "Hydrogen":
+        for bp in bondpoints:
+            bp.Hydrogenate()
+    elif endings == "Nitrogen":
+        dstElem = PeriodicTable.getElement('N')
+        atomtype = dstElem.find_atomtype('sp2')
+        for i in Numeric.nonzero(structure.degrees() == 2).tolist():
+            atoms[i].Transmute(dstElem, force = True, atomtype = atomtype)
+    return atoms
+
+# end
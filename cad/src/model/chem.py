@@ -524,6 +524,12 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
         # it was only valid since chunk's atom order is deterministic
 
     _s_attr__posn = S_DATA #bruce 060308 rewrite
+
+    # If our chunk keeps its atom positions in an AtomStore (see atom_store.py),
+    # our _posn is missing from our __dict__ (see __getattr__), and is
+    # found in row _f_store_row of _f_atom_store.positions instead.
+    _f_atom_store = None
+    _f_store_row = -1
     _s_attr_element = S_DATA
 
     # we'll want an "optional" decl on the following, so they're reset to class attr (or unset) when they equal it:
@@ -1045,6 +1051,10 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
         return
     
     def __getattr__(self, attr): # in class Atom
+        if attr == '_posn':
+            store = self._f_atom_store
+            if store is not None:
+                return store.positions[self._f_store_row]
         assert attr != 'xyz' # temporary: catch bugs in bruce 060308 rewrite
         try:
             return AtomBase.__getattr__(self, attr)
@@ -1285,7 +1295,13 @@ class Atom( PAM_Atom_methods, AtomBase, InvalMixin, StateMixin, Selobj_API):
     setposn_batch = setposn #bruce 060308 rewrite of setposn
 
     def _setposn_no_chunk_or_bond_invals(self, pos): #bruce 060308 (private for Chunk and Atom)
-        self._posn = + pos
+        store = self._f_atom_store
+        if store is None:
+            self._posn = + pos
+        else:
+            store.positions[self._f_store_row] = pos
+            # discard _posn if something (e.g. Undo) assigned it directly
+            self.__dict__.pop('_posn', None)
         _changed_posn_Atoms[self.key] = self #bruce 060322
         if self.jigs: #bruce 050718 added this, for bonds code
             for jig in self.jigs[:]:
@@ -60,7 +60,6 @@ from OpenGL.GL import glPushMatrix
 from OpenGL.GL import glTranslatef
 from OpenGL.GL import glRotatef
 from OpenGL.GL import glPopMatrix
-from OpenGL.GL import glCallList
 from OpenGL.GL import glDisable
 from OpenGL.GL import glEnable
 from OpenGL.GL import glPopName
@@ -109,8 +108,14 @@ from model.ExternalBondSet import ExternalBondSet
 from model.elements import Singlet
 
 from geometry.BoundingBox import BBox
+from geometry.CellIndex import CellIndex
+from model.atom_store import AtomStore
 from graphics.drawing.ColorSorter import ColorSorter
 from graphics.drawing.ColorSorter import ColorSortedDisplayList
+from graphics.drawing.bond_drawer import bulk_bond_cylinders
+from graphics.drawing.bond_drawer import schedule_bond_cylinders
+from graphics.rendering.povray.bulk_writepov import use_bulk_writer
+from graphics.rendering.povray.bulk_writepov import writepov_chunk
 ##from drawer import drawlinelist
 
 ##from constants import PickedColor
@@ -130,8 +135,6 @@ from utilities.constants import diTrueCPK
 from utilities.constants import diDNACYLINDER
 from utilities.constants import diPROTEIN
 
-from utilities.constants import MAX_ATOM_SPHERE_RADIUS 
-from utilities.constants import BBOX_MIN_RADIUS
 
 from utilities.constants import ATOM_CONTENT_FOR_DISPLAY_STYLE
 from utilities.constants import noop
@@ -140,6 +143,8 @@ from utilities.constants import MODEL_PAM3, MODEL_PAM5
 
 from utilities.GlobalPreferences import use_frustum_culling #piotr 080402
 from utilities.GlobalPreferences import pref_show_node_color_in_MT
+from utilities.GlobalPreferences import pref_use_columnar_atom_store
+from utilities.GlobalPreferences import pref_bulk_bond_geometry
 
 from model.elements import PeriodicTable
 
@@ -307,6 +312,11 @@ class Chunk(NodeWithAtomContents, InvalMixin,
     _f_lost_externs = False
     _f_gained_externs = False
 
+    # an AtomStore holding the positions of the atoms in our atlist,
+    # or None (see _recompute_atlist); it's only used when its atlist
+    # is our current one
+    _atom_store = None
+
     protein = None
     
     # ==
@@ -1653,6 +1663,10 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         self.atlist = array(atlist, PyObject) #k it's untested whether making it an array is good or bad
         for atom, i in zip(atlist, range(len(atlist))):
             atom.index = i 
+        if pref_use_columnar_atom_store():
+            self._atom_store = AtomStore(self.atlist)
+        else:
+            self._atom_store = None
         return        
 
     _inputs_for_atpos = ['atlist'] # also incrementally modified by setatomposn [not anymore, 060308]
@@ -1683,8 +1697,12 @@ class Chunk(NodeWithAtomContents, InvalMixin,
 ##                print "fyi: _recompute_atpos sees %r already existing" % attr
 
         atlist = self.atlist # might call _recompute_atlist
-        atpos = map( lambda atom: atom.posn(), atlist ) # atpos, basepos, and atlist must be in same order
-        atpos = A(atpos)
+        store = self._atom_store
+        if store is not None and store.atlist is atlist:
+            atpos = store.get_positions()
+        else:
+            atpos = map( lambda atom: atom.posn(), atlist ) # atpos, basepos, and atlist must be in same order
+            atpos = A(atpos)
         # we must invalidate or fix self.atpos when any of our atoms' positions is changed!
         self.atpos = atpos
 
@@ -1957,17 +1975,11 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         # Frustum culling test # piotr 080331
         # piotr 080401: Do not return yet, because external bonds 
         # may be still drawn.
-        # piotr 080402: Added a correction for the true maximum
-        # DNA CPK atom radius.
-        # Maximum VdW atom radius in PAM3/5 = 5.0 * 1.25 + 0.2 = 6.2
-        # = MAX_ATOM_SPHERE_RADIUS
-        # The default radius used by BBox is equal to sqrt(3*(1.8)^2) =
-        # = 3.11 A, so the difference = approx. 3.1 A = BBOX_MIN_RADIUS
-        # The '0.5' is another 'fuzzy' safety margin, added here just 
-        # to be sure that all objects are within the sphere.
         # piotr 080403: moved the correction here from GLPane.py
-        is_chunk_visible = glpane.is_sphere_visible(self.bbox.center(), 
-                                                    self.bbox.scale() + (MAX_ATOM_SPHERE_RADIUS - BBOX_MIN_RADIUS) + 0.5)
+        # (The correction to our bounding sphere radius for the true maximum
+        #  DNA CPK atom radius is now in chunk_culling.chunk_bounding_sphere,
+        #  which the glpane uses unless it culled all chunks at once.)
+        is_chunk_visible = glpane.is_chunk_visible(self)
 
         if indicate_overlapping_atoms and is_chunk_visible:
             self._indicate_overlapping_atoms()
@@ -2322,6 +2334,11 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         if use_outer_colorsorter:
             ColorSorter.start(None)
                 # [why is this needed? bruce 080707 question]
+
+        bulk_bonds = None
+        if use_outer_colorsorter and pref_bulk_bond_geometry():
+            # external bonds to draw at once, unpicked and picked
+            bulk_bonds = ([], [])
         
         for bond in objects_to_draw:
             # note: bond might be a Bond, or an ExternalBondSet
@@ -2337,12 +2354,25 @@ class Chunk(NodeWithAtomContents, InvalMixin,
                     c1, c2, radius = bond.bounding_lozenge()
                     if not glpane.is_lozenge_visible(c1, c2, radius):
                         continue # skip the bond drawing if culled
-                if bond.should_draw_as_picked():
+                picked = bond.should_draw_as_picked()
+                if picked:
                     color = selColor #bruce 080430 cosmetic improvement
                 else:
                     color = bondcolor
-                bond.draw(glpane, disp, color, drawLevel)
+                if bulk_bonds is not None:
+                    bulk_bonds[picked].append(bond)
+                else:
+                    bond.draw(glpane, disp, color, drawLevel)
             continue
+
+        if bulk_bonds is not None:
+            unpicked_bonds, picked_bonds = bulk_bonds
+            if unpicked_bonds:
+                self._draw_bonds_in_bulk(glpane, unpicked_bonds, disp,
+                                         bondcolor, drawLevel)
+            if picked_bonds:
+                self._draw_bonds_in_bulk(glpane, picked_bonds, disp,
+                                         selColor, drawLevel)
         
         if use_outer_colorsorter:
             ColorSorter.finish()
@@ -2375,10 +2405,22 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         if not model_draw_frame:
             return
         neighborhoodGenerator = model_draw_frame._f_state_for_indicate_overlapping_atoms
-        for atom in self.atoms.itervalues():
-            pos = atom.posn()
-            prior_atoms_too_close = neighborhoodGenerator.region(pos)
+        atlist = self.atlist
+        if not len(atlist):
+            return
+        atpos = self.atpos
+        # find the prior atoms (in other chunks) too close to each atom,
+        # and the pairs of our own atoms too close to each other, in bulk
+        prior_atoms = neighborhoodGenerator.regions(atpos)
+        TOO_CLOSE = neighborhoodGenerator._maxradius
+        indices1, indices2 = CellIndex(atpos, TOO_CLOSE).pairs_within(TOO_CLOSE)
+        for i1, i2 in zip(indices1, indices2):
+            # regard the atom earlier in atlist as the prior one
+            prior_atoms[i2].append(atlist[i1])
+        for i in range(len(atlist)):
+            prior_atoms_too_close = prior_atoms[i]
             if prior_atoms_too_close:
+                atom = atlist[i]
                 # This atom overlaps the prior atoms.
                 # Draw an indicator around it,
                 # and around the prior ones if they don't have one yet.
@@ -2393,8 +2435,8 @@ class Chunk(NodeWithAtomContents, InvalMixin,
                 for prior_atom in prior_atoms_too_close:
                     prior_atom.draw_overlap_indicator((atom,))
                 atom.draw_overlap_indicator(prior_atoms_too_close)
-            neighborhoodGenerator.add(atom)
             continue
+        neighborhoodGenerator.add_atoms(atlist)
         return
 
     def _draw_for_main_display_list(self, glpane, disp0, hd_info, wantlist):
@@ -2436,6 +2478,7 @@ class Chunk(NodeWithAtomContents, InvalMixin,
                     Chunk_SpecialDrawingHandler( self, special_drawing_classes )
         else:
             self.special_drawing_handler = None
+        cull_atoms = not wantlist # (only safe when not making a display list)
         del wantlist
 
         #bruce 050513 optimizing this somewhat; 060608 revising it
@@ -2459,7 +2502,7 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         if delegate_draw_atoms:
             pass # nothing for this is implemented, or yet needed [as of bruce 060608]
         else:
-            self.standard_draw_atoms(glpane, disp0)
+            self.standard_draw_atoms(glpane, disp0, cull_atoms = cull_atoms)
         return
 
     def highlight_color_for_modkeys(self, modkeys):
@@ -2542,7 +2585,7 @@ class Chunk(NodeWithAtomContents, InvalMixin,
             if self.__dict__.has_key('displist') and self.displist.nocolor_dl:
                 apply_material(color)
                 self.pushMatrix()
-                glCallList(self.displist.nocolor_dl)
+                self.displist.draw_nocolor()
                 for extra_displist in self.extra_displists.itervalues():
                     extra_displist.draw_nocolor_dl()
                 self.popMatrix()
@@ -2670,7 +2713,7 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         """
         return color
 
-    def standard_draw_atoms(self, glpane, disp0): #bruce 060608 split this out of _draw_for_main_display_list
+    def standard_draw_atoms(self, glpane, disp0, cull_atoms = False): #bruce 060608 split this out of _draw_for_main_display_list
         """
         [private submethod of self.draw:]
         
@@ -2678,8 +2721,15 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         *including* atom selection wireframes, as if self's display mode was disp0;
         this occurs inside our local coordinate system and display-list-making;
         it doesn't occur if atom drawing is delegated to our display mode.
+
+        If cull_atoms is true (only allowed when we're not making a display
+        list), skip atoms which glpane.visible_atom_keys says are outside
+        the view frustum.
         """
         drawLevel = self.assy.drawLevel
+        visible_atoms = None
+        if cull_atoms:
+            visible_atoms = glpane.visible_atom_keys(self) # usually None
         drawn = {}
         ## self.externs = [] # bruce 050513 removing this
         # bruce 041014 hack for extrude -- use _colorfunc if present [part 1; optimized 050513]
@@ -2694,7 +2744,15 @@ class Chunk(NodeWithAtomContents, InvalMixin,
 
         bondcolor = atomcolor # never changed below
 
+        bulk_bonds = None
+        if _dispfunc is None and pref_bulk_bond_geometry():
+            # internal bonds to draw at once, after all the atoms
+            # (ok since they're all drawn with disp0 and bondcolor)
+            bulk_bonds = []
+
         for atom in self.atoms.itervalues(): #bruce 050513 using itervalues here (probably safe, speed is needed)
+            if visible_atoms is not None and not visible_atoms.has_key(atom.key):
+                continue # outside the view frustum (its internal bonds are drawn with their other atoms)
             try:
                 color = atomcolor # might be modified before use
                 disp = disp0 # might be modified before use
@@ -2757,9 +2815,12 @@ class Chunk(NodeWithAtomContents, InvalMixin,
                             else:
                                 # internal bond, not yet drawn
                                 drawn[id(bond)] = bond
-                                bond.draw(glpane, disp, bondcolor, drawLevel,
-                                          special_drawing_handler = self.special_drawing_handler
-                                          )  
+                                if bulk_bonds is not None:
+                                    bulk_bonds.append(bond)
+                                else:
+                                    bond.draw(glpane, disp, bondcolor, drawLevel,
+                                              special_drawing_handler = self.special_drawing_handler
+                                              )  
             except:
                 # [bruce 041028 general workaround to make bugs less severe]
                 # exception in drawing one atom. Ignore it and try to draw the
@@ -2776,8 +2837,40 @@ class Chunk(NodeWithAtomContents, InvalMixin,
                     pass
                 else:
                     print "Source of current atom:", atom_source
+        if bulk_bonds:
+            self._draw_bonds_in_bulk(glpane, bulk_bonds, disp0, bondcolor,
+                                     drawLevel, positions = self.basepos)
         return # from standard_draw_atoms (submethod of _draw_for_main_display_list)
 
+    def _draw_bonds_in_bulk(self, glpane, bonds, disp, color, drawLevel,
+                            positions = None):
+        """
+        [private submethod of standard_draw_atoms and _draw_external_bonds]
+
+        Draw bonds (internal bonds of self, using positions, which should
+        be self.basepos, or external bonds if positions is None) as
+        bond.draw(glpane, disp, color, drawLevel) would, computing the
+        cylinders of the plain ones all at once (see bulk_bond_cylinders).
+        """
+        # (all cylinders are computed before any is scheduled, so if that
+        #  fails, no bond has been drawn yet when we draw them one at a time)
+        try:
+            cylinders, others = bulk_bond_cylinders(bonds, disp, color, glpane,
+                                                    positions = positions)
+        except:
+            print_compact_traceback("exception in computing bonds in bulk; "
+                                    "drawing them one at a time: ")
+            cylinders, others = [], bonds
+        schedule_bond_cylinders(cylinders)
+        if positions is not None:
+            special_drawing_handler = self.special_drawing_handler
+        else:
+            special_drawing_handler = None # as in _draw_external_bonds
+        for bond in others:
+            bond.draw(glpane, disp, color, drawLevel,
+                      special_drawing_handler = special_drawing_handler)
+        return
+
     def overdraw_hotspot(self, glpane, disp): # bruce 050131 (atom_debug only); [unknown later date] now always active
         """
         If this chunk is a (toplevel) clipboard item with a hotspot
@@ -3045,12 +3138,15 @@ class Chunk(NodeWithAtomContents, InvalMixin,
             # bruce 070928 bugfix: use repeated_bonds_dict
             # instead of a per-chunk dict, so we don't
             # draw external bonds twice
-        for atom in self.atoms.values():
-            atom.writepov(file, disp, self.color)
-            for bond in atom.bonds:
-                if id(bond) not in drawn:
-                    drawn[id(bond)] = bond
-                    bond.writepov(file, disp, self.color)
+        if use_bulk_writer():
+            writepov_chunk(self, file, disp, drawn)
+        else:
+            for atom in self.atoms.values():
+                atom.writepov(file, disp, self.color)
+                for bond in atom.bonds:
+                    if id(bond) not in drawn:
+                        drawn[id(bond)] = bond
+                        bond.writepov(file, disp, self.color)
                     
         # piotr 080521
         # write POV-Ray file for the ChunkDisplayMode
@@ -3088,7 +3184,11 @@ class Chunk(NodeWithAtomContents, InvalMixin,
             # bbox already present -- moving it is faster than recomputing it
             #e (though it might be faster to just delete it, if many moves
             #   will happen before we need it again)
-            self.bbox.data += offset
+            # (Make a new bbox rather than moving the old one in place,
+            #  so a ChunkCuller can tell we moved by its identity.)
+            bbox = BBox()
+            bbox.data = self.bbox.data + offset
+            self.bbox = bbox
 
         # Now, do the move. Note that this might destructively modify the object
         # self.basecenter rather than replacing it with a new one.
@@ -3249,10 +3349,30 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         assert self.__dict__.has_key('atlist')
         atlist = self.atlist
         assert len(atlist) == len(atpos)
+        store = self._atom_store
+        if store is not None and store.atlist is atlist:
+            store.set_positions( atpos, self.atoms)
+            return
         for i in xrange(len(atlist)):
             atlist[i]._setposn_no_chunk_or_bond_invals( atpos[i] )
         return
 
+    def _f_use_atom_store(self):
+        """
+        [friend method for simulation.frame_delivery]
+        If pref_use_columnar_atom_store is on, make sure our atom positions
+        are kept in an AtomStore for our current atlist (even if it was
+        off when atlist was computed), so that set_atom_posns_from_atpos
+        and recomputing atpos handle all our atoms at once.
+        Return our atlist.
+        """
+        atlist = self.atlist
+        if pref_use_columnar_atom_store():
+            store = self._atom_store
+            if store is None or store.atlist is not atlist:
+                self._atom_store = AtomStore(atlist)
+        return atlist
+
     def base_to_abs(self, anything): # bruce 041115
         """
         map anything (which is accepted by quat.rot() and Numeric.array's '+' method)
@@ -3693,7 +3813,7 @@ class Chunk(NodeWithAtomContents, InvalMixin,
     # and many other bugs (mostly never reported). [bruce 041214]
     # (We should use this in extrude, too! #e)
 
-    def findAtomUnderMouse( self, point, matrix, **kws):
+    def findAtomUnderMouse( self, point, matrix, candidates = None, **kws):
         """
         [Public method, but for a more convenient interface see its caller:]
         For each visible atom or singlet (using current display modes and radii,
@@ -3718,12 +3838,25 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         do for individual molecules (it would make them fail to obscure atoms in
         other molecules for selection, even when they are drawn over them).
         See our caller in assembly for that.
+           If candidates is provided, it's a Numeric array of the indices
+        (in self.atlist) of the only atoms to consider (e.g. those whose
+        selection spheres a PickIndex found to be hit by the line);
+        selatom is considered in any case.
         """
         if not self.atoms:
             return []
         #e Someday also check self.bbox as a speedup -- but that might be slower
         #  when there are only a few atoms.
         atpos = self.atpos # a Numeric array; might be recomputed here
+        selatom = self.assy.o.selatom
+        if candidates is not None:
+            if selatom is not None and selatom.molecule is self and \
+               not Numeric.sometrue(candidates == selatom.index):
+                candidates = Numeric.concatenate((candidates, [selatom.index]))
+            if not len(candidates):
+                return []
+            atpos = Numeric.take(atpos, candidates)
+            kws['atom_indices'] = candidates
 
         # assume line of sight hits water surface (parallel to screen) at point
         # (though the docstring doesn't mention this assumption since it is
@@ -3757,11 +3890,14 @@ class Chunk(NodeWithAtomContents, InvalMixin,
 
         radii_2 = self.get_sel_radii_squared() # might be recomputed now
         assert len(radii_2) == len(self.atoms)
-        selatom = self.assy.o.selatom
+        if candidates is not None:
+            radii_2 = Numeric.take(radii_2, candidates) # (a copy, so patching it is harmless)
         unpatched_seli_radius2 = None
         if selatom is not None and selatom.molecule is self:
             # need to patch for selatom, and warn subr of its smaller radii too
             seli = selatom.index
+            if candidates is not None:
+                seli = Numeric.nonzero(candidates == seli)[0]
             unpatched_seli_radius2 = radii_2[seli]
             radii_2[seli] = selatom.selatom_radius() ** 2
             # (note: selatom is drawn even if "invisible")
@@ -3778,9 +3914,12 @@ class Chunk(NodeWithAtomContents, InvalMixin,
         return res # from findAtomUnderMouse
 
     def findAtomUnderMouse_Numeric_stuff(self, v, r_xy_2, radii_2,
-                                         far_cutoff = None, near_cutoff = None, alt_radii = [] ):
+                                         far_cutoff = None, near_cutoff = None, alt_radii = [],
+                                         atom_indices = None ):
         """
         private helper routine for findAtomUnderMouse
+        (atom_indices, if provided, gives the index in self.atlist
+         of each atom in the other arrays)
         """
         ## removed support for backs_ok, since atom backs are not drawn
         from Numeric import take, nonzero, compress # and more...
@@ -3859,6 +3998,8 @@ class Chunk(NodeWithAtomContents, InvalMixin,
             if closest_z < far_cutoff:
                 return []
 
+        if atom_indices is not None:
+            closest_z_ind = atom_indices[ closest_z_ind ]
         atom = self.atlist[ closest_z_ind ]
 
         return [(closest_z, atom)] # from findAtomUnderMouse_Numeric_stuff
@@ -215,6 +215,7 @@ class Jig(NodeWith3DContents, Selobj_API):
             # intended to fix bug 2561 more safely than the prior change [bruce 071010]
             self._remove_all_atoms() 
         self.atoms = list(atomList) # copy the list
+        self._f_changed_for_undo()
         for atom in atomList:
             if self in atom.jigs:
                 print "bug: %r is already in %r.jigs, just before we want" \
@@ -436,6 +437,7 @@ class Jig(NodeWith3DContents, Selobj_API):
         """
         #bruce 071127 renamed this Jig API method, rematom -> remove_atom
         self.atoms.remove(atom)
+        self._f_changed_for_undo()
         # also remove self from atom's list of jigs
         atom._f_jigs_remove(self,
                             changed_structure = self._affects_atom_structure )
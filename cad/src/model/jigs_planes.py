@@ -84,6 +84,7 @@ class RectGadget(Jig):
         if self.atoms:
             print "fyi: bug? setAtoms overwrites existing atoms on %r" % self
         self.atoms = list(atomlist)
+        self._f_changed_for_undo()
         
         
     def __init_quat_center(self, list):
@@ -33,18 +33,26 @@ TODO: make this directly accessible as one or more user operations.
 
 import math
 
-from geometry.VQT import vlen
+import Numeric
+from Numeric import Float, Int
+
+from geometry.VQT import vlen, A
 from geometry.VQT import atom_angle_radians
 
 import foundation.env as env
 
 from model.bonds import bond_atoms_faster
-from geometry.NeighborhoodGenerator import NeighborhoodGenerator
+from geometry.CellIndex import CellIndex
 
 from model.bond_constants import atoms_are_bonded # was: from bonds import bonded
 from model.bond_constants import V_SINGLE
 from model.bond_constants import bond_params
 
+from processes.parallel_map import parallel_map
+from processes.parallel_map import can_fork, number_of_processors
+
+from utilities.GlobalPreferences import pref_parallel_bond_inference
+
 # constants; angles are in radians
 
 degrees = math.pi / 180
@@ -94,10 +102,24 @@ def idealBondLength(atm1, atm2):
     @see: similar function, ideal_bond_length in bond_constants.py
           (not directly useable by this function)
     """
+    return ideal_bond_length_of_elements(atm1.element, atm2.element)
+
+_ideal_bond_lengths = {} # (element1, element2) -> ideal single bond length
+
+def ideal_bond_length_of_elements(elt1, elt2):
+    """
+    Return the ideal length of a single bond between atoms of elements
+    elt1 and elt2 with their default atomtypes (see idealBondLength).
+    """
+    try:
+        return _ideal_bond_lengths[(elt1, elt2)]
+    except KeyError:
+        pass
     # don't use getEquilibriumDistanceForBond directly, in case pyrex sim (ND-1)
     # is not available [bruce 060620]
-    r1, r2 = bond_params(atm1.element.atomtypes[0], atm2.element.atomtypes[0], V_SINGLE)
-    return r1 + r2
+    r1, r2 = bond_params(elt1.atomtypes[0], elt2.atomtypes[0], V_SINGLE)
+    res = _ideal_bond_lengths[(elt1, elt2)] = r1 + r2
+    return res
 
 def max_atom_bonds(atom, special_cases={'H':  1,
                                         'B':  4,
@@ -190,9 +212,13 @@ non-hungry.) The other place is atm_distance_cost, another case
 where there are two atoms involved. I think it applies there too.
 """
 
+def is_hungry(atm):
+    """
+    Does atm have fewer bonds than any of its element's atomtypes needs?
+    """
+    return len(atm.realNeighbors()) < min_atom_bonds(atm)
+
 def max_dist_ratio(atm1, atm2):
-    def is_hungry(atm):
-        return len(atm.realNeighbors()) < min_atom_bonds(atm)
     if is_hungry(atm1) or is_hungry(atm2):
         return MAX_DIST_RATIO_HUNGRY
     else:
@@ -321,35 +347,48 @@ def bond_cost(atm1, atm2):
     ec = bond_element_cost(atm1, atm2)
     return ac + dc + ec
 
-def list_potential_bonds(atmlist0):
+def list_potential_bonds(atmlist0, processes = 1):
     """
     Given a list of atoms, return a list of triples (cost, atm1, atm2) for all bondable pairs of atoms in the list.
     Each pair of atoms is considered separately, as if only it would be bonded, in addition to all existing bonds.
     In other words, the returned bonds can't necessarily all be made (due to atom valence), but any one alone can be made,
     in addition to whatever bonds the atoms currently have.
-       Warning: the current implementation takes quadratic time in len(atmlist0). The return value will have reasonable
-    size for physically realistic atmlists, but could be quadratic in size for unrealistic ones (e.g. if all atom
-    positions were compressed into a small region of space).
+       Candidate pairs are found in bulk by candidate_pairs (in up to processes processes, see parallel_candidate_pairs),
+    using the per-element-pair maximum lengths and each atom's hunger, so only pairs that pass the length test are
+    examined in Python. The return value will have reasonable size for physically realistic atmlists, but could be quadratic
+    in size for unrealistic ones (e.g. if all atom positions were compressed into a small region of space).
     """
     atmlist = filter( bondable_atm, atmlist0 )
     lst = []
     maxBondLength = 2.0
-    ngen = NeighborhoodGenerator(atmlist, maxBondLength)
-    for atm1 in atmlist:
-        key1 = atm1.key
-        pos1 = atm1.posn()
-        for atm2 in ngen.region(pos1):
-            bondLen = vlen(pos1 - atm2.posn())
-            idealBondLen = idealBondLength(atm1, atm2)
-            if atm2.key < key1 and bondLen < max_dist_ratio(atm1, atm2) * idealBondLen:
-                # i.e. for each pair (atm1, atm2) of bondable atoms
-                cost = bond_cost(atm1, atm2)
-                if cost is not None:
-                    lst.append((cost, atm1, atm2))
+    elements, codes = element_codes(atmlist)
+    ideal = ideal_bond_length_table(elements)
+    # (hungry atoms permit the longest bonds; see max_dist_ratio)
+    maxdist = Numeric.minimum(ideal * MAX_DIST_RATIO_HUNGRY, maxBondLength)
+    positions = A([atm.posn() for atm in atmlist])
+    indices1, indices2, distances = parallel_candidate_pairs(
+        positions, codes, maxdist, processes = processes)
+    hungry = Numeric.array(map(is_hungry, atmlist))
+    ratios = Numeric.where(Numeric.logical_or(Numeric.take(hungry, indices1),
+                                              Numeric.take(hungry, indices2)),
+                           MAX_DIST_RATIO_HUNGRY, MAX_DIST_RATIO_NON_HUNGRY)
+    ok = Numeric.less(distances, ratios * pair_values(ideal, codes, indices1, indices2))
+    indices1 = Numeric.compress(ok, indices1)
+    indices2 = Numeric.compress(ok, indices2)
+    for i1, i2 in zip(indices1.tolist(), indices2.tolist()):
+        atm1 = atmlist[i1]
+        atm2 = atmlist[i2]
+        if atm2.key > atm1.key:
+            atm1, atm2 = atm2, atm1
+        # now atm2.key < atm1.key, as the old per-atom loop required
+        # (which matters for the tie-breaking order of lst.sort() below)
+        cost = bond_cost(atm1, atm2)
+        if cost is not None:
+            lst.append((cost, atm1, atm2))
     lst.sort() # least cost first
     return lst
 
-def make_bonds(atmlist, bondtyp = V_SINGLE):
+def make_bonds(atmlist, bondtyp = V_SINGLE, processes = 1):
     """
     Make some bonds between the given atoms. At any moment make the cheapest permitted unmade bond;
     stop only when no more bonds are permitted (i.e. all potential bonds have infinite cost).
@@ -358,11 +397,13 @@ def make_bonds(atmlist, bondtyp = V_SINGLE):
     when their cost has increased since last checked;
     it's true since the bond cost (as defined elsewhere in this module) is a sum of terms,
     and adding a bond can add new terms but doesn't change the value of any existing terms.)
+       The candidate pairs can be found in up to processes processes (see list_potential_bonds);
+    the bonds are always made serially, here.
        Return the number of bonds created.
     """
     # Implementation note: the only way I know of to do this efficiently is to use a linked list
     # (as the Lisp code did), even though this is less natural in Python.
-    bondlst0 = list_potential_bonds(atmlist) # a list of triples (cost, atm1, atm2)
+    bondlst0 = list_potential_bonds(atmlist, processes) # a list of triples (cost, atm1, atm2)
     bondlst = linked_list(bondlst0, list) # arg2 (list) is a function to turn the triple (cost, atm1, atm2) into a list.
         # value is a list [[cost, atm1, atm2], next]; needs to be mutable in next and cost elements
         # (Note: Lisp code used a Lisp linked list of triples, (cost atm1 atm2 . next), but all Lisp lists are mutable.)
@@ -400,7 +441,7 @@ def make_bonds(atmlist, bondtyp = V_SINGLE):
 
 # ==
 
-def inferBonds(mol): # [probably by Will; TODO: needs docstring]
+def inferBonds(mol, processes = 1): # [probably by Will; TODO: needs docstring]
     
     #bruce 071030 moved this from bonds.py to bonds_from_atoms.py
     
@@ -409,24 +450,280 @@ def inferBonds(mol): # [probably by Will; TODO: needs docstring]
     # first remove any coincident singlets
     singlets = filter(lambda a: a.is_singlet(), mol.atoms.values())
     removable = { }
-    sngen = NeighborhoodGenerator(singlets, maxBondLength)
-    for sing1 in singlets:
-        key1 = sing1.key
-        pos1 = sing1.posn()
-        for sing2 in sngen.region(pos1):
-            key2 = sing2.key
-            dist = vlen(pos1 - sing2.posn())
-            if key1 != key2:
-                removable[key1] = sing1
-                removable[key2] = sing2
+    index = CellIndex(A([sing.posn() for sing in singlets]), maxBondLength)
+    indices1, indices2 = index.pairs_within(maxBondLength)
+    for i1, i2 in zip(indices1, indices2):
+        sing1 = singlets[i1]
+        sing2 = singlets[i2]
+        removable[sing1.key] = sing1
+        removable[sing2.key] = sing2
     for badGuy in removable.values():
         badGuy.kill()
-    from operations.bonds_from_atoms import make_bonds
-    make_bonds(mol.atoms.values())
+    make_bonds(mol.atoms.values(), processes = processes)
     return
 
 # ==
 
+# Bond inference from distances and covalent radii alone, done in bulk;
+# much faster than inferBonds for large structures (e.g. PDB files of
+# proteins), though it ignores bond angles.
+
+COVALENT_BOND_TOLERANCE = 0.4 # bond if closer than sum of covalent radii plus this (Angstroms)
+MIN_BOND_DISTANCE = 0.4 # closer pairs are coincident atoms, not bonded ones
+
+def covalent_bond_pairs(positions, radii, tolerance = COVALENT_BOND_TOLERANCE,
+                        processes = 1):
+    """
+    Find the candidate bonds among some atoms, given only their positions
+    (an N x 3 array) and covalent radii (a length N array): the pairs
+    closer than the sum of their radii plus tolerance, but not closer
+    than MIN_BOND_DISTANCE. They are found in bulk by candidate_pairs
+    (in up to processes processes), with no Python code per atom or pair.
+
+    @return: (indices1, indices2, ratios), three equal-length arrays
+             listing each pair once, with ratios[m] being the distance
+             between atoms indices1[m] and indices2[m] divided by the
+             sum of their radii, sorted by increasing ratio.
+    """
+    radii = Numeric.array(radii, Float)
+    unique_radii = {}
+    for radius in radii.tolist():
+        unique_radii[radius] = 1
+    unique_radii = unique_radii.keys()
+    unique_radii.sort()
+    unique_radii = Numeric.array(unique_radii, Float)
+    codes = Numeric.searchsorted(unique_radii, radii)
+    return _covalent_pairs(positions, codes, unique_radii, tolerance, processes)
+
+def _covalent_pairs(positions, codes, radii, tolerance, processes):
+    """
+    [private helper for covalent_bond_pairs and
+     infer_bonds_from_covalent_radii]
+    Like covalent_bond_pairs, but given the atoms' radii as codes
+    (indices into radii, one for each kind of atom).
+    """
+    sums = Numeric.add.outer(radii, radii)
+    indices1, indices2, distances = parallel_candidate_pairs(
+        positions, codes, sums + tolerance, MIN_BOND_DISTANCE, processes)
+    ratios = distances / \
+             Numeric.maximum(pair_values(sums, codes, indices1, indices2), 0.01)
+    # stable, so that ties are broken the same way however the pairs were found
+    order = _stable_argsort(ratios)
+    return (Numeric.take(indices1, order),
+            Numeric.take(indices2, order),
+            Numeric.take(ratios, order))
+
+def infer_bonds_from_covalent_radii(atoms, positions = None,
+                                    tolerance = COVALENT_BOND_TOLERANCE,
+                                    processes = 1):
+    """
+    Make single bonds between the given atoms (a sequence of Atoms,
+    e.g. just read from a PDB file), using covalent_bond_pairs to find
+    candidates by distance (in up to processes processes),
+    and making them in order of increasing distance relative to their
+    ideal length, except for bonds which would give an atom more than
+    max_atom_bonds, or which already exist. Doesn't make or remove
+    bondpoints.
+
+    @param positions: the atoms' positions as an N x 3 array,
+                      if the caller already has one.
+
+    @return: the number of bonds made.
+    """
+    atoms = list(atoms)
+    if positions is None:
+        positions = [atom.posn() for atom in atoms]
+    elements, codes = element_codes(atoms)
+    radii = Numeric.array([float(elt.atomtypes[0].rcovalent)
+                           for elt in elements], Float)
+    maxbonds_of_element = {}
+    for atom in atoms:
+        if not maxbonds_of_element.has_key(atom.element):
+            maxbonds_of_element[atom.element] = max_atom_bonds(atom)
+    maxbonds = [maxbonds_of_element[elt] for elt in elements]
+    maxbonds = [maxbonds[code] for code in codes.tolist()]
+    indices1, indices2, ratios = _covalent_pairs(positions, codes, radii,
+                                                 tolerance, processes)
+    nbonds = [len(atom.bonds) for atom in atoms]
+    res = 0
+    for i1, i2 in zip(indices1.tolist(), indices2.tolist()):
+        if nbonds[i1] < maxbonds[i1] and nbonds[i2] < maxbonds[i2]:
+            atom1, atom2 = atoms[i1], atoms[i2]
+            if nbonds[i1] and nbonds[i2] and atoms_are_bonded(atom1, atom2):
+                continue # e.g. from a CONECT record
+            bond_atoms_faster(atom1, atom2, V_SINGLE)
+            nbonds[i1] += 1
+            nbonds[i2] += 1
+            res += 1
+    return res
+
+# ==
+
+# Candidate bond pairs found in bulk, from coordinate arrays alone.
+#
+# These functions are pure (they neither use nor change atoms), so for
+# very large inputs the work can be divided among several forked
+# processes (see parallel_candidate_pairs); the callers above then make
+# the bonds serially. Distance limits depend only on the pair of
+# "kinds" of the two atoms (usually their elements), and are given as
+# a K x K table indexed by an Int code for each atom's kind.
+
+PARALLEL_MIN_ATOMS = 50000 # don't fork for fewer atoms than this
+
+_NO_PAIRS = (Numeric.zeros((0,), Int),
+             Numeric.zeros((0,), Int),
+             Numeric.zeros((0,), Float))
+
+def element_codes(atoms):
+    """
+    Return (elements, codes), where elements lists the distinct elements
+    of the given atoms, and codes is an Int array giving the index in
+    elements of each atom's element.
+    """
+    elements = []
+    code_of_element = {}
+    codes = []
+    for atom in atoms:
+        elt = atom.element
+        code = code_of_element.get(elt)
+        if code is None:
+            code = code_of_element[elt] = len(elements)
+            elements.append(elt)
+        codes.append(code)
+    return elements, Numeric.array(codes, Int)
+
+def ideal_bond_length_table(elements):
+    """
+    Return a K x K array of the ideal single bond lengths between atoms
+    of the given K elements (see ideal_bond_length_of_elements).
+    """
+    res = Numeric.zeros((len(elements), len(elements)), Float)
+    for i in range(len(elements)):
+        for j in range(len(elements)):
+            res[i, j] = ideal_bond_length_of_elements(elements[i], elements[j])
+    return res
+
+def pair_values(table, codes, indices1, indices2):
+    """
+    Return the values in table (a K x K array) for the pairs of atoms
+    indices1[m], indices2[m], whose kinds are given by codes.
+    """
+    return Numeric.take(Numeric.ravel(table),
+                        Numeric.take(codes, indices1) * len(table) +
+                        Numeric.take(codes, indices2))
+
+def candidate_pairs(positions, codes, maxdist, mindist = 0.0):
+    """
+    Find all pairs of atoms whose distance d satisfies
+    mindist <= d < maxdist[kind1, kind2], given the atom positions
+    (an N x 3 array), the kind of each atom (codes, an Int array of
+    indices into the K x K array maxdist), and mindist.
+
+    @return: (indices1, indices2, distances), three equal-length arrays,
+             with indices1[m] < indices2[m], listing each pair once,
+             sorted by (indices1, indices2).
+    """
+    positions = Numeric.array(positions, Float)
+    n = len(positions)
+    if n < 2:
+        return _NO_PAIRS
+    cutoff = Numeric.maximum.reduce(Numeric.ravel(maxdist))
+    if cutoff <= 0:
+        return _NO_PAIRS
+    index = CellIndex(positions, cutoff)
+    indices1, indices2 = index.pairs_within(cutoff)
+    deltas = Numeric.take(positions, indices1) - Numeric.take(positions, indices2)
+    distances = Numeric.sqrt(Numeric.add.reduce(deltas * deltas, 1))
+    limits = pair_values(maxdist, codes, indices1, indices2)
+    ok = Numeric.logical_and(Numeric.less(distances, limits),
+                             Numeric.greater_equal(distances, mindist))
+    return _sorted_pairs(Numeric.compress(ok, indices1),
+                         Numeric.compress(ok, indices2),
+                         Numeric.compress(ok, distances),
+                         n)
+
+def _sorted_pairs(indices1, indices2, distances, n):
+    """
+    [private helper for candidate_pairs and parallel_candidate_pairs]
+    Sort pairs of indices less than n, and their distances, by
+    (indices1, indices2), so their order doesn't depend on how they
+    were found.
+    """
+    # (a Float key, since i1 * n might overflow a 32-bit Int)
+    order = Numeric.argsort(indices1 * float(n) + indices2)
+    return (Numeric.take(indices1, order),
+            Numeric.take(indices2, order),
+            Numeric.take(distances, order))
+
+def parallel_candidate_pairs(positions, codes, maxdist, mindist = 0.0,
+                             processes = None):
+    """
+    Return the same value as candidate_pairs, but compute it in up to
+    processes (default number_of_processors()) forked processes, when
+    there are at least PARALLEL_MIN_ATOMS atoms and os.fork is available.
+
+    Space is divided into one slab per process, by quantiles of the atoms'
+    x coordinates. Each process finds the pairs among its slab's atoms
+    (its "core") and the atoms to their right within the largest maxdist
+    (its "halo"), keeping the ones with at least one core atom, so every
+    pair is found by exactly one process (the one whose core holds the
+    leftmost atom of the pair).
+    """
+    positions = Numeric.array(positions, Float)
+    n = len(positions)
+    if processes is None:
+        processes = number_of_processors()
+    if processes <= 1 or n < PARALLEL_MIN_ATOMS or not can_fork():
+        return candidate_pairs(positions, codes, maxdist, mindist)
+    cutoff = Numeric.maximum.reduce(Numeric.ravel(maxdist))
+    order = Numeric.argsort(positions[:,0])
+    xs = Numeric.take(positions[:,0], order)
+    slabs = [] # (lo, hi, end): core is order[lo:hi], halo is order[hi:end]
+    for k in range(processes):
+        lo = k * n / processes
+        hi = (k + 1) * n / processes
+        end = Numeric.searchsorted(xs, xs[hi - 1] + cutoff)
+        slabs.append((lo, hi, max(hi, end)))
+    def slab_pairs(slab):
+        lo, hi, end = slab
+        members = order[lo:end]
+        indices1, indices2, distances = candidate_pairs(
+            Numeric.take(positions, members), Numeric.take(codes, members),
+            maxdist, mindist)
+        ncore = hi - lo
+        core = Numeric.logical_or(Numeric.less(indices1, ncore),
+                                  Numeric.less(indices2, ncore))
+        indices1 = Numeric.take(members, Numeric.compress(core, indices1))
+        indices2 = Numeric.take(members, Numeric.compress(core, indices2))
+        return (Numeric.minimum(indices1, indices2),
+                Numeric.maximum(indices1, indices2),
+                Numeric.compress(core, distances))
+    results = parallel_map(slab_pairs, slabs, processes)
+    return _sorted_pairs(Numeric.concatenate([r[0] for r in results]),
+                         Numeric.concatenate([r[1] for r in results]),
+                         Numeric.concatenate([r[2] for r in results]),
+                         n)
+
+def _stable_argsort(values):
+    """
+    Like Numeric.argsort(values) for a 1-D array, but keeping equal values
+    in their original order (which Numeric.argsort doesn't promise).
+    """
+    n = len(values)
+    ranks = Numeric.searchsorted(Numeric.sort(values), values)
+    return Numeric.argsort(ranks * float(n) + Numeric.arange(n))
+
+def bond_inference_processes():
+    """
+    Return the number of processes that bond inference from atom
+    positions should use to find candidate pairs, as set by a debug_pref.
+    """
+    if pref_parallel_bond_inference():
+        return number_of_processors()
+    return 1
+
+# ==
+
 from utilities.debug import register_debug_menu_command
 
 def remake_bonds_in_selection( glpane ):
@@ -469,7 +766,7 @@ def remake_bonds_in_selection( glpane ):
         atm.set_atomtype(atm.element.atomtypes[0]) ###k this might remake singlets if it changes atomtype
         #e future optim: revise above to also destroy singlets and bonds to them
         # (btw I think make_bonds doesn't make any singlets as it runs)
-    n_bonds_made = make_bonds(atmlist)
+    n_bonds_made = make_bonds(atmlist, processes = bond_inference_processes())
         #e it would be nice to figure out how many of these are the same as the ones we destroyed, etc
     for atm in atmlist:
         atm.remake_bondpoints()
@@ -484,4 +781,52 @@ def remake_bonds_in_selection( glpane ):
 
 register_debug_menu_command( "Remake Bonds", remake_bonds_in_selection )
 
+# ==
+
+def _diamond_positions(n):
+    """
+    [for _benchmark]
+    Return the positions of at least n atoms of a cubic block of
+    diamond lattice (8 atoms per unit cell of side 3.567 Angstroms).
+    """
+    cells = int(math.ceil((n / 8.0) ** (1.0 / 3)))
+    basis = Numeric.array([(0, 0, 0), (0, 2, 2), (2, 0, 2), (2, 2, 0),
+                           (1, 1, 1), (1, 3, 3), (3, 1, 3), (3, 3, 1)],
+                          Float) * (3.567 / 4)
+    ijk = Numeric.indices((cells, cells, cells))
+    corners = Numeric.transpose(Numeric.reshape(ijk, (3, -1))) * 3.567
+    positions = Numeric.reshape(corners, (-1, 1, 3)) + \
+                Numeric.reshape(basis, (1, -1, 3))
+    return Numeric.reshape(positions, (-1, 3))
+
+def _benchmark(n = 500000, processes = None):
+    """
+    Print the throughput of candidate_pairs and parallel_candidate_pairs
+    for a diamond lattice block of about n carbon atoms (bonded if closer
+    than 2 Angstroms), and check that they find the same pairs.
+    """
+    import time
+    if processes is None:
+        processes = max(2, number_of_processors())
+    positions = _diamond_positions(n)
+    codes = Numeric.zeros(len(positions), Int)
+    maxdist = Numeric.array([[2.0]])
+    t0 = time.time()
+    serial = candidate_pairs(positions, codes, maxdist)
+    t1 = time.time()
+    parallel = parallel_candidate_pairs(positions, codes, maxdist,
+                                        processes = processes)
+    t2 = time.time()
+    for a, b in zip(serial, parallel):
+        assert Numeric.alltrue(Numeric.equal(a, b))
+    for name, secs in [("serial", t1 - t0),
+                       ("%d processes" % processes, t2 - t1)]:
+        print "%d atoms, %d pairs, %s: %.2f sec, %.0f atoms/sec" % \
+              (len(positions), len(serial[0]), name, secs,
+               len(positions) / secs)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
 #end
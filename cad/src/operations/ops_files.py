@@ -40,6 +40,8 @@ from model.assembly import Assembly
 from model.chem import move_alist_and_snuggle
 
 from simulation.runSim import readGromacsCoordinates
+from simulation.coordinate_files import read_gromacs_positions
+from simulation.frame_delivery import apply_frame
 
 from files.pdb.files_pdb import insertpdb, writepdb
 from files.pdb.files_pdb import EXCLUDE_BONDPOINTS, EXCLUDE_HIDDEN_ATOMS
@@ -63,6 +65,7 @@ from utilities.prefs_constants import toolbar_state_prefs_key
 
 from utilities.debug_prefs import Choice_boolean_False
 from utilities.debug_prefs import debug_pref
+from utilities.GlobalPreferences import pref_bulk_minimize_results
 
 from utilities.constants import SUCCESS, ABORTED, READ_ERROR
 from utilities.constants import str_or_unicode
@@ -1139,10 +1142,15 @@ class fileSlotsMixin: #bruce 050907 moved these methods out of class MWsemantics
                 isMMPFile = True
                 if ok == SUCCESS and (gromacsCoordinateFile):
                     #bruce 080606 added condition ok == SUCCESS (likely bugfix) 
-                    newPositions = readGromacsCoordinates(gromacsCoordinateFile, listOfAtoms)
-                    if (type(newPositions) == type([])):
-                        move_alist_and_snuggle(listOfAtoms, newPositions)
+                    if pref_bulk_minimize_results():
+                        newPositions = read_gromacs_positions(gromacsCoordinateFile, listOfAtoms)
+                        if (type(newPositions) != type("")):
+                            apply_frame(None, listOfAtoms, newPositions)
                     else:
+                        newPositions = readGromacsCoordinates(gromacsCoordinateFile, listOfAtoms)
+                        if (type(newPositions) == type([])):
+                            move_alist_and_snuggle(listOfAtoms, newPositions)
+                    if (type(newPositions) == type("")):
                         env.history.message(redmsg(newPositions))
             
             if ok == SUCCESS:
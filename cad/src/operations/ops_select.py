@@ -30,6 +30,8 @@ from utilities.debug import print_compact_traceback
 from utilities import debug_flags
 from platform_dependent.PlatformDependent import fix_plurals
 from utilities.GlobalPreferences import permit_atom_chunk_coselection
+from utilities.GlobalPreferences import pref_indexed_picking
+from operations.pick_index import PickIndex
 from utilities.icon_utilities import geticon
 
 from dna.model.DnaGroup import DnaGroup
@@ -801,13 +803,18 @@ class ops_select_Mixin:
             # (water_cutoff and cutoffs[1] or None) doesn't work!
         else:
             far_cutoff = None
-        z_atom_pairs = []
-        for mol in self.molecules:
-            if mol.hidden:
-                continue
-            pairs = mol.findAtomUnderMouse(point, matrix, \
-                                           far_cutoff = far_cutoff, near_cutoff = near_cutoff )
-            z_atom_pairs.extend( pairs)
+        if pref_indexed_picking():
+            z_atom_pairs = self.get_pick_index().find_atoms_under_mouse(
+                self, point, z, matrix,
+                far_cutoff = far_cutoff, near_cutoff = near_cutoff )
+        else:
+            z_atom_pairs = []
+            for mol in self.molecules:
+                if mol.hidden:
+                    continue
+                pairs = mol.findAtomUnderMouse(point, matrix, \
+                                               far_cutoff = far_cutoff, near_cutoff = near_cutoff )
+                z_atom_pairs.extend( pairs)
         if not z_atom_pairs:
             return None
         z_atom_pairs.sort() # smallest z == farthest first; we want nearest
@@ -816,6 +823,18 @@ class ops_select_Mixin:
             return None
         return res
 
+    _pick_index = None
+
+    def get_pick_index(self):
+        """
+        Return the PickIndex (see operations/pick_index.py) used to find
+        atoms under the mouse or in a selection area in self, making it
+        if necessary.
+        """
+        if self._pick_index is None:
+            self._pick_index = PickIndex()
+        return self._pick_index
+
     #bruce 041214 renamed and rewrote the following pick_event methods, as part of
     # fixing bug 235 (and perhaps some unreported bugs).
     # I renamed them to distinguish them from the many other "pick" (etc) methods
@@ -0,0 +1,298 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+pick_index.py -- find the atom under the mouse, or the atoms inside
+a selection rectangle or lasso, using bounding volume hierarchies
+of the chunks and of the atoms in large chunks.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that highlighting the atom under the mouse in a large part
+doesn't transform every atom position of every chunk on every mouse
+motion event (as Part.findAtomUnderMouse does by calling
+Chunk.findAtomUnderMouse for each chunk), and so that area selection
+doesn't test every atom against the selection curve one at a time.
+Used by Part.findAtomUnderMouse and SelectionShape when
+pref_indexed_picking is enabled.
+
+Implementation notes:
+
+A PickIndex is kept by each Part (see Part.get_pick_index). It has a
+ChunkCuller (see graphics/drawing/chunk_culling.py) for the bounding
+spheres of the part's chunks, and a SphereBVH of the atom selection
+spheres (from Chunk.get_sel_radii_squared) of each chunk with at least
+MIN_ATOMS_FOR_ATOM_TREE atoms, made when first needed and remade when
+that chunk's atpos or selection radii arrays are replaced (which they
+are, whenever they change).
+
+To find the atom under the mouse, the chunks whose bounding spheres
+are hit by the line of sight are found, then (in large chunks) the
+atoms whose selection spheres are hit, and only those are passed to
+Chunk.findAtomUnderMouse, which decides which one is hit first as
+before.
+
+To find the atoms inside a selection curve, the chunks whose bounding
+spheres are not entirely outside the planes bounding the curve's 3d
+bbox (see simple_shape_2d.bounding_planes) are found, then (in large
+chunks which straddle those planes) the atoms which might be inside
+them, and only those are tested with the curve's isin_array method.
+"""
+
+import Numeric
+
+from geometry.SphereBVH import SphereBVH
+from graphics.drawing.chunk_culling import ChunkCuller
+
+# Chunks with fewer atoms than this are tested atom by atom
+# (using Numeric) rather than with their own SphereBVH.
+MIN_ATOMS_FOR_ATOM_TREE = 200
+
+# Leaf size of the atom trees. (Larger than the default, since testing
+# the atoms of a leaf costs little more than testing one node, and
+# a shallower tree means fewer levels of node tests.)
+ATOM_TREE_LEAFSIZE = 64
+
+# ==
+
+class PickIndex:
+    """
+    Spatial index of one Part's chunks and atoms, for picking.
+    See module docstring for details.
+    """
+    def __init__(self):
+        self._culler = ChunkCuller()
+        self._molecules = None # part.molecules when we last pruned _atom_trees
+        self._atom_trees = {} # id(chunk) -> (chunk, atpos, radii_2, SphereBVH)
+        self.stats = {} # counts from the last query
+        return
+
+    def _update(self, part):
+        """
+        Forget the atom trees of chunks no longer in part.
+        """
+        molecules = part.molecules
+        if molecules is not self._molecules:
+            self._molecules = molecules
+            ids = {}
+            for chunk in molecules:
+                ids[id(chunk)] = chunk
+            for key, entry in self._atom_trees.items():
+                if ids.get(key) is not entry[0]:
+                    del self._atom_trees[key]
+        return
+
+    def _atom_tree(self, chunk):
+        """
+        Return a SphereBVH of the selection spheres of chunk's atoms
+        (whose items are their indices in chunk.atlist), or None if
+        chunk is too small to need one.
+        """
+        atpos = chunk.atpos
+        if len(atpos) < MIN_ATOMS_FOR_ATOM_TREE:
+            return None
+        radii_2 = chunk.get_sel_radii_squared()
+        entry = self._atom_trees.get(id(chunk))
+        if entry is not None and entry[0] is chunk and \
+           entry[1] is atpos and entry[2] is radii_2:
+            return entry[3]
+        # (invisible atoms have radii_2 of -1.0; their radius of 0 only
+        #  makes them candidates which Chunk.findAtomUnderMouse rejects)
+        radii = Numeric.sqrt(Numeric.maximum(radii_2, 0.0))
+        tree = SphereBVH(atpos, radii, leafsize = ATOM_TREE_LEAFSIZE)
+        self._atom_trees[id(chunk)] = (chunk, atpos, radii_2, tree)
+        self.stats['atom trees built'] = self.stats.get('atom trees built', 0) + 1
+        return tree
+
+    def find_atoms_under_mouse(self, part, point, direction, matrix, **kws):
+        """
+        Return a list of pairs (z, atom) for the atoms of the non-hidden
+        chunks of part hit by the line through point along direction
+        (a unit vector; it and point must be what matrix encodes, as in
+        Part.findAtomUnderMouse), as returned by Chunk.findAtomUnderMouse
+        for each chunk (which is passed **kws, i.e. the cutoffs).
+        """
+        self.stats = {}
+        self._update(part)
+        # Chunk.findAtomUnderMouse measures distances from the line in
+        # the xy plane of matrix, whose x and y axes (made by crossing the
+        # view's up vector with direction) can be a bit shorter than unit
+        # length, so it can hit atoms a bit farther from the line than
+        # their radii; enlarge our radii to match.
+        xy_lengths = Numeric.sqrt(Numeric.add.reduce(matrix[:,:2] * matrix[:,:2]))
+        radius_scale = 1.0 / max(min(xy_lengths), 1e-6)
+        chunks = self._culler.chunks_hit_by_line(part, point, direction, radius_scale)
+        self.stats.update(self._culler.stats)
+        pairs = []
+        for chunk in chunks:
+            if chunk.hidden or not chunk.atoms:
+                continue
+            tree = self._atom_tree(chunk)
+            if tree is None:
+                candidates = None
+            else:
+                candidates = tree.hit_by_line(point, direction, self.stats, radius_scale)
+            pairs.extend( chunk.findAtomUnderMouse(point, matrix,
+                                                   candidates = candidates, **kws) )
+        self.stats['chunks tested'] = len(chunks)
+        return pairs
+
+    def atoms_in_region(self, part, curve):
+        """
+        Return a list of pairs (chunk, atoms) for the non-hidden chunks
+        of part which have visible atoms inside curve (a selection
+        rectangle or curve, as made by SelectionShape.pickrect or
+        pickline), with atoms the list of those atoms.
+        """
+        self.stats = {}
+        self._update(part)
+        planes = curve.bounding_planes()
+        chunks = self._culler.chunks_in_planes(part, planes)
+        self.stats.update(self._culler.stats)
+        res = []
+        for chunk, inside in chunks:
+            if chunk.hidden or not chunk.atoms:
+                continue
+            atpos = chunk.atpos
+            tree = self._atom_tree(chunk)
+            if tree is None or inside:
+                candidates = Numeric.arange(len(atpos))
+            else:
+                candidates, junk = tree.cull(planes, self.stats)
+            if not len(candidates):
+                continue
+            radii_2 = chunk.get_sel_radii_squared()
+            # (Atom.visible agrees with selradius_squared() >= 0)
+            ok = Numeric.logical_and( Numeric.take(radii_2, candidates) >= 0,
+                                      curve.isin_array(Numeric.take(atpos, candidates)) )
+            indices = Numeric.compress(ok, candidates)
+            if len(indices):
+                atlist = chunk.atlist
+                res.append( (chunk, [atlist[i] for i in indices.tolist()]) )
+        self.stats['chunks tested'] = len(chunks)
+        return res
+
+    pass # end of class PickIndex
+
+# ==
+
+class _BenchmarkGLPane:
+    """
+    Stand-in for the GLPane attributes used by
+    Chunk.findAtomUnderMouse and Chunk.get_dispdef.
+    """
+    selatom = None
+    def __init__(self, displayMode):
+        self.displayMode = displayMode
+    pass
+
+def _benchmark(natoms = 200000, chunksize = 5000, nrays = 200):
+    """
+    Print the time per query to find the atom under the mouse (for
+    nrays lines of sight) and the atoms in a selection rectangle and
+    lasso, for a part of natoms atoms, by testing every chunk (as
+    Part.findAtomUnderMouse and SelectionShape do when
+    pref_indexed_picking is off) and using a PickIndex, and check that
+    they agree.
+    """
+    import random, time
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom
+    from geometry.VQT import V, norm, cross
+    from graphics.behaviors.shape import SelectionShape
+    from utilities.constants import diBALL, START_NEW_SELECTION
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    assy.o = _BenchmarkGLPane(diBALL)
+    # a slab of atoms, like a large flat crystal, in square chunks
+    side = int(natoms ** 0.5 / 4) * 4 or 4
+    chunkside = int(chunksize ** 0.5) or 1
+    chunks = {}
+    for i in xrange(natoms):
+        x, y, z = (i % side) * 1.5, ((i / side) % side) * 1.5, (i / side / side) * 1.5
+        key = (int(x / 1.5) / chunkside, int(y / 1.5) / chunkside, int(z / 1.5) / chunkside)
+        mol = chunks.get(key)
+        if mol is None:
+            mol = chunks[key] = Chunk(assy, "bench")
+            assy.addmol(mol)
+        Atom('C', V(x, y, z), mol)
+    part = assy.part
+    size = side * 1.5
+    index = PickIndex()
+    print "picking benchmark, %d atoms in %d chunks:" % (natoms, len(chunks))
+
+    # lines of sight from above, a bit tilted, as Part.findAtomUnderMouse makes them
+    up = V(0, 1, 0)
+    lines = []
+    for i in range(nrays):
+        target = V(random.uniform(0, size), random.uniform(0, size), 0.0)
+        z = norm(V(random.uniform(-0.1, 0.1), random.uniform(-0.1, 0.1), 1.0))
+        x = cross(up, z)
+        y = cross(z, x)
+        matrix = Numeric.transpose(V(x, y, z))
+        point = target + 10.0 * z
+        lines.append( (point, z, matrix) )
+    kws = {'near_cutoff': 20.0, 'far_cutoff': None}
+    index.find_atoms_under_mouse(part, lines[0][0], lines[0][1], lines[0][2], **kws) # build it
+    t0 = time.time()
+    slow = []
+    for point, z, matrix in lines:
+        pairs = []
+        for mol in part.molecules:
+            if not mol.hidden:
+                pairs.extend( mol.findAtomUnderMouse(point, matrix, **kws) )
+        pairs.sort()
+        slow.append( pairs and pairs[-1][1] )
+    t1 = time.time()
+    fast = []
+    for point, z, matrix in lines:
+        pairs = index.find_atoms_under_mouse(part, point, z, matrix, **kws)
+        pairs.sort()
+        fast.append( pairs and pairs[-1][1] )
+    t2 = time.time()
+    assert fast == slow, "atom under mouse mismatch"
+    print "  atom under mouse: all chunks %7.2f ms/query; PickIndex %6.2f ms/query (%d hits)" % \
+          ((t1 - t0) * 1000.0 / nrays, (t2 - t1) * 1000.0 / nrays,
+           len(filter(None, fast)))
+
+    # a rectangle covering a sixteenth of the model, and a smaller
+    # triangular lasso (since curve fills its raster recursively),
+    # seen from above
+    quarter = size / 4
+    corners = [V(quarter, quarter, 0), V(2 * quarter, 2 * quarter, 0)]
+    lasso = [V(quarter, quarter, 0), V(quarter + 30, quarter, 0),
+             V(quarter, quarter + 30, 0), V(quarter, quarter, 0)]
+    for name, make in [("rectangle", lambda shape: shape.pickrect(corners[0], corners[1], V(0, 0, 0),
+                                                                 START_NEW_SELECTION)),
+                       ("lasso", lambda shape: shape.pickline(lasso, V(0, 0, 0), START_NEW_SELECTION))]:
+        shape = SelectionShape(V(1, 0, 0), V(0, 1, 0), V(0, 0, -1))
+        make(shape)
+        c = shape.curve
+        t0 = time.time()
+        slow = []
+        for mol in part.molecules:
+            disp = mol.get_dispdef()
+            for a in mol.atoms.itervalues():
+                if c.isin(a.posn()) and a.visible(disp):
+                    slow.append(a)
+        t1 = time.time()
+        fast = []
+        for chunk, atoms in index.atoms_in_region(part, c):
+            fast.extend(atoms)
+        t2 = time.time()
+        slow = [a.key for a in slow]
+        slow.sort()
+        fast = [a.key for a in fast]
+        fast.sort()
+        assert fast == slow, "%s selection mismatch" % name
+        print "  %-9s selection: per atom %7.2f sec; PickIndex %6.3f sec (%d atoms)" % \
+              (name, t1 - t0, t2 - t1, len(fast))
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
@@ -0,0 +1,174 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+parallel_map.py -- compute a function of many arguments in several
+forked child processes at once.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for bond inference on very large selections (see
+parallel_candidate_pairs in operations/bonds_from_atoms.py), whose
+candidate pairs can be computed separately for slabs of space
+(by candidate_pairs).
+
+Usage:
+
+parallel_map(func, items, processes) returns the same list as
+map(func, items), but computes it in up to that many child processes.
+func should be a pure function (at least, any side effects it has are
+lost, since they happen in the children), and its results must be
+picklable (Numeric arrays are). Since the children are forked, func
+and items are not pickled, and large arrays func uses are shared with
+the parent (copy-on-write) rather than copied.
+
+Implementation notes:
+
+The items are divided among the children in turn (child k gets items
+k, k + n, k + 2n, ...). Each child computes its results and writes
+them to a pipe as one pickle, then exits with os._exit (so it never
+returns into the caller's code, or runs Qt or atexit cleanup). Where
+os.fork is not available (Windows), or there is only one process or
+item, this just calls map.
+"""
+
+import os
+import sys
+import cPickle
+
+from utilities.debug import print_compact_traceback
+
+class ParallelMapError(Exception):
+    """
+    Raised by parallel_map when func raises an exception (or a child
+    process fails) for one of the items. Its message includes the
+    traceback from the child.
+    """
+    pass
+
+def can_fork():
+    """
+    Can parallel_map use more than one process on this platform?
+    """
+    return hasattr(os, 'fork')
+
+def number_of_processors():
+    """
+    Return the number of processors on this machine, or 1 if it can't be
+    determined.
+    """
+    try:
+        res = os.sysconf('SC_NPROCESSORS_ONLN')
+    except (AttributeError, ValueError, OSError):
+        try:
+            res = int(os.environ['NUMBER_OF_PROCESSORS']) # Windows
+        except (KeyError, ValueError):
+            res = 1
+    return max(1, res)
+
+def parallel_map(func, items, processes = None):
+    """
+    Return map(func, items), computed in up to processes (default
+    number_of_processors()) forked child processes at once.
+    See module docstring for details.
+
+    @raise ParallelMapError: if func raises an exception for any item,
+                             or a child process fails.
+    """
+    items = list(items)
+    if processes is None:
+        processes = number_of_processors()
+    processes = min(processes, len(items))
+    if processes <= 1 or not can_fork():
+        return map(func, items)
+    children = []
+    try:
+        for k in range(processes):
+            rfd, wfd = os.pipe()
+            pid = os.fork()
+            if not pid:
+                # child
+                os.close(rfd)
+                _run_child(func, items[k::processes], wfd)
+                # (never returns)
+            os.close(wfd)
+            children.append((pid, os.fdopen(rfd, 'rb')))
+        results = [None] * len(items)
+        errors = []
+        for k in range(len(children)):
+            pid, pipe = children[k]
+            try:
+                ok, value = cPickle.load(pipe)
+            except (EOFError, cPickle.UnpicklingError):
+                ok, value = False, "child process %d died" % pid
+            pipe.close()
+            if ok:
+                results[k::processes] = value
+            else:
+                errors.append(value)
+    finally:
+        for pid, pipe in children:
+            if not pipe.closed:
+                pipe.close()
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+    if errors:
+        raise ParallelMapError("in parallel_map child process:\n" +
+                               "\n".join(errors))
+    return results
+
+def _run_child(func, items, wfd):
+    """
+    [private helper for parallel_map, run in a child process]
+    Compute map(func, items), write it (or an error) to file descriptor
+    wfd as a pickled pair (ok, results or traceback string), and exit.
+    """
+    status = 1
+    try:
+        try:
+            try:
+                res = (True, map(func, items))
+            except:
+                import traceback
+                res = (False, "".join(traceback.format_exception(
+                    *sys.exc_info())))
+            pipe = os.fdopen(wfd, 'wb')
+            cPickle.dump(res, pipe, 2)
+            pipe.close()
+            status = 0
+        except:
+            print_compact_traceback("exception in parallel_map child: ")
+    finally:
+        os._exit(status)
+    return
+
+# ==
+
+def _square(x):
+    return x * x
+
+def _test():
+    """
+    Check that parallel_map gives the same results as map, and passes
+    exceptions back from the children.
+    """
+    items = range(101)
+    for processes in (1, 2, 3, 8):
+        assert parallel_map(_square, items, processes) == map(_square, items)
+    try:
+        parallel_map(lambda x: 1 / (x - 50), items, 4)
+    except ParallelMapError, e:
+        assert 'ZeroDivisionError' in str(e)
+    else:
+        assert 0, "parallel_map should have raised ParallelMapError"
+    print "parallel_map: ok, using %d processors" % number_of_processors()
+    return
+
+if __name__ == '__main__':
+    _test()
+
+# end
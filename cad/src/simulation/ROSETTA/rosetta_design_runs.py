@@ -0,0 +1,463 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+rosetta_design_runs.py -- run a Rosetta fixed backbone sequence design
+as several Rosetta processes at once, scoring their output PDB files as
+they appear and keeping the best designs.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written for RosettaRunner (in runRosetta.py), which runs one Rosetta
+process for all the designs requested (its -ndruns option), then reads
+every output PDB file in full to find its score, to choose the best one.
+For sweeps of hundreds of designs, that leaves all but one processor
+idle.
+
+Usage:
+
+A ParallelRosettaDesign is made from the Rosetta program, the arguments
+for one Rosetta run of all the designs (including -ndruns and -pdbout,
+whose values it replaces for each of its runs), and the number of
+processes to use. Its start method starts one Rosetta run per process
+(each making its share of the designs, with its own -pdbout name and
+random seed), and its wait method waits for them all to exit, scoring
+each output file as soon as it's complete. Then best_designs() returns
+the best (lowest) scores and their output files, best first, and
+fasta_filename(pdbfile) returns the name of the sequence file written
+by the run which wrote pdbfile.
+
+read_pdb_score and design_output_filename are also used for the output
+of a single Rosetta run, by getScoreFromOutputFile in runRosetta.py.
+
+Implementation notes:
+
+Each run is a separate process (started with subprocess.Popen, in the
+working directory, with its stdout and stderr going to files), given
+"-constant_seed -jran <seed>" so that runs don't repeat each other's
+designs. With only one run (processes is 1, or only one design), the
+arguments are unchanged, as in RosettaRunner's own run.
+
+Rosetta writes its output files in order (pdbout_0001.pdb, then
+pdbout_0002.pdb, and so on), so a file is complete once the next one
+exists, or once its run has exited. Only the start of each file, up to
+its score record, is read. The best top_k designs are kept in a heap,
+so memory doesn't grow with the number of designs.
+"""
+
+import os
+import sys
+import time
+import heapq
+import subprocess
+
+from processes.parallel_map import number_of_processors
+
+def design_output_filename(pdbout, n):
+    """
+    Return the name of the n-th (counting from 1) output PDB file written
+    by a Rosetta run with the option -pdbout pdbout.
+    """
+    return "%s_%04d.pdb" % (pdbout, n)
+
+def design_fasta_filename(pdbout):
+    """
+    Return the name of the sequence file written by a Rosetta design run
+    with the option -pdbout pdbout.
+    """
+    return pdbout + "_design.fasta"
+
+def read_pdb_score(path):
+    """
+    Return the total score from an output PDB file written by Rosetta
+    (the number following column 15 of the first line containing
+    "score"), reading the file only up to that line. Return None if the
+    file can't be read, or has no such line.
+    """
+    try:
+        f = open(path, 'r')
+    except IOError:
+        return None
+    try:
+        for line in f:
+            if line.find("score") != -1:
+                try:
+                    return float(line[15:].strip())
+                except ValueError:
+                    return None
+        return None
+    finally:
+        f.close()
+
+# ==
+
+class TopDesigns:
+    """
+    Keep the top_k designs with the lowest (best) scores of those added.
+    """
+    def __init__(self, top_k):
+        self.top_k = max(1, top_k)
+        self._heap = [] # (-score, -number, filename); worst kept design first
+        self.count = 0 # designs added
+
+    def add(self, score, number, filename):
+        """
+        Add a design with the given score, whose output file is filename.
+        number orders designs with equal scores (lower is preferred).
+        """
+        self.count += 1
+        item = (-score, -number, filename)
+        if len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+        return
+
+    def best(self):
+        """
+        Return a list of (score, filename) of the kept designs, best first.
+        """
+        items = list(self._heap)
+        items.sort()
+        items.reverse()
+        return [(-score, filename) for score, number, filename in items]
+
+    pass # end of class TopDesigns
+
+# ==
+
+class _DesignRun:
+    """
+    [private helper for ParallelRosettaDesign]
+    One Rosetta process, making designs first to first + ndesigns - 1
+    (numbered from 1 over all runs) into files named from pdbout.
+    """
+    def __init__(self, pdbout, first, ndesigns, args, stdout_file):
+        self.pdbout = pdbout
+        self.first = first
+        self.ndesigns = ndesigns
+        self.args = args
+        self.stdout_file = stdout_file
+        self.process = None
+        self.exitcode = None
+        self.next = 1 # the next output file to score
+        return
+
+    def done(self):
+        return self.exitcode is not None and self.next > self.ndesigns
+
+    pass
+
+def _replace_option_value(args, option, value):
+    """
+    Return a copy of args (a list of command line arguments), with the
+    argument following option (which must be in args) replaced by value.
+    """
+    args = list(args)
+    args[args.index(option) + 1] = value
+    return args
+
+class ParallelRosettaDesign:
+    """
+    Run a Rosetta design as several Rosetta processes at once, keeping
+    the best designs. See module docstring for details.
+    """
+    def __init__(self, program, args, workdir,
+                 processes = None, top_k = 5, seed = None,
+                 stdout_prefix = None):
+        """
+        @param args: the arguments for a single Rosetta run of all the
+                     designs, including -ndruns and -pdbout
+        @type args: list of strings
+
+        @param workdir: the directory Rosetta runs in, where it writes
+                        its output files
+
+        @param processes: the most Rosetta processes to run at once
+                          (default number_of_processors())
+
+        @param top_k: how many of the best designs to keep
+
+        @param seed: the random seed of the first run; the others use
+                     the following integers (default from the time)
+
+        @param stdout_prefix: each run's stdout and stderr go to files
+                              named from this (default from -pdbout)
+        """
+        if processes is None:
+            processes = number_of_processors()
+        if seed is None:
+            seed = int(time.time()) % 1000000 + 1
+        ndesigns = int(args[args.index('-ndruns') + 1])
+        pdbout = args[args.index('-pdbout') + 1]
+        if stdout_prefix is None:
+            stdout_prefix = os.path.join(workdir, pdbout)
+        self.program = program
+        self.workdir = workdir
+        self.ndesigns = ndesigns
+        self.top = TopDesigns(top_k)
+        self.failed = [] # (stdout or output file, exitcode or error message)
+        self._start_time = None
+        self._end_time = None
+        self._runs = []
+        nruns = max(1, min(processes, ndesigns))
+        first = 1
+        for i in range(nruns):
+            # split the designs as evenly as possible
+            n = ndesigns / nruns + (i < ndesigns % nruns)
+            if nruns == 1:
+                run_pdbout = pdbout
+                run_args = list(args)
+                suffix = ""
+            else:
+                run_pdbout = "%s_%d" % (pdbout, i + 1)
+                run_args = _replace_option_value(args, '-ndruns', str(n))
+                run_args = _replace_option_value(run_args, '-pdbout',
+                                                 run_pdbout)
+                run_args.extend(['-constant_seed', '-jran', str(seed + i)])
+                suffix = "-%d" % (i + 1)
+            stdout_file = "%s-rosetta-stdout%s.txt" % (stdout_prefix, suffix)
+            self._runs.append(_DesignRun(run_pdbout, first, n, run_args,
+                                         stdout_file))
+            first += n
+        self.nruns = len(self._runs)
+        return
+
+    def start(self):
+        """
+        Start all our Rosetta runs.
+        """
+        self._start_time = time.time()
+        for run in self._runs:
+            output = open(run.stdout_file, 'w')
+            try:
+                try:
+                    run.process = subprocess.Popen([self.program] + run.args,
+                                                   cwd = self.workdir,
+                                                   stdout = output,
+                                                   stderr = subprocess.STDOUT)
+                except (OSError, ValueError), e:
+                    run.exitcode = -1
+                    run.next = run.ndesigns + 1 # nothing to score
+                    self.failed.append((run.stdout_file, str(e)))
+            finally:
+                output.close() # (the child has its own copy)
+        return
+
+    def poll(self):
+        """
+        Note which runs have exited, and score each output file which is
+        complete. Return the number of runs still running (or whose
+        output is not all scored). Never blocks.
+        """
+        pending = 0
+        for run in self._runs:
+            if run.exitcode is None:
+                exitcode = run.process.poll()
+                if exitcode is not None:
+                    run.exitcode = exitcode
+                    if exitcode:
+                        self.failed.append((run.stdout_file, exitcode))
+            # (exitcode is checked before the files, so a file is only
+            #  taken as complete because its run exited if that was so
+            #  before we looked at it)
+            exited = run.exitcode is not None
+            while run.next <= run.ndesigns:
+                path = self._path(design_output_filename(run.pdbout, run.next))
+                if not os.path.exists(path):
+                    if exited:
+                        # never written; don't wait for it
+                        run.next = run.ndesigns + 1
+                    break
+                if not exited:
+                    # the file may still be being written, unless the
+                    # next one exists
+                    if run.next == run.ndesigns:
+                        break
+                    following = design_output_filename(run.pdbout,
+                                                       run.next + 1)
+                    if not os.path.exists(self._path(following)):
+                        break
+                score = read_pdb_score(path)
+                if score is None:
+                    if not exited:
+                        # try again after the run exits
+                        break
+                    self.failed.append((path, "no score"))
+                else:
+                    self.top.add(score, run.first + run.next - 1,
+                                 os.path.basename(path))
+                run.next += 1
+            if not run.done():
+                pending += 1
+        if not pending and self._end_time is None:
+            self._end_time = time.time()
+        return pending
+
+    def _path(self, filename):
+        return os.path.join(self.workdir, filename)
+
+    def wait(self, progress = None, abort = None, interval = 0.25):
+        """
+        Wait until all our runs have exited and their output is scored,
+        calling progress (if given) with a message, and abort (if given),
+        about every interval seconds. If abort returns true, kill all
+        runs still running and return False; otherwise return True.
+        """
+        while self.poll():
+            if abort and abort():
+                self.kill()
+                return False
+            if progress:
+                progress("Rosetta design: %d of %d designs scored" %
+                         (self.top.count, self.ndesigns))
+            time.sleep(interval)
+        return True
+
+    def kill(self):
+        """
+        Kill all our runs which are still running.
+        """
+        for run in self._runs:
+            if run.process is not None and run.process.poll() is None:
+                try:
+                    if hasattr(run.process, 'terminate'):
+                        run.process.terminate()
+                    else:
+                        os.kill(run.process.pid, 15) # SIGTERM
+                    run.process.wait()
+                except OSError:
+                    pass
+            if run.exitcode is None:
+                run.exitcode = -2
+            run.next = run.ndesigns + 1
+        return
+
+    def best_designs(self):
+        """
+        Return a list of (score, output PDB filename) of the best designs,
+        best first.
+        """
+        return self.top.best()
+
+    def fasta_filename(self, pdbfile):
+        """
+        Return the name of the sequence file written by the run which
+        wrote pdbfile (one of the filenames from best_designs).
+        """
+        for run in self._runs:
+            if pdbfile.startswith(run.pdbout + "_") and \
+               len(pdbfile) == len(design_output_filename(run.pdbout, 1)):
+                return design_fasta_filename(run.pdbout)
+        return None
+
+    def fasta_filenames(self):
+        """
+        Return the names of the sequence files our runs will write.
+        """
+        return [design_fasta_filename(run.pdbout) for run in self._runs]
+
+    def stdout_files(self):
+        """
+        Return the names of the files holding the output of our runs.
+        """
+        return [run.stdout_file for run in self._runs]
+
+    def stats_message(self):
+        """
+        Return a summary of our runs, for a history message.
+        """
+        end = self._end_time or time.time()
+        total = 0.0
+        if self._start_time is not None:
+            total = end - self._start_time
+        msg = "Rosetta design: %d of %d designs scored, in %d runs at " \
+              "once, in %.2f sec" % \
+              (self.top.count, self.ndesigns, len(self._runs), total)
+        if self.failed:
+            filename, error = self.failed[0]
+            msg += "; %d failures, e.g. %s (%s)" % \
+                   (len(self.failed), os.path.basename(filename), error)
+        return msg
+
+    pass # end of class ParallelRosettaDesign
+
+# ==
+
+# a fake Rosetta for _test, which writes canned output PDB files (with
+# scores made from -jran and the design number) and a fasta file
+_FAKE_ROSETTA = """
+import sys, time
+args = sys.argv[1:]
+def value(option, default = None):
+    if option in args:
+        return args[args.index(option) + 1]
+    return default
+ndruns = int(value('-ndruns'))
+pdbout = value('-pdbout')
+seed = int(value('-jran', '0'))
+fasta = open(pdbout + '_design.fasta', 'w')
+for n in range(1, ndruns + 1):
+    score = -((seed * 7919 + n * 104729) % 1000) / 10.0
+    f = open('%s_%04d.pdb' % (pdbout, n), 'w')
+    f.write('ATOM      1  N   ALA A   1       0.000   0.000   0.000\\n')
+    f.flush()
+    time.sleep(0.01) # (so files are sometimes seen half-written)
+    f.write('%-15s%.1f\\n' % ('score', score))
+    f.write('ATOM      2  CA  ALA A   1       1.458   0.000   0.000\\n' * 50)
+    f.close()
+    fasta.write('> %s_%04d.pdb\\nAAAA\\n' % (pdbout, n))
+fasta.close()
+"""
+
+def _test(ndesigns = 23, processes = 4, top_k = 5):
+    """
+    Run a design with a fake Rosetta executable, and check that every
+    design was scored, and that the best designs kept are the best of
+    all the output files written.
+    """
+    import tempfile, shutil
+    workdir = tempfile.mkdtemp()
+    try:
+        args = ['-design', '-fixbb', '-ndruns', str(ndesigns),
+                '-pdbout', 'test_out', '-s', 'test.pdb']
+        runs = ParallelRosettaDesign(sys.executable,
+                                     ['-c', _FAKE_ROSETTA] + args,
+                                     workdir, processes = processes,
+                                     top_k = top_k, seed = 17)
+        runs.start()
+        def progress(msg):
+            print msg
+        assert runs.wait(progress)
+        print runs.stats_message()
+        assert not runs.failed
+        assert runs.top.count == ndesigns
+        scores = []
+        for filename in os.listdir(workdir):
+            if filename.endswith('.pdb'):
+                path = os.path.join(workdir, filename)
+                scores.append((read_pdb_score(path), filename))
+        assert len(scores) == ndesigns
+        scores.sort()
+        best = runs.best_designs()
+        assert [s for s, f in best] == [s for s, f in scores[:top_k]]
+        for score, filename in best:
+            assert read_pdb_score(os.path.join(workdir, filename)) == score
+            fasta = runs.fasta_filename(filename)
+            assert open(os.path.join(workdir, fasta)).read().find(
+                filename) != -1
+        print "best designs:", best
+    finally:
+        shutil.rmtree(workdir)
+    print "rosetta_design_runs: ok"
+    return
+
+if __name__ == '__main__':
+    _test()
+    # one design per run, so each run's only file is also its last one,
+    # which must not be scored until the run exits
+    _test(ndesigns = 10, processes = 10)
+
+# end
@@ -29,59 +29,34 @@ from processes.Plugins import checkPluginPreferences
 from utilities.prefs_constants import rosetta_enabled_prefs_key, rosetta_path_prefs_key
 from utilities.prefs_constants import rosetta_database_enabled_prefs_key, rosetta_dbdir_prefs_key
 from protein.model.Protein import write_rosetta_resfile
+from utilities.GlobalPreferences import pref_rosetta_design_processes
+from simulation.ROSETTA.rosetta_design_runs import ParallelRosettaDesign
+from simulation.ROSETTA.rosetta_design_runs import TopDesigns
+from simulation.ROSETTA.rosetta_design_runs import read_pdb_score
+from simulation.ROSETTA.rosetta_design_runs import design_output_filename
+
+# number of best designs listed in the history by run_design_in_parallel
+ROSETTA_TOP_DESIGNS = 5
 
 
 def getScoreFromOutputFile(tmp_file_prefix, outfile, numSim):
-    scoreList = []
+    dir = os.path.dirname(tmp_file_prefix)
+    top = TopDesigns(1)
     for i in range(numSim):
-        if len(str(i+1)) == 1:
-            extension = '000' + str(i+1)
-        elif  len(str(i+1)) == 2:
-            extension = '00' + str(i+1)
-        elif  len(str(i+1)) == 3:
-            extension = '0' + str(i+1)   
-        else:
-            #Urmi 20080716: what to do beyond 4 digits?
-            extension = str(i+1)
-        pdbFile = outfile + '_' + extension + '.pdb' 
-        dir = os.path.dirname(tmp_file_prefix)
-        pdbFilePath = os.path.join(dir, pdbFile)    
-            
-        f = open(pdbFilePath, 'r')
-        if f:
-            doc = f.readlines()
-            for line in doc:
-                #first instance of score
-                valFind = line.find("score")
-                if valFind!=-1:
-                    #process this line to read the total score
-                    words = line[15:]
-                    score = words.strip()
-                    print "For output pdb file " + pdbFile + ", score = ", score
-                    score1 = float(score) 
-                    f.close()
-                    scoreList.append(score1)
-                    break
-        else:
-            print "Output Pdb file cannot be read to obtain score"
-            f.close()
-            return None, None
-        
-    sortedList = sorted(scoreList)    
-    minScore = sortedList[0]
-    index = scoreList.index(minScore)
-    if len(str(index + 1)) == 1:
-            extension = '000' + str(index + 1)
-    elif  len(str(index)) == 2:
-        extension = '00' + str(index + 1)
-    elif  len(str(index + 1)) == 3:
-        extension = '0' + str(index + 1)   
-    else:
-        #Urmi 20080716: what to do beyond 4 digits?
-        extension = str(index + 1)
-    pdbFile = outfile + '_' + extension + '.pdb' 
+        pdbFile = design_output_filename(outfile, i + 1)
+        #read only up to the score line
+        score = read_pdb_score(os.path.join(dir, pdbFile))
+        if score is None:
+            #skip it, and choose the best of the others
+            print "Output Pdb file %s cannot be read to obtain score" % pdbFile
+            continue
+        print "For output pdb file " + pdbFile + ", score = ", score
+        top.add(score, i + 1, pdbFile)
+    if not top.count:
+        return None, None
+    minScore, pdbFile = top.best()[0]
     return str(minScore), pdbFile
-    
+
 
 def processFastaFile(fastaFilePath, bestSimOutFileName, inputProtein):
     proteinSeqTupleList = []
@@ -598,6 +573,11 @@ class RosettaRunner:
         # Disable some QActions (menu items/toolbar buttons) while the sim is running.
         self.win.disable_QActions_for_sim(True)
 
+        processes = pref_rosetta_design_processes()
+        if processes > 1 and self.numSim > 1:
+            self.run_design_in_parallel(args, processes)
+            return
+
         try: #bruce 050325 added this try/except wrapper, to always restore cursor
             self.simProcess = None #bruce 051231
             self.setup_sim_args(args)
@@ -661,15 +641,21 @@ class RosettaRunner:
                         env.history.message(self.cmdname + ": " + msg)
                         #find out best score from all the generated outputs
                         score, bestSimOutFileName = getScoreFromOutputFile(self.tmp_file_prefix, self.outfile, self.numSim)
-                        chosenOutPath = os.path.join(os.path.dirname(self.tmp_file_prefix), bestSimOutFileName)
-                        insertpdb(self.assy, str(chosenOutPath), None)
-                        env.history.statusbar_msg("")
-                        fastaFile = self.outfile + "_design.fasta" 
-                        fastaFilePath = os.path.join(os.path.dirname(self.tmp_file_prefix), fastaFile)
-                        proteinSeqList = processFastaFile(fastaFilePath, bestSimOutFileName, self.sim_input_file[0:len(self.sim_input_file)-4])
-                        #score = getScoreFromOutputFile(outPath)
-                        if score is not None and proteinSeqList is not []:
-                            self.showResults(score, proteinSeqList)
+                        if bestSimOutFileName is None:
+                            msg = redmsg("Rosetta sequence design failed, no output file has a score.")
+                            env.history.message(self.cmdname + ": " + msg)
+                            self.errcode = 2
+                            env.history.statusbar_msg("")
+                        else:
+                            chosenOutPath = os.path.join(os.path.dirname(self.tmp_file_prefix), bestSimOutFileName)
+                            insertpdb(self.assy, str(chosenOutPath), None)
+                            env.history.statusbar_msg("")
+                            fastaFile = self.outfile + "_design.fasta" 
+                            fastaFilePath = os.path.join(os.path.dirname(self.tmp_file_prefix), fastaFile)
+                            proteinSeqList = processFastaFile(fastaFilePath, bestSimOutFileName, self.sim_input_file[0:len(self.sim_input_file)-4])
+                            #score = getScoreFromOutputFile(outPath)
+                            if score is not None and proteinSeqList is not []:
+                                self.showResults(score, proteinSeqList)
                         
                     else:
                         msg1 = redmsg("Rosetta sequence design failed. ")
@@ -689,6 +675,97 @@ class RosettaRunner:
         
         return # caller should look at self.errcode
     
+    def run_design_in_parallel(self, args, processes):
+        """
+        [private helper for run_using_old_movie_obj_to_hold_sim_params,
+         which has set up everything but the simulator arguments]
+        Run the design as up to processes Rosetta runs at once, each
+        making its share of the designs (see ParallelRosettaDesign), then
+        load the best design and show its results, as that method does
+        for one Rosetta run. Set self.errcode on failure.
+        """
+        progressBar = self.win.statusBar().progressBar
+        try:
+            self.simProcess = None
+            self.setup_sim_args(args)
+            progressBar.setRange(0, 0)
+            progressBar.reset()
+            progressBar.show()
+            env.history.statusbar_msg("Running Rosetta")
+            self._run_design_runs(processes)
+        except:
+            print_compact_traceback("bug in simulator-calling code: ")
+            self.errcode = -11111
+        self.set_waitcursor(False)
+        self.win.disable_QActions_for_sim(False)
+        env.history.statusbar_msg("")
+        return
+
+    def _run_design_runs(self, processes):
+        """
+        [private helper for run_design_in_parallel]
+        Start the Rosetta runs, wait for them (or for Abort), and report
+        their results in the history.
+        """
+        simFilesPath = os.path.dirname(self.tmp_file_prefix)
+        runs = ParallelRosettaDesign(self.program, self._arguments,
+                                     simFilesPath,
+                                     processes = processes,
+                                     top_k = ROSETTA_TOP_DESIGNS,
+                                     stdout_prefix = self.tmp_file_prefix)
+        #remove sequence files of earlier runs, since Rosetta appends to them
+        for fastaFile in runs.fasta_filenames():
+            fastaFilePath = os.path.join(simFilesPath, fastaFile)
+            if os.path.exists(fastaFilePath):
+                os.remove(fastaFilePath)
+        msg = greenmsg("Starting Rosetta sequence design, %d designs in "
+                       "%d processes" % (self.numSim, runs.nruns))
+        env.history.message(self.cmdname + ": " + msg)
+        env.history.message("%s: Rosetta files at %s%s%s.*" %
+            (self.cmdname, simFilesPath, os.sep, self.outfile))
+
+        abortHandler = AbortHandler(self.win.statusBar(), "rosetta")
+        def progress(msg):
+            env.history.statusbar_msg(msg)
+            env.call_qApp_processEvents()
+        def abort():
+            return abortHandler.getPressCount() > 0
+        runs.start()
+        finished = runs.wait(progress, abort)
+        abortHandler.finish()
+        abortHandler = None
+        env.history.message(self.cmdname + ": " + runs.stats_message())
+        if not finished:
+            msg = redmsg("Aborted.")
+            env.history.message(self.cmdname + ": " + msg)
+            return
+        for rosettaStdOut in runs.stdout_files():
+            if self.checkErrorInStdOut(rosettaStdOut):
+                msg = redmsg("Rosetta sequence design failed. For details check " + rosettaStdOut)
+                env.history.message(self.cmdname + ": " + msg)
+                self.errcode = 2
+                return
+        best = runs.best_designs()
+        if not best:
+            msg = redmsg("Rosetta sequence design failed, no design was scored.")
+            env.history.message(self.cmdname + ": " + msg)
+            self.errcode = 2
+            return
+        msg = greenmsg("Rosetta sequence design succeeded")
+        env.history.message(self.cmdname + ": " + msg)
+        for score, pdbFile in best:
+            env.history.message("%s: score %s, %s" %
+                                (self.cmdname, score, pdbFile))
+        score, bestSimOutFileName = best[0]
+        chosenOutPath = os.path.join(simFilesPath, bestSimOutFileName)
+        insertpdb(self.assy, str(chosenOutPath), None)
+        fastaFile = runs.fasta_filename(bestSimOutFileName)
+        fastaFilePath = os.path.join(simFilesPath, fastaFile)
+        proteinSeqList = processFastaFile(fastaFilePath, bestSimOutFileName, self.sim_input_file[0:len(self.sim_input_file)-4])
+        if proteinSeqList:
+            self.showResults(str(score), proteinSeqList)
+        return
+    
     def showResults(self, score, proteinSeqList):
         
         from foundation.wiki_help import WikiHelpBrowser
@@ -0,0 +1,230 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+coordinate_files.py -- read the single-frame coordinate files written
+by the simulator (XYZ) and by GROMACS (.gro) into one Numeric array.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that reading the results of minimizing a large model doesn't
+take longer than the minimization. Used by Minimize_CommandRun and
+fileSlotsMixin.fileOpen (for GROMACS results) when pref_bulk_minimize_results
+is enabled; the positions are then applied with a FramePlan (see
+frame_delivery.py).
+
+Implementation notes:
+
+read_xyz_positions and read_gromacs_positions accept and reject the same
+files as readxyz and readGromacsCoordinates in runSim.py. They check the
+whole file at once (splitting all its lines, converting all coordinates
+with one map(float, ...) and comparing all element symbols with one
+array comparison) and, if anything is wrong with it, call those
+functions to find and report the first error, so their error messages
+are the same.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+from simulation.runSim import readxyz
+from simulation.runSim import readGromacsCoordinates
+
+# ==
+
+def _element_codes(symbols, codes):
+    """
+    Return a Numeric array of the integer codes of the given element
+    symbols, adding new symbols to the codes dict as needed.
+    """
+    for symbol in dict.fromkeys(symbols).keys():
+        if not codes.has_key(symbol):
+            codes[symbol] = len(codes)
+    return Numeric.array(map(codes.__getitem__, symbols), Int)
+
+def read_xyz_positions(filename, alist):
+    """
+    Like readxyz, but return the positions (on success) as an N x 3
+    Numeric array. On error, print a message to stdout and also return
+    it to the caller.
+    """
+    from model.elements import Singlet
+    lines = open(filename, "rU").readlines()
+    body = lines[2:]
+    n = len(body)
+    try:
+        if len(lines) < 3 or n != len(alist):
+            raise ValueError
+        numAtoms_junk = int(lines[0])
+        rms_junk = float(lines[1][4:])
+        if Numeric.sometrue(Numeric.array(map(len, map(str.split, body))) != 4):
+            raise ValueError
+        words = "".join(body).split()
+        positions = Numeric.array(map(float, words[1::4] + words[2::4] + words[3::4]), Float)
+    except ValueError:
+        return readxyz(filename, alist)
+    positions = Numeric.transpose(Numeric.reshape(positions, (3, n)))
+    # the file's element symbols must be those of alist, except that H
+    # may stand for a bondpoint
+    codes = {'H': 0}
+    found = _element_codes(words[0::4], codes)
+    expected = _element_codes([atom.element.symbol for atom in alist], codes)
+    singlets = Numeric.array([atom.element is Singlet for atom in alist])
+    bad = (found != expected) & Numeric.logical_not(singlets & (found == 0))
+    if Numeric.sometrue(bad):
+        return readxyz(filename, alist)
+    return positions
+
+def read_gromacs_positions(filename, atomList, tracefileProcessor = None):
+    """
+    Like readGromacsCoordinates, but return the positions (on success)
+    as an N x 3 Numeric array. On error, print a message to stdout and
+    also return it to the caller.
+    """
+    try:
+        lines = open(filename, "rU").readlines()
+        if len(lines) < 3:
+            raise ValueError
+        numAtoms_junk = int(lines[1])
+    except (IOError, ValueError):
+        return readGromacsCoordinates(filename, atomList, tracefileProcessor)
+    body = lines[2:-1]
+    n = len(body)
+    # coordinates are in nm, in columns 21-44 (see readGromacsCoordinates);
+    # anything after them means an overflowed field
+    fields = "".join([line[20:44] for line in body])
+    extra = "".join([line[44:] for line in body])
+    words = fields.split()
+    if (n < len(atomList) or extra.strip() or fields.find("nan") >= 0
+        or len(words) != 3 * n):
+        return readGromacsCoordinates(filename, atomList, tracefileProcessor)
+    try:
+        positions = Numeric.array(map(float, words), Float)
+    except ValueError:
+        return readGromacsCoordinates(filename, atomList, tracefileProcessor)
+    positions = Numeric.reshape(positions, (n, 3)) * 10.0 + _gromacs_translation(filename)
+    if tracefileProcessor:
+        # (including the virtual sites at the end)
+        tracefileProcessor.newAtomPositions(positions)
+    return positions[:len(atomList)]
+
+def _gromacs_translation(filename):
+    """
+    Return the translation (in Angstroms) to add to the positions in
+    a GROMACS coordinate file, from the .translate file written with it,
+    or zero if there is none.
+    """
+    if filename.endswith("-out.gro"):
+        translateFileName = filename[:-8] + ".translate"
+    elif filename.endswith(".gro"):
+        translateFileName = filename[:-4] + ".translate"
+    else:
+        return Numeric.zeros((3,), Float)
+    try:
+        translateFile = open(translateFileName, "rU")
+        translation = [float(translateFile.readline()) * 10.0 for i in range(3)]
+        translateFile.close()
+    except IOError:
+        # Ok for file not to exist, assume no translation
+        return Numeric.zeros((3,), Float)
+    return Numeric.array(translation, Float)
+
+# ==
+
+def _write_test_files(basename, alist, positions):
+    """
+    Write an XYZ file and a .gro file (with a .translate file) of the
+    given positions for alist, as the simulator and GROMACS would;
+    return their names.
+    """
+    xyzname = basename + ".xyz"
+    f = open(xyzname, "w")
+    f.write("%d\nRMS=0.1\n" % len(alist))
+    for atom, (x, y, z) in zip(alist, positions.tolist()):
+        symbol = atom.element.symbol
+        if symbol == 'X':
+            symbol = 'H'
+        f.write("%s %.6f %.6f %.6f\n" % (symbol, x, y, z))
+    f.close()
+    groname = basename + "-out.gro"
+    f = open(groname, "w")
+    f.write("benchmark\n%5d\n" % len(alist))
+    for i, (x, y, z) in zip(range(len(alist)), positions.tolist()):
+        # (positions are in Angstroms, file coordinates in nm, translated by 1 nm)
+        f.write("%5dxxx  %5s%5d%8.3f%8.3f%8.3f\n" %
+                (i % 100000, "A", (i + 1) % 100000, x / 10.0 - 1.0, y / 10.0, z / 10.0))
+    f.write("   1.00000   1.00000   1.00000\n")
+    f.close()
+    f = open(basename + ".translate", "w")
+    f.write("1.0\n0.0\n0.0\n")
+    f.close()
+    return xyzname, groname
+
+def _benchmark(natoms = 200000, chunksize = 5000):
+    """
+    Print the time to read and apply synthetic minimize results (XYZ
+    and GROMACS) for natoms atoms, using readxyz or readGromacsCoordinates
+    and move_alist_and_snuggle, and using read_xyz_positions or
+    read_gromacs_positions and a FramePlan, and check that they agree.
+    """
+    import os, tempfile, time
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom, move_alist_and_snuggle
+    from model.bonds import bond_atoms
+    from geometry.VQT import V
+    from simulation.frame_delivery import apply_frame
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    alist = []
+    for i in xrange(natoms / 2):
+        if i % (chunksize / 2) == 0:
+            mol = Chunk(assy, "bench")
+            assy.addmol(mol)
+        # (in a grid, so the coordinates fit in a .gro file)
+        x, y, z = (i % 100) * 1.5, ((i / 100) % 100) * 3.0, (i / 10000) * 3.0
+        atom = Atom('C', V(x, y, z), mol)
+        if i % 2:
+            bond_atoms(atom, alist[-2])
+            other = Atom('O', V(x, y + 1.4, z), mol)
+        else:
+            other = Atom('X', V(x, y - 1.0, z), mol)
+        bond_atoms(atom, other)
+        alist.extend([atom, other])
+    positions = Numeric.array([atom.posn() for atom in alist]) + 0.1
+    basename = tempfile.mktemp()
+    xyzname, groname = _write_test_files(basename, alist, positions)
+    print "minimize results benchmark, %d atoms:" % len(alist)
+    for name, slow_reader, fast_reader in \
+            [("XYZ", readxyz, read_xyz_positions),
+             ("GROMACS", readGromacsCoordinates, read_gromacs_positions)]:
+        filename = (name == "XYZ") and xyzname or groname
+        t0 = time.time()
+        slow = slow_reader(filename, alist)
+        t1 = time.time()
+        move_alist_and_snuggle(alist, slow)
+        t2 = time.time()
+        slow_result = [atom.posn() for atom in alist]
+        t3 = time.time()
+        fast = fast_reader(filename, alist)
+        t4 = time.time()
+        apply_frame(None, alist, fast)
+        t5 = time.time()
+        assert Numeric.alltrue(Numeric.ravel(abs(fast - Numeric.array(slow)) < 1e-9))
+        fast_result = Numeric.array([atom.posn() for atom in alist])
+        assert Numeric.alltrue(Numeric.ravel(abs(fast_result - Numeric.array(slow_result)) < 1e-6))
+        print "  %-8s per line: read %6.2f sec, apply %6.2f sec; bulk: read %6.2f sec, apply %6.2f sec" % \
+              (name, t1 - t0, t2 - t1, t4 - t3, t5 - t4)
+    # an error is reported in the same way
+    alist[10], alist[11] = alist[11], alist[10]
+    assert read_xyz_positions(xyzname, alist) == readxyz(xyzname, alist)
+    for filename in (xyzname, groname, basename + ".translate"):
+        os.remove(filename)
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
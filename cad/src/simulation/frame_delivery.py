@@ -0,0 +1,285 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+"""
+frame_delivery.py -- apply simulator frames to a list of atoms
+using Numeric operations over a reused array.
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details.
+
+History:
+
+Written so that watching dynamics of large models in real time is
+limited by the simulator and the redraw, rather than by moving and
+snuggling the atoms one at a time (as move_alist_and_snuggle does).
+Used by MovableAtomList.set_posns and Movie.moveAtoms when
+pref_vectorized_sim_frames is enabled.
+
+Implementation notes:
+
+A FramePlan is made for one list of atoms (in the order of the frames
+which will be applied to them), and is kept until the structure of
+the chunks holding those atoms changes (as seen by their atlist or
+singlets being recomputed). It records:
+
+- for each chunk all of whose atoms are in the list, the list indices
+  of its atoms in atlist order; if pref_use_columnar_atom_store is on,
+  that chunk's atoms are adopted into an AtomStore (see
+  model/atom_store.py), so their new positions are set, and the chunk's
+  atpos is later recomputed, in one operation each;
+
+- the other atoms (e.g. killed ones, or those in chunks with only some
+  of their atoms in the list), which are moved one at a time;
+
+- the bondpoints whose base atom is in the list and is not a PAM atom,
+  with the list indices of their base atoms and the covalent radii of
+  those base atoms, so they can all be snuggled at once (as in
+  Atom.snuggle) before any atoms are moved, directly in the frame;
+
+- the other bondpoints, which are snuggled one at a time after all
+  atoms are moved (as required by the fix for bug 1239).
+
+The frame is copied into an array owned by the plan before the
+bondpoints are corrected in it, so the caller can reuse its frame array
+(e.g. one filled in place by the simulator's getFrameInto method) for
+every frame.
+"""
+
+import Numeric
+from Numeric import Float, Int
+
+from geometry.VQT import A
+
+# ==
+
+class FramePlan:
+    """
+    Precomputed index arrays for applying frames to a given list of
+    atoms. See module docstring for details.
+    """
+    def __init__(self, alist):
+        """
+        @param alist: the atoms which frames will be applied to, in frame
+                      order (the same list object must be passed to
+                      apply_frame for this plan to be reused)
+        """
+        self.alist = alist
+        self.natoms = n = len(alist)
+        self.posns = Numeric.zeros((n, 3), Float)
+        index = {} # atom.key -> index in alist
+        for atom, i in zip(alist, range(n)):
+            index[atom.key] = i
+
+        # chunks all of whose atoms are in alist, and the other atoms
+        self.chunks = [] # list of (chunk, atlist, indices)
+        self.other_atoms = [] # list of (atom, index)
+        self.singlet_lists = [] # list of (chunk, singlets) for live chunks
+        seen = {} # id(chunk) -> chunk, for the chunks we examined
+        for atom, i in zip(alist, range(n)):
+            mol = atom.molecule
+            if mol is None or seen.has_key(id(mol)):
+                continue
+            seen[id(mol)] = mol
+            if mol.part is None:
+                continue # killed chunk (its atoms are moved below)
+            self.singlet_lists.append( (mol, mol.singlets) )
+            keys = mol.atoms.keys()
+            for key in keys:
+                if not index.has_key(key):
+                    break
+            else:
+                atlist = mol._f_use_atom_store()
+                indices = Numeric.array([index[a.key] for a in atlist], Int)
+                self.chunks.append( (mol, atlist, indices) )
+        in_chunks = {}
+        for mol, atlist, indices in self.chunks:
+            in_chunks[id(mol)] = mol
+        for atom, i in zip(alist, range(n)):
+            if not in_chunks.has_key(id(atom.molecule)):
+                self.other_atoms.append( (atom, i) )
+
+        # bondpoints, and atoms whose neighbor geometry must be invalidated
+        singlets = []
+        bases = []
+        radii = []
+        self.slow_singlets = []
+        neighbor_geom_atoms = {}
+        for atom, i in zip(alist, range(n)):
+            if atom._f_checks_neighbor_geom:
+                neighbor_geom_atoms[atom.key] = atom
+            for bond in atom.bonds:
+                other = bond.other(atom)
+                if other._f_checks_neighbor_geom:
+                    neighbor_geom_atoms[other.key] = other
+            if not atom.is_singlet() or len(atom.bonds) != 1:
+                continue # killed bondpoints (no bonds) are not snuggled
+            other = atom.bonds[0].other(atom)
+            if other.element.pam or not index.has_key(other.key):
+                self.slow_singlets.append(atom)
+            else:
+                singlets.append(i)
+                bases.append(index[other.key])
+                radii.append(other.atomtype.rcovalent)
+        self.neighbor_geom_atoms = neighbor_geom_atoms.values()
+        self.nsinglets = len(singlets)
+        if singlets:
+            self.singlets = Numeric.array(singlets, Int)
+            self.bases = Numeric.array(bases, Int)
+            self.radii = Numeric.array(radii, Float)
+            # indices of the singlets' coordinates in the flattened posns
+            self.singlet_coords = Numeric.ravel(
+                3 * Numeric.reshape(self.singlets, (-1, 1)) +
+                Numeric.array([0, 1, 2], Int) )
+        return
+
+    def still_valid(self):
+        """
+        Is this plan still correct for its atoms? (It's not, once atoms
+        are added to or removed from the chunks it moves at once, or
+        any of those chunks is killed, or bondpoints are added to,
+        removed from or transmuted in any chunk holding its atoms.)
+        """
+        for mol, atlist, indices in self.chunks:
+            if mol.part is None or mol.__dict__.get('atlist') is not atlist:
+                return False
+        for mol, singlets in self.singlet_lists:
+            if mol.__dict__.get('singlets') is not singlets:
+                return False
+        return True
+
+    def apply(self, newposns):
+        """
+        Set our atoms' positions to those in newposns (an N x 3 array or
+        sequence, which we don't modify), correcting bondpoint positions;
+        do all required invals but no redisplay.
+        """
+        assert len(newposns) == self.natoms
+        posns = self.posns
+        posns[:] = newposns
+        if self.nsinglets:
+            # like Atom.snuggle, for all the fast singlets at once
+            base_posns = Numeric.take(posns, self.bases)
+            deltas = Numeric.take(posns, self.singlets) - base_posns
+            lengths = Numeric.sqrt(Numeric.add.reduce(deltas * deltas, 1))
+            # (norm of a zero vector is zero, so that singlet goes to its base)
+            scale = self.radii / Numeric.where(lengths, lengths, 1.0)
+            newposns = base_posns + deltas * Numeric.reshape(scale, (-1, 1))
+            Numeric.put(posns, self.singlet_coords, Numeric.ravel(newposns))
+        for mol, atlist, indices in self.chunks:
+            mol.set_atom_posns_from_atpos( Numeric.take(posns, indices) )
+            mol.changed_atom_posn()
+            # this stands for setup_invalidate on each internal bond:
+            mol.invalidate_all_bonds()
+            for bond in mol.externs:
+                bond.setup_invalidate()
+        for atom, i in self.other_atoms:
+            atom.setposn_batch( A(posns[i]) )
+        for atom in self.neighbor_geom_atoms:
+            if atom._f_valid_neighbor_geom:
+                atom._f_invalidate_neighbor_geom()
+        for atom in self.slow_singlets:
+            atom.snuggle()
+        return
+
+    pass # end of class FramePlan
+
+def apply_frame(plan, alist, newposns):
+    """
+    Move the atoms in alist to the positions in newposns, correcting
+    bondpoint positions, using plan if it's a still-valid FramePlan for
+    alist, or otherwise a new one. Return the plan used, for the caller
+    to pass to the next call.
+    """
+    if plan is None or plan.alist is not alist or not plan.still_valid():
+        plan = FramePlan(alist)
+    plan.apply(newposns)
+    return plan
+
+# ==
+
+class _SyntheticFrameSource:
+    """
+    Stand-in for the pyrex simulator's frame API (getFrame and
+    getFrameInto), making each frame by wobbling a list of initial
+    positions.
+    """
+    def __init__(self, posns):
+        self.posns = A(posns)
+        self.frame_number = 0
+
+    def _next_wobble(self):
+        self.frame_number += 1
+        return 0.05 * Numeric.sin(self.posns + self.frame_number)
+
+    def getFrame(self):
+        return self.posns + self._next_wobble()
+
+    def getFrameInto(self, array):
+        array[:] = self.posns
+        array += self._next_wobble()
+        return len(array)
+
+    pass
+
+def _benchmark(natoms = 50000, nframes = 20, chunksize = 5000):
+    """
+    Print the frames per second at which frames from a synthetic frame
+    source can be applied to a model of natoms atoms (a quarter of them
+    bondpoints), including recomputing each chunk's atpos as the next
+    redraw would, both atom by atom and using a FramePlan.
+    """
+    import time
+    from model.assembly import Assembly
+    from model.chunk import Chunk
+    from model.chem import Atom, move_alist_and_snuggle
+    from model.bonds import bond_atoms
+    from geometry.VQT import V
+    Assembly.initialize()
+    assy = Assembly(None, run_updaters = False)
+    alist = []
+    chunks = []
+    for i in xrange(natoms / 2):
+        if i % (chunksize / 2) == 0:
+            mol = Chunk(assy, "bench")
+            assy.addmol(mol)
+            chunks.append(mol)
+        x = i * 1.5
+        atom = Atom('C', V(x, (i % 7) * 1.1, (i % 13) * 1.3), mol)
+        if i % 2:
+            bond_atoms(atom, alist[-2])
+            other = Atom('C', V(x, 1.5, 0.0), mol)
+        else:
+            other = Atom('X', V(x, -1.0, 0.0), mol)
+        bond_atoms(atom, other)
+        alist.extend([atom, other])
+    source = _SyntheticFrameSource([atom.posn() for atom in alist])
+    print "frame delivery benchmark, %d atoms in %d chunks, %d frames:" % \
+          (len(alist), len(chunks), nframes)
+
+    def redraw_atpos():
+        for chunk in chunks:
+            chunk.atpos
+
+    t0 = time.time()
+    for i in range(nframes):
+        move_alist_and_snuggle(alist, source.getFrame())
+        redraw_atpos()
+    t1 = time.time()
+    print "  atom by atom (getFrame):     %6.2f frames/sec" % (nframes / (t1 - t0))
+
+    frame = Numeric.zeros((len(alist), 3), Float)
+    plan = apply_frame(None, alist, source.getFrame())
+    redraw_atpos()
+    t0 = time.time()
+    for i in range(nframes):
+        source.getFrameInto(frame)
+        plan = apply_frame(plan, alist, frame)
+        redraw_atpos()
+    t1 = time.time()
+    print "  FramePlan (getFrameInto):    %6.2f frames/sec" % (nframes / (t1 - t0))
+    return
+
+if __name__ == '__main__':
+    _benchmark()
+
+# end
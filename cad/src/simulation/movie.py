@@ -13,17 +13,31 @@ Initially by Mark.
 Some parts rewritten by Bruce circa 050427.
 """
 
-import os, sys
+import os, sys, time
 from struct import unpack
 from PyQt4.Qt import Qt, qApp, QApplication, QCursor, SIGNAL
-from utilities.Log import redmsg, orangemsg, greenmsg
+from utilities.Log import redmsg, orangemsg, greenmsg, quote_html
 from geometry.VQT import A
 from foundation.state_utils import IdentityCopyMixin
 from model.chem import move_alist_and_snuggle
+from simulation.frame_delivery import apply_frame
+from utilities.GlobalPreferences import pref_vectorized_sim_frames
 from utilities import debug_flags
 from platform_dependent.PlatformDependent import fix_plurals
 from utilities.debug import print_compact_stack, print_compact_traceback
 from files.dpb_trajectory.moviefile import MovieFile #e might be renamed, creation API revised, etc
+from files.dpb_trajectory.new_format_moviefile import is_new_format_moviefile
+from files.dpb_trajectory.new_format_moviefile import NewFormatMovieFile_startup
+from files.dpb_trajectory.frame_cache import FrameCache, FramePrefetcher
+from files.dpb_trajectory.frame_cache import decode_frame
+from utilities.GlobalPreferences import pref_movie_frame_cache_budget
+from utilities.GlobalPreferences import pref_movie_frame_prefetch
+from utilities.GlobalPreferences import pref_parallel_povray_movie_export
+from utilities.GlobalPreferences import pref_render_povray_movie_frames
+from utilities.GlobalPreferences import pref_gzip_povray_movie_files
+from graphics.rendering.povray.movie_export import PovrayMovieExport
+from graphics.rendering.povray.movie_export import RenderQueue
+from processes.parallel_map import ParallelMapError, number_of_processors
 
 import foundation.env as env
 
@@ -305,6 +319,7 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         # it should be revised to work either way and _close if necessary.
         # for now, just break cycles.
         self.win = self.assy = self.part = self.alist = self.fileobj = None
+        self._frame_plan = None
         del self.fileobj # obs attrname
         del self.part
 
@@ -640,6 +655,11 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         
         You may then make a move of it with:
             mencoder "mf://*.png" -mf fps=25 -o output.avi -ovc lavc -lavcopts vcodec=mpeg4
+
+        If the debug_pref for it is set, the files are written in parallel
+        processes (see _export_povray_series), and optionally rendered
+        as they're written. If another one is set, they're gzipped
+        (e.g. foobar.000000.pov.gz).
         """
         from graphics.rendering.fileIO import writepovfile
 
@@ -656,28 +676,128 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         # Writes the POV-Ray series starting at the current frame until the last frame, 
         # skipping frames if "Skip" (on the dashboard) is != 0.  Mark 050908
         nfiles = 0
-        for i in range(self.currentFrame, 
+        skip = self.propMgr.frameSkipSpinBox.value()
+        ext = ".pov"
+        if pref_gzip_povray_movie_files():
+            ext = ".pov.gz" # (writepovfile gzips these)
+        frames = range(self.currentFrame, 
                        self.totalFramesActual+1, 
-                       self.propMgr.frameSkipSpinBox.value()):
-            self.alist_and_moviefile.play_frame(i)
-            filename = "%s.%06d.pov" % (name,i)
-            # For 100s of files, printing a history message for each file is undesired. 
-            # Instead, I include a summary message below. Fixes bug 953.  Mark 051119.
-            # env.history.message( "Writing file: " + filename ) 
-            writepovfile(self.assy.part, self.assy.o, filename) #bruce 050927 revised arglist
-            nfiles += 1
-            self.framecounter  =  i #  gets the the last frame number of the file written. This will be passed in the history message ninad060809
+                       skip)
+        export = None
+        if pref_parallel_povray_movie_export():
+            export = self._export_povray_series(name, ext, frames, skip)
+            nfiles = export.nfiles
+            if nfiles:
+                self.framecounter = frames[nfiles - 1]
+        else:
+            for i in frames:
+                self.alist_and_moviefile.prefetch(i, self.totalFramesActual, skip)
+                self.alist_and_moviefile.play_frame(i)
+                filename = "%s.%06d%s" % (name, i, ext)
+                # For 100s of files, printing a history message for each file is undesired. 
+                # Instead, I include a summary message below. Fixes bug 953.  Mark 051119.
+                # env.history.message( "Writing file: " + filename ) 
+                writepovfile(self.assy.part, self.assy.o, filename) #bruce 050927 revised arglist
+                nfiles += 1
+                self.framecounter  =  i #  gets the the last frame number of the file written. This will be passed in the history message ninad060809
 
         # Return to currentFrame. Fixes bug 1025.  Mark 051119
+        self.alist_and_moviefile.pause_prefetching()
         self.alist_and_moviefile.play_frame(self.currentFrame) 
 
         # Summary msgs tell user number of files saved and where they are located.
         msg = fix_plurals("%d file(s) written." % nfiles)
         env.history.message(msg)
-        filenames = "%s.%06d.pov - %06d.pov" % (name, self.currentFrame, self.framecounter)#ninad060809 fixed bugs 2147 and 2148 
-        msg = "Files are named %s." % filenames
-        env.history.message(msg)
+        if nfiles:
+            filenames = "%s.%06d%s - %06d%s" % (name, self.currentFrame, ext, self.framecounter, ext)#ninad060809 fixed bugs 2147 and 2148 
+            msg = "Files are named %s." % filenames
+            env.history.message(msg)
 
+        if export is not None:
+            # (after returning to currentFrame, since this may wait a long
+            #  time for renderers)
+            env.history.message(export.finish())
+        return
+
+    def _export_povray_series(self, name, ext, frames, skip):
+        """
+        [private helper for _write_povray_series]
+        Write the POV-Ray files for the given frames, named as described
+        there, using a PovrayMovieExport which writes them in one forked
+        process per processor, and (if the debug_pref for it is set)
+        queues each one for rendering. Return that object, whose finish
+        method should be called after the current frame is restored.
+
+        (If this fails, emit an error message and return the object
+         anyway; its nfiles attribute says how many files were written.)
+        """
+        from graphics.rendering.fileIO import writepovfile
+        amf = self.alist_and_moviefile
+        part = self.assy.part
+        glpane = self.assy.o
+        stop = self.totalFramesActual
+
+        def snapshot(n):
+            amf.prefetch(n, stop, skip)
+            return amf.frame_copy(n)
+
+        def write_pov(n, frame, filename):
+            # (in a forked process, unless we can't fork; in that case,
+            #  this moves the atoms as play_frame would)
+            amf.movable_atoms.set_posns(frame)
+            writepovfile(part, glpane, filename)
+
+        def filename_for(n):
+            return "%s.%06d%s" % (name, n, ext)
+
+        def progress(msg):
+            env.history.statusbar_msg(msg)
+            env.call_qApp_processEvents()
+
+        render_queue = None
+        if pref_render_povray_movie_frames():
+            if ext.endswith(".gz"):
+                msg = "POV-Ray files will not be rendered, since they're gzipped."
+                env.history.message( orangemsg( msg ))
+            else:
+                render_queue = self._povray_render_queue()
+        export = PovrayMovieExport(frames, snapshot, write_pov, filename_for,
+                                   processes = number_of_processors(),
+                                   render_queue = render_queue,
+                                   progress = progress)
+        try:
+            export.write_files()
+        except ParallelMapError, e:
+            print_compact_traceback("exception writing POV-Ray files: ")
+            # the child's exception is the last line of its traceback
+            lines = [line for line in str(e).split("\n") if line.strip()]
+            msg = "Error writing POV-Ray file(s): %s (see console for details)." % \
+                  quote_html(lines[-1].strip())
+            env.history.message( redmsg( msg ))
+        env.history.statusbar_msg("")
+        return export
+
+    def _povray_render_queue(self):
+        """
+        [private helper for _export_povray_series]
+        Return a RenderQueue which renders POV-Ray files with the POV-Ray
+        or MegaPOV plug-in at the glpane's size, or None (after emitting
+        a warning) if the plug-in prefs don't let us launch either one.
+        """
+        from graphics.rendering.povray.povray import decode_povray_prefs
+        errorcode, info = decode_povray_prefs(self.assy.w, False)
+        if errorcode:
+            msg = "POV-Ray files will not be rendered: %s" % (info,)
+            env.history.message( orangemsg( msg ))
+            return None
+        program_nickname, program_path, include_dir = info
+        extra_args = ()
+        if sys.platform == 'win32' and program_nickname == 'POV-Ray':
+            extra_args = ("/EXIT",) # as in launch_povray_or_megapov
+        glpane = self.assy.o
+        return RenderQueue([program_path], glpane.width, glpane.height,
+                           include_dir = include_dir,
+                           extra_args = extra_args)
 
     def _continue(self, hflag = True): # [bruce 050427 comment: only called from self._play]
         """
@@ -742,6 +862,8 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         self.win.movie_is_playing = False
         self.showEachFrame = False
         self.moveToEnd = False
+        if self.alist_and_moviefile:
+            self.alist_and_moviefile.pause_prefetching()
         self.propMgr.moviePlayActiveAction.setVisible(0)
         self.propMgr.moviePlayAction.setVisible(1)
         self.propMgr.moviePlayRevActiveAction.setVisible(0)
@@ -922,6 +1044,7 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
             if 1: ## self.showEachFrame: ####@@@@ old code said if 1 for this... what's best? maybe update them every 0.1 sec?
                 self.propMgr.updateCurrentFrame()
             if 1:
+                self.alist_and_moviefile.prefetch( self.currentFrame, fnum, inc * delta_n)
                 self.alist_and_moviefile.play_frame( self.currentFrame) # doing this every time makes it a lot slower, vs doing nothing!
                 ###e [bruce 050428 comments:]
                 # potential optim: do we need to do this now, even if not drawing on glpane?
@@ -1025,6 +1148,10 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
             ".  Number of Atoms: " +  str(self.natoms)
         
         env.history.message(msg)
+        if self.alist_and_moviefile:
+            msg = self.alist_and_moviefile.frame_cache_stats_message()
+            if msg:
+                env.history.message(msg)
 #        env.history.message("Temperature:" + str(self.temp) + "K")
 #        env.history.message("Steps per Frame:" + str(self.stepsper))
 #        env.history.message("Time Step:" + str(self.stepsper))
@@ -1071,14 +1198,18 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
         fullpath, ext = os.path.splitext(self.filename)
         return fullpath + "-plot.txt"
 
-    def moveAtoms(self, newPositions): # used when reading xyz files
+    def moveAtoms(self, newPositions, vectorized = False): # used when reading xyz files
         """
         Move a list of atoms to newPosition. After all atoms moving 
         [and singlet positions updated], bond updated, update display once.
         
         @param newPosition: a list of atom absolute position,
                             the list order is the same as self.alist
-        @type  newPosition: list
+        @type  newPosition: list (or N x 3 array)
+
+        @param vectorized: if true, move them with a FramePlan
+                           (see frame_delivery.py) even if
+                           pref_vectorized_sim_frames is not enabled
         """   
         if len(newPositions) != len(self.alist):
             #bruce 050225 added some parameters to this error message
@@ -1090,10 +1221,15 @@ class Movie(IdentityCopyMixin): #bruce 080321 bugfix: added IdentityCopyMixin
             print msg
             raise ValueError, msg
                 #bruce 060108 reviewed/revised all 2 calls, added this exception to preexisting noop/errorprint (untested)
-        move_alist_and_snuggle(self.alist, newPositions) #bruce 051221 fixed bug 1239 in this function, then split it out
+        if vectorized or pref_vectorized_sim_frames():
+            self._frame_plan = apply_frame(self._frame_plan, self.alist, newPositions)
+        else:
+            move_alist_and_snuggle(self.alist, newPositions) #bruce 051221 fixed bug 1239 in this function, then split it out
         self.glpane.gl_update()
         return
 
+    _frame_plan = None # FramePlan used by moveAtoms for self.alist, if any
+
     pass # end of class Movie
 
 # ==
@@ -1159,7 +1295,11 @@ class MovableAtomList: #bruce 050426 splitting this out of class Movie... except
         #e later we'll optimize this by owning atoms and speeding up or eliminating invals
         #bruce 060109 replaced prior code with this recently split out routine, so that singlet correction is done on every frame;
         # could be optimized, e.g. by precomputing singlet list and optimizing setposn_batch on lists of atoms
-        move_alist_and_snuggle(self.alist, newposns)
+        # (which is what apply_frame does, when that pref is enabled)
+        if pref_vectorized_sim_frames():
+            self._frame_plan = apply_frame(self._frame_plan, self.alist, newposns)
+        else:
+            move_alist_and_snuggle(self.alist, newposns)
 
     set_posns_no_inval = set_posns #e for now... later this can be faster, and require own/release around it
 
@@ -1203,6 +1343,9 @@ class MovableAtomList: #bruce 050426 splitting this out of class Movie... except
 
     def destroy(self):
         self.alist = None
+        self._frame_plan = None
+
+    _frame_plan = None # FramePlan used by set_posns, if any
 
     pass # end of class MovableAtomList
 
@@ -1236,6 +1379,9 @@ class alist_and_moviefile:
     which represents one of these. #k
     """
     _valid = False
+    frame_cache = None # a FrameCache of frames we played or prefetched, if we keep one
+    prefetcher = None # a FramePrefetcher which fills frame_cache, while we have one
+    _prefetcher_failed = False
     def __init__(self, assy, alist, filename, ref_frame = None): #bruce 060112 removed curframe_in_alist, added ref_frame
         """
         Caller promises that filename exists. If it matches alist well enough
@@ -1259,6 +1405,8 @@ class alist_and_moviefile:
         use it in some other way...).
         """
         self.alist = alist # needed for rechecking the match
+        self.filename = filename # needed for opening it again for a FramePrefetcher
+        self.ref_frame = ref_frame
         ## self.history = env.history # not yet used, but probably will be used for error messages [bruce 050913 removed this]
         self.moviefile = MovieFile( filename)
         self.movable_atoms = None 
@@ -1273,6 +1421,9 @@ class alist_and_moviefile:
             self.moviefile = None
             return # caller should check self.valid()
         self.movable_atoms = MovableAtomList( assy, alist)
+        budget = pref_movie_frame_cache_budget()
+        if budget:
+            self.frame_cache = FrameCache(budget)
 ##        if curframe_in_alist is not None:
 ##            n = curframe_in_alist
 ##            frame_n = self.movable_atoms.get_sim_posns()
@@ -1292,6 +1443,8 @@ class alist_and_moviefile:
         return
     def destroy(self):
         try:
+            self._stop_prefetching()
+            self.frame_cache = None
             if self.moviefile:
                 self.moviefile.destroy()
             if self.movable_atoms:
@@ -1324,7 +1477,7 @@ class alist_and_moviefile:
         mf = self.moviefile
         ma = self.movable_atoms
         if mf.frame_index_in_range(n):
-            frame_n = mf.ref_to_transient_frame_n(n)
+            frame_n = self._frame(n)
             ma.set_posns(frame_n) # now we no longer need frame_n
                 # (note: set_posns did invals but not updates.)
 ##            self.current_frame = n #k might not be needed -- our caller keeps its own version of this (named currentFrame)
@@ -1333,9 +1486,73 @@ class alist_and_moviefile:
             ## self.pause() ###k guess -- since we presumably hit the end... maybe return errcode instead, let caller decide??
             return False
         pass
+    def _frame(self, n):
+        """
+        Return frame n, from our frame cache if it has it, which the caller
+        must not modify or keep (see ref_to_transient_frame_n).
+        """
+        cache = self.frame_cache
+        if cache is None:
+            return self.moviefile.ref_to_transient_frame_n(n)
+        frame_n = cache.get(n)
+        if frame_n is None:
+            t0 = time.time()
+            frame_n = decode_frame(self.moviefile, cache, n)
+            cache.put(n, frame_n, time.time() - t0)
+        return frame_n
+    def frame_copy(self, n):
+        """
+        Return a new array of the positions in frame n, which the caller
+        owns, or None if n is beyond either end of our moviefile.
+        """
+        if not self.moviefile.frame_index_in_range(n):
+            return None
+        return + self._frame(n)
+    def prefetch(self, current, stop, step):
+        """
+        Advise us that frame current is about to be played, and that
+        playing will continue to frame stop in steps of step frames
+        (negative for REV), so that (if the prefs for this are set)
+        a FramePrefetcher can decode the next frames into our frame cache.
+        """
+        if self.frame_cache is None or not pref_movie_frame_prefetch():
+            return
+        if self.prefetcher is None:
+            if self._prefetcher_failed:
+                return
+            moviefile = MovieFile( self.filename) # its own one, for its thread
+            if not moviefile:
+                self._prefetcher_failed = True
+                return
+            if self.ref_frame:
+                n, frame_n = self.ref_frame
+                moviefile.donate_immutable_cached_frame( n, frame_n)
+            lookahead = self.frame_cache.lookahead( len(self.alist))
+            self.prefetcher = FramePrefetcher( moviefile, self.frame_cache, lookahead)
+            self.prefetcher.start()
+        self.prefetcher.prefetch(current, stop, step)
+        return
+    def pause_prefetching(self):
+        if self.prefetcher:
+            self.prefetcher.pause()
+    def _stop_prefetching(self):
+        if self.prefetcher:
+            self.prefetcher.stop() # (it destroys its own moviefile)
+            self.prefetcher = None
+    def frame_cache_stats_message(self):
+        """
+        Return a summary of our frame cache's stats, or None if we don't
+        keep one.
+        """
+        if self.frame_cache is None:
+            return None
+        return self.frame_cache.stats_message()
     def get_totalFramesActual(self):
         return self.moviefile.get_totalFramesActual()
     def close_file(self):
+        self._stop_prefetching()
+        if self.frame_cache is not None:
+            self.frame_cache.clear() # (don't keep its memory while we're closed)
         self.moviefile.close_file()
     pass # end of class alist_and_moviefile
 
@@ -1368,9 +1585,9 @@ def _checkMovieFile(part, filename): #bruce 050913 removed history arg since all
     # This function only checks number of atoms, and assumes all atoms of the Part
     # must be involved in the movie (in an order known to the Part, not checked,
     # though the order can easily be wrong).
-    # It is not yet updated to handle the "new dpb format" (ie it doesn't get help
-    # from either file keys or movie ids or atom positions) or movies made from
-    # a possible future "simulate selection" operation.
+    # For the "new dpb format" it only uses the number of atoms in the header
+    # (it doesn't get help from file keys or movie ids or atom positions), and it
+    # doesn't handle movies made from a possible future "simulate selection" operation.
     print_errors = True
 
     if DEBUG1: print "movie._checkMovieFile() function called. filename = ", filename
@@ -1397,17 +1614,27 @@ def _checkMovieFile(part, filename): #bruce 050913 removed history arg since all
             env.history.message(msg)
         return 2
 
-    # start of code that should be moved into moviefile.py and merged with similar code there
-    filesize = os.path.getsize(filename) - 4
+    if is_new_format_moviefile(filename):
+        # the header says how many atoms there are
+        reader = NewFormatMovieFile_startup(filename)
+        if reader.open_and_read_header_errQ():
+            reader.destroy()
+            return 2 # (the reader printed an error message)
+        filesize = os.path.getsize(filename)
+        nframes, natoms = reader.totalFramesActual, reader.natoms
+        reader.destroy()
+    else:
+        # start of code that should be moved into moviefile.py and merged with similar code there
+        filesize = os.path.getsize(filename) - 4
 
-    fp = open(filename,'rb')
+        fp = open(filename,'rb')
 
-    # Read header (4 bytes) from file containing the number of frames in the movie.
-    nframes = unpack('i',fp.read(4))[0]
-    fp.close()
+        # Read header (4 bytes) from file containing the number of frames in the movie.
+        nframes = unpack('i',fp.read(4))[0]
+        fp.close()
 
-    natoms = int(filesize/(nframes*3))
-    # end of code that should be moved into moviefile.py
+        natoms = int(filesize/(nframes*3))
+        # end of code that should be moved into moviefile.py
 
     kluge_ensure_natoms_correct( part)
 
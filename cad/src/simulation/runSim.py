@@ -53,6 +53,7 @@ from utilities.Log import redmsg, greenmsg, orangemsg, quote_html, _graymsg
 import foundation.env as env
 from foundation.env import seen_before
 from geometry.VQT import A, vlen
+from Numeric import zeros, Float
 import re
 from model.chunk import Chunk
 from model.elements import Singlet
@@ -79,6 +80,7 @@ from utilities.prefs_constants import nv1_enabled_prefs_key
 from utilities.prefs_constants import nv1_path_prefs_key
 
 from utilities.GlobalPreferences import pref_create_pattern_indicators
+from utilities.GlobalPreferences import pref_vectorized_sim_frames
 
 # some non-toplevel imports too (of which a few must remain non-toplevel)
 
@@ -1836,13 +1838,12 @@ class SimRunner:
 ##            elif ((not self.mflag and self._movie.watch_motion) or
 ##                  (self.mflag and env.prefs[Adjust_watchRealtimeMinimization_prefs_key])):
             elif self._movie.watch_motion:
-                from sim import theSimulator
-                frame = theSimulator().getFrame()
-                # stick the atom posns in, and adjust the singlet posns
-                newPositions = frame
                 movie = self._movie
                 #bruce 060102 note: following code is approximately duplicated somewhere else in this file.
                 try:
+                    frame = self._get_sim_frame()
+                    # stick the atom posns in, and adjust the singlet posns
+                    newPositions = frame
                     movie.moveAtoms(newPositions)
                 except ValueError: #bruce 060108
                     # wrong number of atoms in newPositions (only catches a subset of possible model-editing-induced errors)
@@ -1857,6 +1858,29 @@ class SimRunner:
                 self.need_process_events = True #bruce 060601
         return
 
+    _frame_buffer = None # array reused for each frame from the pyrex sim, if it supports that
+
+    def _get_sim_frame(self):
+        """
+        Return the pyrex simulator's current frame, as an array of
+        atom positions in the order of self._movie.alist. If
+        pref_vectorized_sim_frames is enabled, the simulator writes it
+        into an array we allocate once per run and return every time
+        (which the caller must not keep); otherwise it's a new array.
+        Raise ValueError if the frame doesn't match the size of alist.
+        """
+        from sim import theSimulator
+        simulator = theSimulator()
+        if not pref_vectorized_sim_frames() or \
+           not hasattr(simulator, 'getFrameInto'): # older sim module
+            return simulator.getFrame()
+        natoms = len(self._movie.alist)
+        frame = self._frame_buffer
+        if frame is None or len(frame) != natoms:
+            frame = self._frame_buffer = zeros((natoms, 3), Float)
+        simulator.getFrameInto(frame) # raises ValueError for wrong size
+        return frame
+
     def sim_frame_callback_updates(self): #bruce 060601 split out of sim_frame_callback_worker so it can be called separately
         """
         Do Qt-related updates which are needed after something has updated progress bar displays or done gl_update
@@ -2626,7 +2650,9 @@ def readxyz(filename, alist):
     for line in lines[2:]:
         words = line.split()
         if len(words) != 4:
-            msg = "readxyz: %s: Line %d format error." % (xyzFile, lines.index(line) + 1)
+            msg = "readxyz: %s: Line %d format error." % (xyzFile, atomIndex + 3)
+                # (not lines.index(line) + 1, which is slow for large files,
+                #  and wrong if an earlier line is the same)
                 #bruce 050404 fixed order of printfields, added 1 to index
             print msg
             return msg
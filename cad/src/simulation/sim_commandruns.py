@@ -32,6 +32,8 @@ from utilities.prefs_constants import MINIMIZE_ENGINE_UNSPECIFIED
 from utilities.prefs_constants import MINIMIZE_ENGINE_GROMACS_FOREGROUND
 from utilities.prefs_constants import MINIMIZE_ENGINE_GROMACS_BACKGROUND
 
+from utilities.GlobalPreferences import pref_bulk_minimize_results
+
 # possibly some non-toplevel imports too (of which a few must remain non-toplevel)
 
 from simulation.runSim import FAILURE_ALREADY_DOCUMENTED
@@ -40,6 +42,8 @@ from simulation.runSim import writemovie
 # these next two are only used in this file; should be split into their own file(s)
 from simulation.runSim import readxyz
 from simulation.runSim import readGromacsCoordinates
+from simulation.coordinate_files import read_xyz_positions
+from simulation.coordinate_files import read_gromacs_positions
 
 from simulation.sim_aspect import sim_aspect
 
@@ -604,19 +608,26 @@ class Minimize_CommandRun(CommandRun):
             return
 
         if mtype == 1:  # Load single-frame XYZ file.
+            bulk = pref_bulk_minimize_results()
             if (self.useGromacs):
                 if (self.background):
                     return
                 tracefileProcessor = movie._simrun.tracefileProcessor
-                newPositions = readGromacsCoordinates(movie.filename + "-out.gro", movie.alist, tracefileProcessor)
+                if bulk:
+                    newPositions = read_gromacs_positions(movie.filename + "-out.gro", movie.alist, tracefileProcessor)
+                else:
+                    newPositions = readGromacsCoordinates(movie.filename + "-out.gro", movie.alist, tracefileProcessor)
             else:
-                newPositions = readxyz( movie.filename, movie.alist )
+                if bulk:
+                    newPositions = read_xyz_positions( movie.filename, movie.alist )
+                else:
+                    newPositions = readxyz( movie.filename, movie.alist )
                     # movie.alist is now created in writemovie [bruce 050325]
-            # retval is either a list of atom posns or an error message string.
-            assert type(newPositions) in [type([]),type("")]
-            if type(newPositions) == type([]):
+            # retval is either a list (or, if bulk, an array) of atom posns
+            # or an error message string.
+            if type(newPositions) != type(""):
                 #bruce 060102 note: following code is approximately duplicated somewhere else in this file.
-                movie.moveAtoms(newPositions)
+                movie.moveAtoms(newPositions, vectorized = bulk)
                 # bruce 050311 hand-merged mark's 1-line bugfix in assembly.py (rev 1.135):
                 self.part.changed() # Mark - bugfix 386
                 self.part.gl_update()
@@ -0,0 +1,80 @@
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details. 
+"""
+Parity tests for the fast mmp reader (readmmp_fast_records):
+reading sample mmp files with and without it must produce
+the same atoms, chunks and bonds.
+
+Run from cad/src, e.g. "python tests/readmmptests.py".
+
+@author: NE1 developers
+@version: $Id$
+@copyright: 2008 Nanorex, Inc.  See LICENSE file for details. 
+"""
+
+import os
+import unittest
+
+from files.mmp.files_mmp import _readmmp
+from model.assembly import Assembly
+from utilities.constants import SUCCESS
+
+# sample files with many atom, bond, bond_direction and compact bond records
+_PARTLIB = os.path.join("..", "partlib")
+
+SAMPLE_FILES = [
+    "sdn/PAM 3 SDN/crossovers junctions/DX_crossover.mmp",
+    "sdn/PAM 3 SDN/Rothemund Origami Star.mmp",
+    "sdn/PAM 3 SDN/Holliday Junction Open.mmp",
+    "bearings/Large Bearing.mmp",
+    "gears/Planetary Gear Box 1.mmp",
+    "nanotubes/Bent Nanotube.mmp",
+    "organic chemistry/aromatic/benzene.mmp",
+]
+
+def summarize(listOfAtomsInFileOrder):
+    """
+    Return a comparable summary of the atoms read from an mmp file,
+    their chunks, and their bonds (with bond order and direction).
+    """
+    index = {}
+    for i, atom in enumerate(listOfAtomsInFileOrder):
+        index[atom.key] = i
+    res = []
+    for atom in listOfAtomsInFileOrder:
+        bonds = []
+        for bond in atom.bonds:
+            other = bond.other(atom)
+            bonds.append( (index.get(other.key), bond.v6,
+                           bond.bond_direction_from(atom)) )
+        res.append( (atom.element.symbol,
+                     tuple(atom.posn()),
+                     atom.display,
+                     atom.molecule.name,
+                     bonds ) ) # note: bonds are in order of creation
+    return res
+
+class ReadMMPTests(unittest.TestCase):
+
+    def _read(self, filename, fast):
+        assy = Assembly(None, run_updaters = False)
+        ok, grouplist, atoms = _readmmp(assy, filename, fast = fast)
+        assert ok == SUCCESS, "can't read %r" % filename
+        return summarize(atoms)
+
+    def test_fast_reader_parity(self):
+        for name in SAMPLE_FILES:
+            filename = os.path.join(_PARTLIB, name)
+            if not os.path.exists(filename):
+                continue
+            slow = self._read(filename, False)
+            fast = self._read(filename, True)
+            assert len(slow) == len(fast), name
+            assert slow == fast, name
+
+def test():
+    suite = unittest.makeSuite(ReadMMPTests, 'test')
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
+
+if __name__ == "__main__":
+    test()
@@ -17,6 +17,7 @@ the kinds of things in it so far -- bruce 080220 comment]
 
 from utilities.prefs_constants import permit_atom_chunk_coselection_prefs_key
 from utilities.debug_prefs import debug_pref, Choice_boolean_False, Choice_boolean_True
+from utilities.debug_prefs import Choice
 from utilities.debug import print_compact_traceback
 
 import sys
@@ -234,6 +235,21 @@ def debug_pref_read_new_display_names(): #bruce 080328
 debug_pref_write_new_display_names()
 debug_pref_read_new_display_names()
 
+def debug_pref_read_mmp_fast():
+    """
+    If enabled, runs of atom and bond records in mmp files are read
+    by a batched fast path (see _readmmp_state.readmmp_fast_records)
+    rather than one line at a time through readmmp_line. Both produce
+    the same model; this is only for testing or working around bugs.
+    """
+    res = debug_pref("mmp format: fast reading of atom and bond records?",
+                     Choice_boolean_True, # use False to compare with old reading code
+                     prefs_key = True
+                 )
+    return res
+
+debug_pref_read_mmp_fast()
+
 # ==
 
 def use_frustum_culling(): #piotr 080401
@@ -249,6 +265,278 @@ def use_frustum_culling(): #piotr 080401
 
     return res
 
+def pref_bvh_frustum_culling():
+    """
+    If enabled (and frustum culling is enabled), GLPane culls all chunks
+    of the current Part against the view frustum at once, using a
+    bounding volume hierarchy of their bounding spheres
+    (see graphics/drawing/chunk_culling.py), rather than testing each
+    chunk's bounding sphere separately when it's drawn.
+    """
+    res = debug_pref("GLPane: cull chunks using bounding volume hierarchy?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_per_atom_frustum_culling():
+    """
+    If enabled (and frustum culling is enabled), chunks whose atoms are
+    drawn one at a time rather than from a display list (e.g. while a
+    movie is playing) skip drawing their atoms which are outside the
+    view frustum, if the chunk is large and only partly inside it.
+    """
+    res = debug_pref("GLPane: per-atom frustum culling in large chunks?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+# ==
+
+def pref_indexed_picking():
+    """
+    If enabled, the atom under the mouse and the atoms inside a
+    selection rectangle or lasso are found using a spatial index of
+    each Part's chunks and atoms (see operations/pick_index.py),
+    rather than by testing every chunk and atom.
+    """
+    res = debug_pref("Selection: use spatial index for picking?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_use_mmap_movie_reader():
+    """
+    If enabled, movie (dpb) files are read through a memory map, with
+    an index of keyframes for fast random access to any frame
+    (see MmapOldFormatMovieFile).
+    """
+    res = debug_pref("Movie: use memory-mapped reader with keyframes?",
+                     Choice_boolean_True,
+                     prefs_key = True)
+    return res
+
+def pref_movie_frame_cache_budget():
+    """
+    Return the memory budget, in bytes, for the cache of decoded frames
+    kept while playing a movie (see FrameCache), or 0 to keep no such
+    cache (and decode each frame as it's played).
+    """
+    res = debug_pref("Movie: frame cache size (MB)",
+                     Choice([0, 32, 128, 512], defaultValue = 0),
+                     prefs_key = True)
+    return res * 1024 * 1024
+
+def pref_movie_frame_prefetch():
+    """
+    If enabled (and the movie frame cache is), a background thread
+    decodes the frames about to be played into the frame cache, in the
+    direction the movie is playing (see FramePrefetcher).
+    """
+    res = debug_pref("Movie: prefetch frames in a thread?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_parallel_povray_movie_export():
+    """
+    If enabled, saving a movie as POV-Ray files writes them in several
+    forked processes, from snapshots of the frames' positions (see
+    PovrayMovieExport), rather than playing and writing each frame in
+    turn. Where os.fork is not available, the files are still written
+    from snapshots, but one at a time.
+    """
+    res = debug_pref("Movie: write POV-Ray files in parallel processes?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_gzip_povray_movie_files():
+    """
+    If enabled, saving a movie as POV-Ray files writes them gzipped
+    (named *.pov.gz), e.g. for rendering elsewhere. (They're not
+    rendered as they're written, since POV-Ray can't read them.)
+    """
+    res = debug_pref("Movie: gzip POV-Ray files?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_render_povray_movie_frames():
+    """
+    If enabled (as well as pref_parallel_povray_movie_export), each
+    POV-Ray file of a saved movie is also rendered into a PNG file, as
+    soon as it's written, by the POV-Ray or MegaPOV plug-in, with one
+    renderer running per processor (see RenderQueue).
+    """
+    res = debug_pref("Movie: render POV-Ray files as they're written?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+# ==
+
+def pref_use_columnar_atom_store():
+    """
+    If enabled, each chunk keeps its atoms' positions in one contiguous
+    array (an AtomStore), so atpos/basepos and whole-chunk moves don't
+    need to visit each atom. Takes effect for a chunk when its atom list
+    is next recomputed.
+    """
+    res = debug_pref("Chunk: keep atom positions in columnar store?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+# ==
+
+def pref_streaming_pdb_io():
+    """
+    If enabled, PDB files are read one line at a time, with their atom
+    records parsed in blocks and bonds inferred in bulk from covalent
+    radii, and written in bulk (see files/pdb/pdb_stream.py).
+    """
+    res = debug_pref("PDB: streaming reader and bulk writer?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_vectorized_sim_frames():
+    """
+    If enabled, frames from the simulator (watched in real time, or
+    played from a movie file) are applied to the atoms with Numeric
+    operations over a reused array (see simulation/frame_delivery.py),
+    rather than by moving and snuggling one atom at a time. Chunks'
+    atoms are only moved all at once if pref_use_columnar_atom_store is
+    also enabled.
+    """
+    res = debug_pref("Simulation: vectorized frame delivery?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_bulk_minimize_results():
+    """
+    If enabled, the coordinate file written by a minimize (XYZ or GROMACS)
+    is read into one array (see simulation/coordinate_files.py), and
+    its positions are applied to the atoms in bulk, as for
+    pref_vectorized_sim_frames.
+    """
+    res = debug_pref("Simulation: bulk reader for minimize results?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_vectorized_crystal_cutter():
+    """
+    If enabled, Build Crystal mode cuts the crystal from the lattice by
+    testing all lattice sites against the curves of each layer at once
+    (see commands/BuildCrystal/crystal_cutter.py), rather than cell by
+    cell, one atom at a time. Takes effect for newly started cookies.
+    """
+    res = debug_pref("Build Crystal: vectorized crystal cutter?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_bulk_hexagonal_generators():
+    """
+    If enabled, Build Graphene and Build Nanotube compute the positions
+    and bonds of all their atoms at once as arrays (see
+    geometry/hexagonal_lattice.py) and make them in bulk, rather than
+    making atoms one at a time and trimming them. (Not used for capped
+    nanotube endings.)
+    """
+    res = debug_pref("Generators: build graphene and nanotubes in bulk?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_dna_duplex_from_templates():
+    """
+    If enabled, the DNA duplex generator reads each base-pair mmp file
+    only once, and makes all the base-pairs from it at once, bonding
+    them directly (see dna/commands/BuildDuplex/duplex_templates.py)
+    rather than inserting and fusing one base-pair chunk at a time.
+    """
+    res = debug_pref("DNA: build duplexes from base-pair templates?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_bulk_bond_geometry():
+    """
+    If enabled, chunks compute the cylinders of their plain bonds
+    (internal and external) all at once, as arrays, and schedule them
+    in ColorSorter with one call per color (see draw_bonds_in_bulk
+    in bond_drawer.py), rather than drawing one bond at a time.
+    """
+    res = debug_pref("Graphics: compute bond cylinders in bulk?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_cache_display_style_geometry():
+    """
+    If enabled, the Protein display style keeps what it draws for each
+    chunk, and the DNA Cylinder style its curved strands, and reuses them
+    while the chunk's positions and the style settings are unchanged
+    (see ChunkDisplayMode.cached_geometry), rather than recomputing them
+    whenever the chunk's display list is remade.
+    """
+    res = debug_pref("Graphics: cache protein and DNA style geometry?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_bulk_povray_writer():
+    """
+    If enabled, chunks write their atoms and plain bonds into POV-Ray
+    files in bulk, as unions of spheres and cylinders grouped by color,
+    with one write per chunk (see bulk_writepov.py), rather than one
+    macro call per atom and bond.
+    """
+    res = debug_pref("POV-Ray: write atoms and bonds in bulk?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_parallel_bond_inference():
+    """
+    If enabled, bond inference from atom positions (e.g. when reading
+    PDB files) finds candidate pairs for very large sets of atoms in
+    several forked processes, one per processor (see
+    parallel_candidate_pairs in bonds_from_atoms.py). Where os.fork
+    is not available, this has no effect.
+    """
+    res = debug_pref("Bonds: infer bonds in parallel processes?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_fuse_chunks_spatial_index():
+    """
+    If enabled, Fuse Chunks finds bondable pairs and overlapping atoms
+    using one spatial index of all the chunks' bondpoints or atoms,
+    reused while only the tolerance changes (see FuseIndex), rather than
+    by comparing the atoms of each pair of nearby chunks.
+    """
+    res = debug_pref("Fuse Chunks: use spatial index?",
+                     Choice_boolean_False,
+                     prefs_key = True)
+    return res
+
+def pref_rosetta_design_processes():
+    """
+    Return the number of Rosetta processes to run at once for a Rosetta
+    sequence design, each making its share of the designs requested
+    with its own random seed (see ParallelRosettaDesign); 1 means one
+    Rosetta process makes them all.
+    """
+    res = debug_pref("Rosetta: design processes to run at once",
+                     Choice([1, 2, 4, 8, 16], defaultValue = 1),
+                     prefs_key = True)
+    return res
+
 # ==
 
 def pref_MMKit_include_experimental_PAM_atoms(): #bruce 080412
@@ -28,12 +28,45 @@
  executed.  When it exits, the job directory is moved to the OUTPUT
  directory, and the queue runner scans the QUEUE directory again.
  When it finds nothing in the QUEUE directory, it exits.
+
+ With --jobs N, the queue runner keeps up to N jobs running at once,
+ each in a forked child process, and with --retries N it reruns a
+ failed job (in place, in the CURRENT directory) up to N more times.
+ When a job is done, a 'timing' file recording its exit status,
+ attempts, wall clock time and CPU time is written into its directory
+ before it is moved to OUTPUT, and the file 'summary.txt' in the base
+ directory is rewritten to describe all completed jobs.
+
+ For unattended runs (e.g. parameter sweeps), 'batchsim --manifest
+ FILE' queues one job for each combination of an mmp file and the
+ parameter values listed in FILE (see readManifest), without asking
+ any questions, then runs the queue in the foreground and prints a
+ summary of those jobs.  For example, this manifest queues four
+ minimizations:
+
+   mmp = gears/*.mmp        # relative to the manifest's directory
+   mode = minimize
+   end_rms = 50, 10
+
+ Options:
+
+   --run-queue            only start the queue runner (in the background)
+   --manifest FILE        queue jobs from FILE and run them (see above)
+   --jobs N               number of jobs to run at once (default 1)
+   --retries N            times to rerun a failed job (default 0)
+   --summary              print the summary of all completed jobs
+   --base-directory DIR   use DIR instead of /tmp/batchsim
+   --simulator PATH       simulator executable to run (default simulator)
 """
 
 import sys
 import os
 import time
 import fcntl
+import errno
+import getopt
+import glob
+import shutil
 
 baseDirectory = "/tmp/batchsim"
 
@@ -42,6 +75,16 @@ OUTPUT  = os.path.join(baseDirectory, "output")
 QUEUE   = os.path.join(baseDirectory, "queue")
 CURRENT = os.path.join(baseDirectory, "current")
 
+simulator = "simulator"
+
+def setBaseDirectory(path):
+    global baseDirectory, INPUT, OUTPUT, QUEUE, CURRENT
+    baseDirectory = path
+    INPUT   = os.path.join(baseDirectory, "input")
+    OUTPUT  = os.path.join(baseDirectory, "output")
+    QUEUE   = os.path.join(baseDirectory, "queue")
+    CURRENT = os.path.join(baseDirectory, "current")
+
 def nextJobNumber():
     nextFileName = os.path.join(QUEUE, "next")
     try:
@@ -52,6 +95,7 @@ def nextJobNumber():
         n = 0
     f = open(nextFileName, 'w')
     print >>f, "%d" % (n + 1)
+    f.close()
     return "%05d" % n
 
 def ask(question, default):
@@ -92,37 +136,111 @@ def askFloat(question, default):
             print
             print "reply was not a float: " + reply.strip()
 
-def runJob(jobNumber):
-    queuePath = os.path.join(QUEUE, jobNumber)
-    currentPath = os.path.join(CURRENT, jobNumber)
-    outputPath = os.path.join(OUTPUT, jobNumber)
-    os.rename(queuePath, currentPath)
+def executeJob(currentPath, attempt):
+    """
+      Run the commands in the 'run' file of the job in currentPath,
+      with stdout and stderr going to files in that directory (appended
+      to, for attempts after the first).  Stop at the first command
+      which fails.  Must be called in a child process, since it changes
+      the current directory and file descriptors 0 to 2.  Return 0 if
+      all the commands succeeded, otherwise 1.
+    """
     os.chdir(currentPath)
 
+    if (attempt > 1):
+        mode = 'a'
+    else:
+        mode = 'w'
     childStdin = open("/dev/null")
-    childStdout = open("stdout", 'w')
-    childStderr = open("stderr", 'w')
+    childStdout = open("stdout", mode)
+    childStderr = open("stderr", mode)
     os.dup2(childStdin.fileno(), 0)
     childStdin.close()
     os.dup2(childStdout.fileno(), 1)
     childStdout.close()
     os.dup2(childStderr.fileno(), 2)
     childStderr.close()
+    if (attempt > 1):
+        print >>sys.stderr, "--- attempt %d ---" % attempt
+        sys.stderr.flush()
 
+    result = 0
     run = open("run")
     for command in run:
         status = os.system(command)
         if (status):
             print >>sys.stderr, "command: %s\nexited with status: %d" % (command, status)
+            result = 1
             break
+    sys.stderr.flush()
 
     os.close(0)
     os.close(1)
     os.close(2)
     os.chdir("/")
-    os.rename(currentPath, outputPath)
+    return result
 
-def processQueue():
+class Job:
+    """
+      A job being run by processQueue, perhaps for the second or later time.
+    """
+    def __init__(self, jobNumber):
+        self.jobNumber = jobNumber
+        self.attempt = 0
+        self.startTime = time.time()
+        self.cpuTime = 0.0 # CPU time of all attempts which have exited
+
+def childCpuTime():
+    """
+      Return the user plus system CPU time used so far by all the
+      children of this process which have been waited for.
+    """
+    times = os.times()
+    return times[2] + times[3]
+
+def startJob(job):
+    """
+      Fork a child process to run the next attempt at job (which must
+      be in the CURRENT directory), and return its process id.
+    """
+    job.attempt += 1
+    pid = os.fork()
+    if (pid):
+        return pid
+    # child
+    try:
+        status = executeJob(os.path.join(CURRENT, job.jobNumber), job.attempt)
+    except:
+        status = 1
+    os._exit(status)
+
+def finishJob(job, status):
+    """
+      Record the outcome of job in its directory, and move it from
+      CURRENT to OUTPUT.
+    """
+    jobPath = os.path.join(CURRENT, job.jobNumber)
+    timing = open(os.path.join(jobPath, "timing"), 'w')
+    print >>timing, "status %d" % status
+    print >>timing, "attempts %d" % job.attempt
+    print >>timing, "wall %.3f" % (time.time() - job.startTime)
+    print >>timing, "cpu %.3f" % job.cpuTime
+    timing.close()
+    if (status):
+        failed = open(os.path.join(jobPath, "FAILED"), 'w')
+        print >>failed, "The job's commands failed in each of %d attempt(s)." % job.attempt
+        failed.close()
+    os.rename(jobPath, os.path.join(OUTPUT, job.jobNumber))
+
+def firstQueuedJob():
+    fileList = os.listdir(QUEUE)
+    fileList.sort()
+    for jobNumber in fileList:
+        if (jobNumber.isdigit()):
+            return jobNumber
+    return None
+
+def processQueue(numJobs = 1, retries = 0):
     # First, we move anything from the current directory into output,
     # and consider those jobs to have failed.  The processQueue that
     # started these should have moved them to output itself, so
@@ -140,23 +258,61 @@ def processQueue():
             os.rename(jobPath, os.path.join(OUTPUT, jobNumber))
 
     # Now, we check to see if there's anything in the queue directory.
-    # If so, we move the first job to current, and execute it's run
-    # file.  Move the results to the output directory and scan again
-    # after the run file completes.
-
+    # If so, we move the first job to current, and execute its run
+    # file in a child process, until numJobs are running.  As each
+    # child exits, we either rerun its job (if it failed and has
+    # retries left), or move the results to the output directory, and
+    # then scan the queue again.
+
+    running = {} # maps process id -> Job
+    lastCpuTime = childCpuTime()
     while (True):
-        gotOne = False
-        fileList = os.listdir(QUEUE)
-        fileList.sort()
-        for jobNumber in fileList:
-            if (jobNumber.isdigit()):
-                gotOne = True
-                runJob(jobNumber)
+        while (len(running) < numJobs):
+            jobNumber = firstQueuedJob()
+            if (jobNumber is None):
                 break
-        if (not gotOne):
+            os.rename(os.path.join(QUEUE, jobNumber),
+                      os.path.join(CURRENT, jobNumber))
+            job = Job(jobNumber)
+            running[startJob(job)] = job
+        if (not running):
             break
+        try:
+            pid, status = os.wait()
+        except OSError, e:
+            if (e.errno == errno.EINTR):
+                continue
+            raise
+        job = running.pop(pid, None)
+        if (job is None):
+            continue
+        cpuTime = childCpuTime()
+        job.cpuTime += cpuTime - lastCpuTime
+        lastCpuTime = cpuTime
+        if (os.WIFEXITED(status)):
+            status = os.WEXITSTATUS(status)
+        if (status and job.attempt <= retries):
+            running[startJob(job)] = job
+        else:
+            finishJob(job, status)
+            writeSummary()
 
-def runQueue():
+def lockQueue():
+    """
+      Take the queue runner lock, returning the open lock file (which
+      holds the lock until it's closed or this process exits), or
+      return None if another process has it.
+    """
+    lockFileName = os.path.join(QUEUE, "lock")
+    lockFile = open(lockFileName, 'w')
+    try:
+        fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lockFile.close()
+        return None
+    return lockFile
+
+def runQueue(numJobs = 1, retries = 0):
     # fork and lock, exiting immediately if another process has the lock
     pid = os.fork()
     if (pid):
@@ -165,16 +321,101 @@ def runQueue():
         # by this time, a simulator sub-process should have been started
     else:
         # child
-        lockFileName = os.path.join(QUEUE, "lock")
-        lockFile = open(lockFileName, 'w')
-        lockFD = lockFile.fileno()
-        try:
-            fcntl.flock(lockFD, fcntl.LOCK_EX | fcntl.LOCK_NB)
-        except IOError:
+        lockFile = lockQueue()
+        if (lockFile is None):
             os._exit(0)
-        processQueue()
+        processQueue(numJobs, retries)
         os._exit(0)
 
+# Simulation parameters, with their default values.  The interactive
+# questions in scanInput, and the lines of a manifest file, set these.
+PARAMETER_DEFAULTS = {
+    'mode': "dynamics",         # "minimize" or "dynamics"
+    'end_rms': 50.0,            # minimize: ending force threshold (pN)
+    'engine': "gromacs",        # minimize: "gromacs" or "nd1"
+    'pam': "yes",               # gromacs: does the model have PAM atoms (DNA)?
+    'neighbor_searching': "no", # gromacs: enable neighbor searching?
+    'temperature': 300,         # dynamics: temperature in Kelvins
+    'steps_per_frame': 10,      # dynamics
+    'frames': 900,              # dynamics
+    }
+
+def runCommands(baseName, fileName, parameters):
+    """
+      Return the list of commands for the 'run' file of a job which
+      simulates fileName (an mmp file named baseName.mmp, in the job's
+      directory) using parameters, a dictionary with the same keys as
+      PARAMETER_DEFAULTS.
+    """
+    commands = []
+    if (parameters['mode'].startswith("m")):
+        end_rms = float(parameters['end_rms'])
+        if (parameters['engine'].startswith("g")):
+            hasPAM = parameters['pam'].startswith("y")
+            if (hasPAM):
+                vdwCutoffRadius = 2
+            else:
+                vdwCutoffRadius = -1
+            if (parameters['neighbor_searching'].startswith("y")):
+                neighborSearching = 1
+            else:
+                neighborSearching = 0
+            commands.append("%s -m --min-threshold-end-rms=%f --trace-file %s-trace.txt --write-gromacs-topology %s --path-to-cpp /usr/bin/cpp --system-parameters %s/control/sim-params.txt --vdw-cutoff-radius %f --neighbor-searching %d %s" \
+                  % (simulator, end_rms, baseName, baseName, baseDirectory, vdwCutoffRadius, neighborSearching, fileName))
+
+            commands.append("grompp -f %s.mdp -c %s.gro -p %s.top -n %s.ndx -o %s.tpr -po %s-out.mdp" \
+                  % (baseName, baseName, baseName, baseName, baseName, baseName))
+
+            if (hasPAM):
+                tableFile = "%s/control/yukawa.xvg" % baseDirectory
+                table = "-table %s -tablep %s" % (tableFile, tableFile)
+            else:
+                table = ""
+
+            commands.append("mdrun -s %s.tpr -o %s.trr -e %s.edr -c %s.xyz-out.gro -g %s.log %s" \
+                  % (baseName, baseName, baseName, baseName, baseName, table))
+        else:
+            commands.append("%s -m --system-parameters %s/control/sim-params.txt --output-format-3 --min-threshold-end-rms=%f --trace-file %s-trace.txt %s" \
+                  % (simulator, baseDirectory, end_rms, baseName, fileName))
+    else:
+        commands.append("%s  --system-parameters %s/control/sim-params.txt --temperature=%d --iters-per-frame=%d --num-frames=%d --trace-file %s-trace.txt %s" \
+              % (simulator, baseDirectory, int(parameters['temperature']),
+                 int(parameters['steps_per_frame']), int(parameters['frames']),
+                 baseName, fileName))
+    return commands
+
+def queueJob(mmpPath, parameters, move = False):
+    """
+      Make a new job in the QUEUE directory to simulate the mmp file
+      mmpPath using parameters (see runCommands), by copying the file
+      (or moving it, if move is true) into the job's directory and
+      writing its 'run' and 'parameters' files.  Return the job number.
+
+      The job directory is built under a temporary name, so a queue
+      runner never sees it before its 'run' file is complete.
+    """
+    fileName = os.path.basename(mmpPath)
+    baseName = fileName[:-4]
+    jobNumber = nextJobNumber()
+    tempDir = os.path.join(QUEUE, "new-" + jobNumber)
+    os.mkdir(tempDir)
+    if (move):
+        os.rename(mmpPath, os.path.join(tempDir, fileName))
+    else:
+        shutil.copy(mmpPath, os.path.join(tempDir, fileName))
+    runFile = open(os.path.join(tempDir, "run"), 'w')
+    for command in runCommands(baseName, fileName, parameters):
+        print >>runFile, command
+    runFile.close()
+    parametersFile = open(os.path.join(tempDir, "parameters"), 'w')
+    keys = parameters.keys()
+    keys.sort()
+    for key in keys:
+        print >>parametersFile, "%s = %s" % (key, parameters[key])
+    parametersFile.close()
+    os.rename(tempDir, os.path.join(QUEUE, jobNumber))
+    return jobNumber
+
 def scanInput():
     fileList = os.listdir(INPUT)
     fileList.sort()
@@ -183,57 +424,201 @@ def scanInput():
             baseName = fileName[:-4]
             print "processing " + baseName
 
-            dirInQueue = os.path.join(QUEUE, nextJobNumber())
-            os.mkdir(dirInQueue)
-            os.rename(os.path.join(INPUT, fileName), os.path.join(dirInQueue, fileName))
-            runFile = open(os.path.join(dirInQueue, "run"), 'w')
-
+            parameters = PARAMETER_DEFAULTS.copy()
             minimize = ask("[M]inimize or [D]ynamics", "D").strip().lower()
             if (minimize.startswith("m")):
-
-                end_rms = askFloat("Ending force threshold (pN)", 50.0)
+                parameters['mode'] = "minimize"
+                parameters['end_rms'] = askFloat("Ending force threshold (pN)", 50.0)
                 useGromacs = ask("Use [G]romacs (required for DNA) or [N]D-1 (required for double bonds)", "G").strip().lower()
                 if (useGromacs.startswith("g")):
+                    parameters['engine'] = "gromacs"
                     hasPAM = ask("Does your model contain PAM atoms (DNA)? (Y/N)", "Y").strip().lower()
-                    hasPAM = hasPAM.startswith("y")
-                    if (hasPAM):
-                        vdwCutoffRadius = 2
-                    else:
-                        vdwCutoffRadius = -1
+                    parameters['pam'] = hasPAM.startswith("y") and "yes" or "no"
                     doNS = ask("Enable neighbor searching? [Y]es (more accurate)/[N]o (faster)", "N").strip().lower()
-                    if (doNS.startswith("y")):
-                        neighborSearching = 1
-                    else:
-                        neighborSearching = 0
-                    print >>runFile, "simulator -m --min-threshold-end-rms=%f --trace-file %s-trace.txt --write-gromacs-topology %s --path-to-cpp /usr/bin/cpp --system-parameters %s/control/sim-params.txt --vdw-cutoff-radius %f --neighbor-searching %d %s" \
-                          % (end_rms, baseName, baseName, baseDirectory, vdwCutoffRadius, neighborSearching, fileName)
-
-                    print >>runFile, "grompp -f %s.mdp -c %s.gro -p %s.top -n %s.ndx -o %s.tpr -po %s-out.mdp" \
-                          % (baseName, baseName, baseName, baseName, baseName, baseName)
-
-                    if (hasPAM):
-                        tableFile = "%s/control/yukawa.xvg" % baseDirectory
-                        table = "-table %s -tablep %s" % (tableFile, tableFile)
-                    else:
-                        table = ""
-
-                    print >>runFile, "mdrun -s %s.tpr -o %s.trr -e %s.edr -c %s.xyz-out.gro -g %s.log %s" \
-                          % (baseName, baseName, baseName, baseName, baseName, table)
+                    parameters['neighbor_searching'] = doNS.startswith("y") and "yes" or "no"
                 else:
-                    print >>runFile, "simulator -m --system-parameters %s/control/sim-params.txt --output-format-3 --min-threshold-end-rms=%f --trace-file %s-trace.txt %s" \
-                          % (baseDirectory, end_rms, baseName, fileName)
+                    parameters['engine'] = "nd1"
             else:
+                parameters['mode'] = "dynamics"
                 temp = askInt("Temperature in Kelvins", 300)
                 stepsPerFrame = askInt("Steps per frame", 10)
                 frames = askInt("Frames", 900)
                 print
                 print "temp %d steps %d frames %d" % (temp, stepsPerFrame, frames)
+                parameters['temperature'] = temp
+                parameters['steps_per_frame'] = stepsPerFrame
+                parameters['frames'] = frames
 
-                print >>runFile, "simulator  --system-parameters %s/control/sim-params.txt --temperature=%d --iters-per-frame=%d --num-frames=%d --trace-file %s-trace.txt %s" \
-                      % (baseDirectory, temp, stepsPerFrame, frames, baseName, fileName)
+            queueJob(os.path.join(INPUT, fileName), parameters, move = True)
         else:
             print "ignoring " + os.path.join(INPUT, fileName)
 
+class ManifestError(Exception):
+    pass
+
+def readManifest(fileName):
+    """
+      Read a manifest file, and return a list of (mmpPath, parameters)
+      pairs, one for each job it describes: each mmp file it lists,
+      with each combination of the parameter values it lists.
+
+      Each line (after removing comments, which start with '#') is
+      blank or has the form 'name = value, value, ...'.  The name is
+      either 'mmp', whose values are mmp file names or glob patterns
+      (relative to the manifest's directory), or a key of
+      PARAMETER_DEFAULTS.  Lines naming 'mmp' add to the files listed;
+      a parameter line replaces that parameter's values, and a
+      parameter given more than one value is swept over all of them.
+      Raise ManifestError if the manifest can't be used.
+    """
+    directory = os.path.dirname(os.path.abspath(fileName))
+    mmpPaths = []
+    grid = {}
+    lineNumber = 0
+    for line in open(fileName):
+        lineNumber += 1
+        line = line.split('#')[0].strip()
+        if (not line):
+            continue
+        where = "%s:%d" % (fileName, lineNumber)
+        if (line.find('=') < 0):
+            raise ManifestError("%s: expected 'name = value, ...'" % where)
+        name, values = line.split('=', 1)
+        name = name.strip()
+        values = [value.strip() for value in values.split(',') if value.strip()]
+        if (not values):
+            raise ManifestError("%s: no values given for %s" % (where, name))
+        if (name == 'mmp'):
+            for pattern in values:
+                paths = glob.glob(os.path.join(directory, pattern))
+                paths.sort()
+                if (not paths):
+                    raise ManifestError("%s: no files match %s" % (where, pattern))
+                for path in paths:
+                    if (not path.endswith(".mmp")):
+                        raise ManifestError("%s: not an mmp file: %s" % (where, path))
+                mmpPaths.extend(paths)
+        elif (PARAMETER_DEFAULTS.has_key(name)):
+            grid[name] = values
+        else:
+            raise ManifestError("%s: unknown name %s" % (where, name))
+    if (not mmpPaths):
+        raise ManifestError("%s: no mmp files listed" % fileName)
+
+    combinations = [PARAMETER_DEFAULTS.copy()]
+    names = grid.keys()
+    names.sort()
+    for name in names:
+        newCombinations = []
+        for parameters in combinations:
+            for value in grid[name]:
+                parameters = parameters.copy()
+                parameters[name] = value
+                newCombinations.append(parameters)
+        combinations = newCombinations
+
+    jobs = []
+    for mmpPath in mmpPaths:
+        for parameters in combinations:
+            jobs.append((mmpPath, parameters))
+    return jobs
+
+def readTiming(jobPath):
+    """
+      Return the contents of a job's 'timing' file as a dictionary
+      (see finishJob), or None if it has none.
+    """
+    try:
+        lines = open(os.path.join(jobPath, "timing")).readlines()
+    except IOError:
+        return None
+    timing = {}
+    for line in lines:
+        words = line.split()
+        if (len(words) == 2):
+            timing[words[0]] = float(words[1])
+    return timing
+
+def summaryLines(jobNumbers = None):
+    """
+      Return a list of lines describing the completed jobs in the
+      OUTPUT directory (or just those in jobNumbers, if given): one
+      per job, with its mmp file, status, attempts and times, and a
+      line of totals.
+    """
+    if (jobNumbers is None):
+        jobNumbers = [jobNumber for jobNumber in os.listdir(OUTPUT) if jobNumber.isdigit()]
+    jobNumbers = list(jobNumbers)
+    jobNumbers.sort()
+    lines = ["%-6s %-30s %-7s %8s %10s %10s" % ("job", "file", "status", "attempts", "wall", "cpu")]
+    completed = failed = 0
+    totalWall = totalCpu = 0.0
+    for jobNumber in jobNumbers:
+        jobPath = os.path.join(OUTPUT, jobNumber)
+        if (not os.path.isdir(jobPath)):
+            continue
+        mmpFiles = [fileName for fileName in os.listdir(jobPath) if fileName.endswith(".mmp")]
+        mmpFiles.sort()
+        fileName = (mmpFiles + ["?"])[0]
+        timing = readTiming(jobPath)
+        isFailed = os.path.exists(os.path.join(jobPath, "FAILED"))
+        if (isFailed):
+            failed += 1
+            status = "FAILED"
+        else:
+            completed += 1
+            status = "ok"
+        if (timing is None):
+            lines.append("%-6s %-30s %-7s" % (jobNumber, fileName, status))
+            continue
+        totalWall += timing.get('wall', 0.0)
+        totalCpu += timing.get('cpu', 0.0)
+        lines.append("%-6s %-30s %-7s %8d %10.2f %10.2f" % \
+                     (jobNumber, fileName, status, timing.get('attempts', 0),
+                      timing.get('wall', 0.0), timing.get('cpu', 0.0)))
+    lines.append("%d succeeded, %d failed; total wall %.2f sec, total cpu %.2f sec" % \
+                 (completed, failed, totalWall, totalCpu))
+    return lines
+
+def writeSummary():
+    summary = open(os.path.join(baseDirectory, "summary.txt"), 'w')
+    for line in summaryLines():
+        print >>summary, line
+    summary.close()
+
+def runManifest(manifestFileName, numJobs, retries):
+    """
+      Queue the jobs described by a manifest file, run the queue in
+      the foreground, and print a summary of those jobs.  Return 0 if
+      they all succeeded, otherwise 1.
+    """
+    try:
+        jobs = readManifest(manifestFileName)
+    except (ManifestError, IOError), e:
+        print >>sys.stderr, "batchsim: %s" % e
+        return 1
+    jobNumbers = []
+    for mmpPath, parameters in jobs:
+        jobNumbers.append(queueJob(mmpPath, parameters))
+    print "queued %d jobs from %s" % (len(jobNumbers), manifestFileName)
+    lockFile = lockQueue()
+    if (lockFile is None):
+        print "another queue runner is active, and will run them"
+        return 0
+    startTime = time.time()
+    processQueue(numJobs, retries)
+    elapsed = time.time() - startTime
+    lockFile.close()
+    lines = summaryLines(jobNumbers)
+    print
+    for line in lines:
+        print line
+    print "elapsed %.2f sec using %d parallel jobs" % (elapsed, numJobs)
+    for jobNumber in jobNumbers:
+        if (os.path.exists(os.path.join(OUTPUT, jobNumber, "FAILED"))):
+            return 1
+    return 0
+
 def showOneJob(dirName, jobNumber):
     fileList = os.listdir(dirName)
     fileList.sort()
@@ -254,7 +639,7 @@ def showJobsInDirectory(dirName, header):
 
 def showStatus():
     showJobsInDirectory(QUEUE, "\nJobs queued for later processing:\n")
-    showJobsInDirectory(CURRENT, "\nCurrently executing job:\n")
+    showJobsInDirectory(CURRENT, "\nCurrently executing jobs:\n")
     showJobsInDirectory(OUTPUT, "\nCompleted jobs:\n")
     gotProcess = False
     ps = os.popen("ps ax")
@@ -277,17 +662,60 @@ def makeDirectory(path):
         return
     os.makedirs(path)
 
+def usage():
+    print >>sys.stderr, "usage: batchsim [--run-queue | --manifest FILE | --summary] [--jobs N] [--retries N]"
+    print >>sys.stderr, "                [--base-directory DIR] [--simulator PATH]"
+    sys.exit(2)
+
 def main():
+    global simulator
+    try:
+        options, args = getopt.getopt(sys.argv[1:], "",
+                                      ["run-queue", "manifest=", "summary", "jobs=",
+                                       "retries=", "base-directory=", "simulator="])
+    except getopt.GetoptError, e:
+        print >>sys.stderr, "batchsim: %s" % e
+        usage()
+    if (args):
+        usage()
+    action = None
+    manifestFileName = None
+    numJobs = 1
+    retries = 0
+    for option, value in options:
+        try:
+            if (option in ("--run-queue", "--summary")):
+                action = option
+            elif (option == "--manifest"):
+                action = option
+                manifestFileName = value
+            elif (option == "--jobs"):
+                numJobs = max(1, int(value))
+            elif (option == "--retries"):
+                retries = max(0, int(value))
+            elif (option == "--base-directory"):
+                setBaseDirectory(os.path.abspath(value))
+            elif (option == "--simulator"):
+                simulator = value
+        except ValueError:
+            print >>sys.stderr, "batchsim: %s needs an integer, not %s" % (option, value)
+            usage()
+
     makeDirectory(INPUT)
     makeDirectory(QUEUE)
     makeDirectory(CURRENT)
     makeDirectory(OUTPUT)
-    if (len(sys.argv) > 1 and sys.argv[1] == '--run-queue'):
-        runQueue()
+    if (action == '--run-queue'):
+        runQueue(numJobs, retries)
+    elif (action == '--manifest'):
+        sys.exit(runManifest(manifestFileName, numJobs, retries))
+    elif (action == '--summary'):
+        for line in summaryLines():
+            print line
     else:
         print
         scanInput()
-        runQueue()
+        runQueue(numJobs, retries)
         showStatus()
         print
 
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Copyright 2008 Nanorex, Inc.  See LICENSE file for details.
+
+"""
+Tests for the parallel queue runner and manifest mode of batchsim.py,
+using a stub simulator script in place of the real simulator.
+
+Run from sim/src, e.g. "python batchsimtests.py".
+
+$Id$
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import batchsim
+
+# Stand-in for the simulator: takes a while, writes its trace file,
+# fails for files named fail*.mmp, and fails on the first attempt
+# (only) for files named flaky*.mmp.
+STUB_SIMULATOR = """#!/bin/sh
+for arg in "$@"; do file="$arg"; done
+sleep %(sleep)s
+case "$file" in
+fail*) echo "stub failure" >&2; exit 3;;
+flaky*) if [ ! -f attempted ]; then touch attempted; exit 4; fi;;
+esac
+echo "$@" > "${file%%.mmp}-trace.txt"
+exit 0
+"""
+
+SLEEP = 0.5
+
+class BatchsimTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.oldBaseDirectory = batchsim.baseDirectory
+        self.oldSimulator = batchsim.simulator
+        batchsim.setBaseDirectory(os.path.join(self.tempDir, "batchsim"))
+        for path in (batchsim.INPUT, batchsim.QUEUE, batchsim.CURRENT, batchsim.OUTPUT):
+            batchsim.makeDirectory(path)
+        batchsim.simulator = os.path.join(self.tempDir, "stub-simulator")
+        stub = open(batchsim.simulator, 'w')
+        stub.write(STUB_SIMULATOR % {'sleep': SLEEP})
+        stub.close()
+        os.chmod(batchsim.simulator, 0755)
+
+    def tearDown(self):
+        batchsim.setBaseDirectory(self.oldBaseDirectory)
+        batchsim.simulator = self.oldSimulator
+        shutil.rmtree(self.tempDir)
+
+    def _writeManifest(self, mmpNames, lines):
+        for name in mmpNames:
+            f = open(os.path.join(self.tempDir, name), 'w')
+            f.write("mmpformat 050920 required; 060421 preferred\nend1\n")
+            f.close()
+        manifestName = os.path.join(self.tempDir, "sweep.manifest")
+        manifest = open(manifestName, 'w')
+        for line in lines:
+            print >>manifest, line
+        manifest.close()
+        return manifestName
+
+    def test_readManifest(self):
+        manifestName = self._writeManifest(
+            ["a.mmp", "b.mmp"],
+            ["mmp = *.mmp   # both files",
+             "mode = minimize",
+             "end_rms = 50, 10",
+             "engine = nd1, gromacs"])
+        jobs = batchsim.readManifest(manifestName)
+        self.assertEqual(len(jobs), 8)
+        sweeps = [(os.path.basename(path), parameters['end_rms'], parameters['engine'])
+                  for path, parameters in jobs]
+        self.assert_(("b.mmp", "10", "gromacs") in sweeps)
+        self.assertEqual(jobs[0][1]['mode'], "minimize")
+        self.assertEqual(jobs[0][1]['frames'], batchsim.PARAMETER_DEFAULTS['frames'])
+
+    def test_readManifestErrors(self):
+        manifestName = self._writeManifest(["a.mmp"], ["mmp = a.mmp", "tempurature = 300"])
+        self.assertRaises(batchsim.ManifestError, batchsim.readManifest, manifestName)
+        manifestName = self._writeManifest([], ["mmp = nothing*.mmp"])
+        self.assertRaises(batchsim.ManifestError, batchsim.readManifest, manifestName)
+
+    def test_parallelQueue(self):
+        names = ["ok1.mmp", "ok2.mmp", "ok3.mmp", "flaky.mmp", "fail.mmp"]
+        manifestName = self._writeManifest(names, ["mmp = " + ", ".join(names)])
+        jobNumbers = []
+        for mmpPath, parameters in batchsim.readManifest(manifestName):
+            jobNumbers.append(batchsim.queueJob(mmpPath, parameters))
+        start = time.time()
+        batchsim.processQueue(numJobs = 4, retries = 1)
+        elapsed = time.time() - start
+
+        # 7 attempts (fail and flaky are run twice) take at least 3.5 sec in series
+        self.assert_(elapsed < 6 * SLEEP, "not run in parallel: %.2f sec" % elapsed)
+        self.assertEqual(os.listdir(batchsim.CURRENT), [])
+        for jobNumber, name in zip(jobNumbers, names):
+            jobPath = os.path.join(batchsim.OUTPUT, jobNumber)
+            timing = batchsim.readTiming(jobPath)
+            failed = os.path.exists(os.path.join(jobPath, "FAILED"))
+            traced = os.path.exists(os.path.join(jobPath, name[:-4] + "-trace.txt"))
+            self.assert_(timing['wall'] >= SLEEP)
+            if (name.startswith("fail")):
+                self.assert_(failed and not traced)
+                self.assertEqual(timing['attempts'], 2)
+                self.assertEqual(timing['status'], 1)
+            elif (name.startswith("flaky")):
+                self.assert_(traced and not failed)
+                self.assertEqual(timing['attempts'], 2)
+            else:
+                self.assert_(traced and not failed)
+                self.assertEqual(timing['attempts'], 1)
+                self.assertEqual(timing['status'], 0)
+        summary = open(os.path.join(batchsim.baseDirectory, "summary.txt")).read()
+        self.assert_(summary.find("4 succeeded, 1 failed") >= 0, summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -65,6 +65,7 @@ cdef extern from "simhelp.c":
     setWriteTraceCallbackFunc(PyObject)
     setFrameCallbackFunc(PyObject)
     getFrame_c()
+    getFrameInto_c(PyObject)
     pyrexInitBondTable()
     void dumpPart()
     void reinit_globals()
@@ -361,6 +362,15 @@ cdef class _Simulator:
         array = Numeric.fromstring(frm, Numeric.Float64)
         return Numeric.resize(array, [num_atoms, 3])
 
+    def getFrameInto(self, array):
+        """
+        Copy the current frame into array, a contiguous Float64 array
+        of shape (num_atoms, 3) owned by the caller, instead of making
+        a new array as getFrame does. Raises ValueError if array has
+        the wrong size. Returns the number of atoms.
+        """
+        return getFrameInto_c(array)
+
 _theSimulator = None
 
 def theSimulator():
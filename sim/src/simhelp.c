@@ -307,6 +307,45 @@ getFrame_c(void)
     return finish_python_call(retval);
 }
 
+#if PY_VERSION_HEX < 0x02050000
+typedef int Py_ssize_t;
+#endif
+
+// Like getFrame_c, but write the frame into the caller's writable
+// buffer (e.g. a contiguous Float64 Numeric array of shape (num_atoms, 3))
+// instead of allocating a new string, so the GUI can reuse one array
+// for every frame of a run. Returns the number of atoms.
+static PyObject *
+getFrameInto_c(PyObject *dest)
+{
+    double *data;
+    Py_ssize_t len;
+    int i, n;
+
+    start_python_call();
+    if (part == NULL) {
+	raiseExceptionIfNoneEarlier(PyExc_MemoryError,
+				    "part is null");
+	return NULL;
+    }
+    if (PyObject_AsWriteBuffer(dest, (void **) &data, &len) < 0) {
+	return NULL;
+    }
+    n = 3 * part->num_atoms * sizeof(double);
+    if (len != n) {
+	PyErr_Format(PyExc_ValueError,
+		     "frame buffer has %d bytes, %d atoms need %d",
+		     (int) len, part->num_atoms, n);
+	return NULL;
+    }
+    for (i = 0; i < part->num_atoms; i++) {
+	data[i * 3 + 0] = pos[i].x * XYZ;
+	data[i * 3 + 1] = pos[i].y * XYZ;
+	data[i * 3 + 2] = pos[i].z * XYZ;
+    }
+    return finish_python_call(PyInt_FromLong(part->num_atoms));
+}
+
 static PyObject *
 pyrexInitBondTable(void)
 {